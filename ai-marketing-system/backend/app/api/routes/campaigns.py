@@ -11,8 +11,8 @@ from app.models.email_template import EmailTemplate
 from app.models.segment import Segment
 from app.schemas.campaign import CampaignCreate, CampaignUpdate, CampaignResponse, CampaignStats
 from app.core.security import get_current_active_user
-from app.services.email_service import email_service
-from app.services.template_service import template_service
+from app.core.config import settings
+from app.services.email_queue_service import email_queue_service
 from app.services.segment_service import segment_service
 
 router = APIRouter()
@@ -173,11 +173,10 @@ async def send_campaign(
                 detail="Segment not found"
             )
         
-        # Get all leads matching segment
-        all_segment_leads = segment_service.get_segment_leads(campaign.segment_id, db)
-        
-        # Filter for email consent
-        leads = [lead for lead in all_segment_leads if lead.email_consent]
+        # Get segment members with email consent
+        leads = segment_service.get_segment_leads_query(campaign.segment_id, db).filter(
+            Lead.email_consent == True
+        ).all()
         
         # Update segment usage
         segment.campaign_count += 1
@@ -235,85 +234,38 @@ async def send_campaign(
         for lead in leads
     ]
 
-    # Send emails in background
-    background_tasks.add_task(
-        send_campaign_emails,
-        campaign_id=campaign.id,
-        subject=campaign.subject,
-        content=campaign.content,
-        template_id=campaign.template_id,
-        recipients=recipients,
-        db=db
-    )
+    # Queue one message per recipient; duplicates of an earlier send are skipped
+    queued = email_queue_service.enqueue_campaign(db, campaign.id, recipients)
+
+    # Without a standalone worker, deliver the queue in the background
+    if settings.EMAIL_QUEUE_INLINE_WORKER:
+        background_tasks.add_task(email_queue_service.drain, campaign_id=campaign.id)
 
     return {
         "message": "Campaign is being sent",
-        "total_recipients": len(recipients)
+        "total_recipients": len(recipients),
+        "queued": queued
     }
 
 
-async def send_campaign_emails(
+@router.get("/{campaign_id}/queue")
+async def get_campaign_queue(
     campaign_id: int,
-    subject: str,
-    content: str,
-    template_id: Optional[int],
-    recipients: list,
-    db: Session
+    db: Session = Depends(get_db)
 ):
-    """Background task to send campaign emails"""
+    """Get outbound queue status for a campaign"""
 
-    # Get template if template_id is provided
-    template = None
-    if template_id:
-        template = db.query(EmailTemplate).filter(EmailTemplate.id == template_id).first()
-
-    # Send emails to each recipient
-    sent_count = 0
-    failed_count = 0
-    
-    for recipient in recipients:
-        try:
-            # Determine subject and content
-            email_subject = subject
-            email_content = content
-            
-            # If using a template, render it with recipient's data
-            if template:
-                lead_data = recipient.get("lead_data", {})
-                variables = template_service.prepare_variables(lead_data)
-                email_subject = template_service.render_template(template.subject, variables)
-                email_content = template_service.render_template(template.html_content, variables)
-            else:
-                # Wrap custom content in email template
-                email_content = email_service.create_email_template(content)
-            
-            # Send individual email
-            success = await email_service.send_email(
-                to_email=recipient["email"],
-                subject=email_subject,
-                body=email_content,
-                campaign_id=campaign_id,
-                lead_id=recipient.get("lead_id"),
-                db=db
-            )
-            
-            if success:
-                sent_count += 1
-            else:
-                failed_count += 1
-                
-        except Exception as e:
-            print(f"Error sending email to {recipient['email']}: {str(e)}")
-            failed_count += 1
-
-    # Update campaign statistics
     campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
-    if campaign:
-        campaign.total_sent = sent_count
-        campaign.total_delivered = sent_count  # Will be updated by webhook/tracking
-        if sent_count == campaign.total_recipients:
-            campaign.status = "completed"
-        db.commit()
+    if not campaign:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Campaign not found"
+        )
+
+    return {
+        "campaign_id": campaign_id,
+        "queue": email_queue_service.get_queue_stats(db, campaign_id)
+    }
 
 
 @router.get("/{campaign_id}/stats")
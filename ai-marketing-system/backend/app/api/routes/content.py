@@ -1,11 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime
+import json
 import os
 
-from app.db.session import get_db
+from app.db.session import SessionLocal, get_db
 from app.models.content import GeneratedContent
 from app.models.user import User
 from app.schemas.content import (
@@ -17,10 +18,129 @@ from app.schemas.content import (
 from app.core.security import get_current_active_user
 from app.core.config import settings
 from app.services.ai_content_generator import ai_content_generator
+from app.services.blob_store import BLOB_NAME, blob_store
 
 router = APIRouter()
 
 
+# Field the AI result must contain for each content type, and the error when it is missing
+REQUIRED_RESULT_FIELDS = {
+    "social_post": ("caption", "Failed to generate content. AI returned empty result."),
+    "email_template": ("body", "Failed to generate email content. AI returned empty result."),
+    "ad_copy": ("primary_text", "Failed to generate ad copy. AI returned empty result.")
+}
+
+
+def _content_from_result(
+    request: ContentGenerationRequest,
+    ai_result: Dict[str, Any],
+    image_prompt: Optional[str] = None,
+    image_url: Optional[str] = None
+) -> GeneratedContent:
+    """Map a generation result onto a GeneratedContent record"""
+
+    if request.content_type == "social_post":
+        # Handle hashtags - could be array or string
+        hashtags = ai_result.get("hashtags", "")
+        if isinstance(hashtags, list):
+            hashtags = " ".join(hashtags)
+
+        return GeneratedContent(
+            content_type=request.content_type,
+            platform=request.platform,
+            title=ai_result.get("title", ""),
+            caption=ai_result.get("caption", ""),
+            hashtags=hashtags,
+            image_prompt=image_prompt,
+            image_url=image_url,
+            prompt_used=request.topic,
+            ai_model=ai_content_generator.text_model,
+            created_by=None
+        )
+
+    if request.content_type == "email_template":
+        return GeneratedContent(
+            content_type=request.content_type,
+            platform="email",
+            title=ai_result.get("subject", ""),
+            caption=ai_result.get("preview_text", ""),
+            body=ai_result.get("body", ""),
+            prompt_used=request.topic,
+            ai_model=ai_content_generator.text_model,
+            created_by=None
+        )
+
+    return GeneratedContent(
+        content_type=request.content_type,
+        platform=request.platform or "facebook",
+        title=ai_result.get("headline", ""),
+        caption=ai_result.get("primary_text", ""),
+        body=ai_result.get("description", ""),
+        prompt_used=request.topic,
+        ai_model=ai_content_generator.text_model,
+        created_by=None
+    )
+
+
+async def _generate_post_image(request: ContentGenerationRequest) -> Tuple[Optional[str], Optional[str]]:
+    """Generate or enhance the image for a social post if requested, returning its prompt and URL"""
+
+    image_prompt = None
+    image_url = None
+    if request.include_image:
+        try:
+            if request.product_image_base64:
+                # User provided their own product image - enhance it
+                print(f"Enhancing user's product image for: {request.topic}")
+                
+                # Create enhancement prompt based on topic and style
+                enhancement_instructions = f"""Transform this product image for marketing purposes:
+- Topic/Context: {request.topic}
+- Style: {request.image_style or 'professional product photography'}
+- Target Audience: {request.target_audience}
+- Tone: {request.tone}
+
+Enhance the image by:
+1. Adding an appropriate background or setting that fits the topic
+2. Improving lighting and colors for marketing appeal
+3. Adding professional effects or ambiance that matches the tone
+4. Making it visually compelling for social media
+
+Keep the product as the main focus while creating an engaging marketing scene around it.
+Generate a new enhanced marketing image based on these requirements."""
+                
+                image_prompt = enhancement_instructions
+                image_url = await ai_content_generator.enhance_product_image(
+                    product_image_base64=request.product_image_base64,
+                    enhancement_prompt=enhancement_instructions,
+                    aspect_ratio="1:1"
+                )
+                print(f"Product image enhanced successfully: {image_url}")
+            else:
+                # Generate image from scratch
+                print(f"Generating image prompt for: {request.topic}")
+                image_prompt = await ai_content_generator.generate_image_prompt(
+                    content_topic=request.topic,
+                    style=request.image_style or "professional product photography"
+                )
+                print(f"Image prompt generated: {image_prompt[:100]}...")
+
+                # Then generate the actual image
+                print(f"Generating actual image...")
+                image_url = await ai_content_generator.generate_image(
+                    prompt=image_prompt,
+                    aspect_ratio="1:1"  # 1:1 for square images (1024x1024)
+                )
+                print(f"Image generated successfully: {image_url}")
+        except Exception as e:
+            print(f"Failed to generate/enhance image: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            # Continue without image if generation fails
+
+    return image_prompt, image_url
+
+
 @router.post("/generate", response_model=ContentResponse, status_code=status.HTTP_201_CREATED)
 async def generate_content(
     request: ContentGenerationRequest,
@@ -42,7 +162,8 @@ async def generate_content(
                 platform=request.platform,
                 tone=request.tone,
                 target_audience=request.target_audience,
-                additional_context=request.additional_context
+                additional_context=request.additional_context,
+                fresh=request.fresh
             )
 
             # Validate AI result
@@ -53,84 +174,17 @@ async def generate_content(
                 )
 
             # Generate or enhance image if requested
-            image_prompt = None
-            image_url = None
-            if request.include_image:
-                try:
-                    if request.product_image_base64:
-                        # User provided their own product image - enhance it
-                        print(f"Enhancing user's product image for: {request.topic}")
-                        
-                        # Create enhancement prompt based on topic and style
-                        enhancement_instructions = f"""Transform this product image for marketing purposes:
-- Topic/Context: {request.topic}
-- Style: {request.image_style or 'professional product photography'}
-- Target Audience: {request.target_audience}
-- Tone: {request.tone}
+            image_prompt, image_url = await _generate_post_image(request)
 
-Enhance the image by:
-1. Adding an appropriate background or setting that fits the topic
-2. Improving lighting and colors for marketing appeal
-3. Adding professional effects or ambiance that matches the tone
-4. Making it visually compelling for social media
-
-Keep the product as the main focus while creating an engaging marketing scene around it.
-Generate a new enhanced marketing image based on these requirements."""
-                        
-                        image_prompt = enhancement_instructions
-                        image_url = await ai_content_generator.enhance_product_image(
-                            product_image_base64=request.product_image_base64,
-                            enhancement_prompt=enhancement_instructions,
-                            aspect_ratio="1:1"
-                        )
-                        print(f"Product image enhanced successfully: {image_url}")
-                    else:
-                        # Generate image from scratch
-                        print(f"Generating image prompt for: {request.topic}")
-                        image_prompt = await ai_content_generator.generate_image_prompt(
-                            content_topic=request.topic,
-                            style=request.image_style or "professional product photography"
-                        )
-                        print(f"Image prompt generated: {image_prompt[:100]}...")
-
-                        # Then generate the actual image
-                        print(f"Generating actual image...")
-                        image_url = await ai_content_generator.generate_image(
-                            prompt=image_prompt,
-                            aspect_ratio="1:1"  # 1:1 for square images (1024x1024)
-                        )
-                        print(f"Image generated successfully: {image_url}")
-                except Exception as e:
-                    print(f"Failed to generate/enhance image: {str(e)}")
-                    import traceback
-                    traceback.print_exc()
-                    # Continue without image if generation fails
-
-            # Handle hashtags - could be array or string
-            hashtags = ai_result.get("hashtags", "")
-            if isinstance(hashtags, list):
-                hashtags = " ".join(hashtags)
-            
-            # Create content record
-            new_content = GeneratedContent(
-                content_type=request.content_type,
-                platform=request.platform,
-                title=ai_result.get("title", ""),
-                caption=ai_result.get("caption", ""),
-                hashtags=hashtags,
-                image_prompt=image_prompt,
-                image_url=image_url,
-                prompt_used=request.topic,
-                ai_model=ai_content_generator.text_model,
-                created_by=None
-            )
+            new_content = _content_from_result(request, ai_result, image_prompt, image_url)
 
         elif request.content_type == "email_template":
             ai_result = await ai_content_generator.generate_email_content(
                 subject_topic=request.topic,
                 purpose=request.additional_context or "Marketing email",
                 tone=request.tone,
-                target_audience=request.target_audience
+                target_audience=request.target_audience,
+                fresh=request.fresh
             )
 
             # Validate AI result
@@ -140,16 +194,7 @@ Generate a new enhanced marketing image based on these requirements."""
                     detail="Failed to generate email content. AI returned empty result."
                 )
 
-            new_content = GeneratedContent(
-                content_type=request.content_type,
-                platform="email",
-                title=ai_result.get("subject", ""),
-                caption=ai_result.get("preview_text", ""),
-                body=ai_result.get("body", ""),
-                prompt_used=request.topic,
-                ai_model=ai_content_generator.text_model,
-                created_by=None
-            )
+            new_content = _content_from_result(request, ai_result)
 
         elif request.content_type == "ad_copy":
             ai_result = await ai_content_generator.generate_ad_copy(
@@ -157,7 +202,8 @@ Generate a new enhanced marketing image based on these requirements."""
                 product_description=request.additional_context or "",
                 platform=request.platform or "facebook",
                 tone=request.tone,
-                target_audience=request.target_audience
+                target_audience=request.target_audience,
+                fresh=request.fresh
             )
 
             # Validate AI result
@@ -167,16 +213,7 @@ Generate a new enhanced marketing image based on these requirements."""
                     detail="Failed to generate ad copy. AI returned empty result."
                 )
 
-            new_content = GeneratedContent(
-                content_type=request.content_type,
-                platform=request.platform or "facebook",
-                title=ai_result.get("headline", ""),
-                caption=ai_result.get("primary_text", ""),
-                body=ai_result.get("description", ""),
-                prompt_used=request.topic,
-                ai_model=ai_content_generator.text_model,
-                created_by=None
-            )
+            new_content = _content_from_result(request, ai_result)
 
         else:
             raise HTTPException(
@@ -197,6 +234,110 @@ Generate a new enhanced marketing image based on these requirements."""
         )
 
 
+def _generation_prompt(request: ContentGenerationRequest) -> str:
+    """Build the generation prompt for a request, rejecting ones that cannot be generated"""
+
+    if request.content_type == "social_post":
+        if not request.platform:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Platform is required for social posts"
+            )
+        return ai_content_generator.social_post_prompt(
+            topic=request.topic,
+            platform=request.platform,
+            tone=request.tone,
+            target_audience=request.target_audience,
+            additional_context=request.additional_context
+        )
+
+    if request.content_type == "email_template":
+        return ai_content_generator.email_content_prompt(
+            subject_topic=request.topic,
+            purpose=request.additional_context or "Marketing email",
+            tone=request.tone,
+            target_audience=request.target_audience
+        )
+
+    if request.content_type == "ad_copy":
+        return ai_content_generator.ad_copy_prompt(
+            product_name=request.topic,
+            product_description=request.additional_context or "",
+            platform=request.platform or "facebook",
+            tone=request.tone,
+            target_audience=request.target_audience
+        )
+
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"Unsupported content type: {request.content_type}"
+    )
+
+
+def _sse(event: str, data: Any) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/generate/stream")
+async def generate_content_stream(request: ContentGenerationRequest):
+    """
+    Generate marketing content using AI, streamed as server-sent events.
+
+    Emits "token" events with the model's text as it arrives, a "field"
+    event as each field of the result (title, caption, hashtags, ...)
+    completes, and a final "done" event with the saved content, or
+    "error" if generation fails.
+    """
+
+    prompt = _generation_prompt(request)
+
+    async def events():
+        try:
+            ai_result = None
+            async for kind, data in ai_content_generator.stream_json(
+                prompt, ai_content_generator.text_model, fresh=request.fresh
+            ):
+                if kind == "result":
+                    ai_result = data
+                else:
+                    yield _sse(kind, data)
+
+            required, error = REQUIRED_RESULT_FIELDS[request.content_type]
+            if not ai_result or not ai_result.get(required):
+                yield _sse("error", {"detail": error})
+                return
+
+            image_prompt, image_url = None, None
+            if request.content_type == "social_post":
+                image_prompt, image_url = await _generate_post_image(request)
+                if image_url:
+                    yield _sse("field", {"name": "image_url", "value": image_url})
+
+            # The request's session is not held open for the length of the stream
+            db = SessionLocal()
+            try:
+                new_content = _content_from_result(request, ai_result, image_prompt, image_url)
+                db.add(new_content)
+                db.commit()
+                db.refresh(new_content)
+                saved = ContentResponse.model_validate(new_content).model_dump(mode="json")
+            finally:
+                db.close()
+
+            yield _sse("done", saved)
+
+        except Exception as e:
+            print(f"Streaming content generation failed: {str(e)}")
+            yield _sse("error", {"detail": f"Error generating content: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/", response_model=List[ContentResponse])
 async def get_content(
     skip: int = 0,
@@ -384,12 +525,21 @@ async def improve_content(
         )
 
 
+@router.get("/blobs/{name}")
+async def get_blob(name: str, request: Request):
+    """Serve a stored image; blobs never change, so they are cached by hash"""
+    return await blob_store.response(name, request.headers)
+
+
 @router.get("/download-image/{filename}")
-async def download_image(filename: str):
+async def download_image(filename: str, request: Request):
     """Download generated image with proper Content-Disposition header"""
 
-    # Construct file path
-    file_path = os.path.join(settings.UPLOAD_DIR, filename)
+    if BLOB_NAME.match(filename):
+        return await blob_store.response(filename, request.headers, download=True)
+
+    # Images saved before the blob store live flat in the uploads directory
+    file_path = os.path.join(settings.UPLOAD_DIR, os.path.basename(filename))
 
     # Check if file exists
     if not os.path.exists(file_path):
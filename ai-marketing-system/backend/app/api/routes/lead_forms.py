@@ -14,6 +14,7 @@ from app.db.session import get_db
 from app.models.lead_form import LeadForm, LeadFormSubmission
 from app.models.lead import Lead, LeadSource
 from app.models.user import User
+from app.services.segment_service import segment_service
 from app.core.security import get_current_active_user
 from app.schemas.lead_form import (
     FormCreate,
@@ -302,6 +303,7 @@ async def submit_form(
 
     # Create lead if email provided
     lead_id = None
+    lead_created = False
     if email:
         # Check for duplicate
         existing_lead = db.query(Lead).filter(Lead.email == email).first()
@@ -325,6 +327,7 @@ async def submit_form(
             db.add(new_lead)
             db.flush()  # Get the ID
             lead_id = new_lead.id
+            lead_created = True
 
             submission_record.lead_id = lead_id
             submission_record.status = "processed"
@@ -340,6 +343,9 @@ async def submit_form(
 
     db.commit()
 
+    if lead_created:
+        segment_service.refresh_lead_memberships([lead_id], db)
+
     return FormSubmissionResponse(
         success=True,
         message=form.success_message,
@@ -10,6 +10,7 @@ from app.models.lead_tracking import (
     LeadAttribution, LeadJourney, LeadActivitySummary
 )
 from app.services.lead_tracking_service import lead_tracking_service
+from app.services.lead_scoring_service import lead_scoring_service
 
 router = APIRouter()
 
@@ -229,35 +230,9 @@ async def bulk_calculate_scores(
     lead_ids: Optional[List[int]] = None,
     db: Session = Depends(get_db)
 ):
-    """Calculate scores for multiple leads"""
-
-    if lead_ids:
-        leads = db.query(Lead).filter(Lead.id.in_(lead_ids)).all()
-    else:
-        leads = db.query(Lead).all()
-
-    results = {
-        "total_leads": len(leads),
-        "calculated": 0,
-        "failed": 0,
-        "scores": []
-    }
-
-    for lead in leads:
-        try:
-            lead_score = lead_tracking_service.calculate_lead_score(lead, db)
-            results["calculated"] += 1
-            results["scores"].append({
-                "lead_id": lead.id,
-                "total_score": lead_score.total_score,
-                "grade": lead_score.grade,
-                "temperature": lead_score.temperature
-            })
-        except Exception as e:
-            results["failed"] += 1
-            print(f"Error calculating score for lead {lead.id}: {str(e)}")
+    """Calculate scores for multiple leads, or every lead when none are given"""
 
-    return results
+    return lead_scoring_service.bulk_calculate(db, lead_ids or None)
 
 
 # ============= Engagement Tracking =============
@@ -3,14 +3,16 @@ from sqlalchemy.orm import Session
 from sqlalchemy import or_
 from typing import List, Optional
 from datetime import datetime
-import pandas as pd
-import io
 
 from app.db.session import get_db
 from app.models.lead import Lead
+from app.models.lead_import_job import LeadImportJob
 from app.models.user import User
 from app.schemas.lead import LeadCreate, LeadUpdate, LeadResponse, LeadImportRequest
 from app.core.security import get_current_active_user
+from app.services.segment_service import segment_service
+from app.services.lead_import_service import lead_import_service, ImportFormatError
+from app.services.lead_upsert_service import lead_upsert_service, MergePolicy
 
 router = APIRouter()
 
@@ -22,23 +24,26 @@ async def create_lead(
 ):
     """Create a new lead with consent tracking"""
 
-    # Check if lead already exists
-    existing_lead = db.query(Lead).filter(Lead.email == lead_data.email).first()
-    if existing_lead:
+    # Insert only; an existing lead with this email is left untouched
+    result = lead_upsert_service.upsert_leads(
+        db,
+        [{
+            **lead_data.dict(),
+            "consent_date": datetime.utcnow() if lead_data.email_consent or lead_data.sms_consent else None
+        }],
+        default_policy=MergePolicy.KEEP
+    )
+    if not result["inserted"]:
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Lead with this email already exists"
         )
 
-    # Create new lead
-    new_lead = Lead(
-        **lead_data.dict(),
-        consent_date=datetime.utcnow() if lead_data.email_consent or lead_data.sms_consent else None
-    )
-
-    db.add(new_lead)
     db.commit()
-    db.refresh(new_lead)
+    new_lead = db.query(Lead).filter(Lead.id == result["inserted"][0]).first()
+
+    segment_service.refresh_lead_memberships([new_lead.id], db)
 
     return new_lead
 
@@ -122,13 +127,17 @@ async def update_lead(
         setattr(lead, field, value)
 
     # Update consent date if consent status changed
+    changed_fields = set(update_data)
     if "email_consent" in update_data or "sms_consent" in update_data:
         if lead.email_consent or lead.sms_consent:
             lead.consent_date = datetime.utcnow()
+            changed_fields.add("consent_date")
 
     db.commit()
     db.refresh(lead)
 
+    segment_service.refresh_lead_memberships([lead.id], db, changed_fields=changed_fields)
+
     return lead
 
 
@@ -146,20 +155,26 @@ async def delete_lead(
             detail="Lead not found"
         )
 
+    segment_service.remove_lead_memberships([lead.id], db)
     db.delete(lead)
     db.commit()
 
     return None
 
 
-@router.post("/import", status_code=status.HTTP_201_CREATED)
+@router.post("/import", status_code=status.HTTP_202_ACCEPTED)
 async def import_leads(
     file: UploadFile = File(...),
     consent_confirmed: bool = False,
     source: str = "import",
     db: Session = Depends(get_db)
 ):
-    """Import leads from CSV or Excel file"""
+    """
+    Import leads from CSV or Excel file.
+
+    The upload is saved and imported in the background; follow progress
+    at GET /leads/import/{job_id}.
+    """
 
     if not consent_confirmed:
         raise HTTPException(
@@ -167,78 +182,42 @@ async def import_leads(
             detail="You must confirm that all imported contacts have given consent"
         )
 
-    # Read file
-    contents = await file.read()
-
     try:
-        # Try to read as CSV or Excel
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(contents))
-        elif file.filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(io.BytesIO(contents))
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="File must be CSV or Excel format"
-            )
+        job = await lead_import_service.create_job(file, source, db)
+    except ImportFormatError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error importing file: {str(e)}"
+        )
 
-        # Validate required columns
-        required_columns = ['email']
-        if not all(col in df.columns for col in required_columns):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"File must contain columns: {', '.join(required_columns)}"
-            )
+    return {
+        "message": "Import queued",
+        "job_id": job.id,
+        "total_rows": job.total_rows
+    }
 
-        # Import leads
-        imported = 0
-        skipped = 0
-        errors = []
-
-        for _, row in df.iterrows():
-            try:
-                # Check if lead already exists
-                existing = db.query(Lead).filter(Lead.email == row['email']).first()
-                if existing:
-                    skipped += 1
-                    continue
-
-                # Create new lead
-                new_lead = Lead(
-                    email=row['email'],
-                    first_name=row.get('first_name', ''),
-                    last_name=row.get('last_name', ''),
-                    phone=row.get('phone', ''),
-                    location=row.get('location', ''),
-                    sport_type=row.get('sport_type', ''),
-                    customer_type=row.get('customer_type', ''),
-                    email_consent=True,
-                    consent_date=datetime.utcnow(),
-                    consent_source=source,
-                    source=source
-                )
-
-                db.add(new_lead)
-                imported += 1
-
-            except Exception as e:
-                errors.append(f"Row {_ + 1}: {str(e)}")
-
-        db.commit()
 
-        return {
-            "message": "Import completed",
-            "imported": imported,
-            "skipped": skipped,
-            "errors": errors
-        }
+@router.get("/import/{job_id}")
+async def get_import_progress(
+    job_id: str,
+    db: Session = Depends(get_db)
+):
+    """Get progress, throughput and estimated time remaining of a lead import"""
 
-    except Exception as e:
+    job = db.query(LeadImportJob).filter(LeadImportJob.id == job_id).first()
+    if not job:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error importing file: {str(e)}"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Import job not found"
         )
 
+    return lead_import_service.get_job_status(job)
+
 
 @router.get("/stats/overview")
 async def get_leads_stats(
@@ -414,6 +393,7 @@ async def enrich_lead(
 
     try:
         enriched_lead = lead_enrichment_service.enrich_lead(lead, db)
+        segment_service.refresh_lead_memberships([enriched_lead.id], db)
         return enriched_lead
 
     except Exception as e:
@@ -433,6 +413,7 @@ async def bulk_enrich_leads(
 
     try:
         results = lead_enrichment_service.bulk_enrich(db, lead_ids=lead_ids)
+        segment_service.refresh_lead_memberships(results["lead_ids"], db)
 
         return {
             "message": "Bulk enrichment complete",
@@ -495,6 +476,7 @@ async def clean_lead_data(
 
     try:
         cleaned_lead = lead_enrichment_service.clean_lead_data(lead, db)
+        segment_service.refresh_lead_memberships([cleaned_lead.id], db)
         return cleaned_lead
 
     except Exception as e:
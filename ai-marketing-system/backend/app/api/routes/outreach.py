@@ -160,7 +160,8 @@ async def generate_personalized_message(
             lead=lead,
             message_type=request.message_type,
             template=request.template,
-            additional_context=request.additional_context
+            additional_context=request.additional_context,
+            fresh=request.fresh
         )
 
         return PersonalizedMessageResponse(**message_data)
@@ -1,10 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 
 from app.db.session import get_db
-from app.models.segment import Segment
+from app.models.segment import Segment, SegmentMembership
 from app.models.lead import Lead
 from app.schemas.segment import (
     SegmentCreate,
@@ -14,6 +14,7 @@ from app.schemas.segment import (
     SegmentPreviewResponse,
     SegmentFieldsResponse,
     SegmentStatsResponse,
+    SegmentOverlapResponse,
     SegmentField
 )
 from app.services.segment_service import segment_service
@@ -158,6 +159,9 @@ async def delete_segment(
             detail="Segment not found"
         )
     
+    db.query(SegmentMembership).filter(
+        SegmentMembership.segment_id == segment_id
+    ).delete(synchronize_session=False)
     db.delete(segment)
     db.commit()
     
@@ -215,7 +219,7 @@ async def refresh_segment_count(
     segment_id: int,
     db: Session = Depends(get_db)
 ):
-    """Recalculate lead count for a segment"""
+    """Rebuild membership and lead count for a segment"""
     
     segment = db.query(Segment).filter(Segment.id == segment_id).first()
     if not segment:
@@ -290,12 +294,8 @@ async def get_segment_stats(
     total_segments = db.query(Segment).count()
     active_segments = db.query(Segment).filter(Segment.is_active == True).count()
     
-    # Get total unique leads covered
-    segments = db.query(Segment).all()
-    all_lead_ids = set()
-    for segment in segments:
-        leads = segment_service.get_segment_leads(segment.id, db)
-        all_lead_ids.update(lead.id for lead in leads)
+    # Get total unique leads covered from materialized membership
+    total_leads_covered = segment_service.count_covered_leads(db)
     
     # Get most used segment
     most_used = db.query(Segment).order_by(Segment.campaign_count.desc()).first()
@@ -310,11 +310,43 @@ async def get_segment_stats(
     return SegmentStatsResponse(
         total_segments=total_segments,
         active_segments=active_segments,
-        total_leads_covered=len(all_lead_ids),
+        total_leads_covered=total_leads_covered,
         most_used_segment=most_used_data
     )
 
 
+@router.get("/stats/overlap", response_model=SegmentOverlapResponse)
+async def get_segment_overlap(
+    include: List[int] = Query(default=[], description="Segment ids the leads must all belong to"),
+    exclude: List[int] = Query(default=[], description="Segment ids the leads must not belong to"),
+    lead_status: Optional[str] = Query(default=None, alias="status"),
+    sport_type: Optional[str] = None,
+    email_consent: Optional[bool] = None,
+    db: Session = Depends(get_db)
+):
+    """Count leads in segments X and Y but not Z, optionally filtered by status, sport or consent"""
+    
+    lead_count = segment_service.count_segment_overlap(
+        db,
+        include_segment_ids=include,
+        exclude_segment_ids=exclude,
+        status=lead_status,
+        sport_type=sport_type,
+        email_consent=email_consent
+    )
+    
+    return SegmentOverlapResponse(
+        include_segment_ids=include,
+        exclude_segment_ids=exclude,
+        filters={
+            "status": lead_status,
+            "sport_type": sport_type,
+            "email_consent": email_consent
+        },
+        lead_count=lead_count
+    )
+
+
 @router.post("/{segment_id}/duplicate", response_model=SegmentResponse)
 async def duplicate_segment(
     segment_id: int,
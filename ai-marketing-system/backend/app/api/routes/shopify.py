@@ -55,18 +55,35 @@ async def audit_store(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/sync-customers")
+async def sync_all_stores(full_sync: bool = False):
+    """Sync customers of all configured stores concurrently
+
+    Each store syncs incrementally from its own checkpoint; pass
+    full_sync=true to walk every customer again.
+
+    Note: Using default user_id=1 for testing. In production, re-enable authentication.
+    """
+    try:
+        return await shopify_service.sync_all_stores(user_id=1, full_sync=full_sync)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/stores/{store_id}/sync-customers", response_model=ShopifySyncResponse)
 async def sync_customers_to_leads(
     store_id: int,
+    full_sync: bool = False,
     db: Session = Depends(get_db)
 ):
     """Sync Shopify customers to marketing leads database
 
     This will:
-    1. Fetch customers from Shopify store
-    2. Import them as leads in the marketing system
+    1. Fetch every page of customers updated since the last sync
+       (all customers on the first sync or with full_sync=true)
+    2. Upsert them as leads in the marketing system
     3. Set email consent based on accepts_marketing flag
-    4. Skip duplicate emails
+    4. Merge duplicate emails into the existing leads
 
     Returns sync statistics (synced, skipped, errors)
 
@@ -77,7 +94,8 @@ async def sync_customers_to_leads(
         result = await shopify_service.sync_customers_to_leads(
             store_id=store_id,
             user_id=1,  # Default user ID for testing
-            db=db
+            db=db,
+            full_sync=full_sync
         )
         return result
     except Exception as e:
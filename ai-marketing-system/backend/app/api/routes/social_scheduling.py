@@ -51,6 +51,7 @@ async def create_scheduled_post(
     db.add(new_post)
     db.commit()
     db.refresh(new_post)
+    social_scheduler.track_post(new_post)
     
     return new_post
 
@@ -105,6 +106,7 @@ async def schedule_from_content(
     
     db.commit()
     db.refresh(new_post)
+    social_scheduler.track_post(new_post)
     
     return new_post
 
@@ -149,6 +151,7 @@ async def bulk_schedule_posts(
     
     for post in created_posts:
         db.refresh(post)
+        social_scheduler.track_post(post)
     
     if errors:
         print(f"Bulk schedule had errors: {errors}")
@@ -294,6 +297,7 @@ async def update_scheduled_post(
     
     db.commit()
     db.refresh(post)
+    social_scheduler.track_post(post)
     
     return post
 
@@ -323,6 +327,7 @@ async def delete_scheduled_post(
     if post.status == "scheduled":
         post.status = "cancelled"
         db.commit()
+        social_scheduler.track_post(post)
     else:
         db.delete(post)
         db.commit()
@@ -351,44 +356,21 @@ async def post_now(
             detail=f"Can only post scheduled posts. Current status: {post.status}"
         )
     
-    # Update status
-    post.status = "posting"
-    db.commit()
+    # Claim the post so a dispatcher cannot publish it at the same time
+    claimed_at, claimed = social_scheduler.claim_due_posts(db, post_ids=[post.id])
+    if not claimed:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Post is already being published"
+        )
     
     # Post in background
-    background_tasks.add_task(post_scheduled_item, post.id, db)
+    background_tasks.add_task(social_scheduler.publish_claimed, db, claimed_at, claimed)
     
     db.refresh(post)
     return post
 
 
-async def post_scheduled_item(post_id: int, db: Session):
-    """Background task to post an item"""
-    
-    post = db.query(ScheduledPost).filter(ScheduledPost.id == post_id).first()
-    if not post:
-        return
-    
-    try:
-        result = await social_scheduler.post_to_platform(post, db)
-        
-        if result['success']:
-            post.status = "posted"
-            post.posted_at = datetime.utcnow()
-            post.platform_post_id = result.get('post_id')
-            post.platform_url = result.get('post_url')
-        else:
-            post.status = "failed"
-            post.error_message = result.get('error')
-        
-        db.commit()
-        
-    except Exception as e:
-        post.status = "failed"
-        post.error_message = str(e)
-        db.commit()
-
-
 @router.post("/{post_id}/metrics/refresh")
 async def refresh_metrics(
     post_id: int,
@@ -421,6 +403,30 @@ async def refresh_metrics(
     }
 
 
+@router.post("/metrics/refresh")
+async def refresh_all_metrics(
+    platform: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Refresh engagement metrics for every posted item, batching Graph API calls"""
+
+    query = db.query(ScheduledPost).filter(
+        ScheduledPost.status == "posted",
+        ScheduledPost.platform_post_id.isnot(None)
+    )
+    if platform:
+        query = query.filter(ScheduledPost.platform == platform)
+
+    posts = query.all()
+    refreshed = await social_scheduler.update_metrics_for_posts(posts, db)
+
+    return {
+        "message": "Metrics updated",
+        "total_posts": len(posts),
+        "refreshed": refreshed
+    }
+
+
 @router.get("/stats/overview")
 async def get_scheduling_stats(
     db: Session = Depends(get_db)
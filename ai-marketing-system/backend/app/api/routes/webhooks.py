@@ -335,13 +335,25 @@ async def receive_webhook(
             detail="Invalid JSON payload"
         )
     
+    # Providers such as SendGrid post arrays of events; these are stored in
+    # bulk and processed together rather than one request-scoped task each
+    if isinstance(payload, list):
+        if not all(isinstance(item, dict) for item in payload):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid JSON payload"
+            )
+
+        received = webhook_service.ingest_event_batch(db, webhook, payload)
+
+        # Without a standalone worker, process the batch in the background
+        if settings.WEBHOOK_INLINE_WORKER:
+            background_tasks.add_task(webhook_service.drain_queued_events)
+
+        return {"status": "received", "events_received": received}
+
     # Parse based on provider
-    if webhook.provider == "sendgrid":
-        parsed_data = webhook_service.parse_sendgrid_event(payload)
-    elif webhook.provider == "mailchimp":
-        parsed_data = webhook_service.parse_mailchimp_event(payload)
-    else:
-        parsed_data = webhook_service.parse_generic_event(payload)
+    parsed_data = webhook_service.parse_event(webhook.provider, payload)
     
     # Create webhook event
     webhook_event = WebhookEvent(
@@ -34,6 +34,21 @@ class Settings(BaseSettings):
     SMTP_PASSWORD: str = ""
     SMTP_FROM_EMAIL: str = ""
     SMTP_FROM_NAME: str = "AI Marketing System"
+    SMTP_POOL_SIZE: int = 5  # Concurrent authenticated SMTP connections
+    SMTP_MAX_MESSAGES_PER_CONNECTION: int = 100  # Reconnect after this many messages
+    SMTP_TIMEOUT: int = 30
+    EMAIL_LOG_FLUSH_SIZE: int = 200  # Buffered email log rows per bulk insert
+    EMAIL_LOG_FLUSH_MS: int = 1000  # Flush buffered email logs at least this often
+
+    # Outbound Email Queue
+    EMAIL_QUEUE_INLINE_WORKER: bool = True  # Drain the queue in-process after a campaign send
+    EMAIL_QUEUE_BATCH_SIZE: int = 100  # Messages claimed per worker batch
+    EMAIL_QUEUE_LEASE_SECONDS: int = 300  # Claimed messages are retried after this
+    EMAIL_QUEUE_MAX_ATTEMPTS: int = 3
+    EMAIL_QUEUE_RETRY_SECONDS: int = 60  # Doubles with each failed attempt
+    EMAIL_QUEUE_POLL_SECONDS: float = 2.0
+    EMAIL_PROVIDER_RATE_PER_SECOND: float = 10.0  # Per worker, 0 = unlimited
+    EMAIL_DOMAIN_RATE_PER_SECOND: float = 2.0  # Per worker and recipient domain, 0 = unlimited
 
     # Shopify Integration
     SHOPIFY_STORE_URL_1: str = ""
@@ -42,12 +57,17 @@ class Settings(BaseSettings):
     SHOPIFY_STORE_URL_2: str = ""
     SHOPIFY_API_KEY_2: str = ""
     SHOPIFY_ACCESS_TOKEN_2: str = ""
+    SHOPIFY_LEAK_RATE_PER_SECOND: float = 2.0  # REST call bucket leak rate (4.0 on Shopify Plus)
+    SHOPIFY_MAX_RETRIES: int = 3  # Retries of a throttled (429) request
 
     # Meta/Facebook Configuration
     META_APP_ID: str = ""
     META_APP_SECRET: str = ""
     META_ACCESS_TOKEN: str = ""
     META_PIXEL_ID: str = ""  # Optional: For Meta Pixel tracking
+    META_BATCH_MAX_SIZE: int = 50  # Graph API sub-requests per batch (at most 50)
+    META_BATCH_FLUSH_MS: int = 25  # Longest a queued Graph API call waits for its batch to fill
+    META_BATCH_TIMEOUT_SECONDS: float = 120.0  # Longest a caller waits for its batched Graph API response
 
     # Google Analytics
     GA_MEASUREMENT_ID: str = ""
@@ -61,6 +81,58 @@ class Settings(BaseSettings):
     # File Storage
     UPLOAD_DIR: str = "./data/uploads"
     MAX_UPLOAD_SIZE: int = 10485760  # 10MB
+    IMAGE_THUMBNAIL_WIDTHS: List[int] = [256, 512]  # WebP thumbnails rendered for saved images
+    IMAGE_WEBP_QUALITY: int = 80
+    IMAGE_PROCESS_WORKERS: int = 2  # Processes rendering image variants
+    BLOB_GC_GRACE_SECONDS: int = 86400  # Unreferenced blobs younger than this are kept
+    BLOB_GC_INTERVAL_SECONDS: int = 86400
+
+    # Scheduler
+    SCHEDULER_ENABLED: bool = True  # Fire scheduled work when due instead of polling
+    SCHEDULER_RESYNC_SECONDS: float = 300.0  # Reload pending items to pick up writes from other processes
+
+    # LLM Response Cache
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_PATH: str = "./data/llm_cache.db"
+    LLM_CACHE_TTL_SECONDS: int = 604800  # 7 days
+    LLM_CACHE_MAX_ENTRIES: int = 10000  # Least recently used responses are evicted beyond this
+
+    # Outreach Sequences
+    OUTREACH_INLINE_WORKER: bool = False  # Send due sequence steps from inside the API process; opt in, since past-due steps go out on start
+    OUTREACH_CONCURRENCY: int = 20  # Enrollments processed at once
+    OUTREACH_AI_CONCURRENCY: int = 8  # Message generation calls in flight to the AI provider
+    OUTREACH_SMTP_CONCURRENCY: int = 4  # Outreach sends in flight to the SMTP server
+    OUTREACH_STEP_LEASE_SECONDS: int = 600  # A failed step is retried after this
+    OUTREACH_CLAIM_BATCH_SIZE: int = 100  # Enrollments leased per claim
+    OUTREACH_PROMPT_BATCH_SIZE: int = 10  # Leads per message generation request; 1 disables batching
+
+    # Webhook Ingestion
+    WEBHOOK_INLINE_WORKER: bool = True  # Process batched events in-process after they are received
+    WEBHOOK_BATCH_SIZE: int = 500  # Queued events claimed and processed together
+    WEBHOOK_LEASE_SECONDS: int = 300  # Claimed events are queued again after this
+    WEBHOOK_POLL_SECONDS: float = 2.0
+
+    # Social Posting
+    SOCIAL_POST_INLINE_WORKER: bool = False  # Publish due auto-posts from inside the API process; opt in, since past-due posts go out on start
+    SOCIAL_POST_BATCH_SIZE: int = 500  # Posts claimed per dispatch
+    SOCIAL_POST_CONCURRENCY: int = 5  # Posts published at once per platform
+    SOCIAL_POST_LEASE_SECONDS: int = 300  # Renewed while publishing; posts left posting this long after are marked failed
+    SOCIAL_POST_POLL_SECONDS: float = 15.0
+
+    # Lead Import
+    LEAD_IMPORT_INLINE_WORKER: bool = True  # Process import jobs inside the API process
+    LEAD_IMPORT_CHUNK_SIZE: int = 1000  # Rows per bulk upsert and checkpoint
+    LEAD_IMPORT_LEASE_SECONDS: int = 120  # A job is resumed elsewhere if not renewed in time
+    LEAD_IMPORT_MAX_ATTEMPTS: int = 3
+    LEAD_IMPORT_POLL_SECONDS: float = 2.0
+    LEAD_IMPORT_SPOOL_DIR: str = "./data/imports"  # Uploads awaiting import; keep outside UPLOAD_DIR, which is served
+
+    # Lead Scoring
+    INCREMENTAL_LEAD_SCORING: bool = True  # Update scores as engagements are tracked
+    SCORE_DECAY_INLINE_WORKER: bool = False  # Rescore leads from inside the API process as recency points lapse; opt in, since overdue leads are rescored on start
+
+    # Segment Bitmap Index
+    SEGMENT_BITMAP_PATH: str = "./data/segment_bitmaps.bin"
 
     # Rate Limiting
     RATE_LIMIT_PER_MINUTE: int = 60
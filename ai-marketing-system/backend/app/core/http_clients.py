@@ -0,0 +1,175 @@
+"""
+Shared HTTP Clients
+
+Outbound integrations borrow long-lived httpx clients from this registry
+instead of opening a client per call, so connection pools, keep-alive
+connections and TLS sessions survive between requests. Each integration
+has its own client with its own timeouts, connection limits and retry
+policy. Clients are created by start() in the API lifespan (or on first
+use in workers and scripts) and closed by close() on shutdown.
+"""
+
+import asyncio
+import importlib.util
+import random
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+
+
+# Requests that can be repeated without side effects
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# Retry-After values above this are not worth waiting for inline
+MAX_RETRY_AFTER_SECONDS = 30.0
+
+
+class ClientPolicy:
+    """Timeouts, pool limits and retry behaviour of one integration's client"""
+
+    def __init__(
+        self,
+        timeout: float,
+        connect_timeout: float = 10.0,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        connect_retries: int = 2,
+        max_retries: int = 2,
+        retry_statuses: Tuple[int, ...] = (429, 502, 503, 504),
+        backoff_seconds: float = 0.5,
+        follow_redirects: bool = False
+    ):
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_retries = connect_retries  # Connection failures; safe for any method
+        self.max_retries = max_retries  # Retryable responses to idempotent requests
+        self.retry_statuses = retry_statuses
+        self.backoff_seconds = backoff_seconds
+        self.follow_redirects = follow_redirects
+
+
+# Most integrations talk to a single host, so pool limits are effectively per host
+POLICIES: Dict[str, ClientPolicy] = {
+    # Graph API: social posting, lead ads, experiments, custom audiences, pixel events
+    "meta": ClientPolicy(timeout=60.0, max_connections=50, max_keepalive_connections=20),
+    # OpenRouter completions and image generation are slow to respond
+    "openrouter": ClientPolicy(timeout=120.0, max_connections=20, max_retries=1, backoff_seconds=2.0),
+    # Shopify paces and retries 429s itself from its call limit header
+    "shopify": ClientPolicy(timeout=30.0, max_connections=10, retry_statuses=(502, 503, 504)),
+    "google_analytics": ClientPolicy(timeout=30.0, max_connections=20),
+    # Arbitrary hosts, e.g. generated images to download
+    "downloads": ClientPolicy(timeout=60.0, max_connections=10, max_retries=1, follow_redirects=True),
+}
+
+
+class RetryTransport(httpx.AsyncBaseTransport):
+    """Retries idempotent requests on retryable statuses with exponential backoff"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, policy: ClientPolicy):
+        self.transport = transport
+        self.policy = policy
+
+    def _delay(self, response: httpx.Response, attempt: int) -> float:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), MAX_RETRY_AFTER_SECONDS)
+            except ValueError:
+                pass
+        backoff = self.policy.backoff_seconds * (2 ** attempt)
+        return backoff + random.uniform(0, backoff / 2)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            response = await self.transport.handle_async_request(request)
+
+            if (
+                response.status_code not in self.policy.retry_statuses
+                or request.method not in IDEMPOTENT_METHODS
+                or attempt >= self.policy.max_retries
+            ):
+                return response
+
+            delay = self._delay(response, attempt)
+            await response.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class HTTPClientRegistry:
+    """Application-scoped httpx clients, one per integration"""
+
+    def __init__(self, policies: Optional[Dict[str, ClientPolicy]] = None):
+        self.policies = policies or POLICIES
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._loops: Dict[str, asyncio.AbstractEventLoop] = {}
+
+    @staticmethod
+    def http2_available() -> bool:
+        return importlib.util.find_spec("h2") is not None
+
+    def _create(self, name: str) -> httpx.AsyncClient:
+        policy = self.policies[name]
+        http2 = self.http2_available()
+        limits = httpx.Limits(
+            max_connections=policy.max_connections,
+            max_keepalive_connections=policy.max_keepalive_connections,
+            keepalive_expiry=policy.keepalive_expiry
+        )
+        transport = httpx.AsyncHTTPTransport(http2=http2, limits=limits, retries=policy.connect_retries)
+
+        return httpx.AsyncClient(
+            transport=RetryTransport(transport, policy),
+            timeout=httpx.Timeout(policy.timeout, connect=policy.connect_timeout),
+            follow_redirects=policy.follow_redirects
+        )
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """Shared client for an integration, created on first use"""
+        if name not in self.policies:
+            raise KeyError(f"Unknown HTTP integration: {name}")
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        client = self._clients.get(name)
+        # Pooled connections belong to the event loop that opened them
+        if client is None or client.is_closed or (loop is not None and self._loops.get(name) not in (None, loop)):
+            client = self._create(name)
+            self._clients[name] = client
+        if loop is not None:
+            self._loops[name] = loop
+        return client
+
+    @asynccontextmanager
+    async def borrow(self, name: str) -> AsyncIterator[httpx.AsyncClient]:
+        """Use the shared client in an `async with` block without closing it afterwards"""
+        yield self.get(name)
+
+    def start(self):
+        """Create every integration's client up front"""
+        for name in self.policies:
+            self.get(name)
+
+    async def close(self):
+        """Close all clients and their connection pools"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        self._loops.clear()
+        for client in clients:
+            await client.aclose()
+
+
+# Singleton instance
+http_clients = HTTPClientRegistry()
@@ -1,27 +1,32 @@
 # Import all models to register them with SQLAlchemy
 from app.models.user import User
 from app.models.lead import Lead
+from app.models.lead_import_job import LeadImportJob, LeadImportJobStatus
 from app.models.campaign import Campaign, EmailLog
+from app.models.email_queue import OutboundEmail, OutboundEmailStatus
 from app.models.content import GeneratedContent
 from app.models.email_template import EmailTemplate
 from app.models.scheduled_post import ScheduledPost
-from app.models.segment import Segment
+from app.models.segment import Segment, SegmentMembership
 from app.models.ab_test import ABTest, ABTestVariant
 from app.models.webhook import Webhook, WebhookEvent
+from app.models.shopify_sync import ShopifySyncCheckpoint
 from app.models.outreach import OutreachMessage, OutreachSequence, OutreachEnrollment
 from app.models.retargeting import (
     RetargetingAudience, RetargetingEvent, RetargetingCampaign, RetargetingPerformance
 )
 from app.models.lead_tracking import (
-    LeadLifecycle, LeadScore, EngagementHistory,
+    LeadLifecycle, LeadScore, LeadScoreAggregate, EngagementHistory,
     LeadAttribution, LeadJourney, LeadActivitySummary
 )
 
 __all__ = [
-    "User", "Lead", "Campaign", "EmailLog", "GeneratedContent", "EmailTemplate",
-    "ScheduledPost", "Segment", "ABTest", "ABTestVariant", "Webhook", "WebhookEvent",
+    "User", "Lead", "LeadImportJob", "LeadImportJobStatus", "Campaign", "EmailLog", "OutboundEmail", "OutboundEmailStatus",
+    "GeneratedContent", "EmailTemplate",
+    "ScheduledPost", "Segment", "SegmentMembership", "ABTest", "ABTestVariant", "Webhook", "WebhookEvent",
+    "ShopifySyncCheckpoint",
     "OutreachMessage", "OutreachSequence", "OutreachEnrollment",
     "RetargetingAudience", "RetargetingEvent", "RetargetingCampaign", "RetargetingPerformance",
-    "LeadLifecycle", "LeadScore", "EngagementHistory",
+    "LeadLifecycle", "LeadScore", "LeadScoreAggregate", "EngagementHistory",
     "LeadAttribution", "LeadJourney", "LeadActivitySummary"
 ]
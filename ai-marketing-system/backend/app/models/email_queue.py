@@ -0,0 +1,50 @@
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, JSON
+from sqlalchemy.sql import func
+from app.db.base import Base
+import enum
+
+
+class OutboundEmailStatus(str, enum.Enum):
+    QUEUED = "queued"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+
+
+class OutboundEmail(Base):
+    """Durable outbound email queue entry, delivered at least once by queue workers"""
+
+    __tablename__ = "outbound_emails"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Deduplicates enqueues, e.g. "campaign:12:lead:345"
+    idempotency_key = Column(String(255), unique=True, index=True, nullable=False)
+
+    campaign_id = Column(Integer, ForeignKey("campaigns.id"), nullable=True, index=True)
+    lead_id = Column(Integer, ForeignKey("leads.id"), nullable=True)
+
+    # Message; campaign emails leave subject/body empty and are rendered
+    # from the campaign and lead_data when sent
+    to_email = Column(String, nullable=False)
+    subject = Column(String, nullable=True)
+    body = Column(Text, nullable=True)
+    is_html = Column(Boolean, default=True)
+    lead_data = Column(JSON, nullable=True)
+
+    # Delivery state
+    status = Column(String(20), default=OutboundEmailStatus.QUEUED, index=True)
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, server_default=func.now(), index=True)
+    last_error = Column(Text, nullable=True)
+
+    # Lease held by the worker currently sending this message
+    locked_by = Column(String(64), nullable=True, index=True)
+    locked_until = Column(DateTime, nullable=True)
+
+    # Metadata
+    created_at = Column(DateTime, server_default=func.now())
+    sent_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<OutboundEmail(id={self.id}, to='{self.to_email}', status='{self.status}')>"
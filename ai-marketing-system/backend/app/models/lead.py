@@ -33,18 +33,18 @@ class Lead(Base):
     location = Column(String)
 
     # Consent tracking
-    email_consent = Column(Boolean, default=False)
+    email_consent = Column(Boolean, default=False, index=True)
     sms_consent = Column(Boolean, default=False)
     consent_date = Column(DateTime(timezone=True))
     consent_source = Column(String)
 
     # Lead information
     source = Column(String, default=LeadSource.MANUAL)
-    status = Column(String, default=LeadStatus.NEW)
+    status = Column(String, default=LeadStatus.NEW, index=True)
 
     # Interests and segmentation
     interests = Column(Text)  # JSON stored as text
-    sport_type = Column(String)  # cycling, triathlon, running
+    sport_type = Column(String, index=True)  # cycling, triathlon, running
     customer_type = Column(String)  # athlete, coach, team, bike_fitter
 
     # Engagement tracking
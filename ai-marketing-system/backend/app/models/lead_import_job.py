@@ -0,0 +1,52 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON
+from sqlalchemy.sql import func
+from app.db.base import Base
+import enum
+
+
+class LeadImportJobStatus(str, enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class LeadImportJob(Base):
+    """Lead import processed in the background from a spooled upload"""
+
+    __tablename__ = "lead_import_jobs"
+
+    id = Column(String(32), primary_key=True)
+
+    # Upload
+    filename = Column(String(255), nullable=False)
+    file_path = Column(String, nullable=False)
+    source = Column(String, default="import")
+
+    # Progress; processed_rows is the checkpoint of the last committed data row
+    status = Column(String(20), default=LeadImportJobStatus.PENDING, index=True)
+    total_rows = Column(Integer, nullable=True)  # Estimated from the upload
+    processed_rows = Column(Integer, default=0)
+    imported = Column(Integer, default=0)
+    updated = Column(Integer, default=0)  # Existing leads with empty columns filled in
+    skipped = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    errors = Column(JSON, default=list)
+    attempts = Column(Integer, default=0)
+
+    # Lease held by the worker processing this job
+    locked_by = Column(String(64), nullable=True)
+    locked_until = Column(DateTime, nullable=True)
+
+    # Current run, for throughput after a resume
+    run_started_at = Column(DateTime, nullable=True)
+    run_start_row = Column(Integer, default=0)
+
+    # Timestamps
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<LeadImportJob(id='{self.id}', status='{self.status}', processed_rows={self.processed_rows})>"
@@ -116,6 +116,20 @@ class LeadScore(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
 
+class LeadScoreAggregate(Base):
+    """Running engagement counts used to update a lead's score incrementally"""
+    __tablename__ = "lead_score_aggregates"
+
+    lead_id = Column(Integer, ForeignKey("leads.id", ondelete="CASCADE"), primary_key=True)
+
+    # Engagement counts per UTC day and type for the longest scoring window
+    # Example: {"2024-05-01": {"email_opened": 2, "purchase_made": 1}}
+    daily_counts = Column(JSON, nullable=False, default=dict)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
 class EngagementHistory(Base):
     """Detailed log of all lead interactions"""
     __tablename__ = "engagement_history"
@@ -14,10 +14,13 @@ class Segment(Base):
     
     # Segment criteria stored as JSON
     # Format: {
-    #   "operator": "AND" | "OR",
+    #   "operator": "AND" | "OR" | "NOT",
     #   "conditions": [
     #     {"field": "sport_type", "operator": "equals", "value": "cycling"},
-    #     {"field": "status", "operator": "in", "value": ["new", "active"]},
+    #     {"operator": "OR", "conditions": [
+    #       {"field": "status", "operator": "in", "value": ["new", "active"]},
+    #       ...
+    #     ]},
     #     ...
     #   ]
     # }
@@ -48,3 +51,16 @@ class Segment(Base):
     def __repr__(self):
         return f"<Segment(id={self.id}, name='{self.name}', lead_count={self.lead_count})>"
 
+
+
+class SegmentMembership(Base):
+    """Materialized lead membership for a segment, maintained incrementally"""
+    
+    __tablename__ = "segment_memberships"
+
+    segment_id = Column(Integer, ForeignKey("segments.id", ondelete="CASCADE"), primary_key=True)
+    lead_id = Column(Integer, ForeignKey("leads.id", ondelete="CASCADE"), primary_key=True, index=True)
+    created_at = Column(DateTime, server_default=func.now())
+
+    def __repr__(self):
+        return f"<SegmentMembership(segment_id={self.segment_id}, lead_id={self.lead_id})>"
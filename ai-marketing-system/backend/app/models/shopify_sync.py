@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from app.db.base import Base
+
+
+class ShopifySyncCheckpoint(Base):
+    """Incremental sync position per store and resource"""
+
+    __tablename__ = "shopify_sync_checkpoints"
+
+    store_id = Column(Integer, primary_key=True)
+    resource = Column(String(32), primary_key=True)  # e.g. customers
+
+    # Newest Shopify updated_at seen; the next sync passes it as updated_at_min
+    updated_at_min = Column(String(40), nullable=True)
+    last_synced_at = Column(DateTime, nullable=True)
+    records_synced = Column(Integer, default=0)
+
+    def __repr__(self):
+        return f"<ShopifySyncCheckpoint(store_id={self.store_id}, resource='{self.resource}', updated_at_min='{self.updated_at_min}')>"
@@ -13,6 +13,7 @@ class ContentGenerationRequest(BaseModel):
     include_image: bool = False
     image_style: Optional[str] = "professional product photography"
     product_image_base64: Optional[str] = None  # User's product image to enhance/edit
+    fresh: bool = False  # Skip cached AI responses for a new variation
 
 
 class ContentResponse(BaseModel):
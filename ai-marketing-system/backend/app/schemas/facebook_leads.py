@@ -65,6 +65,7 @@ class FacebookSyncResponse(BaseModel):
     """Response after syncing Facebook leads"""
     success: bool
     imported: int
+    updated: int = 0
     skipped: int
     errors: List[str]
     message: str
@@ -148,6 +148,7 @@ class PersonalizedMessageRequest(BaseModel):
     message_type: str = "intro"
     template: Optional[str] = None
     additional_context: Optional[str] = None
+    fresh: bool = False  # Skip cached AI responses for a new variation
 
 
 class PersonalizedMessageResponse(BaseModel):
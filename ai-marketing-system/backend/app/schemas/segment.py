@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Union
 from datetime import datetime
 
 
@@ -11,9 +11,9 @@ class SegmentCondition(BaseModel):
 
 
 class SegmentCriteria(BaseModel):
-    """Segment criteria with multiple conditions"""
-    operator: str = Field(default="AND", description="Logic operator: AND or OR")
-    conditions: List[SegmentCondition] = Field(..., description="List of conditions")
+    """Segment criteria with multiple conditions and nested condition groups"""
+    operator: str = Field(default="AND", description="Logic operator: AND, OR or NOT (negates the AND of its conditions)")
+    conditions: List[Union[SegmentCondition, "SegmentCriteria"]] = Field(..., description="List of conditions or nested groups")
 
 
 class SegmentBase(BaseModel):
@@ -82,6 +82,14 @@ class SegmentFieldsResponse(BaseModel):
     fields: List[SegmentField]
 
 
+class SegmentOverlapResponse(BaseModel):
+    """Lead count for a combination of segments and lead filters"""
+    include_segment_ids: List[int]
+    exclude_segment_ids: List[int]
+    filters: Dict[str, Any]
+    lead_count: int
+
+
 class SegmentStatsResponse(BaseModel):
     """Segment statistics"""
     total_segments: int
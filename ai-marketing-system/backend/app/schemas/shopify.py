@@ -81,7 +81,10 @@ class ShopifySyncResponse(BaseModel):
     """Response from customer sync operation"""
     success: bool
     synced: int
+    updated: int = 0
     skipped: int
     errors: int
     total_processed: Optional[int] = 0
+    pages: Optional[int] = 0
+    updated_at_min: Optional[str] = None
     error: Optional[str] = None
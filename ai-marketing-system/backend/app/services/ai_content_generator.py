@@ -1,10 +1,12 @@
 import httpx
 import json
-import os
-import base64
-from typing import Optional, Dict, Any
-from datetime import datetime
+from typing import AsyncIterator, Callable, Optional, Dict, Any, Tuple
+from fastapi.concurrency import run_in_threadpool
 from app.core.config import settings
+from app.core.http_clients import http_clients
+from app.services.image_store import image_store
+from app.services.json_stream import JSONFieldStream
+from app.services.llm_cache import llm_cache
 
 
 class AIContentGenerator:
@@ -16,15 +18,15 @@ class AIContentGenerator:
         self.text_model = settings.AI_MODEL_TEXT
         self.image_model = settings.AI_MODEL_IMAGE
 
-    async def generate_social_post(
+    def social_post_prompt(
         self,
         topic: str,
         platform: str,
         tone: str = "professional",
         target_audience: str = "cyclists and triathletes",
         additional_context: Optional[str] = None
-    ) -> Dict[str, str]:
-        """Generate a social media post"""
+    ) -> str:
+        """Prompt for a social media post"""
 
         platform_guidelines = {
             "facebook": "Facebook post (max 400 chars recommended)",
@@ -59,18 +61,31 @@ Return the response ONLY as valid JSON in this exact format (no markdown, no ext
 IMPORTANT: Return ONLY the JSON object, nothing else before or after it.
 """
 
-        result = await self._call_openrouter(prompt, self.text_model)
-        return self._parse_json_response(result)
+        return prompt
 
-    async def generate_email_content(
+    async def generate_social_post(
+        self,
+        topic: str,
+        platform: str,
+        tone: str = "professional",
+        target_audience: str = "cyclists and triathletes",
+        additional_context: Optional[str] = None,
+        fresh: bool = False
+    ) -> Dict[str, str]:
+        """Generate a social media post"""
+
+        prompt = self.social_post_prompt(topic, platform, tone, target_audience, additional_context)
+        return await self._generate_json(prompt, self.text_model, fresh=fresh)
+
+    def email_content_prompt(
         self,
         subject_topic: str,
         purpose: str,
         tone: str = "professional",
         target_audience: str = "cyclists and triathletes",
         additional_context: Optional[str] = None
-    ) -> Dict[str, str]:
-        """Generate email marketing content"""
+    ) -> str:
+        """Prompt for email marketing content"""
 
         prompt = f"""Generate a compelling marketing email.
 
@@ -94,18 +109,31 @@ Return the response ONLY as valid JSON in this exact format (no markdown, no ext
 IMPORTANT: Return ONLY the JSON object, nothing else before or after it.
 """
 
-        result = await self._call_openrouter(prompt, self.text_model)
-        return self._parse_json_response(result)
+        return prompt
 
-    async def generate_ad_copy(
+    async def generate_email_content(
+        self,
+        subject_topic: str,
+        purpose: str,
+        tone: str = "professional",
+        target_audience: str = "cyclists and triathletes",
+        additional_context: Optional[str] = None,
+        fresh: bool = False
+    ) -> Dict[str, str]:
+        """Generate email marketing content"""
+
+        prompt = self.email_content_prompt(subject_topic, purpose, tone, target_audience, additional_context)
+        return await self._generate_json(prompt, self.text_model, fresh=fresh)
+
+    def ad_copy_prompt(
         self,
         product_name: str,
         product_description: str,
         platform: str = "facebook",
         tone: str = "enthusiastic",
         target_audience: str = "cyclists and triathletes"
-    ) -> Dict[str, str]:
-        """Generate ad copy for paid advertising"""
+    ) -> str:
+        """Prompt for paid advertising copy"""
 
         prompt = f"""Generate compelling ad copy for {platform} advertising.
 
@@ -130,8 +158,21 @@ Return the response ONLY as valid JSON in this exact format (no markdown, no ext
 IMPORTANT: Return ONLY the JSON object, nothing else before or after it.
 """
 
-        result = await self._call_openrouter(prompt, self.text_model)
-        return self._parse_json_response(result)
+        return prompt
+
+    async def generate_ad_copy(
+        self,
+        product_name: str,
+        product_description: str,
+        platform: str = "facebook",
+        tone: str = "enthusiastic",
+        target_audience: str = "cyclists and triathletes",
+        fresh: bool = False
+    ) -> Dict[str, str]:
+        """Generate ad copy for paid advertising"""
+
+        prompt = self.ad_copy_prompt(product_name, product_description, platform, tone, target_audience)
+        return await self._generate_json(prompt, self.text_model, fresh=fresh)
 
     async def generate_image_prompt(
         self,
@@ -191,7 +232,7 @@ Return only the image prompt text, nothing else.
             }
         }
 
-        async with httpx.AsyncClient(timeout=120.0) as client:
+        async with http_clients.borrow("openrouter") as client:
             try:
                 response = await client.post(
                     f"{self.base_url}/chat/completions",
@@ -294,7 +335,7 @@ Return only the image prompt text, nothing else.
         
         print(f"Enhancing product image with prompt: {enhancement_prompt[:100]}...")
         
-        async with httpx.AsyncClient(timeout=120.0) as client:
+        async with http_clients.borrow("openrouter") as client:
             try:
                 response = await client.post(
                     f"{self.base_url}/chat/completions",
@@ -336,21 +377,11 @@ Return only the image prompt text, nothing else.
     async def _download_and_save_image(self, image_url: str) -> str:
         """Download image from URL and save to uploads directory"""
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
+            async with http_clients.borrow("downloads") as client:
                 response = await client.get(image_url)
                 response.raise_for_status()
 
-                # Generate unique filename
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"generated_{timestamp}.png"
-                filepath = os.path.join(settings.UPLOAD_DIR, filename)
-
-                # Save image
-                with open(filepath, "wb") as f:
-                    f.write(response.content)
-
-                # Return relative URL path
-                return f"/uploads/{filename}"
+                return await image_store.save_bytes(response.content)
 
         except Exception as e:
             print(f"Error downloading image: {str(e)}")
@@ -359,21 +390,7 @@ Return only the image prompt text, nothing else.
     async def _save_base64_image(self, base64_data: str) -> str:
         """Save base64 encoded image to uploads directory"""
         try:
-            # Decode base64 data
-            image_bytes = base64.b64decode(base64_data)
-
-            # Generate unique filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"generated_{timestamp}.png"
-            filepath = os.path.join(settings.UPLOAD_DIR, filename)
-
-            # Save image
-            with open(filepath, "wb") as f:
-                f.write(image_bytes)
-
-            # Return relative URL path
-            return f"/uploads/{filename}"
-
+            return await image_store.save_base64(base64_data)
         except Exception as e:
             print(f"Error saving base64 image: {str(e)}")
             raise Exception(f"Failed to save image: {str(e)}")
@@ -381,30 +398,7 @@ Return only the image prompt text, nothing else.
     async def _save_data_url_image(self, data_url: str) -> str:
         """Save base64 data URL image (format: data:image/png;base64,xxxxx) to uploads directory"""
         try:
-            # Extract base64 data from data URL
-            # Format: data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAA...
-            if "base64," in data_url:
-                base64_data = data_url.split("base64,")[1]
-            else:
-                raise Exception("Invalid data URL format - no base64 data found")
-
-            # Decode base64 data
-            image_bytes = base64.b64decode(base64_data)
-
-            # Generate unique filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"generated_{timestamp}.png"
-            filepath = os.path.join(settings.UPLOAD_DIR, filename)
-
-            # Save image
-            with open(filepath, "wb") as f:
-                f.write(image_bytes)
-
-            print(f"Image saved successfully to: {filepath}")
-
-            # Return relative URL path
-            return f"/uploads/{filename}"
-
+            return await image_store.save_data_url(data_url)
         except Exception as e:
             print(f"Error saving data URL image: {str(e)}")
             raise Exception(f"Failed to save image: {str(e)}")
@@ -432,6 +426,156 @@ Return only the improved content, nothing else.
         result = await self._call_openrouter(prompt, self.text_model)
         return result.strip()
 
+    async def _generate_json(
+        self,
+        prompt: str,
+        model: str,
+        fresh: bool = False,
+        limiter=None,
+        validate: Optional[Callable[[Dict[str, Any]], bool]] = None,
+        max_tokens: int = 2000,
+        temperature: float = 0.7
+    ) -> Dict[str, Any]:
+        """
+        Call the model for a JSON response through the response cache.
+
+        fresh skips the cached response (the new one replaces it), and
+        limiter is an optional async context manager held around the API
+        call only, so cache hits never wait on it. Responses failing
+        validate are returned but not cached.
+        """
+        use_cache = settings.LLM_CACHE_ENABLED
+        key = llm_cache.make_key(model, prompt, max_tokens=max_tokens, temperature=temperature)
+
+        if use_cache and not fresh:
+            cached = await run_in_threadpool(llm_cache.get, key)
+            if cached is not None:
+                return self._parse_json_response(cached)
+
+        if limiter is not None:
+            async with limiter:
+                result = await self._call_openrouter(prompt, model, max_tokens, temperature)
+        else:
+            result = await self._call_openrouter(prompt, model, max_tokens, temperature)
+
+        parsed = self._parse_json_response(result)
+
+        # Unparseable replies come back as {"content": ...} and are not worth repeating
+        if use_cache and set(parsed) != {"content"} and (validate is None or validate(parsed)):
+            await run_in_threadpool(llm_cache.set, key, model, result)
+
+        return parsed
+
+    async def stream_json(
+        self,
+        prompt: str,
+        model: str,
+        fresh: bool = False,
+        max_tokens: int = 2000,
+        temperature: float = 0.7
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Stream a JSON response through the response cache.
+
+        Yields ("token", text) as the model writes, ("field", {"name", "value"})
+        as each top-level field of the JSON object completes, and finally
+        ("result", parsed). Cache hits replay the fields without tokens.
+        """
+        use_cache = settings.LLM_CACHE_ENABLED
+        key = llm_cache.make_key(model, prompt, max_tokens=max_tokens, temperature=temperature)
+
+        if use_cache and not fresh:
+            cached = await run_in_threadpool(llm_cache.get, key)
+            if cached is not None:
+                parsed = self._parse_json_response(cached)
+                for name, value in parsed.items():
+                    yield "field", {"name": name, "value": value}
+                yield "result", parsed
+                return
+
+        fields = JSONFieldStream()
+        chunks = []
+        async for token in self._stream_openrouter(prompt, model, max_tokens, temperature):
+            chunks.append(token)
+            yield "token", token
+            for name, value in fields.feed(token):
+                yield "field", {"name": name, "value": value}
+
+        result = "".join(chunks)
+        if not result.strip():
+            raise Exception("OpenRouter API error: API returned empty content")
+
+        parsed = self._parse_json_response(result)
+
+        if use_cache and set(parsed) != {"content"}:
+            await run_in_threadpool(llm_cache.set, key, model, result)
+
+        yield "result", parsed
+
+    async def _stream_openrouter(
+        self,
+        prompt: str,
+        model: str,
+        max_tokens: int = 2000,
+        temperature: float = 0.7
+    ) -> AsyncIterator[str]:
+        """Make a streaming call to OpenRouter API, yielding content as it arrives"""
+
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": settings.BACKEND_URL,
+            "X-Title": settings.APP_NAME
+        }
+
+        payload = {
+            "model": model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True
+        }
+
+        print(f"Making streaming OpenRouter API call to model: {model}")
+
+        async with http_clients.borrow("openrouter") as client:
+            try:
+                async with client.stream(
+                    "POST",
+                    f"{self.base_url}/chat/completions",
+                    headers=headers,
+                    json=payload
+                ) as response:
+                    if response.is_error:
+                        await response.aread()
+                        print(f"Response body: {response.text}")
+                    response.raise_for_status()
+
+                    async for line in response.aiter_lines():
+                        # Server-sent events; lines starting with ":" are keep-alive comments
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+
+                        event = json.loads(data)
+                        if "error" in event:
+                            raise Exception(event["error"].get("message", str(event["error"])))
+
+                        choices = event.get("choices") or []
+                        content = choices[0].get("delta", {}).get("content") if choices else None
+                        if content:
+                            yield content
+            except httpx.HTTPError as e:
+                print(f"OpenRouter API HTTP error: {str(e)}")
+                raise Exception(f"OpenRouter API error: {str(e)}")
+
     async def _call_openrouter(
         self,
         prompt: str,
@@ -463,7 +607,7 @@ Return only the improved content, nothing else.
         print(f"Making OpenRouter API call to model: {model}")
         print(f"Prompt length: {len(prompt)} chars")
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
+        async with http_clients.borrow("openrouter") as client:
             try:
                 response = await client.post(
                     f"{self.base_url}/chat/completions",
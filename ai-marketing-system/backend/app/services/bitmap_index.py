@@ -0,0 +1,236 @@
+"""
+Lead Bitmap Index
+
+Keeps one bitmap of lead ids per segment, status, sport type and consent
+flag so segment counts, unions, intersections and exclusions are answered
+with bitwise operations instead of loading leads. Bitmaps are Python ints
+(bit N set = lead N is a member), persisted zlib-compressed to disk and
+rebuilt lazily whenever the database no longer matches the saved snapshot.
+"""
+
+import json
+import os
+import struct
+import threading
+import zlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.lead import Lead
+from app.models.segment import Segment, SegmentMembership
+
+
+# Bitmap keys
+ALL_LEADS = "all"
+EMAIL_CONSENT = "email_consent"
+SMS_CONSENT = "sms_consent"
+
+# Rows fetched per round trip while rebuilding
+REBUILD_BATCH_SIZE = 5000
+
+
+def segment_key(segment_id: int) -> str:
+    return f"segment:{segment_id}"
+
+
+def status_key(status: str) -> str:
+    return f"status:{status}"
+
+
+def sport_type_key(sport_type: str) -> str:
+    return f"sport_type:{sport_type}"
+
+
+class _BitmapBuilder:
+    """Collects lead ids into byte arrays before converting them to ints"""
+
+    def __init__(self, max_id: int):
+        self.size = max_id // 8 + 1
+        self.buffers: Dict[str, bytearray] = defaultdict(lambda: bytearray(self.size))
+
+    def add(self, key: str, lead_id: int):
+        self.buffers[key][lead_id >> 3] |= 1 << (lead_id & 7)
+
+    def build(self) -> Dict[str, int]:
+        return {key: int.from_bytes(buffer, "little") for key, buffer in self.buffers.items()}
+
+
+class LeadBitmapIndex:
+    """Compressed lead-id bitmaps for segment set algebra"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._bitmaps: Optional[Dict[str, int]] = None
+        self._fingerprint: Optional[List] = None
+        self._lock = threading.Lock()
+
+    # ============= Set Algebra =============
+
+    @staticmethod
+    def count(bitmap: int) -> int:
+        """Number of leads in a bitmap"""
+        return bitmap.bit_count()
+
+    @staticmethod
+    def lead_ids(bitmap: int) -> List[int]:
+        """Lead ids set in a bitmap, in ascending order"""
+        ids = []
+        data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+        for byte_index, byte in enumerate(data):
+            while byte:
+                low_bit = byte & -byte
+                ids.append(byte_index * 8 + low_bit.bit_length() - 1)
+                byte ^= low_bit
+        return ids
+
+    def get(self, key: str, db: Session) -> int:
+        """Bitmap for a key; unknown keys are empty"""
+        return self._load(db).get(key, 0)
+
+    def union(self, keys: Iterable[str], db: Session) -> int:
+        """Leads present under any of the keys"""
+        bitmaps = self._load(db)
+        result = 0
+        for key in keys:
+            result |= bitmaps.get(key, 0)
+        return result
+
+    def intersection(self, keys: Iterable[str], db: Session) -> int:
+        """Leads present under every key; all leads when no keys are given"""
+        bitmaps = self._load(db)
+        result = bitmaps.get(ALL_LEADS, 0)
+        for key in keys:
+            result &= bitmaps.get(key, 0)
+        return result
+
+    # ============= Maintenance =============
+
+    def invalidate(self):
+        """Drop the in-memory bitmaps so the next read checks the database"""
+        with self._lock:
+            self._bitmaps = None
+            self._fingerprint = None
+
+    def _current_fingerprint(self, db: Session) -> List:
+        """Cheap aggregates that change whenever leads or memberships change"""
+        lead_count, max_lead_id, last_lead_update, last_lead_created = db.query(
+            func.count(Lead.id), func.max(Lead.id), func.max(Lead.updated_at), func.max(Lead.created_at)
+        ).one()
+        membership_count, last_membership = db.query(
+            func.count(SegmentMembership.lead_id), func.max(SegmentMembership.created_at)
+        ).one()
+        segment_count, last_calculated = db.query(
+            func.count(Segment.id), func.max(Segment.last_calculated)
+        ).one()
+
+        return [
+            str(value) if value is not None else None
+            for value in (
+                lead_count, max_lead_id, last_lead_update, last_lead_created,
+                membership_count, last_membership, segment_count, last_calculated
+            )
+        ]
+
+    def _load(self, db: Session) -> Dict[str, int]:
+        """Return bitmaps matching the database, loading or rebuilding as needed"""
+        with self._lock:
+            fingerprint = self._current_fingerprint(db)
+
+            if self._bitmaps is not None and self._fingerprint == fingerprint:
+                return self._bitmaps
+
+            if self._bitmaps is None:
+                saved = self._read_file()
+                if saved and saved[0] == fingerprint:
+                    self._fingerprint, self._bitmaps = saved
+                    return self._bitmaps
+
+            self._bitmaps = self._rebuild(db)
+            self._fingerprint = fingerprint
+            self._write_file()
+            return self._bitmaps
+
+    def _rebuild(self, db: Session) -> Dict[str, int]:
+        """Build every bitmap from the leads and segment_memberships tables"""
+        max_id = db.query(func.max(Lead.id)).scalar() or 0
+        builder = _BitmapBuilder(max_id)
+
+        leads = db.query(
+            Lead.id, Lead.status, Lead.sport_type, Lead.email_consent, Lead.sms_consent
+        ).yield_per(REBUILD_BATCH_SIZE)
+
+        for lead_id, status, sport_type, email_consent, sms_consent in leads:
+            builder.add(ALL_LEADS, lead_id)
+            if status:
+                builder.add(status_key(status), lead_id)
+            if sport_type:
+                builder.add(sport_type_key(sport_type), lead_id)
+            if email_consent:
+                builder.add(EMAIL_CONSENT, lead_id)
+            if sms_consent:
+                builder.add(SMS_CONSENT, lead_id)
+
+        memberships = db.query(
+            SegmentMembership.segment_id, SegmentMembership.lead_id
+        ).filter(
+            SegmentMembership.lead_id <= max_id
+        ).yield_per(REBUILD_BATCH_SIZE)
+
+        for segment_id, lead_id in memberships:
+            builder.add(segment_key(segment_id), lead_id)
+
+        return builder.build()
+
+    # ============= Persistence =============
+
+    def _write_file(self):
+        """Save bitmaps as a JSON header followed by raw bitmap bytes, zlib-compressed"""
+        keys = []
+        chunks = []
+        for key, bitmap in self._bitmaps.items():
+            data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+            keys.append([key, len(data)])
+            chunks.append(data)
+
+        header = json.dumps({"fingerprint": self._fingerprint, "bitmaps": keys}).encode()
+        payload = zlib.compress(struct.pack("<I", len(header)) + header + b"".join(chunks))
+
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(payload)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Error saving segment bitmap index: {str(e)}")
+
+    def _read_file(self):
+        """Load (fingerprint, bitmaps) from disk, or None if missing or unreadable"""
+        try:
+            with open(self.path, "rb") as f:
+                payload = zlib.decompress(f.read())
+
+            (header_length,) = struct.unpack_from("<I", payload)
+            header = json.loads(payload[4:4 + header_length])
+
+            bitmaps = {}
+            offset = 4 + header_length
+            for key, length in header["bitmaps"]:
+                bitmaps[key] = int.from_bytes(payload[offset:offset + length], "little")
+                offset += length
+
+            return header["fingerprint"], bitmaps
+
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, struct.error, zlib.error) as e:
+            print(f"Ignoring unreadable segment bitmap index: {str(e)}")
+            return None
+
+
+# Singleton instance
+lead_bitmap_index = LeadBitmapIndex(settings.SEGMENT_BITMAP_PATH)
@@ -0,0 +1,279 @@
+"""
+Content-Addressed Blob Store
+
+Uploaded and generated images are stored once per distinct content, named
+after the SHA-256 of their bytes and sharded two levels deep so no
+directory grows past a few hundred files:
+
+    UPLOAD_DIR/blobs/ab/cd/abcd...<sha256>.png
+    UPLOAD_DIR/blobs/ab/cd/abcd...<sha256>_256.webp   (derived variant)
+
+Blobs are served from /api/content/blobs/<name>. A name never changes
+content, so responses carry the hash as a strong ETag and are cacheable
+forever; byte ranges and zero-copy sending (where the server supports it)
+come from Starlette's FileResponse. Blobs no longer referenced by any
+content, post or ad variant are removed by collect_garbage().
+"""
+
+import hashlib
+import os
+import re
+import time
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Iterator, Optional, Set
+
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.content import GeneratedContent
+from app.models.meta_ab_test import MetaABTestVariant
+from app.models.scheduled_post import ScheduledPost
+
+
+URL_PREFIX = "/api/content/blobs/"
+
+# <sha256>.<ext> for a stored blob, <sha256>_<width>.webp for a variant
+BLOB_NAME = re.compile(r"^([0-9a-f]{64})(?:_(\d+))?\.(png|jpg|gif|webp)$")
+BLOB_REFERENCE = re.compile(r"([0-9a-f]{64})(?:_\d+)?\.(?:png|jpg|gif|webp)\b")
+
+# Flat files written to UPLOAD_DIR before the blob store existed
+LEGACY_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+LEGACY_VARIANT_NAME = re.compile(r"^(generated_[0-9a-f]{64})(?:_\d+)?\.webp$")
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    """Sharded, content-addressed file storage under UPLOAD_DIR/blobs"""
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or os.path.join(settings.UPLOAD_DIR, "blobs")
+
+    @staticmethod
+    def url(name: str) -> str:
+        return f"{URL_PREFIX}{name}"
+
+    @staticmethod
+    def name_from_url(url: Optional[str]) -> Optional[str]:
+        """Blob name referenced by a stored URL, if any"""
+        if not url:
+            return None
+        match = BLOB_REFERENCE.search(url)
+        return match.group(0) if match else None
+
+    def path(self, name: str) -> str:
+        """Location of a blob; raises ValueError for names that are not blob names"""
+        match = BLOB_NAME.match(name)
+        if not match:
+            raise ValueError(f"Invalid blob name: {name}")
+        digest = match.group(1)
+        return os.path.join(self.root, digest[:2], digest[2:4], name)
+
+    async def put(self, data: bytes, extension: str, digest: Optional[str] = None) -> str:
+        """Store bytes under their hash, returning the blob name; identical content is stored once"""
+        if digest is None:
+            digest = await run_in_threadpool(lambda: hashlib.sha256(data).hexdigest())
+        name = f"{digest}.{extension}"
+        path = self.path(name)
+
+        if await aiofiles.os.path.exists(path):
+            # Refreshed so garbage collection's grace period restarts for the new reference
+            await run_in_threadpool(os.utime, path)
+            return name
+
+        await aiofiles.os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name so readers never see a partial blob
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        async with aiofiles.open(temp_path, "wb") as f:
+            await f.write(data)
+        await aiofiles.os.replace(temp_path, path)
+
+        return name
+
+    def put_file(self, source: str, extension: str) -> str:
+        """Move an existing file into the store, returning its blob name"""
+        name = f"{hash_file(source)}.{extension}"
+        path = self.path(name)
+
+        if os.path.exists(path):
+            os.remove(source)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(source, path)
+
+        return name
+
+    async def response(self, name: str, headers, download: bool = False) -> Response:
+        """
+        Serve a blob with conditional and range request support.
+
+        headers are the request headers; download adds an attachment
+        Content-Disposition.
+        """
+        try:
+            path = self.path(name)
+            stat_result = await aiofiles.os.stat(path)
+        except (ValueError, FileNotFoundError):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Image not found"
+            )
+
+        etag = f'"{os.path.splitext(name)[0]}"'
+        cache_headers = {
+            "ETag": etag,
+            "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+            "Cache-Control": CACHE_CONTROL
+        }
+
+        if self._not_modified(headers, etag, stat_result.st_mtime):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+
+        return FileResponse(
+            path=path,
+            headers=cache_headers,
+            stat_result=stat_result,
+            filename=name if download else None
+        )
+
+    @staticmethod
+    def _not_modified(headers, etag: str, mtime: float) -> bool:
+        if_none_match = headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return etag in tags or "*" in tags
+
+        if_modified_since = headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+
+        return False
+
+    def _walk(self) -> Iterator[os.DirEntry]:
+        """Every file in the store, one shard directory at a time"""
+        if not os.path.isdir(self.root):
+            return
+        for first in os.scandir(self.root):
+            if not first.is_dir():
+                continue
+            for second in os.scandir(first.path):
+                if not second.is_dir():
+                    continue
+                for entry in os.scandir(second.path):
+                    if entry.is_file():
+                        yield entry
+
+    @staticmethod
+    def referenced_digests(db: Session) -> Set[str]:
+        """Hashes of the blobs referenced by content, scheduled posts and ad variants"""
+        digests = set()
+        for column in (GeneratedContent.image_url, ScheduledPost.image_url, MetaABTestVariant.image_url):
+            for (url,) in db.query(column).filter(column.like(f"%{URL_PREFIX}%")).yield_per(1000):
+                name = BlobStore.name_from_url(url)
+                if name:
+                    digests.add(name[:64])
+        return digests
+
+    def collect_garbage(self, db: Session, grace_seconds: Optional[int] = None) -> Dict[str, int]:
+        """
+        Delete blobs, and their variants, that nothing references.
+
+        Blobs stored or re-stored within the grace period are kept, since
+        the row referencing them may not have been committed yet.
+        """
+        grace_seconds = settings.BLOB_GC_GRACE_SECONDS if grace_seconds is None else grace_seconds
+        cutoff = time.time() - grace_seconds
+        referenced = self.referenced_digests(db)
+
+        # Variants live and die with their original, which decides the blob's age
+        files: Dict[str, list] = {}
+        stored_at: Dict[str, float] = {}
+        for entry in self._walk():
+            match = BLOB_NAME.match(entry.name)
+            if not match:
+                # Temporary files left behind by interrupted writes
+                if entry.name.endswith(".tmp") and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                continue
+            digest = match.group(1)
+            files.setdefault(digest, []).append(entry)
+            if not match.group(2):
+                stored_at[digest] = max(stored_at.get(digest, 0), entry.stat().st_mtime)
+
+        stats = {"scanned": len(files), "deleted": 0, "bytes_freed": 0}
+        for digest, entries in files.items():
+            if digest in referenced or stored_at.get(digest, 0) >= cutoff:
+                continue
+            for entry in entries:
+                try:
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                    stats["bytes_freed"] += size
+                except FileNotFoundError:
+                    pass
+            stats["deleted"] += 1
+
+        return stats
+
+    def migrate_flat_uploads(self, db: Session, upload_dir: Optional[str] = None) -> Dict[str, int]:
+        """
+        Move images from the flat uploads directory into the store.
+
+        References to each file are rewritten to the blob URL before the
+        file moves; files whose hash is already stored are simply removed.
+        """
+        upload_dir = upload_dir or settings.UPLOAD_DIR
+        stats = {"moved": 0, "references_updated": 0, "variants_removed": 0}
+
+        entries = [
+            entry for entry in os.scandir(upload_dir)
+            if entry.is_file() and entry.name.lower().endswith(LEGACY_IMAGE_EXTENSIONS)
+        ]
+        names = {entry.name for entry in entries}
+
+        for entry in entries:
+            # WebP copies and thumbnails of a flat original are rendered again on demand, not moved
+            variant = LEGACY_VARIANT_NAME.match(entry.name)
+            if variant and any(f"{variant.group(1)}.{ext}" in names for ext in ("png", "jpg", "gif")):
+                os.remove(entry.path)
+                stats["variants_removed"] += 1
+                continue
+
+            extension = entry.name.rsplit(".", 1)[1].lower().replace("jpeg", "jpg")
+            old_url = f"/uploads/{entry.name}"
+            new_url = self.url(f"{hash_file(entry.path)}.{extension}")
+
+            updated = 0
+            for model in (GeneratedContent, ScheduledPost, MetaABTestVariant):
+                updated += db.query(model).filter(model.image_url == old_url).update(
+                    {model.image_url: new_url}, synchronize_session=False
+                )
+            db.commit()
+
+            self.put_file(entry.path, extension)
+            stats["moved"] += 1
+            stats["references_updated"] += updated
+
+        return stats
+
+
+# Singleton instance
+blob_store = BlobStore()
@@ -0,0 +1,266 @@
+"""
+Due-Time Scheduler
+
+Keeps the due time of pending scheduled items (posts, outreach steps,
+score decay) in an in-process min-heap and fires the registered callback
+for a kind as soon as its items come due, instead of polling tables with
+`<= now` filters. Each kind supplies a loader that reads its items due
+within the next two resync intervals from the database, at startup and
+on each resync, and services call schedule()/cancel() when they write
+due times.
+
+Callbacks receive the due item ids and must re-check them against the
+database: entries can be stale (a post edited by another process, an
+enrollment stopped since it was scheduled), and a resync every
+SCHEDULER_RESYNC_SECONDS picks up writes made outside this process.
+"""
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+
+
+Callback = Callable[[List[Hashable]], Awaitable[Any]]
+Loader = Callable[[Any, datetime], Iterable[Tuple[Hashable, datetime]]]
+
+
+def _timestamp(due_at: datetime) -> float:
+    """Epoch seconds for a due time; naive datetimes are UTC"""
+    if due_at.tzinfo is None:
+        due_at = due_at.replace(tzinfo=timezone.utc)
+    return due_at.timestamp()
+
+
+class _Kind:
+    def __init__(self, callback: Callback, loader: Optional[Loader]):
+        self.callback = callback
+        self.loader = loader
+        self.running = False
+        self.waiting: Set[Hashable] = set()  # Came due while the callback was running
+
+
+class DueScheduler:
+    """Fires per-kind callbacks when scheduled items come due"""
+
+    def __init__(self, resync_seconds: Optional[float] = None, session_factory=SessionLocal):
+        self.resync_seconds = settings.SCHEDULER_RESYNC_SECONDS if resync_seconds is None else resync_seconds
+        self.session_factory = session_factory
+        self._kinds: Dict[str, _Kind] = {}
+        self._heap: List[Tuple[float, int, str, Hashable]] = []
+        self._due: Dict[Tuple[str, Hashable], float] = {}  # Current due time per item
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._writes_during_load: Optional[Dict[Tuple[str, Hashable], Optional[float]]] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._callbacks = set()
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    def register(self, kind: str, callback: Callback, loader: Optional[Loader] = None):
+        """Register the callback fired with due item ids, and the loader for pending items"""
+        self._kinds[kind] = _Kind(callback, loader)
+
+    def schedule(self, kind: str, item_id: Hashable, due_at: Optional[datetime]):
+        """
+        Set when an item comes due, replacing any earlier time. A due_at of
+        None cancels. Ignored until the scheduler is started, since the
+        startup load reads every pending item anyway. Safe to call from
+        worker threads.
+        """
+        if not self.running or kind not in self._kinds:
+            return
+        if due_at is None:
+            self.cancel(kind, item_id)
+            return
+
+        due = _timestamp(due_at)
+        with self._lock:
+            self._due[(kind, item_id)] = due
+            if self._writes_during_load is not None:
+                self._writes_during_load[(kind, item_id)] = due
+            heapq.heappush(self._heap, (due, next(self._counter), kind, item_id))
+            earliest = self._heap[0][0] == due
+        if earliest:
+            self._wake()
+
+    def cancel(self, kind: str, item_id: Hashable):
+        """Stop tracking an item; its heap entry is skipped when it surfaces"""
+        with self._lock:
+            self._due.pop((kind, item_id), None)
+            if self._writes_during_load is not None:
+                self._writes_during_load[(kind, item_id)] = None
+
+    def pending(self, kind: Optional[str] = None) -> int:
+        with self._lock:
+            return sum(1 for key in self._due if kind is None or key[0] == kind)
+
+    def load(self, db) -> int:
+        """Replace tracked items with the items each kind's loader reports due before the next resync"""
+        # Any item due before the resync after next is read by the next one at the latest
+        until = datetime.utcnow() + timedelta(seconds=2 * self.resync_seconds)
+        with self._lock:
+            self._writes_during_load = {}
+
+        entries = {}
+        try:
+            for kind, registration in self._kinds.items():
+                if registration.loader is None:
+                    continue
+                for item_id, due_at in registration.loader(db, until):
+                    if due_at is not None:
+                        entries[(kind, item_id)] = _timestamp(due_at)
+        finally:
+            with self._lock:
+                writes, self._writes_during_load = self._writes_during_load, None
+
+        with self._lock:
+            # Kinds without a loader keep what they were given through schedule()
+            for key, due in self._due.items():
+                if self._kinds[key[0]].loader is None:
+                    entries.setdefault(key, due)
+            # Changes made while the loaders ran may be newer than what they read
+            for key, due in writes.items():
+                if due is None:
+                    entries.pop(key, None)
+                else:
+                    entries[key] = due
+            self._due = entries
+            self._heap = [(due, next(self._counter), kind, item_id) for (kind, item_id), due in entries.items()]
+            heapq.heapify(self._heap)
+        return len(entries)
+
+    def pop_due(self, now: Optional[float] = None) -> Dict[str, List[Hashable]]:
+        """Remove and return the ids that are due, grouped by kind"""
+        now = time.time() if now is None else now
+        due_items: Dict[str, List[Hashable]] = {}
+
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due, _, kind, item_id = heapq.heappop(self._heap)
+                # Entries replaced by a later schedule() or cancelled are skipped
+                if self._due.get((kind, item_id)) != due:
+                    continue
+                del self._due[(kind, item_id)]
+                due_items.setdefault(kind, []).append(item_id)
+
+        return due_items
+
+    def next_due_in(self, now: Optional[float] = None) -> Optional[float]:
+        """Seconds until the earliest tracked item is due"""
+        now = time.time() if now is None else now
+        with self._lock:
+            while self._heap and self._due.get((self._heap[0][2], self._heap[0][3])) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                return None
+            return max(self._heap[0][0] - now, 0.0)
+
+    async def start(self):
+        """Load pending items from the database and start firing callbacks"""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        await run_in_threadpool(self._load_from_db)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._loop = None
+        self._wakeup = None
+        with self._lock:
+            self._heap = []
+            self._due = {}
+
+    def _load_from_db(self):
+        db = self.session_factory()
+        try:
+            count = self.load(db)
+            print(f"Scheduler tracking {count} pending items")
+        finally:
+            db.close()
+
+    def _wake(self):
+        loop, wakeup = self._loop, self._wakeup
+        if loop is None or wakeup is None or loop.is_closed() or self._task is None:
+            return
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is loop:
+            wakeup.set()
+        else:
+            loop.call_soon_threadsafe(wakeup.set)
+
+    async def _run(self):
+        next_resync = time.monotonic() + self.resync_seconds
+
+        while True:
+            for kind, item_ids in self.pop_due().items():
+                self._fire(kind, item_ids)
+
+            timeout = next_resync - time.monotonic()
+            next_due = self.next_due_in()
+            if next_due is not None:
+                timeout = min(timeout, next_due)
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+
+            if time.monotonic() >= next_resync:
+                try:
+                    await run_in_threadpool(self._load_from_db)
+                except Exception as e:
+                    print(f"Error reloading scheduled items: {str(e)}")
+                next_resync = time.monotonic() + self.resync_seconds
+
+    def _fire(self, kind: str, item_ids: List[Hashable]):
+        """Run a kind's callback, never more than one at a time per kind"""
+        registration = self._kinds[kind]
+        if registration.running:
+            registration.waiting.update(item_ids)
+            return
+
+        registration.running = True
+        task = asyncio.create_task(self._run_callback(kind, registration, item_ids))
+        self._callbacks.add(task)
+        task.add_done_callback(self._callbacks.discard)
+
+    async def _run_callback(self, kind: str, registration: _Kind, item_ids: List[Hashable]):
+        try:
+            while item_ids:
+                try:
+                    await registration.callback(item_ids)
+                except Exception as e:
+                    print(f"Error running scheduled {kind} for {len(item_ids)} items: {str(e)}")
+                item_ids = list(registration.waiting)
+                registration.waiting.clear()
+        finally:
+            registration.running = False
+
+
+# Singleton instance
+due_scheduler = DueScheduler()
@@ -0,0 +1,372 @@
+"""
+Outbound Email Queue
+
+Campaign sends are written to the outbound_emails table and delivered by
+queue workers, either the standalone worker (python -m app.workers.email_worker)
+or an in-process drain scheduled by the send endpoint. Workers claim
+batches under a time-limited lease, so a crashed worker's messages are
+picked up again once the lease expires (at-least-once delivery), and each
+message carries an idempotency key so the same campaign/lead pair is
+never enqueued twice. Sends are throttled with token buckets per SMTP
+provider and per recipient domain.
+"""
+
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, or_, select, update, func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.campaign import Campaign
+from app.models.email_queue import OutboundEmail, OutboundEmailStatus
+from app.models.email_template import EmailTemplate
+from app.services.email_service import EmailLogWriter, email_service
+from app.services.template_service import template_service
+
+
+# Rows per INSERT statement when enqueueing
+ENQUEUE_BATCH_SIZE = 500
+
+
+class TokenBucket:
+    """Token bucket allowing `rate` operations per second with bursts up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        if self.rate <= 0:
+            return
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class SendRateLimiter:
+    """Token buckets per SMTP provider and per recipient domain, local to a worker"""
+
+    def __init__(self, provider_rate: float, domain_rate: float):
+        self.provider_rate = provider_rate
+        self.domain_rate = domain_rate
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def _bucket(self, key: str, rate: float) -> TokenBucket:
+        if key not in self._buckets:
+            self._buckets[key] = TokenBucket(rate)
+        return self._buckets[key]
+
+    async def acquire(self, to_email: str):
+        """Wait for both the provider and the recipient domain to allow a send"""
+        domain = to_email.rsplit("@", 1)[-1].lower()
+        await self._bucket(f"provider:{settings.SMTP_HOST}", self.provider_rate).acquire()
+        await self._bucket(f"domain:{domain}", self.domain_rate).acquire()
+
+
+class EmailQueueService:
+    """Service for enqueueing and delivering outbound email"""
+
+    def __init__(self):
+        self.rate_limiter = SendRateLimiter(
+            settings.EMAIL_PROVIDER_RATE_PER_SECOND,
+            settings.EMAIL_DOMAIN_RATE_PER_SECOND
+        )
+
+    # ============= Enqueueing =============
+
+    @staticmethod
+    def campaign_idempotency_key(campaign_id: int, lead_id: int) -> str:
+        return f"campaign:{campaign_id}:lead:{lead_id}"
+
+    def _insert_ignoring_duplicates(self, db: Session, rows: List[Dict[str, Any]]) -> int:
+        """Insert queue rows, skipping idempotency keys that are already queued"""
+        dialect = db.get_bind().dialect.name
+
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            insert = None
+
+        if insert is not None:
+            statement = insert(OutboundEmail).on_conflict_do_nothing(
+                index_elements=["idempotency_key"]
+            ).returning(OutboundEmail.id)
+            return len(db.execute(statement, rows).all())
+
+        # Other databases: filter known keys first
+        keys = [row["idempotency_key"] for row in rows]
+        existing = {
+            key for (key,) in db.query(OutboundEmail.idempotency_key).filter(
+                OutboundEmail.idempotency_key.in_(keys)
+            )
+        }
+        new_rows = [row for row in rows if row["idempotency_key"] not in existing]
+        if new_rows:
+            db.bulk_insert_mappings(OutboundEmail, new_rows)
+        return len(new_rows)
+
+    def enqueue_campaign(self, db: Session, campaign_id: int, recipients: List[Dict[str, Any]]) -> int:
+        """
+        Queue a campaign email for each recipient.
+
+        Recipients carry email, lead_id and lead_data; subject and body are
+        rendered from the campaign when the message is sent. Returns the
+        number of newly queued messages.
+        """
+        now = datetime.utcnow()
+        queued = 0
+
+        for i in range(0, len(recipients), ENQUEUE_BATCH_SIZE):
+            rows = [
+                {
+                    "idempotency_key": self.campaign_idempotency_key(campaign_id, recipient["lead_id"]),
+                    "campaign_id": campaign_id,
+                    "lead_id": recipient["lead_id"],
+                    "to_email": recipient["email"],
+                    "is_html": True,
+                    "lead_data": recipient.get("lead_data", {}),
+                    "status": OutboundEmailStatus.QUEUED.value,
+                    "attempts": 0,
+                    "next_attempt_at": now,
+                }
+                for recipient in recipients[i:i + ENQUEUE_BATCH_SIZE]
+            ]
+            queued += self._insert_ignoring_duplicates(db, rows)
+
+        db.commit()
+        return queued
+
+    # ============= Delivery =============
+
+    def claim_batch(
+        self,
+        db: Session,
+        worker_id: str,
+        batch_size: int,
+        campaign_id: Optional[int] = None
+    ) -> List[OutboundEmail]:
+        """Lease up to batch_size due messages to this worker"""
+        now = datetime.utcnow()
+        lease_token = f"{worker_id[:48]}:{uuid.uuid4().hex[:8]}"
+
+        claimable = or_(
+            and_(
+                OutboundEmail.status == OutboundEmailStatus.QUEUED.value,
+                OutboundEmail.next_attempt_at <= now
+            ),
+            and_(
+                OutboundEmail.status == OutboundEmailStatus.SENDING.value,
+                OutboundEmail.locked_until < now
+            )
+        )
+        if campaign_id is not None:
+            claimable = and_(claimable, OutboundEmail.campaign_id == campaign_id)
+
+        candidates = select(OutboundEmail.id).where(claimable).order_by(OutboundEmail.id).limit(batch_size)
+
+        # Re-checking claimable in the outer WHERE keeps concurrent workers
+        # from taking over a row another worker has just leased
+        db.execute(
+            update(OutboundEmail)
+            .where(OutboundEmail.id.in_(candidates), claimable)
+            .values(
+                status=OutboundEmailStatus.SENDING.value,
+                locked_by=lease_token,
+                locked_until=now + timedelta(seconds=settings.EMAIL_QUEUE_LEASE_SECONDS)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+        return db.query(OutboundEmail).filter(
+            OutboundEmail.locked_by == lease_token,
+            OutboundEmail.status == OutboundEmailStatus.SENDING.value
+        ).order_by(OutboundEmail.id).all()
+
+    @staticmethod
+    def render_campaign_email(
+        campaign: Campaign,
+        template: Optional[EmailTemplate],
+        lead_data: Dict[str, Any],
+        wrapped_content: Optional[str] = None
+    ) -> Tuple[str, str]:
+        """Render a campaign's subject and HTML body for one lead"""
+        if template:
+            rendered = template_service.render_email_template(
+                template, template_service.prepare_variables(lead_data)
+            )
+            return rendered["subject"], rendered["html_content"]
+
+        if wrapped_content is None:
+            wrapped_content = email_service.create_email_template(campaign.content)
+        return campaign.subject, wrapped_content
+
+    async def process_batch(
+        self,
+        db: Session,
+        worker_id: str,
+        batch_size: Optional[int] = None,
+        campaign_id: Optional[int] = None
+    ) -> int:
+        """Claim and send one batch of messages. Returns the number claimed."""
+        messages = self.claim_batch(
+            db, worker_id, batch_size or settings.EMAIL_QUEUE_BATCH_SIZE, campaign_id
+        )
+        if not messages:
+            return 0
+
+        # Load each campaign and its template once per batch
+        campaigns: Dict[int, Tuple[Campaign, Optional[EmailTemplate], Optional[str]]] = {}
+        for campaign_id_ in {m.campaign_id for m in messages if m.campaign_id}:
+            campaign = db.query(Campaign).filter(Campaign.id == campaign_id_).first()
+            template = None
+            wrapped_content = None
+            if campaign and campaign.template_id:
+                template = db.query(EmailTemplate).filter(EmailTemplate.id == campaign.template_id).first()
+            if campaign and not template:
+                wrapped_content = email_service.create_email_template(campaign.content)
+            campaigns[campaign_id_] = (campaign, template, wrapped_content)
+
+        outcomes: Dict[int, Optional[str]] = {}
+        log_writer = EmailLogWriter(db)
+
+        async def send(message: OutboundEmail) -> bool:
+            subject, body = message.subject, message.body
+            if body is None:
+                campaign, template, wrapped_content = campaigns.get(message.campaign_id, (None, None, None))
+                if not campaign:
+                    outcomes[message.id] = "Campaign not found"
+                    return False
+                subject, body = self.render_campaign_email(
+                    campaign, template, message.lead_data or {}, wrapped_content
+                )
+
+            await self.rate_limiter.acquire(message.to_email)
+
+            success = await email_service.send_email(
+                to_email=message.to_email,
+                subject=subject,
+                body=body,
+                is_html=message.is_html,
+                campaign_id=message.campaign_id,
+                lead_id=message.lead_id,
+                message_id=message.idempotency_key,
+                log_writer=log_writer
+            )
+            outcomes[message.id] = None if success else "SMTP send failed"
+            return success
+
+        try:
+            await email_service.send_many(messages, send)
+            self._record_outcomes(db, messages, outcomes)
+        finally:
+            # After the outcomes, so logs that cannot be written never get sent messages resent
+            log_writer.close()
+
+        self._finalize_campaigns(db, {m.campaign_id for m in messages if m.campaign_id})
+
+        return len(messages)
+
+    def _record_outcomes(self, db: Session, messages: List[OutboundEmail], outcomes: Dict[int, Optional[str]]):
+        """Mark messages sent, or schedule a retry with backoff until attempts run out"""
+        now = datetime.utcnow()
+
+        for message in messages:
+            error = outcomes.get(message.id, "Send did not complete")
+            message.attempts = (message.attempts or 0) + 1
+            message.locked_by = None
+            message.locked_until = None
+
+            if error is None:
+                message.status = OutboundEmailStatus.SENT.value
+                message.sent_at = now
+                message.last_error = None
+            elif message.attempts >= settings.EMAIL_QUEUE_MAX_ATTEMPTS:
+                message.status = OutboundEmailStatus.FAILED.value
+                message.last_error = error
+            else:
+                message.status = OutboundEmailStatus.QUEUED.value
+                message.last_error = error
+                message.next_attempt_at = now + timedelta(
+                    seconds=settings.EMAIL_QUEUE_RETRY_SECONDS * 2 ** (message.attempts - 1)
+                )
+
+        db.commit()
+
+    def _finalize_campaigns(self, db: Session, campaign_ids: set):
+        """
+        Reconcile campaign totals with the queue and complete campaigns with
+        nothing left to send. Log flushes bump the totals while a batch is in
+        flight; the queue is authoritative when a lease expired and a message
+        was sent twice.
+        """
+        for campaign_id in campaign_ids:
+            counts = dict(
+                db.query(OutboundEmail.status, func.count(OutboundEmail.id)).filter(
+                    OutboundEmail.campaign_id == campaign_id
+                ).group_by(OutboundEmail.status).all()
+            )
+
+            campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
+            if not campaign:
+                continue
+
+            sent_count = counts.get(OutboundEmailStatus.SENT.value, 0)
+            campaign.total_sent = sent_count
+            campaign.total_delivered = sent_count  # Will be updated by webhook/tracking
+
+            pending = counts.get(OutboundEmailStatus.QUEUED.value, 0) + counts.get(OutboundEmailStatus.SENDING.value, 0)
+            if not pending and sent_count == campaign.total_recipients:
+                campaign.status = "completed"
+
+        db.commit()
+
+    async def drain(self, campaign_id: Optional[int] = None, worker_id: Optional[str] = None) -> int:
+        """Send queued messages until none are due, using a dedicated session"""
+        worker_id = worker_id or f"inline-{uuid.uuid4().hex[:8]}"
+        total = 0
+
+        db = SessionLocal()
+        try:
+            while True:
+                claimed = await self.process_batch(db, worker_id, campaign_id=campaign_id)
+                if not claimed:
+                    break
+                total += claimed
+        finally:
+            db.close()
+
+        return total
+
+    def get_queue_stats(self, db: Session, campaign_id: Optional[int] = None) -> Dict[str, int]:
+        """Count queued messages by status"""
+        query = db.query(OutboundEmail.status, func.count(OutboundEmail.id))
+        if campaign_id is not None:
+            query = query.filter(OutboundEmail.campaign_id == campaign_id)
+
+        counts = dict(query.group_by(OutboundEmail.status).all())
+        return {status.value: counts.get(status.value, 0) for status in OutboundEmailStatus}
+
+
+# Singleton instance
+email_queue_service = EmailQueueService()
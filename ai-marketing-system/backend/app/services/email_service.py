@@ -1,15 +1,268 @@
+import asyncio
+import time
 import aiosmtplib
+from email.message import Message
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Iterable, Callable, Awaitable, TypeVar
+from collections import Counter
 from datetime import datetime
 
 from app.core.config import settings
+from sqlalchemy import func, insert, update
 from sqlalchemy.orm import Session
-from app.models.campaign import EmailLog
+from app.models.campaign import Campaign, EmailLog
 from app.models.lead import Lead
 
 
+T = TypeVar("T")
+
+# Errors after which an SMTP connection cannot be reused
+CONNECTION_ERRORS = (
+    aiosmtplib.SMTPServerDisconnected,
+    aiosmtplib.SMTPConnectError,
+    aiosmtplib.SMTPTimeoutError,
+    ConnectionError,
+    asyncio.TimeoutError,
+)
+
+# Errors refusing one message on an otherwise healthy connection
+REJECTION_ERRORS = (
+    aiosmtplib.SMTPRecipientsRefused,
+    aiosmtplib.SMTPResponseException,
+)
+
+
+class _PooledConnection:
+    """An authenticated SMTP session and the number of messages sent on it"""
+
+    def __init__(self, client: aiosmtplib.SMTP):
+        self.client = client
+        self.sent = 0
+
+
+class SMTPConnectionPool:
+    """
+    Pool of authenticated SMTP sessions shared by concurrent senders.
+
+    Each connection pays the TCP, STARTTLS and AUTH handshake once and is
+    then reused for up to max_messages messages. Dropped connections are
+    replaced and the message retried once on a fresh session. A refused
+    recipient or message is raised to the caller, and the session is reset
+    with RSET and kept.
+    """
+
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        username: str,
+        password: str,
+        size: int,
+        max_messages: int,
+        timeout: float
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.size = max(1, size)
+        self.max_messages = max(1, max_messages)
+        self.timeout = timeout
+
+        self._idle: List[_PooledConnection] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _bind_loop(self):
+        """Create loop-bound primitives, discarding connections from an old loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.size)
+            self._idle = []
+
+    async def _connect(self) -> _PooledConnection:
+        """Open a connection, upgrading with STARTTLS and logging in"""
+        client = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            username=self.username or None,
+            password=self.password or None,
+            start_tls=True,
+            timeout=self.timeout
+        )
+        await client.connect()
+        return _PooledConnection(client)
+
+    async def _discard(self, connection: Optional[_PooledConnection]):
+        """Close a connection, ignoring errors from an already broken session"""
+        if connection is None:
+            return
+        try:
+            if connection.client.is_connected:
+                await connection.client.quit()
+        except Exception:
+            connection.client.close()
+
+    async def send_message(self, message: Message):
+        """Send a message on a pooled connection"""
+        self._bind_loop()
+
+        async with self._slots:
+            connection = self._idle.pop() if self._idle else None
+
+            for attempt in range(2):
+                try:
+                    if connection is None or not connection.client.is_connected:
+                        await self._discard(connection)
+                        connection = await self._connect()
+                    await connection.client.send_message(message)
+                    connection.sent += 1
+                    break
+                except CONNECTION_ERRORS:
+                    await self._discard(connection)
+                    connection = None
+                    if attempt:
+                        raise
+                except REJECTION_ERRORS:
+                    # The server refused this message, not the session; reset it for the next one
+                    if connection is not None and await self._reset(connection):
+                        await self._release(connection)
+                    raise
+                except Exception:
+                    # Leave no half-finished transaction on a reused session
+                    await self._discard(connection)
+                    raise
+
+            await self._release(connection)
+
+    async def _reset(self, connection: _PooledConnection) -> bool:
+        """Abort the current transaction with RSET, discarding the connection if that fails"""
+        try:
+            await connection.client.rset()
+            return True
+        except Exception:
+            await self._discard(connection)
+            return False
+
+    async def _release(self, connection: _PooledConnection):
+        """Return a connection to the pool, or close it once it has sent max_messages"""
+        if connection.sent >= self.max_messages:
+            await self._discard(connection)
+        else:
+            self._idle.append(connection)
+
+    async def close(self):
+        """Close all idle connections"""
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            await self._discard(connection)
+
+
+class EmailLogWriter:
+    """
+    Buffers EmailLog rows and writes them in one transaction per flush.
+
+    A flush happens once flush_size rows are buffered or flush_ms after the
+    first row was buffered, on a timer when running in an event loop, and
+    also bumps each campaign's sent/delivered counters by the number of
+    successful sends in the flush. Flushes use their own session on db's
+    engine, so they never commit or roll back the caller's pending changes.
+    Rows from a failed flush stay buffered for the next one; close() raises
+    if they still cannot be written.
+    """
+
+    def __init__(self, db: Session, flush_size: Optional[int] = None, flush_ms: Optional[int] = None):
+        self.bind = db.get_bind()
+        self.flush_size = max(1, flush_size or settings.EMAIL_LOG_FLUSH_SIZE)
+        self.flush_ms = flush_ms if flush_ms is not None else settings.EMAIL_LOG_FLUSH_MS
+        self._rows: List[Dict[str, Any]] = []
+        self._first_buffered: Optional[float] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def add(self, **row):
+        """Buffer one EmailLog row, flushing if the buffer is full or stale"""
+        if not self._rows:
+            self._start_timer()
+        self._rows.append(row)
+
+        elapsed_ms = (time.monotonic() - self._first_buffered) * 1000
+        if len(self._rows) >= self.flush_size or elapsed_ms >= self.flush_ms:
+            self.flush()
+
+    def _start_timer(self):
+        """Start the flush_ms clock, flushing when it runs out if an event loop is running"""
+        self._first_buffered = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._timer = loop.call_later(self.flush_ms / 1000, self._flush_on_timer)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _flush_on_timer(self):
+        self._timer = None
+        self.flush()
+
+    def flush(self, raise_errors: bool = False) -> bool:
+        """
+        Insert buffered rows and update campaign counters in one commit.
+
+        Returns False if the write failed, in which case the rows stay
+        buffered and are retried after another flush_ms.
+        """
+        self._cancel_timer()
+        if not self._rows:
+            return True
+
+        rows = self._rows
+        sent_per_campaign = Counter(
+            row["campaign_id"] for row in rows if row.get("status") == "sent" and row.get("campaign_id")
+        )
+
+        session = Session(bind=self.bind)
+        try:
+            session.execute(insert(EmailLog), rows)
+            for campaign_id, sent in sent_per_campaign.items():
+                session.execute(
+                    update(Campaign)
+                    .where(Campaign.id == campaign_id)
+                    .values(
+                        total_sent=func.coalesce(Campaign.total_sent, 0) + sent,
+                        total_delivered=func.coalesce(Campaign.total_delivered, 0) + sent
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"Error writing {len(rows)} email logs, keeping them for the next flush: {str(e)}")
+            if raise_errors:
+                raise
+            self._start_timer()
+            return False
+        finally:
+            session.close()
+
+        self._rows = []
+        return True
+
+    def close(self):
+        """Flush remaining rows, raising if they cannot be written"""
+        self.flush(raise_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
 class EmailService:
     """Service for sending emails to opted-in contacts"""
 
@@ -20,6 +273,16 @@ class EmailService:
         self.smtp_password = settings.SMTP_PASSWORD
         self.from_email = settings.SMTP_FROM_EMAIL
         self.from_name = settings.SMTP_FROM_NAME
+        self.concurrency = max(1, settings.SMTP_POOL_SIZE)
+        self.pool = SMTPConnectionPool(
+            hostname=self.smtp_host,
+            port=self.smtp_port,
+            username=self.smtp_user,
+            password=self.smtp_password,
+            size=self.concurrency,
+            max_messages=settings.SMTP_MAX_MESSAGES_PER_CONNECTION,
+            timeout=settings.SMTP_TIMEOUT
+        )
 
     async def send_email(
         self,
@@ -29,9 +292,16 @@ class EmailService:
         is_html: bool = True,
         campaign_id: Optional[int] = None,
         lead_id: Optional[int] = None,
-        db: Optional[Session] = None
+        db: Optional[Session] = None,
+        message_id: Optional[str] = None,
+        log_writer: Optional[EmailLogWriter] = None
     ) -> bool:
-        """Send an individual email"""
+        """
+        Send an individual email, optionally with a stable Message-ID for retries.
+
+        The EmailLog row goes to log_writer when given, otherwise it is
+        committed through db immediately.
+        """
 
         try:
             # Create message
@@ -39,6 +309,9 @@ class EmailService:
             message["Subject"] = subject
             message["From"] = f"{self.from_name} <{self.from_email}>"
             message["To"] = to_email
+            if message_id:
+                domain = self.from_email.rsplit("@", 1)[-1] or "localhost"
+                message["Message-ID"] = f"<{message_id.replace(':', '.')}@{domain}>"
 
             # Add unsubscribe header for compliance
             if campaign_id:
@@ -57,49 +330,50 @@ class EmailService:
                 part = MIMEText(body, "plain")
                 message.attach(part)
 
-            # Send email
-            await aiosmtplib.send(
-                message,
-                hostname=self.smtp_host,
-                port=self.smtp_port,
-                username=self.smtp_user,
-                password=self.smtp_password,
-                start_tls=True
-            )
+            # Send email over a pooled connection
+            await self.pool.send_message(message)
 
-            # Log email if database session provided
-            if db and campaign_id and lead_id:
-                email_log = EmailLog(
-                    campaign_id=campaign_id,
-                    lead_id=lead_id,
-                    recipient_email=to_email,
-                    subject=subject,
-                    status="sent",
-                    sent_at=datetime.utcnow()
-                )
-                db.add(email_log)
-                db.commit()
+            # Log email if a log writer or database session is provided
+            self._log_email(
+                db, log_writer,
+                campaign_id=campaign_id,
+                lead_id=lead_id,
+                recipient_email=to_email,
+                subject=subject,
+                status="sent",
+                sent_at=datetime.utcnow()
+            )
 
             return True
 
         except Exception as e:
             # Log error
-            if db and campaign_id and lead_id:
-                email_log = EmailLog(
-                    campaign_id=campaign_id,
-                    lead_id=lead_id,
-                    recipient_email=to_email,
-                    subject=subject,
-                    status="failed",
-                    error_message=str(e),
-                    sent_at=datetime.utcnow()
-                )
-                db.add(email_log)
-                db.commit()
+            self._log_email(
+                db, log_writer,
+                campaign_id=campaign_id,
+                lead_id=lead_id,
+                recipient_email=to_email,
+                subject=subject,
+                status="failed",
+                error_message=str(e),
+                sent_at=datetime.utcnow()
+            )
 
             print(f"Error sending email to {to_email}: {str(e)}")
             return False
 
+    @staticmethod
+    def _log_email(db: Optional[Session], log_writer: Optional[EmailLogWriter], **row):
+        """Record a send in the log writer's buffer, or commit it directly"""
+        if not (row.get("campaign_id") and row.get("lead_id")):
+            return
+
+        if log_writer is not None:
+            log_writer.add(**row)
+        elif db:
+            db.add(EmailLog(**row))
+            db.commit()
+
     async def send_bulk_email(
         self,
         recipients: List[dict],
@@ -110,29 +384,52 @@ class EmailService:
     ) -> dict:
         """Send emails to multiple recipients"""
 
-        results = {
-            "total": len(recipients),
-            "sent": 0,
-            "failed": 0
-        }
+        with EmailLogWriter(db) as log_writer:
+            async def send(recipient: dict) -> bool:
+                return await self.send_email(
+                    to_email=recipient["email"],
+                    subject=subject,
+                    body=body,
+                    campaign_id=campaign_id,
+                    lead_id=recipient.get("lead_id"),
+                    log_writer=log_writer
+                )
 
-        for recipient in recipients:
-            success = await self.send_email(
-                to_email=recipient["email"],
-                subject=subject,
-                body=body,
-                campaign_id=campaign_id,
-                lead_id=recipient.get("lead_id"),
-                db=db
-            )
+            results = await self.send_many(recipients, send)
+        results["total"] = len(recipients)
 
-            if success:
-                results["sent"] += 1
-            else:
-                results["failed"] += 1
+        return results
+
+    async def send_many(
+        self,
+        jobs: Iterable[T],
+        send: Callable[[T], Awaitable[bool]]
+    ) -> dict:
+        """
+        Run send(job) for every job with up to SMTP_POOL_SIZE sends in flight.
+
+        Exceptions from send count as failures. Returns sent/failed counts.
+        """
+        results = {"sent": 0, "failed": 0}
+        pending = iter(jobs)
+
+        async def worker():
+            for job in pending:
+                try:
+                    success = await send(job)
+                except Exception as e:
+                    print(f"Error sending email: {str(e)}")
+                    success = False
+                results["sent" if success else "failed"] += 1
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
 
         return results
 
+    async def close(self):
+        """Close pooled SMTP connections"""
+        await self.pool.close()
+
     def _html_to_plain(self, html: str) -> str:
         """Convert HTML to plain text (basic implementation)"""
         # Remove HTML tags (basic implementation)
@@ -13,7 +13,20 @@ from datetime import datetime
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
-from app.models.lead import Lead, LeadSource
+from app.core.http_clients import http_clients
+from app.models.lead import LeadSource
+from app.services.lead_upsert_service import lead_upsert_service, MergePolicy
+from app.services.segment_service import segment_service
+
+
+# Consent is recorded on new leads only, so a re-sync never opts an existing
+# lead back in after an unsubscribe or bounce; other fields only fill gaps
+FACEBOOK_MERGE_POLICIES = {
+    "email_consent": MergePolicy.REVOKE_ONLY,
+    "consent_date": MergePolicy.KEEP,
+    "consent_source": MergePolicy.KEEP,
+    "source": MergePolicy.KEEP,
+}
 
 
 class FacebookLeadAdsService:
@@ -27,7 +40,7 @@ class FacebookLeadAdsService:
     async def verify_credentials(self) -> Dict:
         """Verify Facebook access token and permissions"""
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            async with http_clients.borrow("meta") as client:
                 # Get token info
                 response = await client.get(
                     f"{self.base_url}/me",
@@ -79,7 +92,7 @@ class FacebookLeadAdsService:
             # First, get the page access token for this specific page
             page_token = None
             try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
+                async with http_clients.borrow("meta") as client:
                     # Get page access token
                     pages_response = await client.get(
                         f"{self.base_url}/me/accounts",
@@ -105,7 +118,7 @@ class FacebookLeadAdsService:
                 print(f"Error getting page token: {str(e)}, using user token")
                 page_token = self.access_token
 
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            async with http_clients.borrow("meta") as client:
                 # Use the page access token for this request
                 response = await client.get(
                     f"{self.base_url}/{page_id}/leadgen_forms",
@@ -135,7 +148,7 @@ class FacebookLeadAdsService:
     async def get_pages(self) -> List[Dict]:
         """Get all Facebook Pages the user manages"""
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            async with http_clients.borrow("meta") as client:
                 response = await client.get(
                     f"{self.base_url}/me/accounts",
                     params={
@@ -154,7 +167,7 @@ class FacebookLeadAdsService:
     async def get_leads_from_form(self, form_id: str, limit: int = 100) -> List[Dict]:
         """Get leads from a specific Lead Ad form"""
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
+            async with http_clients.borrow("meta") as client:
                 response = await client.get(
                     f"{self.base_url}/{form_id}/leads",
                     params={
@@ -191,9 +204,9 @@ class FacebookLeadAdsService:
                     "message": "No leads found in this form"
                 }
 
-            imported = 0
             skipped = 0
             errors = []
+            rows = []
 
             for fb_lead in fb_leads:
                 try:
@@ -211,12 +224,6 @@ class FacebookLeadAdsService:
                         skipped += 1
                         continue
 
-                    # Check if lead already exists
-                    existing_lead = db.query(Lead).filter(Lead.email == email).first()
-                    if existing_lead:
-                        skipped += 1
-                        continue
-
                     # Extract name fields
                     first_name = field_data.get("first_name", "")
                     last_name = field_data.get("last_name", "")
@@ -228,35 +235,35 @@ class FacebookLeadAdsService:
                         first_name = name_parts[0]
                         last_name = name_parts[1] if len(name_parts) > 1 else ""
 
-                    # Create lead record
-                    new_lead = Lead(
-                        user_id=user_id,
-                        email=email,
-                        first_name=first_name,
-                        last_name=last_name,
-                        phone=field_data.get("phone_number", ""),
-                        source=LeadSource.FACEBOOK,
-                        email_consent=True,  # Facebook Lead Ads require user consent
-                        consent_date=datetime.now(),
-                        consent_source="facebook_lead_ads",
-                        notes=f"Imported from Facebook Lead Ads. Form ID: {form_id}. FB Lead ID: {fb_lead.get('id')}"
-                    )
-
-                    db.add(new_lead)
-                    imported += 1
+                    rows.append({
+                        "email": email,
+                        "first_name": first_name or None,
+                        "last_name": last_name or None,
+                        "phone": field_data.get("phone_number") or None,
+                        "source": LeadSource.FACEBOOK.value,
+                        "email_consent": True,  # Facebook Lead Ads require user consent
+                        "consent_date": datetime.now(),
+                        "consent_source": "facebook_lead_ads",
+                        "notes": f"Imported from Facebook Lead Ads. Form ID: {form_id}. FB Lead ID: {fb_lead.get('id')}"
+                    })
 
                 except Exception as e:
                     errors.append(f"Lead {fb_lead.get('id', 'unknown')}: {str(e)}")
                     skipped += 1
                     continue
 
-            # Commit all leads
+            # Upsert all leads in one pass
+            result = lead_upsert_service.upsert_leads(db, rows, policies=FACEBOOK_MERGE_POLICIES)
             db.commit()
 
+            segment_service.refresh_lead_memberships(result["inserted"] + result["updated"], db)
+
+            imported = len(result["inserted"])
             return {
                 "success": True,
                 "imported": imported,
-                "skipped": skipped,
+                "updated": len(result["updated"]),
+                "skipped": skipped + len(result["unchanged"]),
                 "errors": errors,
                 "message": f"Successfully imported {imported} leads from Facebook"
             }
@@ -268,7 +275,7 @@ class FacebookLeadAdsService:
     async def get_form_details(self, form_id: str) -> Dict:
         """Get detailed information about a Lead Ad form"""
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            async with http_clients.borrow("meta") as client:
                 response = await client.get(
                     f"{self.base_url}/{form_id}",
                     params={
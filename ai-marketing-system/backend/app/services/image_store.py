@@ -0,0 +1,168 @@
+"""
+Image Store
+
+Persists generated and enhanced images in the blob store without blocking
+the event loop. Base64 decoding and hashing run in the thread pool and
+files are written with aiofiles. Each image is named after the SHA-256 of
+its bytes, so saving the same image twice stores it once. Resized WebP
+thumbnails and a full-size WebP copy are rendered with Pillow in a process
+pool next to the original, in the background once the original is written:
+
+    <sha256>.png        original, served as returned
+    <sha256>.webp       full-size WebP
+    <sha256>_256.webp   thumbnail, 256px wide
+"""
+
+import asyncio
+import base64
+import hashlib
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.services.blob_store import BlobStore, blob_store
+
+
+# Leading bytes of the formats image models return, and their file extensions
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+]
+
+
+def image_extension(image_bytes: bytes) -> str:
+    """File extension for an image's format, defaulting to png"""
+    for signature, extension in IMAGE_SIGNATURES:
+        if image_bytes.startswith(signature):
+            return extension
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "webp"
+    return "png"
+
+
+def render_variants(path: str, widths: List[int], quality: int) -> List[str]:
+    """
+    Write the WebP copy and thumbnails of an image, returning their paths.
+
+    Runs in a worker process; variants that already exist are kept.
+    """
+    from PIL import Image
+
+    stem = os.path.splitext(path)[0]
+    targets = [(f"{stem}.webp", None)] + [(f"{stem}_{width}.webp", width) for width in widths]
+    missing = [(target, width) for target, width in targets if not os.path.exists(target)]
+    if not missing:
+        return [target for target, _ in targets]
+
+    with Image.open(path) as image:
+        image.load()
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        for target, width in missing:
+            variant = image
+            if width and image.width > width:
+                variant = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+
+            temp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+            variant.save(temp_path, "WEBP", quality=quality, method=4)
+            os.replace(temp_path, target)
+
+    return [target for target, _ in targets]
+
+
+class ImageStore:
+    """Writes images to the blob store and renders their variants"""
+
+    def __init__(
+        self,
+        blobs: Optional[BlobStore] = None,
+        thumbnail_widths: Optional[List[int]] = None,
+        webp_quality: Optional[int] = None,
+        process_workers: Optional[int] = None
+    ):
+        self.blobs = blobs or blob_store
+        self.thumbnail_widths = thumbnail_widths if thumbnail_widths is not None else settings.IMAGE_THUMBNAIL_WIDTHS
+        self.webp_quality = webp_quality or settings.IMAGE_WEBP_QUALITY
+        self.process_workers = process_workers or settings.IMAGE_PROCESS_WORKERS
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._renders: Dict[str, asyncio.Task] = {}
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # Spawned rather than forked: the API process runs threads
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.process_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    @staticmethod
+    def _decode(base64_data: str) -> Tuple[bytes, str]:
+        image_bytes = base64.b64decode(base64_data)
+        return image_bytes, hashlib.sha256(image_bytes).hexdigest()
+
+    async def save_base64(self, base64_data: str) -> str:
+        """Decode and save a base64 image, returning its URL"""
+        image_bytes, digest = await run_in_threadpool(self._decode, base64_data)
+        return await self._save(image_bytes, digest)
+
+    async def save_data_url(self, data_url: str) -> str:
+        """Save a data URL image (data:image/png;base64,...), returning its URL"""
+        if "base64," not in data_url:
+            raise Exception("Invalid data URL format - no base64 data found")
+        return await self.save_base64(data_url.split("base64,", 1)[1])
+
+    async def save_bytes(self, image_bytes: bytes) -> str:
+        """Save raw image bytes, returning their URL"""
+        digest = await run_in_threadpool(lambda: hashlib.sha256(image_bytes).hexdigest())
+        return await self._save(image_bytes, digest)
+
+    async def _save(self, image_bytes: bytes, digest: str) -> str:
+        name = await self.blobs.put(image_bytes, image_extension(image_bytes), digest=digest)
+        print(f"Image saved successfully as blob: {name}")
+
+        self._schedule_variants(self.blobs.path(name))
+
+        return self.blobs.url(name)
+
+    def _schedule_variants(self, filepath: str):
+        # An image saved again while its variants render shares the pending task
+        if filepath in self._renders:
+            return
+        task = asyncio.create_task(self.render_variants(filepath))
+        self._renders[filepath] = task
+        task.add_done_callback(lambda _: self._renders.pop(filepath, None))
+
+    async def wait_for_variants(self):
+        """Wait until every scheduled variant render has finished"""
+        while self._renders:
+            await asyncio.gather(*list(self._renders.values()))
+
+    async def render_variants(self, filepath: str) -> List[str]:
+        """Render an image's WebP variants in the process pool; failures are logged, not raised"""
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor(), render_variants, filepath, self.thumbnail_widths, self.webp_quality
+            )
+        except Exception as e:
+            print(f"Error rendering image variants for {filepath}: {str(e)}")
+            return []
+
+    def close(self):
+        """Shut down the process pool"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+
+# Singleton instance
+image_store = ImageStore()
@@ -0,0 +1,114 @@
+"""
+Incremental JSON Field Parsing
+
+Reads a JSON object as it streams in, chunk by chunk, and reports each
+top-level field as soon as its value is complete, so a caller can show
+"title" while the model is still writing "caption". Text before the
+opening brace (such as a markdown code fence) is skipped.
+"""
+
+import json
+from typing import Any, List, Tuple
+
+
+class JSONFieldStream:
+    """Emits (key, value) for each top-level field of a streamed JSON object"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields = {}
+        self._pos = 0
+        self._state = "object"  # object, key, colon, value, after_value, done
+        self._key_start = 0
+        self._key = None
+        self._value_start = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    @property
+    def complete(self) -> bool:
+        return self._state == "done"
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Add text and return the fields it completed"""
+        self.buffer += chunk
+        completed = []
+
+        while self._pos < len(self.buffer) and self._state != "done":
+            char = self.buffer[self._pos]
+
+            if self._state == "object":
+                if char == "{":
+                    self._state = "key"
+
+            elif self._state == "key":
+                if self._in_string:
+                    if self._escaped:
+                        self._escaped = False
+                    elif char == "\\":
+                        self._escaped = True
+                    elif char == '"':
+                        self._in_string = False
+                        self._key = json.loads(self.buffer[self._key_start:self._pos + 1])
+                        self._state = "colon"
+                elif char == '"':
+                    self._in_string = True
+                    self._key_start = self._pos
+                elif char == "}":
+                    self._state = "done"
+
+            elif self._state == "colon":
+                if char == ":":
+                    self._state = "value"
+                    self._value_start = None
+
+            elif self._state == "value":
+                if self._value_start is None:
+                    if char.isspace():
+                        self._pos += 1
+                        continue
+                    self._value_start = self._pos
+                    self._depth = 0
+
+                if self._in_string:
+                    if self._escaped:
+                        self._escaped = False
+                    elif char == "\\":
+                        self._escaped = True
+                    elif char == '"':
+                        self._in_string = False
+                        if self._depth == 0:
+                            completed.append(self._finish_value(self._pos + 1))
+                elif char == '"':
+                    self._in_string = True
+                elif char in "{[":
+                    self._depth += 1
+                elif char in "}]":
+                    if self._depth == 0:
+                        # Bare value (number, true, false, null) ended by the object's closing brace
+                        completed.append(self._finish_value(self._pos))
+                        self._state = "done"
+                    else:
+                        self._depth -= 1
+                        if self._depth == 0:
+                            completed.append(self._finish_value(self._pos + 1))
+                elif char == "," and self._depth == 0:
+                    completed.append(self._finish_value(self._pos))
+                    self._state = "key"
+
+            elif self._state == "after_value":
+                if char == ",":
+                    self._state = "key"
+                elif char == "}":
+                    self._state = "done"
+
+            self._pos += 1
+
+        return completed
+
+    def _finish_value(self, end: int) -> Tuple[str, Any]:
+        value = json.loads(self.buffer[self._value_start:end])
+        self.fields[self._key] = value
+        self._state = "after_value"
+        return self._key, value
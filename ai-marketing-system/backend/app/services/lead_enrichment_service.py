@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func, or_
 
 from app.models.lead import Lead
+from app.services.segment_service import segment_service
 
 
 class LeadEnrichmentService:
@@ -72,6 +73,7 @@ class LeadEnrichmentService:
             raise Exception(f"Primary lead {primary_lead_id} not found")
 
         duplicate_leads = db.query(Lead).filter(Lead.id.in_(duplicate_lead_ids)).all()
+        segment_service.remove_lead_memberships([dup.id for dup in duplicate_leads], db)
 
         # Merge data from duplicates into primary
         for dup_lead in duplicate_leads:
@@ -119,6 +121,8 @@ class LeadEnrichmentService:
         db.commit()
         db.refresh(primary_lead)
 
+        segment_service.refresh_lead_memberships([primary_lead.id], db)
+
         return primary_lead
 
     def auto_deduplicate(
@@ -259,7 +263,8 @@ class LeadEnrichmentService:
 
         return {
             'total_leads': len(leads),
-            'enriched_count': enriched_count
+            'enriched_count': enriched_count,
+            'lead_ids': [lead.id for lead in leads]
         }
 
     def _calculate_engagement_score(
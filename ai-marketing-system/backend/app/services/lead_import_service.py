@@ -0,0 +1,451 @@
+"""
+Lead Import
+
+Uploads are spooled to disk and imported in the background by import
+workers (python -m app.workers.import_worker, or the in-process worker
+started with the API). Files are streamed in fixed-size chunks; each chunk
+is written with one bulk lead upsert in the same transaction as the job's
+row checkpoint, so an interrupted import resumes after the last committed
+row.
+"""
+
+import codecs
+import csv
+import os
+import secrets
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import aiofiles
+import aiofiles.os
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, func, or_, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.lead_import_job import LeadImportJob, LeadImportJobStatus
+from app.services.lead_upsert_service import lead_upsert_service, MergePolicy
+from app.services.segment_service import segment_service
+
+
+# Bytes read per write while spooling an upload
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+# Supported upload extensions
+IMPORT_EXTENSIONS = (".csv", ".xlsx", ".xls")
+
+# Optional lead columns read from import files
+IMPORT_COLUMNS = ["first_name", "last_name", "phone", "location", "sport_type", "customer_type"]
+
+# Imports fill gaps in existing leads but never change their consent
+IMPORT_MERGE_POLICIES = {
+    "email_consent": MergePolicy.KEEP,
+    "consent_date": MergePolicy.KEEP,
+    "consent_source": MergePolicy.KEEP,
+    "source": MergePolicy.KEEP,
+}
+
+# Row errors kept per job; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportFormatError(ValueError):
+    """The upload is not a readable lead import file"""
+
+
+class LeadImportService:
+    """Service for streaming lead imports from CSV and Excel files"""
+
+    # ============= Jobs =============
+
+    @staticmethod
+    async def _spool_dir() -> str:
+        path = settings.LEAD_IMPORT_SPOOL_DIR
+        await aiofiles.os.makedirs(path, exist_ok=True)
+        return path
+
+    @staticmethod
+    def _count_rows(file_path: str, extension: str) -> Optional[int]:
+        """Estimate data rows for progress reporting"""
+        try:
+            if extension == ".csv":
+                with open(file_path, "rb") as f:
+                    lines = sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(SPOOL_CHUNK_SIZE), b""))
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        lines += 1
+                return max(lines - 1, 0)
+
+            if extension == ".xlsx":
+                from openpyxl import load_workbook
+
+                workbook = load_workbook(file_path, read_only=True)
+                max_row = workbook.active.max_row
+                workbook.close()
+                return max(max_row - 1, 0) if max_row else None
+
+        except (OSError, ValueError) as e:
+            print(f"Could not count rows in {file_path}: {str(e)}")
+
+        return None
+
+    async def create_job(self, file: UploadFile, source: str, db: Session) -> LeadImportJob:
+        """
+        Spool an upload to disk and queue it for import.
+
+        Uploads hold contact details, so they are spooled under random names
+        to LEAD_IMPORT_SPOOL_DIR rather than the publicly served UPLOAD_DIR.
+        The header is validated before the job is created.
+        """
+        extension = os.path.splitext((file.filename or "").lower())[1]
+        if extension not in IMPORT_EXTENSIONS:
+            raise ImportFormatError("File must be CSV or Excel format")
+
+        file_path = os.path.join(await self._spool_dir(), f"{secrets.token_hex(16)}{extension}")
+
+        try:
+            async with aiofiles.open(file_path, "wb") as spooled:
+                while True:
+                    data = await file.read(SPOOL_CHUNK_SIZE)
+                    if not data:
+                        break
+                    await spooled.write(data)
+
+            await run_in_threadpool(self._validate_header, file_path, file.filename)
+
+        except Exception:
+            if await aiofiles.os.path.exists(file_path):
+                await aiofiles.os.remove(file_path)
+            raise
+
+        total_rows = await run_in_threadpool(self._count_rows, file_path, extension)
+
+        job = LeadImportJob(
+            id=uuid.uuid4().hex,
+            filename=file.filename,
+            file_path=file_path,
+            source=source,
+            status=LeadImportJobStatus.PENDING.value,
+            total_rows=total_rows,
+            processed_rows=0,
+            imported=0,
+            skipped=0,
+            failed=0,
+            errors=[],
+            attempts=0
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+
+        return job
+
+    def claim_job(self, db: Session, worker_id: str) -> Optional[LeadImportJob]:
+        """Lease the oldest pending job, or a running job whose worker stopped renewing"""
+        now = datetime.utcnow()
+        claimable = or_(
+            LeadImportJob.status == LeadImportJobStatus.PENDING.value,
+            and_(
+                LeadImportJob.status == LeadImportJobStatus.RUNNING.value,
+                LeadImportJob.locked_until < now
+            )
+        )
+
+        candidates = db.query(LeadImportJob.id).filter(claimable).order_by(LeadImportJob.created_at).limit(5).all()
+        for (job_id,) in candidates:
+            claimed = db.execute(
+                update(LeadImportJob)
+                .where(LeadImportJob.id == job_id, claimable)
+                .values(
+                    status=LeadImportJobStatus.RUNNING.value,
+                    locked_by=worker_id[:64],
+                    locked_until=now + timedelta(seconds=settings.LEAD_IMPORT_LEASE_SECONDS),
+                    attempts=LeadImportJob.attempts + 1,
+                    run_started_at=now,
+                    run_start_row=LeadImportJob.processed_rows,
+                    started_at=func.coalesce(LeadImportJob.started_at, now)
+                )
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+
+            if claimed:
+                return db.query(LeadImportJob).filter(LeadImportJob.id == job_id).first()
+
+        return None
+
+    def get_job_status(self, job: LeadImportJob) -> Dict[str, Any]:
+        """Progress of a job with throughput and estimated time remaining"""
+        rows_per_second = None
+        eta_seconds = None
+
+        if job.run_started_at:
+            end = job.finished_at or datetime.utcnow()
+            elapsed = (end - job.run_started_at).total_seconds()
+            rows_this_run = (job.processed_rows or 0) - (job.run_start_row or 0)
+            if elapsed > 0 and rows_this_run > 0:
+                rows_per_second = round(rows_this_run / elapsed, 1)
+
+        if job.status == LeadImportJobStatus.COMPLETED.value:
+            eta_seconds = 0
+        elif rows_per_second and job.total_rows is not None:
+            eta_seconds = round(max(job.total_rows - job.processed_rows, 0) / rows_per_second, 1)
+
+        return {
+            "job_id": job.id,
+            "filename": job.filename,
+            "status": job.status,
+            "total_rows": job.total_rows,
+            "processed_rows": job.processed_rows,
+            "imported": job.imported,
+            "updated": job.updated,
+            "skipped": job.skipped,
+            "failed": job.failed,
+            "errors": job.errors or [],
+            "attempts": job.attempts,
+            "rows_per_second": rows_per_second,
+            "eta_seconds": eta_seconds,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+            "created_at": job.created_at
+        }
+
+    # ============= Reading =============
+
+    @classmethod
+    def _validate_header(cls, file_path: str, filename: str):
+        """Raise ImportFormatError unless a spooled file is readable and has an email column"""
+        with open(file_path, "rb") as spooled:
+            cls.open_rows(spooled, filename)
+
+    @staticmethod
+    def _clean(value) -> Optional[str]:
+        """Cell value as a stripped string, or None when empty"""
+        if value is None:
+            return None
+        value = str(value).strip()
+        return value or None
+
+    @staticmethod
+    def open_rows(file: BinaryIO, filename: str) -> Tuple[List[str], Iterator[Tuple[int, Dict[str, Any]]]]:
+        """
+        Return the header and a lazy (row number, row) iterator for a CSV or
+        Excel file.
+
+        CSV is decoded incrementally and XLSX is read with openpyxl in
+        read-only mode, so only the current chunk is held in memory.
+        """
+        name = (filename or "").lower()
+
+        if name.endswith(".csv"):
+            text = codecs.getreader("utf-8-sig")(file, errors="replace")
+            reader = csv.reader(text)
+            header = next(reader, [])
+            rows = reader
+
+        elif name.endswith(".xlsx"):
+            from openpyxl import load_workbook
+
+            workbook = load_workbook(file, read_only=True, data_only=True)
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, ())
+
+        elif name.endswith(".xls"):
+            # Legacy Excel has no streaming reader
+            import pandas as pd
+
+            df = pd.read_excel(file, dtype=object)
+            header = list(df.columns)
+            rows = (tuple(None if pd.isna(value) else value for value in row) for row in df.itertuples(index=False))
+
+        else:
+            raise ImportFormatError("File must be CSV or Excel format")
+
+        columns = [LeadImportService._clean(column) or "" for column in header]
+        if "email" not in columns:
+            raise ImportFormatError("File must contain columns: email")
+
+        def iterate():
+            # Data rows are numbered from 1, counting blank rows
+            for row_number, row in enumerate(rows, start=1):
+                if any(value not in (None, "") for value in row):
+                    yield row_number, dict(zip(columns, row))
+
+        return columns, iterate()
+
+    @staticmethod
+    def iter_chunks(
+        rows: Iterator[Tuple[int, Dict[str, Any]]],
+        size: int
+    ) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+        """Group (row number, row) pairs into chunks"""
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    # ============= Writing =============
+
+    def import_chunk(
+        self,
+        chunk: List[Tuple[int, Dict[str, Any]]],
+        source: str,
+        db: Session
+    ) -> Dict[str, Any]:
+        """
+        Upsert the leads in one chunk. Existing leads only have empty
+        profile columns filled in; their consent and source are kept.
+
+        Does not commit; the caller commits with its checkpoint.
+        """
+        result = {"imported": 0, "updated": 0, "skipped": 0, "failed": 0, "errors": [], "lead_ids": []}
+        now = datetime.utcnow()
+
+        candidates: Dict[str, Dict[str, Any]] = {}
+        for row_number, row in chunk:
+            email = self._clean(row.get("email"))
+            if not email or "@" not in email:
+                result["failed"] += 1
+                result["errors"].append(f"Row {row_number}: invalid email {email!r}")
+                continue
+            if email in candidates:
+                result["skipped"] += 1
+                continue
+
+            candidates[email] = {
+                "email": email,
+                **{column: self._clean(row.get(column)) for column in IMPORT_COLUMNS},
+                "email_consent": True,
+                "consent_date": now,
+                "consent_source": source,
+                "source": source
+            }
+
+        if candidates:
+            upserted = lead_upsert_service.upsert_leads(db, list(candidates.values()), policies=IMPORT_MERGE_POLICIES)
+            result["imported"] += len(upserted["inserted"])
+            result["updated"] += len(upserted["updated"])
+            result["skipped"] += len(upserted["unchanged"])
+            result["lead_ids"] = upserted["inserted"] + upserted["updated"]
+
+        return result
+
+    def process_job(
+        self,
+        db: Session,
+        job: LeadImportJob,
+        chunk_size: Optional[int] = None
+    ) -> LeadImportJob:
+        """
+        Import a claimed job from its checkpoint onwards.
+
+        Invalid rows are reported per row by import_chunk. Any other error
+        ends the attempt without advancing the checkpoint, so the job is
+        retried from the last committed chunk. Each checkpoint is only
+        written while this worker still holds the job's lease; once another
+        worker has taken the job over, the attempt stops.
+        """
+        chunk_size = chunk_size or settings.LEAD_IMPORT_CHUNK_SIZE
+        worker_id = job.locked_by
+
+        try:
+            with open(job.file_path, "rb") as f:
+                _, rows = self.open_rows(f, job.filename)
+                remaining = (row for row in rows if row[0] > job.processed_rows)
+
+                for chunk in self.iter_chunks(remaining, chunk_size):
+                    result = self.import_chunk(chunk, job.source, db)
+
+                    # Leads and checkpoint commit together
+                    held = self._checkpoint(
+                        db, job, worker_id,
+                        processed_rows=chunk[-1][0],
+                        imported=job.imported + result["imported"],
+                        updated=job.updated + result["updated"],
+                        skipped=job.skipped + result["skipped"],
+                        failed=job.failed + result["failed"],
+                        errors=(job.errors or []) + result["errors"][:max(0, MAX_REPORTED_ERRORS - len(job.errors or []))],
+                        locked_until=datetime.utcnow() + timedelta(seconds=settings.LEAD_IMPORT_LEASE_SECONDS)
+                    )
+                    if not held:
+                        print(f"Lease on import job {job.id} was lost; stopping at row {job.processed_rows}")
+                        return job
+
+                    segment_service.refresh_lead_memberships(result["lead_ids"], db)
+
+            completed = self._checkpoint(
+                db, job, worker_id,
+                status=LeadImportJobStatus.COMPLETED.value,
+                finished_at=datetime.utcnow(),
+                locked_by=None,
+                locked_until=None
+            )
+            if completed:
+                os.remove(job.file_path)
+
+        except Exception as e:
+            db.rollback()
+            print(f"Error importing leads for job {job.id}: {str(e)}")
+
+            failed = job.attempts >= settings.LEAD_IMPORT_MAX_ATTEMPTS
+            self._checkpoint(
+                db, job, worker_id,
+                errors=(job.errors or []) + [f"Attempt {job.attempts}: {str(e)}"],
+                locked_by=None,
+                locked_until=None,
+                status=LeadImportJobStatus.FAILED.value if failed else LeadImportJobStatus.PENDING.value,
+                finished_at=datetime.utcnow() if failed else None
+            )
+
+        return job
+
+    def _checkpoint(self, db: Session, job: LeadImportJob, worker_id: str, **values) -> bool:
+        """
+        Commit job progress, with any pending lead writes, if worker_id still
+        holds the job's lease. Otherwise roll back and return False.
+        """
+        held = db.execute(
+            update(LeadImportJob)
+            .where(
+                LeadImportJob.id == job.id,
+                LeadImportJob.locked_by == worker_id,
+                LeadImportJob.status == LeadImportJobStatus.RUNNING.value
+            )
+            .values(**values)
+        ).rowcount
+
+        if not held:
+            db.rollback()
+            return False
+        db.commit()
+        return True
+
+    def process_available_jobs(self, worker_id: Optional[str] = None) -> int:
+        """Claim and process jobs until none are waiting. Returns jobs processed."""
+        worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        processed = 0
+
+        db = SessionLocal()
+        try:
+            while True:
+                job = self.claim_job(db, worker_id)
+                if not job:
+                    break
+                self.process_job(db, job)
+                processed += 1
+        finally:
+            db.close()
+
+        return processed
+
+
+# Singleton instance
+lead_import_service = LeadImportService()
@@ -0,0 +1,432 @@
+"""
+Bulk Lead Scoring
+
+Vectorized counterpart of LeadTrackingService.calculate_lead_score for
+rescoring many leads at once. Lead attributes and engagement aggregates
+are loaded per chunk with one query each, every component score, grade and
+temperature is computed as a NumPy/pandas column, and LeadScore rows are
+written back with bulk UPDATE/INSERT statements.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import and_, case, func, insert, or_, update
+from sqlalchemy.orm import Session
+
+from app.models.lead import Lead
+from app.models.lead_tracking import LeadScore, LeadScoreAggregate, EngagementHistory, EngagementType
+from app.services.due_scheduler import due_scheduler
+from app.services.segment_service import segment_service
+
+
+# Due scheduler kind for scores about to lose recency points
+SCORE_DECAY_JOB = "score_decay"
+
+
+# Leads scored per round trip
+SCORING_BATCH_SIZE = 5000
+
+# Engagement windows in days
+BEHAVIORAL_WINDOW_DAYS = 90
+INTENT_WINDOW_DAYS = 30
+REPLY_WINDOW_DAYS = 14
+
+# Scoring rules, shared with LeadTrackingService.calculate_lead_score
+SCORE_WEIGHTS = {
+    "demographic": 0.20,
+    "behavioral": 0.25,
+    "firmographic": 0.15,
+    "engagement": 0.25,
+    "intent": 0.15
+}
+
+DEMOGRAPHIC_POINTS = {
+    "email": 15,
+    "first_name": 10,
+    "last_name": 10,
+    "phone": 15,
+    "location": 10,
+    "customer_type": 20,
+    "sport_type": 10,
+    "interests": 10
+}
+
+BEHAVIORAL_POINTS = {
+    EngagementType.EMAIL_OPENED.value: 2,
+    EngagementType.EMAIL_CLICKED.value: 5,
+    EngagementType.EMAIL_REPLIED.value: 10,
+    EngagementType.FORM_SUBMITTED.value: 15,
+    EngagementType.PAGE_VIEWED.value: 1,
+    EngagementType.CONTENT_DOWNLOADED.value: 8,
+    EngagementType.MEETING_SCHEDULED.value: 20,
+    EngagementType.PURCHASE_MADE.value: 50
+}
+
+HIGH_INTENT_TYPES = [
+    EngagementType.PURCHASE_MADE.value,
+    EngagementType.MEETING_SCHEDULED.value,
+    EngagementType.CONTENT_DOWNLOADED.value,
+    EngagementType.FORM_SUBMITTED.value
+]
+
+TARGET_LOCATIONS = ["United States", "Canada", "United Kingdom", "Australia"]
+
+CUSTOMER_TYPE_POINTS = {"coach": 15, "team": 15, "bike_fitter": 10, "athlete": 5}
+
+SOURCE_POINTS = {
+    "referral": 15, "partner": 15, "shopify": 15,
+    "facebook_lead_ads": 10, "form_submission": 10,
+    "import": 5, "manual": 5
+}
+
+STAGE_ENGAGEMENT_SCORES = {
+    "customer": 100,
+    "opportunity": 80,
+    "engaged": 60,
+    "qualified": 50,
+    "contacted": 30,
+    "new": 15
+}
+
+STAGE_INTENT_POINTS = {"opportunity": 40, "engaged": 30, "qualified": 20}
+
+# Days since last contact at which the engagement recency points drop
+RECENCY_DECAY_DAYS = [7, 30, 90]
+
+GRADE_THRESHOLDS = [(90, "A+"), (80, "A"), (70, "B+"), (60, "B"), (50, "C+"), (40, "C")]
+
+TEMPERATURE_THRESHOLDS = [(75, "hot"), (50, "warm")]
+
+LEAD_COLUMNS = [
+    "id", "email", "first_name", "last_name", "phone", "location", "customer_type",
+    "sport_type", "interests", "source", "status", "email_consent", "sms_consent",
+    "last_contact_date", "created_at", "engagement_score"
+]
+
+
+def _truthy(series: pd.Series) -> pd.Series:
+    """Python truthiness of each value, treating None/NaN as false"""
+    return series.notna() & series.map(bool, na_action="ignore").fillna(False).astype(bool)
+
+
+def _classify(scores: np.ndarray, thresholds, default: str) -> np.ndarray:
+    """Label scores by the first threshold they reach"""
+    return np.select([scores >= limit for limit, _ in thresholds], [label for _, label in thresholds], default)
+
+
+class LeadScoringService:
+    """Service for scoring leads in bulk"""
+
+    # ============= Component Scores =============
+
+    @staticmethod
+    def demographic_scores(leads: pd.DataFrame) -> np.ndarray:
+        score = sum(_truthy(leads[field]).to_numpy() * points for field, points in DEMOGRAPHIC_POINTS.items())
+        return np.minimum(score, 100)
+
+    @staticmethod
+    def behavioral_scores(leads: pd.DataFrame, events: pd.DataFrame) -> np.ndarray:
+        points = (events["engagement_type"].map(BEHAVIORAL_POINTS).fillna(0) * events["count_90d"])
+        points = points.groupby(events["lead_id"]).sum().reindex(leads["id"], fill_value=0).to_numpy()
+        total = events.groupby("lead_id")["count_90d"].sum().reindex(leads["id"], fill_value=0).to_numpy()
+
+        bonus = np.select([total > 10, total > 5], [10, 5], 0)
+        return np.minimum(points + bonus, 100).astype(int)
+
+    @staticmethod
+    def firmographic_scores(leads: pd.DataFrame) -> np.ndarray:
+        location = leads["location"].fillna("").astype(str)
+        in_target_market = np.zeros(len(leads), dtype=bool)
+        for target in TARGET_LOCATIONS:
+            in_target_market |= location.str.contains(target, regex=False).to_numpy()
+
+        score = (
+            50
+            + in_target_market * 20
+            + leads["customer_type"].map(CUSTOMER_TYPE_POINTS).fillna(0).to_numpy()
+            + leads["source"].map(SOURCE_POINTS).fillna(0).to_numpy()
+        )
+        return np.minimum(score, 100).astype(int)
+
+    @staticmethod
+    def engagement_scores(leads: pd.DataFrame, now: datetime) -> np.ndarray:
+        last_contact = pd.to_datetime(leads["last_contact_date"], utc=True).dt.tz_convert(None)
+        days = (pd.Timestamp(now) - last_contact).dt.days.to_numpy()
+
+        recency = np.select(
+            [np.isnan(days)] + [days < limit for limit in RECENCY_DECAY_DAYS],
+            [0, 40, 30, 20],
+            10
+        )
+        score = (
+            recency
+            + _truthy(leads["email_consent"]).to_numpy() * 30
+            + _truthy(leads["sms_consent"]).to_numpy() * 15
+        )
+        stage = leads["status"].map(STAGE_ENGAGEMENT_SCORES).fillna(15).to_numpy()
+        return np.minimum(np.maximum(score, stage), 100).astype(int)
+
+    @staticmethod
+    def intent_scores(leads: pd.DataFrame, events: pd.DataFrame) -> np.ndarray:
+        high_intent = events[events["engagement_type"].isin(HIGH_INTENT_TYPES)]
+        high_intent = high_intent.groupby("lead_id")["count_30d"].sum().reindex(leads["id"], fill_value=0).to_numpy()
+
+        replies = events[events["engagement_type"] == EngagementType.EMAIL_REPLIED.value]
+        replies = replies.groupby("lead_id")["count_14d"].sum().reindex(leads["id"], fill_value=0).to_numpy()
+
+        score = (
+            np.minimum(high_intent * 15, 50)
+            + leads["status"].map(STAGE_INTENT_POINTS).fillna(0).to_numpy()
+            + np.minimum(replies * 10, 30)
+        )
+        return np.minimum(score, 100).astype(int)
+
+    @staticmethod
+    def total_scores(components: Dict[str, np.ndarray]) -> np.ndarray:
+        """Weighted total, truncated like int() in the per-lead calculation"""
+        total = (
+            (components["demographic"] * SCORE_WEIGHTS["demographic"]) +
+            (components["behavioral"] * SCORE_WEIGHTS["behavioral"]) +
+            (components["firmographic"] * SCORE_WEIGHTS["firmographic"]) +
+            (components["engagement"] * SCORE_WEIGHTS["engagement"]) +
+            (components["intent"] * SCORE_WEIGHTS["intent"])
+        )
+        return total.astype(int)
+
+    # ============= Loading =============
+
+    @staticmethod
+    def _load_leads(db: Session, lead_ids: List[int]) -> pd.DataFrame:
+        rows = db.query(*(getattr(Lead, column) for column in LEAD_COLUMNS)).filter(
+            Lead.id.in_(lead_ids)
+        ).order_by(Lead.id).all()
+        return pd.DataFrame.from_records(rows, columns=LEAD_COLUMNS)
+
+    @staticmethod
+    def _load_engagement_counts(db: Session, lead_ids: List[int], now: datetime) -> pd.DataFrame:
+        """Engagement counts per lead and type over each scoring window"""
+        rows = db.query(
+            EngagementHistory.lead_id,
+            EngagementHistory.engagement_type,
+            func.count(EngagementHistory.id),
+            func.sum(case((EngagementHistory.engaged_at >= now - timedelta(days=INTENT_WINDOW_DAYS), 1), else_=0)),
+            func.sum(case((EngagementHistory.engaged_at >= now - timedelta(days=REPLY_WINDOW_DAYS), 1), else_=0))
+        ).filter(
+            EngagementHistory.lead_id.in_(lead_ids),
+            EngagementHistory.engaged_at >= now - timedelta(days=BEHAVIORAL_WINDOW_DAYS)
+        ).group_by(
+            EngagementHistory.lead_id, EngagementHistory.engagement_type
+        ).all()
+
+        return pd.DataFrame.from_records(
+            rows, columns=["lead_id", "engagement_type", "count_90d", "count_30d", "count_14d"]
+        ).astype({"count_90d": int, "count_30d": int, "count_14d": int})
+
+    @staticmethod
+    def _load_existing_scores(db: Session, lead_ids: List[int]) -> Dict[int, Any]:
+        """lead_id -> (score id, total_score) of each lead's first LeadScore row"""
+        existing = {}
+        rows = db.query(LeadScore.id, LeadScore.lead_id, LeadScore.total_score).filter(
+            LeadScore.lead_id.in_(lead_ids)
+        ).order_by(LeadScore.id)
+        for score_id, lead_id, total_score in rows:
+            existing.setdefault(lead_id, (score_id, total_score))
+        return existing
+
+    # ============= Scoring =============
+
+    def score_frame(self, leads: pd.DataFrame, events: pd.DataFrame, now: datetime) -> Dict[str, np.ndarray]:
+        """Compute every score column for a frame of leads"""
+        components = {
+            "demographic": self.demographic_scores(leads),
+            "behavioral": self.behavioral_scores(leads, events),
+            "firmographic": self.firmographic_scores(leads),
+            "engagement": self.engagement_scores(leads, now),
+            "intent": self.intent_scores(leads, events)
+        }
+        total = self.total_scores(components)
+
+        return {
+            **components,
+            "total": total,
+            "grade": _classify(total, GRADE_THRESHOLDS, "D"),
+            "temperature": _classify(total, TEMPERATURE_THRESHOLDS, "cold")
+        }
+
+    def _score_batch(self, db: Session, lead_ids: List[int], now: datetime) -> List[Dict[str, Any]]:
+        """Score one batch of leads and write the results back"""
+        leads = self._load_leads(db, lead_ids)
+        if leads.empty:
+            return []
+
+        scores = self.score_frame(leads, self._load_engagement_counts(db, lead_ids, now), now)
+        existing = self._load_existing_scores(db, lead_ids)
+
+        columns = {key: values.tolist() for key, values in scores.items()}
+        score_updates, score_inserts, lead_updates, results = [], [], [], []
+
+        for i, lead in enumerate(leads.itertuples(index=False)):
+            total = columns["total"][i]
+            components = {name: columns[name][i] for name in SCORE_WEIGHTS}
+            score_id, previous_score = existing.get(lead.id, (None, None))
+
+            row = {
+                "demographic_score": components["demographic"],
+                "behavioral_score": components["behavioral"],
+                "firmographic_score": components["firmographic"],
+                "engagement_score": components["engagement"],
+                "intent_score": components["intent"],
+                "total_score": total,
+                "previous_score": previous_score,
+                "grade": columns["grade"][i],
+                "temperature": columns["temperature"][i],
+                "score_change_amount": total - previous_score if previous_score else 0,
+                "score_changed": bool(previous_score) and total != previous_score,
+                "score_factors": {**components, "weights": SCORE_WEIGHTS},
+                "last_calculated_at": now,
+                "last_activity_date": self._activity_date(lead)
+            }
+
+            if score_id is None:
+                score_inserts.append({"lead_id": lead.id, **row})
+            else:
+                score_updates.append({"id": score_id, **row})
+
+            if lead.engagement_score != total:
+                lead_updates.append({"id": lead.id, "engagement_score": total})
+
+            results.append({
+                "lead_id": lead.id,
+                "total_score": total,
+                "grade": row["grade"],
+                "temperature": row["temperature"]
+            })
+
+        if score_updates:
+            db.execute(update(LeadScore), score_updates)
+        if score_inserts:
+            db.execute(insert(LeadScore), score_inserts)
+        if lead_updates:
+            db.execute(update(Lead), lead_updates)
+
+        # Running aggregates reseed from history on the lead's next engagement
+        db.query(LeadScoreAggregate).filter(
+            LeadScoreAggregate.lead_id.in_(lead_ids)
+        ).delete(synchronize_session=False)
+        db.commit()
+
+        if lead_updates:
+            segment_service.refresh_lead_memberships(
+                [row["id"] for row in lead_updates], db, changed_fields={"engagement_score"}
+            )
+
+        for lead in leads.itertuples(index=False):
+            due_scheduler.schedule(SCORE_DECAY_JOB, lead.id, self.next_decay_at(lead.last_contact_date, now))
+
+        return results
+
+    @staticmethod
+    def next_decay_at(last_contact_date, scored_at: datetime) -> Optional[datetime]:
+        """When a score calculated at scored_at next loses recency points, in naive UTC"""
+        if last_contact_date is None or pd.isna(last_contact_date):
+            return None
+
+        last_contact = pd.Timestamp(last_contact_date)
+        if last_contact.tzinfo is not None:
+            last_contact = last_contact.tz_convert(timezone.utc).tz_localize(None)
+        if scored_at.tzinfo is not None:
+            scored_at = scored_at.astimezone(timezone.utc).replace(tzinfo=None)
+
+        for days in RECENCY_DECAY_DAYS:
+            decay_at = last_contact.to_pydatetime() + timedelta(days=days)
+            if decay_at > scored_at:
+                return decay_at
+        return None
+
+    def scheduled_times(self, db: Session, until: datetime) -> List[Tuple[int, datetime]]:
+        """Next decay time of every scored lead, up to until"""
+        rows = db.query(LeadScore.lead_id, Lead.last_contact_date, LeadScore.last_calculated_at).join(
+            Lead, Lead.id == LeadScore.lead_id
+        ).filter(
+            Lead.last_contact_date.isnot(None),
+            self._decays_by(db, until)
+        ).yield_per(SCORING_BATCH_SIZE)
+
+        times = []
+        for lead_id, last_contact_date, last_calculated_at in rows:
+            decay_at = self.next_decay_at(last_contact_date, last_calculated_at or datetime.min)
+            if decay_at is not None and decay_at <= until:
+                times.append((lead_id, decay_at))
+        return times
+
+    @staticmethod
+    def _decays_by(db: Session, until: datetime):
+        """
+        Filter for scores with a recency threshold after their last
+        calculation and on or before until. Thresholds are compared in
+        julian days on SQLite, which has no interval arithmetic.
+        """
+        sqlite = db.get_bind().dialect.name == "sqlite"
+        windows = []
+        for days in RECENCY_DECAY_DAYS:
+            if sqlite:
+                after_scoring = func.julianday(Lead.last_contact_date) + days > func.julianday(LeadScore.last_calculated_at)
+            else:
+                after_scoring = Lead.last_contact_date + timedelta(days=days) > LeadScore.last_calculated_at
+            windows.append(and_(
+                Lead.last_contact_date <= until - timedelta(days=days),
+                or_(LeadScore.last_calculated_at.is_(None), after_scoring)
+            ))
+        return or_(*windows)
+
+    @staticmethod
+    def _activity_date(lead) -> Optional[datetime]:
+        """last_contact_date or created_at as a plain datetime"""
+        for value in (lead.last_contact_date, lead.created_at):
+            if value is not None and not pd.isna(value):
+                return value.to_pydatetime() if isinstance(value, pd.Timestamp) else value
+        return None
+
+    def bulk_calculate(
+        self,
+        db: Session,
+        lead_ids: Optional[List[int]] = None,
+        batch_size: int = SCORING_BATCH_SIZE
+    ) -> Dict[str, Any]:
+        """
+        Recalculate LeadScore rows for the given leads, or every lead.
+
+        Returns totals and the new score, grade and temperature per lead.
+        """
+        query = db.query(Lead.id)
+        if lead_ids is not None:
+            query = query.filter(Lead.id.in_(lead_ids))
+        lead_ids = [lead_id for (lead_id,) in query.order_by(Lead.id)]
+
+        results = {
+            "total_leads": len(lead_ids),
+            "calculated": 0,
+            "failed": 0,
+            "scores": []
+        }
+        now = datetime.utcnow()
+
+        for i in range(0, len(lead_ids), batch_size):
+            batch = lead_ids[i:i + batch_size]
+            try:
+                scores = self._score_batch(db, batch, now)
+                results["calculated"] += len(scores)
+                results["scores"].extend(scores)
+            except Exception as e:
+                db.rollback()
+                results["failed"] += len(batch)
+                print(f"Error calculating scores for {len(batch)} leads: {str(e)}")
+
+        return results
+
+
+# Singleton instance
+lead_scoring_service = LeadScoringService()
@@ -1,22 +1,32 @@
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, List, Dict, Optional, Tuple
+from collections import Counter
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, or_, desc
 from datetime import datetime, timedelta
 import json
 
+from app.core.config import settings
 from app.models.lead import Lead
 from app.models.lead_tracking import (
-    LeadLifecycle, LeadScore, EngagementHistory,
+    LeadLifecycle, LeadScore, LeadScoreAggregate, EngagementHistory,
     LeadAttribution, LeadJourney, LeadActivitySummary,
     LeadStage, EngagementType, AttributionModel
 )
+from app.services.due_scheduler import due_scheduler
+from app.services.lead_scoring_service import (
+    BEHAVIORAL_POINTS, BEHAVIORAL_WINDOW_DAYS, HIGH_INTENT_TYPES,
+    INTENT_WINDOW_DAYS, REPLY_WINDOW_DAYS, SCORE_DECAY_JOB, SCORE_WEIGHTS,
+    lead_scoring_service
+)
+from app.services.segment_service import segment_service
 
 
 class LeadTrackingService:
     """Service for lead lifecycle tracking, scoring, and attribution"""
 
     def __init__(self):
-        pass
+        # Callbacks run with (lead, lead_score) when a lead turns hot
+        self.hot_lead_listeners: List[Callable[[Lead, LeadScore], None]] = []
 
     # ============= Lifecycle Management =============
 
@@ -69,6 +79,8 @@ class LeadTrackingService:
         db.commit()
         db.refresh(new_lifecycle)
 
+        segment_service.refresh_lead_memberships([lead.id], db, changed_fields={"status"})
+
         return new_lifecycle
 
     def get_lead_lifecycle_history(
@@ -105,6 +117,25 @@ class LeadTrackingService:
     ) -> LeadScore:
         """Calculate comprehensive lead score"""
 
+        # Calculate component scores (each 0-100)
+        components = {
+            "demographic": self._calculate_demographic_score(lead),
+            "behavioral": self._calculate_behavioral_score(lead, db),
+            "firmographic": self._calculate_firmographic_score(lead),
+            "engagement": self._calculate_engagement_score(lead, db),
+            "intent": self._calculate_intent_score(lead, db)
+        }
+
+        return self._save_lead_score(lead, components, db)
+
+    def _save_lead_score(
+        self,
+        lead: Lead,
+        components: Dict[str, int],
+        db: Session
+    ) -> LeadScore:
+        """Store component scores with their total, grade and temperature"""
+
         # Get or create lead score record
         lead_score = db.query(LeadScore).filter(
             LeadScore.lead_id == lead.id
@@ -117,35 +148,22 @@ class LeadTrackingService:
             # Store previous score
             lead_score.previous_score = lead_score.total_score
 
-        # Calculate demographic score (0-100)
-        demographic_score = self._calculate_demographic_score(lead)
-
-        # Calculate behavioral score (0-100)
-        behavioral_score = self._calculate_behavioral_score(lead, db)
-
-        # Calculate firmographic score (0-100)
-        firmographic_score = self._calculate_firmographic_score(lead)
-
-        # Calculate engagement score (0-100)
-        engagement_score = self._calculate_engagement_score(lead, db)
-
-        # Calculate intent score (0-100)
-        intent_score = self._calculate_intent_score(lead, db)
+        previous_temperature = lead_score.temperature
 
         # Update component scores
-        lead_score.demographic_score = demographic_score
-        lead_score.behavioral_score = behavioral_score
-        lead_score.firmographic_score = firmographic_score
-        lead_score.engagement_score = engagement_score
-        lead_score.intent_score = intent_score
+        lead_score.demographic_score = components["demographic"]
+        lead_score.behavioral_score = components["behavioral"]
+        lead_score.firmographic_score = components["firmographic"]
+        lead_score.engagement_score = components["engagement"]
+        lead_score.intent_score = components["intent"]
 
         # Calculate weighted total score
         total_score = int(
-            (demographic_score * 0.20) +
-            (behavioral_score * 0.25) +
-            (firmographic_score * 0.15) +
-            (engagement_score * 0.25) +
-            (intent_score * 0.15)
+            (components["demographic"] * SCORE_WEIGHTS["demographic"]) +
+            (components["behavioral"] * SCORE_WEIGHTS["behavioral"]) +
+            (components["firmographic"] * SCORE_WEIGHTS["firmographic"]) +
+            (components["engagement"] * SCORE_WEIGHTS["engagement"]) +
+            (components["intent"] * SCORE_WEIGHTS["intent"])
         )
 
         lead_score.total_score = total_score
@@ -184,18 +202,8 @@ class LeadTrackingService:
 
         # Store score factors
         lead_score.score_factors = {
-            "demographic": demographic_score,
-            "behavioral": behavioral_score,
-            "firmographic": firmographic_score,
-            "engagement": engagement_score,
-            "intent": intent_score,
-            "weights": {
-                "demographic": 0.20,
-                "behavioral": 0.25,
-                "firmographic": 0.15,
-                "engagement": 0.25,
-                "intent": 0.15
-            }
+            **components,
+            "weights": dict(SCORE_WEIGHTS)
         }
 
         lead_score.last_calculated_at = datetime.utcnow()
@@ -208,8 +216,27 @@ class LeadTrackingService:
         lead.engagement_score = total_score
         db.commit()
 
+        segment_service.refresh_lead_memberships([lead.id], db, changed_fields={"engagement_score"})
+
+        due_scheduler.schedule(
+            SCORE_DECAY_JOB, lead.id,
+            lead_scoring_service.next_decay_at(lead.last_contact_date, lead_score.last_calculated_at)
+        )
+
+        if lead_score.temperature == "hot" and previous_temperature != "hot":
+            self._notify_hot_lead(lead, lead_score)
+
         return lead_score
 
+    def _notify_hot_lead(self, lead: Lead, lead_score: LeadScore):
+        """Run hot lead listeners, isolating their failures"""
+        print(f"Lead {lead.id} is now hot (score {lead_score.total_score})")
+        for listener in self.hot_lead_listeners:
+            try:
+                listener(lead, lead_score)
+            except Exception as e:
+                print(f"Error in hot lead listener: {str(e)}")
+
     def _calculate_demographic_score(self, lead: Lead) -> int:
         """Calculate demographic fit score based on profile completeness"""
         score = 0
@@ -242,42 +269,33 @@ class LeadTrackingService:
 
     def _calculate_behavioral_score(self, lead: Lead, db: Session) -> int:
         """Calculate behavioral score based on past actions"""
-        score = 0
 
-        # Get engagement history
-        recent_engagements = db.query(EngagementHistory).filter(
+        # Get engagement counts by type
+        recent_engagements = db.query(
+            EngagementHistory.engagement_type, func.count(EngagementHistory.id)
+        ).filter(
             and_(
                 EngagementHistory.lead_id == lead.id,
-                EngagementHistory.engaged_at >= datetime.utcnow() - timedelta(days=90)
+                EngagementHistory.engaged_at >= datetime.utcnow() - timedelta(days=BEHAVIORAL_WINDOW_DAYS)
             )
-        ).all()
+        ).group_by(EngagementHistory.engagement_type).all()
 
-        if not recent_engagements:
+        return self._behavioral_score_from_counts(dict(recent_engagements))
+
+    @staticmethod
+    def _behavioral_score_from_counts(type_counts: Dict[str, int]) -> int:
+        """Behavioral score from engagement counts by type in the window"""
+        total = sum(type_counts.values())
+        if not total:
             return 0
 
         # Score based on engagement types
-        for engagement in recent_engagements:
-            if engagement.engagement_type == EngagementType.EMAIL_OPENED:
-                score += 2
-            elif engagement.engagement_type == EngagementType.EMAIL_CLICKED:
-                score += 5
-            elif engagement.engagement_type == EngagementType.EMAIL_REPLIED:
-                score += 10
-            elif engagement.engagement_type == EngagementType.FORM_SUBMITTED:
-                score += 15
-            elif engagement.engagement_type == EngagementType.PAGE_VIEWED:
-                score += 1
-            elif engagement.engagement_type == EngagementType.CONTENT_DOWNLOADED:
-                score += 8
-            elif engagement.engagement_type == EngagementType.MEETING_SCHEDULED:
-                score += 20
-            elif engagement.engagement_type == EngagementType.PURCHASE_MADE:
-                score += 50
+        score = sum(BEHAVIORAL_POINTS.get(engagement_type, 0) * count for engagement_type, count in type_counts.items())
 
         # Engagement frequency bonus
-        if len(recent_engagements) > 10:
+        if total > 10:
             score += 10
-        elif len(recent_engagements) > 5:
+        elif total > 5:
             score += 5
 
         return min(score, 100)
@@ -349,23 +367,31 @@ class LeadTrackingService:
 
     def _calculate_intent_score(self, lead: Lead, db: Session) -> int:
         """Calculate purchase intent score"""
-        score = 0
 
         # Get recent high-intent activities
         high_intent_activities = db.query(EngagementHistory).filter(
             and_(
                 EngagementHistory.lead_id == lead.id,
-                EngagementHistory.engaged_at >= datetime.utcnow() - timedelta(days=30),
-                EngagementHistory.engagement_type.in_([
-                    EngagementType.PURCHASE_MADE,
-                    EngagementType.MEETING_SCHEDULED,
-                    EngagementType.CONTENT_DOWNLOADED,
-                    EngagementType.FORM_SUBMITTED
-                ])
+                EngagementHistory.engaged_at >= datetime.utcnow() - timedelta(days=INTENT_WINDOW_DAYS),
+                EngagementHistory.engagement_type.in_(HIGH_INTENT_TYPES)
             )
         ).count()
 
-        score += min(high_intent_activities * 15, 50)
+        # Recent replies indicate intent
+        recent_replies = db.query(EngagementHistory).filter(
+            and_(
+                EngagementHistory.lead_id == lead.id,
+                EngagementHistory.engaged_at >= datetime.utcnow() - timedelta(days=REPLY_WINDOW_DAYS),
+                EngagementHistory.engagement_type == EngagementType.EMAIL_REPLIED
+            )
+        ).count()
+
+        return self._intent_score_from_counts(lead, high_intent_activities, recent_replies)
+
+    @staticmethod
+    def _intent_score_from_counts(lead: Lead, high_intent_activities: int, recent_replies: int) -> int:
+        """Intent score from recent high-intent activity and reply counts"""
+        score = min(high_intent_activities * 15, 50)
 
         # Stage-based intent
         if lead.status == "opportunity":
@@ -375,19 +401,98 @@ class LeadTrackingService:
         elif lead.status == "qualified":
             score += 20
 
-        # Recent replies indicate intent
-        recent_replies = db.query(EngagementHistory).filter(
-            and_(
-                EngagementHistory.lead_id == lead.id,
-                EngagementHistory.engaged_at >= datetime.utcnow() - timedelta(days=14),
-                EngagementHistory.engagement_type == EngagementType.EMAIL_REPLIED
-            )
-        ).count()
-
         score += min(recent_replies * 10, 30)
 
         return min(score, 100)
 
+    # ============= Incremental Scoring =============
+
+    @staticmethod
+    def _window_start(now: datetime, days: int) -> str:
+        """First UTC day (ISO date) inside a scoring window"""
+        return (now - timedelta(days=days)).date().isoformat()
+
+    def _seed_daily_counts(self, lead_id: int, now: datetime, db: Session) -> Dict[str, Dict[str, int]]:
+        """Build a lead's daily engagement counts from its history"""
+        window_start = datetime.fromisoformat(self._window_start(now, BEHAVIORAL_WINDOW_DAYS))
+        rows = db.query(
+            func.date(EngagementHistory.engaged_at),
+            EngagementHistory.engagement_type,
+            func.count(EngagementHistory.id)
+        ).filter(
+            EngagementHistory.lead_id == lead_id,
+            EngagementHistory.engaged_at >= window_start
+        ).group_by(
+            func.date(EngagementHistory.engaged_at), EngagementHistory.engagement_type
+        ).all()
+
+        daily_counts: Dict[str, Dict[str, int]] = {}
+        for day, engagement_type, count in rows:
+            day_counts = daily_counts.setdefault(str(day)[:10], {})
+            day_counts[engagement_type] = day_counts.get(engagement_type, 0) + count
+        return daily_counts
+
+    def update_score_for_engagement(
+        self,
+        lead: Lead,
+        engagement: EngagementHistory,
+        db: Session
+    ) -> LeadScore:
+        """
+        Update a lead's score for one new engagement without rescanning history.
+
+        Keeps per-day engagement counts for the lead in LeadScoreAggregate,
+        seeded from history on first use, and recomputes the components
+        from them. Windows are whole UTC days; bulk rescoring reconciles.
+        """
+        now = datetime.utcnow()
+        window_start = self._window_start(now, BEHAVIORAL_WINDOW_DAYS)
+
+        # Locked until the score is saved so concurrent engagements do not lose increments
+        aggregate = db.query(LeadScoreAggregate).filter(
+            LeadScoreAggregate.lead_id == lead.id
+        ).with_for_update().first()
+
+        if aggregate is None:
+            # The committed engagement is part of the seeded history
+            daily_counts = self._seed_daily_counts(lead.id, now, db)
+            aggregate = LeadScoreAggregate(lead_id=lead.id, daily_counts=daily_counts)
+            db.add(aggregate)
+        else:
+            daily_counts = {
+                day: dict(counts) for day, counts in (aggregate.daily_counts or {}).items()
+                if day >= window_start
+            }
+            day = (engagement.engaged_at or now).date().isoformat()
+            day_counts = daily_counts.setdefault(day, {})
+            day_counts[engagement.engagement_type] = day_counts.get(engagement.engagement_type, 0) + 1
+            aggregate.daily_counts = daily_counts
+
+        intent_start = self._window_start(now, INTENT_WINDOW_DAYS)
+        reply_start = self._window_start(now, REPLY_WINDOW_DAYS)
+
+        type_counts: Counter = Counter()
+        high_intent_activities = 0
+        recent_replies = 0
+        for day, counts in daily_counts.items():
+            if day < window_start:
+                continue
+            type_counts.update(counts)
+            if day >= intent_start:
+                high_intent_activities += sum(counts.get(t, 0) for t in HIGH_INTENT_TYPES)
+            if day >= reply_start:
+                recent_replies += counts.get(EngagementType.EMAIL_REPLIED.value, 0)
+
+        components = {
+            "demographic": self._calculate_demographic_score(lead),
+            "behavioral": self._behavioral_score_from_counts(type_counts),
+            "firmographic": self._calculate_firmographic_score(lead),
+            "engagement": self._calculate_engagement_score(lead, db),
+            "intent": self._intent_score_from_counts(lead, high_intent_activities, recent_replies)
+        }
+
+        return self._save_lead_score(lead, components, db)
+
     def apply_score_decay(
         self,
         lead_score: LeadScore,
@@ -481,6 +586,17 @@ class LeadTrackingService:
         db.commit()
         db.refresh(engagement)
 
+        if lead:
+            segment_service.refresh_lead_memberships([lead.id], db, changed_fields={"last_contact_date"})
+
+        # Keep the lead score current without a full recalculation
+        if settings.INCREMENTAL_LEAD_SCORING and lead:
+            try:
+                self.update_score_for_engagement(lead, engagement, db)
+            except Exception as e:
+                db.rollback()
+                print(f"Error updating score for lead {lead_id}: {str(e)}")
+
         return engagement
 
     def get_engagement_history(
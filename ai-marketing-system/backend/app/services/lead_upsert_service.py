@@ -0,0 +1,230 @@
+"""
+Lead Bulk Upsert
+
+Every lead ingestion path (manual create, file import, Shopify and Facebook
+syncs) writes through LeadUpsertService, keyed on the unique Lead.email.
+Rows are written with a single INSERT ... ON CONFLICT (email) DO UPDATE per
+batch on SQLite and PostgreSQL, and each column is merged with an existing
+lead according to its MergePolicy.
+"""
+
+import enum
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, case, func, insert, or_, update
+from sqlalchemy.orm import Session
+
+from app.models.lead import Lead
+
+
+# Rows per upsert statement
+UPSERT_BATCH_SIZE = 1000
+
+
+class MergePolicy(str, enum.Enum):
+    KEEP = "keep"                  # Existing value always wins
+    OVERWRITE = "overwrite"        # Incoming value wins unless it is null
+    FILL_IF_NULL = "fill_if_null"  # Incoming value only fills an empty column
+    REVOKE_ONLY = "revoke_only"    # Incoming False always wins; anything else only fills an empty column
+
+
+class LeadUpsertService:
+    """Bulk insert-or-merge of leads keyed on email"""
+
+    def _merge_duplicate(
+        self,
+        existing: Dict[str, Any],
+        incoming: Dict[str, Any],
+        policies: Dict[str, MergePolicy],
+        default_policy: MergePolicy
+    ):
+        """Fold a repeated email within one batch into the first row, as the database would"""
+        for column, value in incoming.items():
+            policy = policies.get(column, default_policy)
+            if value is None or policy == MergePolicy.KEEP:
+                continue
+            if policy == MergePolicy.REVOKE_ONLY and value is False:
+                existing[column] = value
+            elif policy == MergePolicy.OVERWRITE or existing.get(column) is None:
+                existing[column] = value
+
+    def _prepare_rows(
+        self,
+        rows: Iterable[Dict[str, Any]],
+        policies: Dict[str, MergePolicy],
+        default_policy: MergePolicy
+    ) -> Dict[str, Dict[str, Any]]:
+        prepared: Dict[str, Dict[str, Any]] = {}
+
+        for row in rows:
+            email = (row.get("email") or "").strip()
+            if not email:
+                raise ValueError("Lead rows require an email")
+
+            row = {**row, "email": email}
+            if email in prepared:
+                self._merge_duplicate(prepared[email], row, policies, default_policy)
+            else:
+                prepared[email] = row
+
+        return prepared
+
+    def _lookup_ids(self, db: Session, emails: List[str]) -> Dict[str, int]:
+        ids = {}
+        for start in range(0, len(emails), UPSERT_BATCH_SIZE):
+            batch = emails[start:start + UPSERT_BATCH_SIZE]
+            ids.update(db.query(Lead.email, Lead.id).filter(Lead.email.in_(batch)))
+        return ids
+
+    def _dialect_insert(self, db: Session):
+        dialect = db.get_bind().dialect.name
+
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            return None
+        return insert
+
+    def _upsert_group(
+        self,
+        db: Session,
+        rows: List[Dict[str, Any]],
+        columns: List[str],
+        policies: Dict[str, MergePolicy],
+        default_policy: MergePolicy
+    ) -> Dict[str, int]:
+        """Upsert rows sharing one column set, returning ids of inserted or changed leads"""
+        dialect_insert = self._dialect_insert(db)
+        if dialect_insert is None:
+            return self._upsert_portable(db, rows, columns, policies, default_policy)
+
+        statement = dialect_insert(Lead)
+
+        # Values on conflict, and the condition under which any of them changes
+        assignments = {}
+        changes = []
+        for column in columns:
+            policy = policies.get(column, default_policy)
+            if column == "email" or policy == MergePolicy.KEEP:
+                continue
+
+            current, incoming = Lead.__table__.c[column], statement.excluded[column]
+            if policy == MergePolicy.OVERWRITE:
+                assignments[column] = func.coalesce(incoming, current)
+                changes.append(and_(incoming.isnot(None), current.is_distinct_from(incoming)))
+            elif policy == MergePolicy.REVOKE_ONLY:
+                assignments[column] = case((incoming.is_(False), incoming), else_=func.coalesce(current, incoming))
+                changes.append(or_(
+                    and_(incoming.is_(False), current.is_distinct_from(incoming)),
+                    and_(current.is_(None), incoming.isnot(None))
+                ))
+            else:
+                assignments[column] = func.coalesce(current, incoming)
+                changes.append(and_(current.is_(None), incoming.isnot(None)))
+
+        if assignments:
+            statement = statement.on_conflict_do_update(
+                index_elements=["email"],
+                set_={**assignments, "updated_at": func.now()},
+                where=or_(*changes)
+            )
+        else:
+            statement = statement.on_conflict_do_nothing(index_elements=["email"])
+
+        returned = {}
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            returned.update(db.execute(statement.returning(Lead.email, Lead.id), batch).all())
+        return returned
+
+    def _upsert_portable(
+        self,
+        db: Session,
+        rows: List[Dict[str, Any]],
+        columns: List[str],
+        policies: Dict[str, MergePolicy],
+        default_policy: MergePolicy
+    ) -> Dict[str, int]:
+        """Select-then-write fallback for databases without ON CONFLICT"""
+        existing = {
+            lead.email: lead for lead in db.query(Lead).filter(Lead.email.in_([row["email"] for row in rows]))
+        }
+
+        new_rows = [row for row in rows if row["email"] not in existing]
+        returned = {}
+        if new_rows:
+            returned.update(db.execute(insert(Lead).returning(Lead.email, Lead.id), new_rows).all())
+
+        updates = []
+        for row in rows:
+            lead = existing.get(row["email"])
+            if lead is None:
+                continue
+            merged = {column: getattr(lead, column) for column in columns}
+            self._merge_duplicate(merged, row, policies, default_policy)
+            changed = {
+                column: value for column, value in merged.items()
+                if value != getattr(lead, column)
+            }
+            if changed:
+                updates.append({"id": lead.id, **changed})
+                returned[lead.email] = lead.id
+
+        for values in updates:
+            db.execute(update(Lead).where(Lead.id == values.pop("id")).values(**values, updated_at=func.now()))
+        return returned
+
+    def upsert_leads(
+        self,
+        db: Session,
+        rows: Iterable[Dict[str, Any]],
+        policies: Optional[Dict[str, MergePolicy]] = None,
+        default_policy: MergePolicy = MergePolicy.FILL_IF_NULL
+    ) -> Dict[str, Any]:
+        """
+        Insert new leads and merge the rest into existing leads by email.
+
+        Columns missing from a row are left alone. Does not commit; the
+        caller commits and refreshes segment memberships for the touched
+        leads. Returns lead ids by email plus the inserted, updated and
+        unchanged id lists.
+        """
+        policies = {column: MergePolicy(policy) for column, policy in (policies or {}).items()}
+        prepared = self._prepare_rows(rows, policies, default_policy)
+
+        result = {"ids": {}, "inserted": [], "updated": [], "unchanged": []}
+        if not prepared:
+            return result
+
+        existing = self._lookup_ids(db, list(prepared))
+
+        # One statement per column set, so absent columns keep their defaults
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for row in prepared.values():
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+
+        written = {}
+        for columns, group in groups.items():
+            written.update(self._upsert_group(db, group, list(columns), policies, default_policy))
+
+        # Leads created concurrently since the lookup above were left untouched
+        missing = [email for email in prepared if email not in existing and email not in written]
+        if missing:
+            existing.update(self._lookup_ids(db, missing))
+
+        for email in prepared:
+            if email in existing:
+                lead_id = existing[email]
+                result["updated" if email in written else "unchanged"].append(lead_id)
+            else:
+                lead_id = written[email]
+                result["inserted"].append(lead_id)
+            result["ids"][email] = lead_id
+
+        return result
+
+
+# Singleton instance
+lead_upsert_service = LeadUpsertService()
@@ -16,6 +16,8 @@ from scipy import stats
 import numpy as np
 
 from app.core.config import settings
+from app.core.http_clients import http_clients
+from app.services.meta_graph_batch import graph_batch_client
 from app.models.meta_ab_test import MetaABTest, MetaABTestVariant, MetaABTestResult
 from app.models.user import User
 
@@ -33,7 +35,7 @@ class MetaExperimentsService:
     async def verify_ad_account(self, ad_account_id: str) -> Dict:
         """Verify access to an ad account"""
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            async with http_clients.borrow("meta") as client:
                 response = await client.get(
                     f"{self.base_url}/act_{ad_account_id}",
                     params={
@@ -70,7 +72,7 @@ class MetaExperimentsService:
     ) -> Dict:
         """Create a Facebook Experiment (A/B test)"""
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
+            async with http_clients.borrow("meta") as client:
                 # Step 1: Create Campaign if not exists
                 if not test.campaign_id:
                     campaign = await self._create_campaign(client, test)
@@ -238,7 +240,7 @@ class MetaExperimentsService:
             return {"success": False, "error": "No Meta experiment ID found"}
 
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            async with http_clients.borrow("meta") as client:
                 # Update experiment status
                 response = await client.post(
                     f"{self.base_url}/{test.meta_experiment_id}",
@@ -272,7 +274,7 @@ class MetaExperimentsService:
             return {"success": False, "error": "Test not found"}
 
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            async with http_clients.borrow("meta") as client:
                 response = await client.post(
                     f"{self.base_url}/{test.meta_experiment_id}",
                     data={
@@ -301,56 +303,23 @@ class MetaExperimentsService:
             return {"success": False, "error": "Test not found"}
 
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                # Fetch results for each variant
-                variants = db.query(MetaABTestVariant).filter(
-                    MetaABTestVariant.test_id == test_id
-                ).all()
+            # Fetch results for all variants concurrently; their Graph API calls share batches
+            variants = db.query(MetaABTestVariant).filter(
+                MetaABTestVariant.test_id == test_id,
+                MetaABTestVariant.ad_id.isnot(None)
+            ).all()
 
-                for variant in variants:
-                    if not variant.ad_id:
-                        continue
-
-                    # Fetch ad insights
-                    response = await client.get(
-                        f"{self.base_url}/{variant.ad_id}/insights",
-                        params={
-                            "access_token": self.access_token,
-                            "fields": "impressions,reach,clicks,conversions,spend,cpm,cpc,ctr,conversion_rate",
-                            "date_preset": "lifetime"
-                        }
-                    )
-                    response.raise_for_status()
-                    insights = response.json().get("data", [{}])[0]
-
-                    # Update variant metrics
-                    variant.impressions = insights.get("impressions", 0)
-                    variant.reach = insights.get("reach", 0)
-                    variant.clicks = insights.get("clicks", 0)
-                    variant.conversions = insights.get("conversions", 0)
-                    variant.spend = float(insights.get("spend", 0))
-                    variant.cpm = float(insights.get("cpm", 0))
-                    variant.cpc = float(insights.get("cpc", 0))
-                    variant.ctr = float(insights.get("ctr", 0))
-                    variant.conversion_rate = float(insights.get("conversion_rate", 0))
-
-                    # Calculate ROAS if applicable
-                    if variant.conversions > 0 and variant.spend > 0:
-                        # This is simplified - in reality you'd need conversion value
-                        variant.roas = (variant.conversions * 50) / variant.spend  # Assuming $50 value per conversion
-
-                    # Store time-series data
-                    await self._fetch_time_series_data(db, test, variant, client)
+            await asyncio.gather(*(self._fetch_variant_results(db, test, variant) for variant in variants))
 
-                db.commit()
+            db.commit()
 
-                # Analyze results
-                analysis = self.analyze_experiment(db, test_id)
+            # Analyze results
+            analysis = self.analyze_experiment(db, test_id)
 
-                return {
-                    "success": True,
-                    "results": analysis
-                }
+            return {
+                "success": True,
+                "results": analysis
+            }
 
         except Exception as e:
             return {
@@ -358,19 +327,52 @@ class MetaExperimentsService:
                 "error": f"Failed to fetch results: {str(e)}"
             }
 
+    async def _fetch_variant_results(self, db: Session, test: MetaABTest, variant: MetaABTestVariant):
+        """Fetch lifetime and daily insights for a variant's ad"""
+        # Fetch ad insights
+        response, _ = await asyncio.gather(
+            graph_batch_client.get(
+                f"{variant.ad_id}/insights",
+                self.access_token,
+                params={
+                    "fields": "impressions,reach,clicks,conversions,spend,cpm,cpc,ctr,conversion_rate",
+                    "date_preset": "lifetime"
+                }
+            ),
+            # Store time-series data
+            self._fetch_time_series_data(db, test, variant)
+        )
+        response.raise_for_status()
+        insights = response.json().get("data", [{}])[0]
+
+        # Update variant metrics
+        variant.impressions = insights.get("impressions", 0)
+        variant.reach = insights.get("reach", 0)
+        variant.clicks = insights.get("clicks", 0)
+        variant.conversions = insights.get("conversions", 0)
+        variant.spend = float(insights.get("spend", 0))
+        variant.cpm = float(insights.get("cpm", 0))
+        variant.cpc = float(insights.get("cpc", 0))
+        variant.ctr = float(insights.get("ctr", 0))
+        variant.conversion_rate = float(insights.get("conversion_rate", 0))
+
+        # Calculate ROAS if applicable
+        if variant.conversions > 0 and variant.spend > 0:
+            # This is simplified - in reality you'd need conversion value
+            variant.roas = (variant.conversions * 50) / variant.spend  # Assuming $50 value per conversion
+
     async def _fetch_time_series_data(
         self,
         db: Session,
         test: MetaABTest,
-        variant: MetaABTestVariant,
-        client: httpx.AsyncClient
+        variant: MetaABTestVariant
     ):
         """Fetch time-series data for a variant"""
         try:
-            response = await client.get(
-                f"{self.base_url}/{variant.ad_id}/insights",
+            response = await graph_batch_client.get(
+                f"{variant.ad_id}/insights",
+                self.access_token,
                 params={
-                    "access_token": self.access_token,
                     "fields": "impressions,reach,clicks,conversions,spend,cpm,cpc,ctr",
                     "time_increment": "1",  # Daily data
                     "date_preset": "lifetime"
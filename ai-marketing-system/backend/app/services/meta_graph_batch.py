@@ -0,0 +1,184 @@
+"""
+Meta Graph API Batching
+
+Graph API calls made through GraphBatchClient are queued and sent as
+batch requests (POST / with a `batch` parameter of up to 50 sub-requests)
+instead of one HTTP round trip each. Concurrent callers each await their
+own sub-response, which is handed back as an httpx.Response, so call
+sites keep using status_code, json() and raise_for_status(). A batch is
+sent as soon as it is full, or META_BATCH_FLUSH_MS after its first
+request was queued. Callers give up after META_BATCH_TIMEOUT_SECONDS.
+
+API Documentation: https://developers.facebook.com/docs/graph-api/batch-requests
+"""
+
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlencode
+
+import httpx
+
+from app.core.config import settings
+from app.core.http_clients import http_clients
+
+
+GRAPH_BASE_URL = "https://graph.facebook.com"
+GRAPH_API_VERSION = "v18.0"
+
+# Graph API limit on sub-requests per batch
+MAX_BATCH_SIZE = 50
+
+# Times a sub-request left unanswered (null) by Meta is queued again
+MAX_SUBREQUEST_RETRIES = 1
+
+
+class _PendingRequest:
+    def __init__(self, method: str, relative_url: str, body: Optional[str], future: asyncio.Future):
+        self.method = method
+        self.relative_url = relative_url
+        self.body = body
+        self.future = future
+        self.attempts = 0
+
+    def to_batch_item(self) -> Dict[str, Any]:
+        item = {"method": self.method, "relative_url": self.relative_url}
+        if self.body is not None:
+            item["body"] = self.body
+        return item
+
+
+class GraphBatchClient:
+    """Coalesces Graph API requests into batch requests"""
+
+    def __init__(
+        self,
+        api_version: str = GRAPH_API_VERSION,
+        max_batch_size: Optional[int] = None,
+        flush_ms: Optional[int] = None,
+        timeout_seconds: Optional[float] = None
+    ):
+        self.api_version = api_version
+        self.max_batch_size = min(max_batch_size or settings.META_BATCH_MAX_SIZE, MAX_BATCH_SIZE)
+        self.flush_ms = settings.META_BATCH_FLUSH_MS if flush_ms is None else flush_ms
+        self.timeout_seconds = timeout_seconds or settings.META_BATCH_TIMEOUT_SECONDS
+        self._pending: Dict[str, List[_PendingRequest]] = {}  # By access token
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        access_token: str,
+        params: Optional[Dict[str, Any]] = None,
+        data: Optional[Dict[str, Any]] = None
+    ) -> httpx.Response:
+        """Queue one Graph API call (path relative to the API version) and wait for its response"""
+        relative_url = f"{self.api_version}/{path.lstrip('/')}"
+        if params:
+            relative_url = f"{relative_url}?{urlencode(params)}"
+        body = urlencode({
+            key: json.dumps(value) if isinstance(value, (dict, list)) else value
+            for key, value in data.items()
+        }) if data else None
+
+        loop = asyncio.get_running_loop()
+        pending = _PendingRequest(method.upper(), relative_url, body, loop.create_future())
+        self._enqueue(access_token, pending)
+        try:
+            return await asyncio.wait_for(pending.future, self.timeout_seconds)
+        except asyncio.TimeoutError:
+            raise Exception(f"Graph API batch request timed out after {self.timeout_seconds}s")
+
+    async def get(self, path: str, access_token: str, params: Optional[Dict[str, Any]] = None) -> httpx.Response:
+        return await self.request("GET", path, access_token, params=params)
+
+    async def post(self, path: str, access_token: str, data: Optional[Dict[str, Any]] = None) -> httpx.Response:
+        return await self.request("POST", path, access_token, data=data)
+
+    def _enqueue(self, access_token: str, pending: _PendingRequest):
+        queue = self._pending.setdefault(access_token, [])
+        queue.append(pending)
+
+        if len(queue) >= self.max_batch_size:
+            self._spawn(self._flush_token(access_token))
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.flush_ms / 1000, self._on_timer)
+
+    def _spawn(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _on_timer(self):
+        self._timer = None
+        for access_token in list(self._pending):
+            self._spawn(self._flush_token(access_token))
+
+    async def flush(self):
+        """Send everything queued now"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await asyncio.gather(*(self._flush_token(access_token) for access_token in list(self._pending)))
+
+    async def _flush_token(self, access_token: str):
+        queue = self._pending.get(access_token, [])
+        while queue:
+            batch = queue[:self.max_batch_size]
+            del queue[:self.max_batch_size]
+            await self._send(access_token, batch)
+
+        # Another flush may have emptied this queue and a newer one taken its place
+        if self._pending.get(access_token) is queue:
+            del self._pending[access_token]
+
+    async def _send(self, access_token: str, batch: List[_PendingRequest]):
+        """Send one batch request and resolve each caller's future with its sub-response"""
+        try:
+            client = http_clients.get("meta")
+            response = await client.post(
+                f"{GRAPH_BASE_URL}/",
+                data={
+                    "access_token": access_token,
+                    "include_headers": "false",
+                    "batch": json.dumps([pending.to_batch_item() for pending in batch])
+                }
+            )
+            response.raise_for_status()
+            results = response.json()
+        except Exception as e:
+            print(f"Error sending Graph API batch of {len(batch)}: {str(e)}")
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+            return
+
+        for pending, result in zip(batch, results):
+            if pending.future.done():
+                continue
+
+            # Sub-requests Meta did not get to come back as null
+            if result is None:
+                if pending.attempts < MAX_SUBREQUEST_RETRIES:
+                    pending.attempts += 1
+                    self._enqueue(access_token, pending)
+                    continue
+                result = {"code": 504, "body": json.dumps({"error": {"message": "Batch sub-request timed out"}})}
+
+            pending.future.set_result(httpx.Response(
+                result.get("code", 500),
+                content=(result.get("body") or "").encode(),
+                headers={"Content-Type": "application/json"},
+                request=httpx.Request(pending.method, f"{GRAPH_BASE_URL}/{pending.relative_url}")
+            ))
+
+        for pending in batch[len(results):]:
+            if not pending.future.done():
+                pending.future.set_exception(Exception("Graph API batch response is missing sub-responses"))
+
+
+# Singleton instance
+graph_batch_client = GraphBatchClient()
@@ -1,64 +1,96 @@
+import asyncio
 import json
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, select, update
 
 from app.models.outreach import (
     OutreachMessage, OutreachSequence, OutreachEnrollment,
     OutreachStatus, OutreachType, SequenceStatus
 )
+from app.core.config import settings
 from app.models.lead import Lead, LeadStatus
 from app.services.ai_content_generator import ai_content_generator
+from app.services.due_scheduler import due_scheduler
 from app.services.email_service import email_service
+from app.services.segment_service import segment_service
+
+
+# Due scheduler kind for enrollments waiting on their next step
+OUTREACH_STEP_JOB = "outreach_step"
+
+# Fields every message in a batch reply must have
+BATCH_REQUIRED_FIELDS = ("subject", "body")
+
+# Completion budget per lead in a batch request
+BATCH_TOKENS_PER_LEAD = 700
+
+# Purpose, tone and focus of each outreach message type
+MESSAGE_TEMPLATES = {
+    "intro": {
+        "purpose": "introductory outreach to establish connection",
+        "tone": "friendly and professional",
+        "focus": "value proposition and building rapport"
+    },
+    "follow_up": {
+        "purpose": "following up on previous message",
+        "tone": "helpful and persistent",
+        "focus": "addressing pain points and offering solutions"
+    },
+    "promotional": {
+        "purpose": "promoting specific products or offers",
+        "tone": "enthusiastic and informative",
+        "focus": "benefits and limited-time offers"
+    },
+    "re_engagement": {
+        "purpose": "re-engaging inactive leads",
+        "tone": "curious and value-focused",
+        "focus": "checking in and offering new value"
+    }
+}
 
 
 class OutreachService:
     """Service for generating and managing personalized outreach campaigns"""
 
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ai_slots: Optional[asyncio.Semaphore] = None
+        self._smtp_slots: Optional[asyncio.Semaphore] = None
+
+    def _bind_loop(self):
+        """Semaphores belong to an event loop, so recreate them when it changes"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._ai_slots = asyncio.Semaphore(settings.OUTREACH_AI_CONCURRENCY)
+            self._smtp_slots = asyncio.Semaphore(settings.OUTREACH_SMTP_CONCURRENCY)
+
+    @staticmethod
+    def _lead_context(lead: Lead) -> Dict[str, str]:
+        """Personalization context for a lead, with defaults for missing fields"""
+        return {
+            "first_name": lead.first_name or "there",
+            "location": lead.location or "your area",
+            "sport_type": lead.sport_type or "endurance sports",
+            "customer_type": lead.customer_type or "athlete",
+            "interests": lead.interests or "cycling and triathlon"
+        }
+
     async def generate_personalized_message(
         self,
         lead: Lead,
         message_type: str = "intro",
         template: Optional[str] = None,
-        additional_context: Optional[str] = None
+        additional_context: Optional[str] = None,
+        fresh: bool = False
     ) -> Dict[str, str]:
         """Generate a personalized outreach message for a specific lead using AI"""
 
-        # Build personalization context
-        lead_context = {
-            "first_name": lead.first_name or "there",
-            "location": lead.location or "your area",
-            "sport_type": lead.sport_type or "endurance sports",
-            "customer_type": lead.customer_type or "athlete",
-            "interests": lead.interests or "cycling and triathlon"
-        }
-
-        # Message type templates
-        message_templates = {
-            "intro": {
-                "purpose": "introductory outreach to establish connection",
-                "tone": "friendly and professional",
-                "focus": "value proposition and building rapport"
-            },
-            "follow_up": {
-                "purpose": "following up on previous message",
-                "tone": "helpful and persistent",
-                "focus": "addressing pain points and offering solutions"
-            },
-            "promotional": {
-                "purpose": "promoting specific products or offers",
-                "tone": "enthusiastic and informative",
-                "focus": "benefits and limited-time offers"
-            },
-            "re_engagement": {
-                "purpose": "re-engaging inactive leads",
-                "tone": "curious and value-focused",
-                "focus": "checking in and offering new value"
-            }
-        }
+        lead_context = self._lead_context(lead)
 
-        template_config = message_templates.get(message_type, message_templates["intro"])
+        template_config = MESSAGE_TEMPLATES.get(message_type, MESSAGE_TEMPLATES["intro"])
 
         # Build AI prompt for personalized message
         prompt = f"""Generate a highly personalized outreach email for a potential customer.
@@ -103,11 +135,159 @@ Return the response ONLY as valid JSON in this exact format (no markdown, no ext
 IMPORTANT: Return ONLY the JSON object, nothing else before or after it.
 """
 
-        result = await ai_content_generator._call_openrouter(
+        self._bind_loop()
+        return await ai_content_generator._generate_json(
             prompt,
-            ai_content_generator.text_model
+            ai_content_generator.text_model,
+            fresh=fresh,
+            limiter=self._ai_slots
+        )
+
+    async def generate_personalized_messages(
+        self,
+        leads: List[Lead],
+        message_type: str = "intro",
+        template: Optional[str] = None,
+        additional_context: Optional[str] = None,
+        fresh: bool = False,
+        batch_size: Optional[int] = None
+    ) -> List[Dict[str, str]]:
+        """
+        Generate personalized messages for many leads, packing up to
+        OUTREACH_PROMPT_BATCH_SIZE leads into each AI request.
+
+        Returns one message per lead, in order. A batch whose reply is not
+        a complete, valid set of messages falls back to one request per lead.
+        """
+        batch_size = batch_size or settings.OUTREACH_PROMPT_BATCH_SIZE
+        if batch_size <= 1:
+            return list(await asyncio.gather(*(
+                self.generate_personalized_message(lead, message_type, template, additional_context, fresh)
+                for lead in leads
+            )))
+
+        batches = [leads[i:i + batch_size] for i in range(0, len(leads), batch_size)]
+        results = await asyncio.gather(*(
+            self._generate_message_batch(batch, message_type, template, additional_context, fresh)
+            for batch in batches
+        ))
+        return [message for batch in results for message in batch]
+
+    async def _generate_message_batch(
+        self,
+        leads: List[Lead],
+        message_type: str,
+        template: Optional[str],
+        additional_context: Optional[str],
+        fresh: bool
+    ) -> List[Dict[str, str]]:
+        """One AI request for a batch of leads, falling back to per-lead requests"""
+
+        template_config = MESSAGE_TEMPLATES.get(message_type, MESSAGE_TEMPLATES["intro"])
+        contexts = [self._lead_context(lead) for lead in leads]
+
+        lead_lines = "\n".join(
+            f"{index}. Name: {context['first_name']} | Location: {context['location']} | "
+            f"Sport/Activity: {context['sport_type']} | Customer Type: {context['customer_type']} | "
+            f"Interests: {context['interests']} | Lead Status: {lead.status}"
+            for index, (lead, context) in enumerate(zip(leads, contexts))
         )
-        return ai_content_generator._parse_json_response(result)
+
+        prompt = f"""Generate a highly personalized outreach email for each of the {len(leads)} potential customers below.
+
+Leads:
+{lead_lines}
+
+Message Type: {message_type}
+Purpose: {template_config['purpose']}
+Tone: {template_config['tone']}
+Focus: {template_config['focus']}
+
+{f'Template Guidelines: {template}' if template else ''}
+{f'Additional Context: {additional_context}' if additional_context else ''}
+
+Company Context:
+We are Premier Bike and Position One Sports, specializing in cycling, triathlon, and running products.
+We serve athletes, coaches, teams, and bike fitters with premium equipment and expert guidance.
+
+Generate a separate personalized email for every lead that:
+1. Uses the lead's name naturally
+2. References their specific sport/interest
+3. Addresses their needs as their customer type
+4. Includes a clear, non-pushy call-to-action
+5. Feels personal and authentic, not template-like
+6. Is concise (250-350 words)
+
+Return the response ONLY as valid JSON in this exact format (no markdown, no extra text), with one
+entry per lead, where "lead" is the lead's number from the list above:
+{{
+    "messages": [
+        {{
+            "lead": 0,
+            "subject": "compelling subject line that includes personalization",
+            "body": "full email body in plain text format with proper paragraphs",
+            "preview_text": "engaging preview text (max 90 chars)",
+            "call_to_action": "clear CTA text"
+        }}
+    ]
+}}
+
+IMPORTANT: Return ONLY the JSON object, nothing else before or after it.
+"""
+
+        self._bind_loop()
+        try:
+            parsed = await ai_content_generator._generate_json(
+                prompt,
+                ai_content_generator.text_model,
+                fresh=fresh,
+                limiter=self._ai_slots,
+                validate=lambda parsed: self._batch_messages(parsed, len(leads)) is not None,
+                max_tokens=BATCH_TOKENS_PER_LEAD * len(leads)
+            )
+            messages = self._batch_messages(parsed, len(leads))
+        except Exception as e:
+            print(f"Error generating batch of {len(leads)} messages: {str(e)}")
+            messages = None
+
+        if messages is None:
+            print(f"Batch generation for {len(leads)} leads failed validation, generating individually")
+            return list(await asyncio.gather(*(
+                self.generate_personalized_message(lead, message_type, template, additional_context, fresh)
+                for lead in leads
+            )))
+
+        for message, context in zip(messages, contexts):
+            message["personalization_tokens"] = {
+                "first_name": context["first_name"],
+                "sport_type": context["sport_type"]
+            }
+        return messages
+
+    @staticmethod
+    def _batch_messages(parsed: Any, count: int) -> Optional[List[Dict[str, str]]]:
+        """Messages from a batch reply in lead order, or None unless there is exactly one valid message per lead"""
+        entries = parsed.get("messages") if isinstance(parsed, dict) else None
+        if not isinstance(entries, list) or len(entries) != count:
+            return None
+
+        messages: Dict[int, Dict[str, str]] = {}
+        for entry in entries:
+            if not isinstance(entry, dict):
+                return None
+            index = entry.get("lead")
+            if not isinstance(index, int) or isinstance(index, bool) or not 0 <= index < count or index in messages:
+                return None
+            if not all(isinstance(entry.get(field), str) and entry[field].strip() for field in BATCH_REQUIRED_FIELDS):
+                return None
+            messages[index] = {
+                "subject": entry["subject"],
+                "body": entry["body"],
+                "preview_text": entry.get("preview_text") or "",
+                "call_to_action": entry.get("call_to_action") or ""
+            }
+
+        return [messages[index] for index in range(count)]
 
     async def send_outreach_message(
         self,
@@ -127,14 +307,16 @@ IMPORTANT: Return ONLY the JSON object, nothing else before or after it.
 
             # Send based on outreach type
             if message.outreach_type == OutreachType.EMAIL:
-                success = await email_service.send_email(
-                    to_email=lead.email,
-                    subject=message.subject,
-                    body=message.content,
-                    is_html=False,
-                    lead_id=lead.id,
-                    db=db
-                )
+                self._bind_loop()
+                async with self._smtp_slots:
+                    success = await email_service.send_email(
+                        to_email=lead.email,
+                        subject=message.subject,
+                        body=message.content,
+                        is_html=False,
+                        lead_id=lead.id,
+                        db=db
+                    )
 
                 if success:
                     message.status = OutreachStatus.SENT
@@ -146,6 +328,10 @@ IMPORTANT: Return ONLY the JSON object, nothing else before or after it.
                         lead.status = LeadStatus.CONTACTED
 
                     db.commit()
+
+                    segment_service.refresh_lead_memberships(
+                        [lead.id], db, changed_fields={"last_contact_date", "status"}
+                    )
                     return True
 
             return False
@@ -194,6 +380,7 @@ IMPORTANT: Return ONLY the JSON object, nothing else before or after it.
         """Enroll multiple leads into a sequence"""
 
         results = {"enrolled": 0, "skipped": 0, "errors": 0}
+        enrollments = []
 
         sequence = db.query(OutreachSequence).filter(
             OutreachSequence.id == sequence_id
@@ -238,6 +425,7 @@ IMPORTANT: Return ONLY the JSON object, nothing else before or after it.
                 )
 
                 db.add(enrollment)
+                enrollments.append(enrollment)
                 results["enrolled"] += 1
 
             except Exception as e:
@@ -248,6 +436,9 @@ IMPORTANT: Return ONLY the JSON object, nothing else before or after it.
         sequence.total_enrolled += results["enrolled"]
         db.commit()
 
+        for enrollment in enrollments:
+            due_scheduler.schedule(OUTREACH_STEP_JOB, enrollment.id, enrollment.next_send_at)
+
         return results
 
     async def process_sequence_step(
@@ -256,6 +447,25 @@ IMPORTANT: Return ONLY the JSON object, nothing else before or after it.
         db: Session
     ) -> bool:
         """Process the next step in a sequence for an enrollment"""
+        result = await self._run_sequence_step(enrollment, db)
+        return result["status"] == "sent"
+
+    async def _run_sequence_step(
+        self,
+        enrollment: OutreachEnrollment,
+        db: Session,
+        message_data: Optional[Dict[str, Any]] = None,
+        leased_until: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """
+        Process an enrollment's next step, returning its status (sent,
+        completed, stopped, failed) and any error. message_data is the
+        step's message when it was already generated in a batch, and
+        leased_until the lease taken by claim_due_enrollments, which is
+        extended before sending.
+        """
+
+        result = {"enrollment_id": enrollment.id, "status": "failed", "error": None}
 
         try:
             sequence = db.query(OutreachSequence).filter(
@@ -267,34 +477,43 @@ IMPORTANT: Return ONLY the JSON object, nothing else before or after it.
             ).first()
 
             if not sequence or not lead:
-                return False
+                result["error"] = "Sequence or lead no longer exists"
+                return result
 
             # Check if sequence should stop
             if sequence.stop_on_reply and enrollment.stop_reason == "replied":
                 enrollment.status = "stopped"
                 enrollment.stopped_at = datetime.utcnow()
                 db.commit()
-                return False
+                result["status"] = "stopped"
+                return result
 
             # Get current step
             steps = sequence.sequence_steps
             if enrollment.current_step >= len(steps):
-                # Sequence completed
+                # Sequence completed; counters are incremented in SQL since enrollments run concurrently
                 enrollment.status = "completed"
                 enrollment.completed_at = datetime.utcnow()
-                sequence.total_completed += 1
+                sequence.total_completed = OutreachSequence.total_completed + 1
                 db.commit()
-                return False
+                result["status"] = "completed"
+                return result
 
             step = steps[enrollment.current_step]
 
             # Generate personalized message for this step
-            message_data = await self.generate_personalized_message(
-                lead=lead,
-                message_type=step.get("message_type", "intro"),
-                template=step.get("template"),
-                additional_context=step.get("context")
-            )
+            if message_data is None:
+                message_data = await self.generate_personalized_message(
+                    lead=lead,
+                    message_type=step.get("message_type", "intro"),
+                    template=step.get("template"),
+                    additional_context=step.get("context")
+                )
+
+            # Another run may have taken the step over while its message was generated
+            if leased_until is not None and self.extend_lease(db, enrollment.id, leased_until) is None:
+                result["error"] = "Lease expired before the step was sent"
+                return result
 
             # Create outreach message
             message = OutreachMessage(
@@ -306,7 +525,7 @@ IMPORTANT: Return ONLY the JSON object, nothing else before or after it.
                 content=message_data.get("body"),
                 personalization_data=message_data.get("personalization_tokens"),
                 status=OutreachStatus.SCHEDULED,
-                scheduled_at=enrollment.next_send_at
+                scheduled_at=datetime.utcnow()
             )
 
             db.add(message)
@@ -325,40 +544,185 @@ IMPORTANT: Return ONLY the JSON object, nothing else before or after it.
                     enrollment.next_send_at = datetime.utcnow() + timedelta(days=delay_days)
 
                 # Update sequence stats
-                sequence.total_sent += 1
+                sequence.total_sent = OutreachSequence.total_sent + 1
 
                 db.commit()
-                return True
 
-            return False
+                due_scheduler.schedule(OUTREACH_STEP_JOB, enrollment.id, enrollment.next_send_at)
+                result["status"] = "sent"
+                return result
+
+            result["error"] = message.error_message or "Message was not sent"
+            return result
 
         except Exception as e:
+            db.rollback()
             print(f"Error processing sequence step: {str(e)}")
-            return False
-
-    async def process_pending_sequences(self, db: Session) -> Dict[str, int]:
-        """Process all pending sequence steps (called by scheduler)"""
+            result["error"] = str(e)
+            return result
+
+    def scheduled_times(self, db: Session, until: datetime) -> List[Tuple[int, datetime]]:
+        """Next send time of active enrollments, up to until"""
+        return db.query(OutreachEnrollment.id, OutreachEnrollment.next_send_at).filter(
+            OutreachEnrollment.status == "active",
+            OutreachEnrollment.next_send_at <= until
+        ).all()
 
-        results = {"processed": 0, "failed": 0}
+    def claim_due_enrollments(
+        self,
+        db: Session,
+        enrollment_ids: Optional[List[int]] = None,
+        limit: Optional[int] = None
+    ) -> List[int]:
+        """
+        Lease up to limit active enrollments whose next step is due, earliest
+        first, by pushing next_send_at OUTREACH_STEP_LEASE_SECONDS ahead in
+        one UPDATE, so overlapping runs never send the same step twice. A
+        step that fails is retried once the lease runs out; a sent step sets
+        the real next send time.
+        """
+        now = datetime.utcnow()
+        due = and_(
+            OutreachEnrollment.status == "active",
+            OutreachEnrollment.next_send_at <= now
+        )
 
-        # Find all active enrollments due for next step
-        enrollments = db.query(OutreachEnrollment).filter(
-            and_(
+        candidates = select(OutreachEnrollment.id).where(due).order_by(OutreachEnrollment.next_send_at)
+        if enrollment_ids is not None:
+            candidates = candidates.where(OutreachEnrollment.id.in_(enrollment_ids))
+        if limit is not None:
+            candidates = candidates.limit(limit)
+
+        claimed_ids = [
+            enrollment_id for (enrollment_id,) in db.execute(
+                update(OutreachEnrollment)
+                .where(OutreachEnrollment.id.in_(candidates), due)
+                .values(next_send_at=now + timedelta(seconds=settings.OUTREACH_STEP_LEASE_SECONDS))
+                .returning(OutreachEnrollment.id)
+                .execution_options(synchronize_session=False)
+            )
+        ]
+        db.commit()
+        return claimed_ids
+
+    def extend_lease(self, db: Session, enrollment_id: int, leased_until: datetime) -> Optional[datetime]:
+        """
+        Push an enrollment's lease OUTREACH_STEP_LEASE_SECONDS ahead if it
+        is still the one taken at leased_until and has not run out. Returns
+        the new lease, or None when the step must not be sent.
+        """
+        now = datetime.utcnow()
+        renewed_until = now + timedelta(seconds=settings.OUTREACH_STEP_LEASE_SECONDS)
+        renewed = db.execute(
+            update(OutreachEnrollment)
+            .where(
+                OutreachEnrollment.id == enrollment_id,
                 OutreachEnrollment.status == "active",
-                OutreachEnrollment.next_send_at <= datetime.utcnow()
+                OutreachEnrollment.next_send_at == leased_until,
+                OutreachEnrollment.next_send_at > now
+            )
+            .values(next_send_at=renewed_until)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        return renewed_until if renewed else None
+
+    async def _generate_step_messages(self, db: Session, enrollment_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Generate the messages of enrollments due for the same sequence step in batches, by enrollment id"""
+        if settings.OUTREACH_PROMPT_BATCH_SIZE <= 1:
+            return {}
+
+        rows = db.query(OutreachEnrollment, OutreachSequence, Lead).join(
+            OutreachSequence, OutreachSequence.id == OutreachEnrollment.sequence_id
+        ).join(
+            Lead, Lead.id == OutreachEnrollment.lead_id
+        ).filter(OutreachEnrollment.id.in_(enrollment_ids)).all()
+
+        groups: Dict[Tuple[int, int], List[Tuple[int, Lead, Dict[str, Any]]]] = {}
+        for enrollment, sequence, lead in rows:
+            steps = sequence.sequence_steps or []
+            if enrollment.current_step >= len(steps):
+                continue
+            if sequence.stop_on_reply and enrollment.stop_reason == "replied":
+                continue
+            groups.setdefault((sequence.id, enrollment.current_step), []).append(
+                (enrollment.id, lead, steps[enrollment.current_step])
             )
-        ).all()
 
-        for enrollment in enrollments:
+        async def generate(members) -> Dict[int, Dict[str, Any]]:
+            # A lone enrollment gains nothing from batching and generates its own message
+            if len(members) < 2:
+                return {}
+            step = members[0][2]
             try:
-                success = await self.process_sequence_step(enrollment, db)
-                if success:
+                messages = await self.generate_personalized_messages(
+                    [lead for _, lead, _ in members],
+                    message_type=step.get("message_type", "intro"),
+                    template=step.get("template"),
+                    additional_context=step.get("context")
+                )
+            except Exception as e:
+                print(f"Error generating messages for {len(members)} enrollments: {str(e)}")
+                return {}
+            return {enrollment_id: message for (enrollment_id, _, _), message in zip(members, messages)}
+
+        prefetched = {}
+        for messages in await asyncio.gather(*(generate(members) for members in groups.values())):
+            prefetched.update(messages)
+        return prefetched
+
+    async def process_pending_sequences(
+        self,
+        db: Session,
+        enrollment_ids: Optional[List[int]] = None
+    ) -> Dict[str, Any]:
+        """
+        Process pending sequence steps, optionally only for the given
+        enrollments (called by scheduler).
+
+        Enrollments are claimed OUTREACH_CLAIM_BATCH_SIZE at a time so each
+        batch is sent well within its lease. Up to OUTREACH_CONCURRENCY
+        enrollments run at once, each in its own session so one failure
+        cannot roll back another. Returns totals and a status per enrollment.
+        """
+
+        results = {"processed": 0, "completed": 0, "stopped": 0, "failed": 0, "enrollments": []}
+
+        bind = db.get_bind()
+        slots = asyncio.Semaphore(settings.OUTREACH_CONCURRENCY)
+
+        async def process(enrollment_id: int, prefetched: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+            async with slots:
+                session = Session(bind=bind, autoflush=False)
+                try:
+                    enrollment = session.get(OutreachEnrollment, enrollment_id)
+                    if enrollment is None:
+                        return {"enrollment_id": enrollment_id, "status": "failed", "error": "Enrollment no longer exists"}
+                    return await self._run_sequence_step(
+                        enrollment, session, prefetched.get(enrollment_id), leased_until=enrollment.next_send_at
+                    )
+                except Exception as e:
+                    print(f"Error processing enrollment {enrollment_id}: {str(e)}")
+                    return {"enrollment_id": enrollment_id, "status": "failed", "error": str(e)}
+                finally:
+                    session.close()
+
+        while True:
+            claimed_ids = self.claim_due_enrollments(db, enrollment_ids, limit=settings.OUTREACH_CLAIM_BATCH_SIZE)
+            if not claimed_ids:
+                break
+
+            prefetched = await self._generate_step_messages(db, claimed_ids)
+
+            for result in await asyncio.gather(*(process(enrollment_id, prefetched) for enrollment_id in claimed_ids)):
+                results["enrollments"].append(result)
+                if result["status"] == "sent":
                     results["processed"] += 1
                 else:
-                    results["failed"] += 1
-            except Exception as e:
-                print(f"Error processing enrollment {enrollment.id}: {str(e)}")
-                results["failed"] += 1
+                    results[result["status"]] += 1
+
+            if len(claimed_ids) < settings.OUTREACH_CLAIM_BATCH_SIZE:
+                break
 
         return results
 
@@ -1,4 +1,3 @@
-import httpx
 import hashlib
 import json
 from typing import List, Dict, Optional, Any
@@ -12,6 +11,8 @@ from app.models.retargeting import (
 )
 from app.models.lead import Lead
 from app.core.config import settings
+from app.core.http_clients import http_clients
+from app.services.meta_graph_batch import graph_batch_client
 
 
 class RetargetingService:
@@ -153,7 +154,7 @@ class RetargetingService:
                         }
                     }
 
-                    async with httpx.AsyncClient(timeout=60.0) as client:
+                    async with http_clients.borrow("meta") as client:
                         response = await client.post(
                             url,
                             params={"access_token": self.meta_access_token},
@@ -172,7 +173,7 @@ class RetargetingService:
                     "customer_file_source": "USER_PROVIDED_ONLY"
                 }
 
-                async with httpx.AsyncClient(timeout=60.0) as client:
+                async with http_clients.borrow("meta") as client:
                     response = await client.post(
                         url,
                         params={"access_token": self.meta_access_token},
@@ -383,8 +384,6 @@ class RetargetingService:
             return False
 
         try:
-            url = f"https://graph.facebook.com/v18.0/{self.meta_pixel_id}/events"
-
             # Build event data
             event_data = {
                 "event_name": event.event_name or event.event_type,
@@ -413,14 +412,13 @@ class RetargetingService:
                     "currency": event.currency
                 }
 
-            payload = {
-                "data": [event_data],
-                "access_token": self.meta_access_token
-            }
-
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(url, json=payload)
-                response.raise_for_status()
+            # Concurrent events share Graph API batch requests
+            response = await graph_batch_client.post(
+                f"{self.meta_pixel_id}/events",
+                self.meta_access_token,
+                data={"data": [event_data]}
+            )
+            response.raise_for_status()
 
             return True
 
@@ -455,7 +453,7 @@ class RetargetingService:
                 }]
             }
 
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            async with http_clients.borrow("google_analytics") as client:
                 response = await client.post(url, params=params, json=payload)
                 response.raise_for_status()
 
@@ -1,9 +1,58 @@
-from typing import List, Any, Dict
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, not_
+from typing import List, Any, Dict, Optional, Tuple, Set, Iterable
+from sqlalchemy.orm import Session, Query
+from sqlalchemy import (
+    and_, or_, not_, true, false, func, insert, literal,
+    DateTime, Integer, String, Text, Boolean
+)
+from sqlalchemy.sql.elements import ColumnElement
 from app.models.lead import Lead
-from app.models.segment import Segment
-from datetime import datetime
+from app.models.segment import Segment, SegmentMembership
+from app.services.bitmap_index import (
+    lead_bitmap_index, segment_key, status_key, sport_type_key, EMAIL_CONSENT
+)
+from datetime import datetime, date, timezone
+
+
+# Operators that compare date fields by value
+DATE_COMPARISON_OPERATORS = {"equals", "not_equals", "greater_than", "less_than"}
+
+# Rows fetched per round trip when conditions have to be checked in Python
+PYTHON_FILTER_BATCH_SIZE = 1000
+
+# Lead ids per IN (...) list when maintaining segment membership
+MEMBERSHIP_BATCH_SIZE = 500
+
+# Logic operators allowed on condition groups; NOT negates the AND of its conditions
+LOGICAL_OPERATORS = ["AND", "OR", "NOT"]
+
+# Lead columns backed by a database index, evaluated ahead of other predicates
+INDEXED_FIELDS = {"email", "email_consent", "status", "sport_type"}
+
+# Planner estimates: relative evaluation cost per operator and the rough share
+# of leads an equals condition matches for low-cardinality fields
+OPERATOR_COST = {
+    "equals": 1.0,
+    "not_equals": 1.0,
+    "exists": 1.0,
+    "not_exists": 1.0,
+    "in": 2.0,
+    "not_in": 2.0,
+    "greater_than": 2.0,
+    "less_than": 2.0,
+    "contains": 4.0,
+    "not_contains": 4.0,
+}
+INDEXED_COST_FACTOR = 0.5
+FIELD_EQUALS_SELECTIVITY = {
+    "email": 0.001,
+    "email_consent": 0.5,
+    "sms_consent": 0.5,
+    "status": 0.2,
+    "sport_type": 0.25,
+    "customer_type": 0.25,
+    "source": 0.2,
+}
+DEFAULT_EQUALS_SELECTIVITY = 0.1
 
 
 class SegmentService:
@@ -106,6 +155,27 @@ class SegmentService:
             },
         ]
     
+    @staticmethod
+    def _normalize_datetime(value: datetime) -> datetime:
+        """Convert aware datetimes to naive UTC so they compare with stored values"""
+        if value.tzinfo is not None:
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    @staticmethod
+    def _coerce_datetime(value: Any) -> Any:
+        """Parse ISO date strings from segment criteria into datetimes"""
+        if isinstance(value, datetime):
+            return SegmentService._normalize_datetime(value)
+        if isinstance(value, date):
+            return datetime(value.year, value.month, value.day)
+        if isinstance(value, str):
+            try:
+                return SegmentService._normalize_datetime(datetime.fromisoformat(value))
+            except ValueError:
+                return value
+        return value
+
     @staticmethod
     def evaluate_condition(lead: Lead, condition: Dict[str, Any]) -> bool:
         """Evaluate a single condition against a lead"""
@@ -116,6 +186,11 @@ class SegmentService:
         # Get field value from lead
         lead_value = getattr(lead, field, None)
         
+        # Date fields are compared as naive UTC datetimes so ISO strings work
+        if isinstance(lead_value, datetime) and operator in DATE_COMPARISON_OPERATORS:
+            lead_value = SegmentService._normalize_datetime(lead_value)
+            value = SegmentService._coerce_datetime(value)
+        
         # Handle different operators
         if operator == "equals":
             return lead_value == value
@@ -168,101 +243,548 @@ class SegmentService:
         else:
             return False
     
+    @staticmethod
+    def is_group(node: Dict[str, Any]) -> bool:
+        """Check whether a criteria node is a condition group rather than a condition"""
+        return "conditions" in node
+    
     @staticmethod
     def evaluate_criteria(lead: Lead, criteria: Dict[str, Any]) -> bool:
-        """Evaluate segment criteria against a lead"""
+        """
+        Evaluate segment criteria against a lead.
+        
+        Groups may nest, e.g. (A AND (B OR C)) AND NOT D is expressed as
+        {"operator": "AND", "conditions": [A, {"operator": "OR", "conditions": [B, C]},
+        {"operator": "NOT", "conditions": [D]}]}. Evaluation stops at the first
+        condition that decides the group.
+        """
+        if not SegmentService.is_group(criteria):
+            return SegmentService.evaluate_condition(lead, criteria)
+        
         operator = criteria.get("operator", "AND")
         conditions = criteria.get("conditions", [])
         
-        if not conditions:
-            return True
-        
-        results = [SegmentService.evaluate_condition(lead, cond) for cond in conditions]
+        results = (SegmentService.evaluate_criteria(lead, cond) for cond in conditions)
         
         if operator == "AND":
             return all(results)
         elif operator == "OR":
-            return any(results)
+            return any(results) if conditions else True
+        elif operator == "NOT":
+            return not all(results)
         else:
             return False
     
     @staticmethod
-    def get_matching_leads(criteria: Dict[str, Any], db: Session, limit: int = None) -> List[Lead]:
-        """Get all leads matching the segment criteria"""
+    def _estimate_condition(condition: Dict[str, Any]) -> Tuple[float, float]:
+        """Estimate (cost, selectivity) of a single condition"""
+        field = condition.get("field")
+        operator = condition.get("operator")
+        value = condition.get("value")
+        
+        equals_selectivity = FIELD_EQUALS_SELECTIVITY.get(field, DEFAULT_EQUALS_SELECTIVITY)
+        value_count = len(value) if isinstance(value, list) else 1
+        in_selectivity = min(1.0, equals_selectivity * value_count)
+        
+        selectivity = {
+            "equals": equals_selectivity,
+            "not_equals": 1.0 - equals_selectivity,
+            "in": in_selectivity,
+            "not_in": 1.0 - in_selectivity,
+            "contains": 0.2,
+            "not_contains": 0.8,
+            "greater_than": 0.5,
+            "less_than": 0.5,
+            "exists": 0.8,
+            "not_exists": 0.2,
+        }.get(operator, 0.0)
+        
+        cost = OPERATOR_COST.get(operator, 1.0)
+        if field in INDEXED_FIELDS:
+            cost *= INDEXED_COST_FACTOR
+        
+        return cost, selectivity
+    
+    @staticmethod
+    def _plan_node(node: Dict[str, Any]) -> Tuple[Dict[str, Any], float, float]:
+        """Plan a criteria node, returning (planned node, cost, selectivity)"""
+        if not SegmentService.is_group(node):
+            cost, selectivity = SegmentService._estimate_condition(node)
+            return node, cost, selectivity
+        
+        operator = node.get("operator", "AND")
+        planned = [SegmentService._plan_node(cond) for cond in node.get("conditions", [])]
+        
+        if operator == "OR":
+            # Cheap conditions likely to be true settle an OR soonest
+            planned.sort(key=lambda p: p[1] / p[2] if p[2] > 0 else float("inf"))
+        elif operator in ["AND", "NOT"]:
+            # Cheap conditions likely to be false settle an AND soonest
+            planned.sort(key=lambda p: p[1] / (1.0 - p[2]) if p[2] < 1 else float("inf"))
+        
+        cost = sum(p[1] for p in planned)
+        all_match = 1.0
+        none_match = 1.0
+        for _, _, selectivity in planned:
+            all_match *= selectivity
+            none_match *= 1.0 - selectivity
+        
+        if operator == "AND":
+            selectivity = all_match
+        elif operator == "OR":
+            selectivity = 1.0 - none_match if planned else 1.0
+        elif operator == "NOT":
+            selectivity = 1.0 - all_match
+        else:
+            selectivity = 0.0
+        
+        return {**node, "conditions": [p[0] for p in planned]}, cost, selectivity
+    
+    @staticmethod
+    def plan_criteria(criteria: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Reorder criteria for cheapest evaluation without changing its meaning.
+        
+        Each group is sorted by estimated cost and selectivity so short-circuit
+        evaluation decides it as early as possible; predicates on indexed
+        columns (email_consent, status, sport_type) are costed lower and go first.
+        """
+        planned, _, _ = SegmentService._plan_node(criteria)
+        return planned
+    
+    @staticmethod
+    def _sql_comparable(column, value: Any) -> bool:
+        """Check that comparing the column with value in SQL matches Python semantics"""
+        column_type = column.type
+        if isinstance(column_type, Boolean):
+            return isinstance(value, bool)
+        if isinstance(column_type, Integer):
+            return isinstance(value, (int, float)) and not isinstance(value, bool)
+        if isinstance(column_type, DateTime):
+            return isinstance(value, datetime)
+        if isinstance(column_type, (String, Text)):
+            return isinstance(value, str)
+        return False
+    
+    @staticmethod
+    def compile_condition(condition: Dict[str, Any]) -> Optional[ColumnElement]:
+        """
+        Compile a single condition into a SQLAlchemy expression.
+        
+        The expressions never evaluate to NULL, so they can be combined and
+        negated freely. Returns None when the condition cannot be expressed
+        with the same semantics as evaluate_condition.
+        """
+        field = condition.get("field")
+        operator = condition.get("operator")
+        value = condition.get("value")
+        
+        column = Lead.__table__.columns.get(field) if isinstance(field, str) else None
+        if column is None:
+            return None
+        
+        if isinstance(column.type, DateTime):
+            if operator in DATE_COMPARISON_OPERATORS:
+                value = SegmentService._coerce_datetime(value)
+        
+        is_string = isinstance(column.type, (String, Text))
+        
+        if operator == "equals":
+            if value is None:
+                return column.is_(None)
+            if not SegmentService._sql_comparable(column, value):
+                return None
+            return and_(column.isnot(None), column == value)
+        
+        elif operator == "not_equals":
+            if value is None:
+                return column.isnot(None)
+            if not SegmentService._sql_comparable(column, value):
+                return None
+            return or_(column.is_(None), column != value)
+        
+        elif operator in ("in", "not_in"):
+            values = value if isinstance(value, list) else [value]
+            non_null = [v for v in values if v is not None]
+            if not all(SegmentService._sql_comparable(column, v) for v in non_null):
+                return None
+            expression = and_(column.isnot(None), column.in_(non_null)) if non_null else false()
+            if len(non_null) < len(values):
+                expression = or_(expression, column.is_(None))
+            return expression if operator == "in" else not_(expression)
+        
+        elif operator in ("contains", "not_contains"):
+            if not is_string:
+                return None
+            expression = and_(column.isnot(None), column.icontains(str(value), autoescape=True))
+            return expression if operator == "contains" else not_(expression)
+        
+        elif operator in ("greater_than", "less_than"):
+            # String ordering depends on the database collation, so leave it to Python
+            if is_string or value is None or not SegmentService._sql_comparable(column, value):
+                return None
+            comparison = column > value if operator == "greater_than" else column < value
+            return and_(column.isnot(None), comparison)
+        
+        elif operator in ("exists", "not_exists"):
+            expression = column.isnot(None)
+            if is_string:
+                expression = and_(expression, column != "")
+            return expression if operator == "exists" else not_(expression)
+        
+        else:
+            return false()
+    
+    @staticmethod
+    def _compile_node(node: Dict[str, Any]) -> Tuple[Optional[ColumnElement], Optional[Dict[str, Any]]]:
+        """Compile a criteria node into a (clause, residual) pair"""
+        if not SegmentService.is_group(node):
+            expression = SegmentService.compile_condition(node)
+            return (expression, None) if expression is not None else (None, node)
+        
+        operator = node.get("operator", "AND")
+        conditions = node.get("conditions", [])
+        
+        if operator not in LOGICAL_OPERATORS:
+            return false(), None
+        
+        compiled = [SegmentService._compile_node(cond) for cond in conditions]
+        clauses = [clause for clause, _ in compiled if clause is not None]
+        residuals = [residual for _, residual in compiled if residual is not None]
+        
+        if operator == "OR":
+            if not conditions:
+                return true(), None
+            if not residuals:
+                return or_(*clauses), None
+            # Each branch's clause is necessary for that branch, so their OR
+            # still narrows the rows the Python check has to look at
+            if len(clauses) == len(compiled):
+                return or_(*clauses), node
+            return None, node
+        
+        clause = and_(*clauses) if clauses else true()
+        
+        if operator == "NOT":
+            if residuals:
+                return None, node
+            return not_(clause), None
+        
+        residual = {"operator": "AND", "conditions": residuals} if residuals else None
+        return clause, residual
+    
+    @staticmethod
+    def compile_criteria(criteria: Dict[str, Any]) -> Tuple[Optional[ColumnElement], Optional[Dict[str, Any]]]:
+        """
+        Compile segment criteria into a SQL WHERE clause.
+        
+        Returns a (clause, residual) pair. The clause narrows the lead query and
+        the residual holds criteria that must still run through evaluate_criteria,
+        or None when SQL covers everything. Criteria are planned first, so both
+        the SQL terms and the residual come out in evaluation order.
+        """
+        return SegmentService._compile_node(SegmentService.plan_criteria(criteria))
+    
+    @staticmethod
+    def build_matching_query(criteria: Dict[str, Any], db: Session):
+        """Build the lead query for criteria along with the Python-only residual"""
+        clause, residual = SegmentService.compile_criteria(criteria)
         
-        # Get all leads
         query = db.query(Lead)
+        if clause is not None:
+            query = query.filter(clause)
         
-        if limit:
-            query = query.limit(limit)
+        return query, residual
+    
+    @staticmethod
+    def get_matching_leads(criteria: Dict[str, Any], db: Session, limit: int = None) -> List[Lead]:
+        """Get all leads matching the segment criteria"""
         
-        all_leads = query.all()
+        query, residual = SegmentService.build_matching_query(criteria, db)
         
-        # Filter leads based on criteria
-        matching_leads = [
-            lead for lead in all_leads
-            if SegmentService.evaluate_criteria(lead, criteria)
-        ]
+        if residual is None:
+            if limit:
+                query = query.limit(limit)
+            return query.all()
+        
+        # Fall back to Python for the conditions SQL could not express
+        matching_leads = []
+        for lead in query.yield_per(PYTHON_FILTER_BATCH_SIZE):
+            if SegmentService.evaluate_criteria(lead, residual):
+                matching_leads.append(lead)
+                if limit and len(matching_leads) >= limit:
+                    break
         
         return matching_leads
     
     @staticmethod
     def count_matching_leads(criteria: Dict[str, Any], db: Session) -> int:
         """Count leads matching the segment criteria"""
-        matching_leads = SegmentService.get_matching_leads(criteria, db)
-        return len(matching_leads)
+        query, residual = SegmentService.build_matching_query(criteria, db)
+        
+        if residual is None:
+            return query.count()
+        
+        return sum(
+            1 for lead in query.yield_per(PYTHON_FILTER_BATCH_SIZE)
+            if SegmentService.evaluate_criteria(lead, residual)
+        )
+    
+    @staticmethod
+    def criteria_fields(criteria: Dict[str, Any]) -> Set[str]:
+        """Collect the lead fields referenced anywhere in the criteria"""
+        if not SegmentService.is_group(criteria):
+            return {criteria.get("field")}
+        
+        fields = set()
+        for cond in criteria.get("conditions", []):
+            fields |= SegmentService.criteria_fields(cond)
+        return fields
+    
+    @staticmethod
+    def _batches(ids: Iterable[int]) -> Iterable[List[int]]:
+        """Split lead ids into IN-list sized batches"""
+        ids = list(ids)
+        for i in range(0, len(ids), MEMBERSHIP_BATCH_SIZE):
+            yield ids[i:i + MEMBERSHIP_BATCH_SIZE]
+    
+    @staticmethod
+    def _matching_lead_ids(criteria: Dict[str, Any], db: Session, lead_ids: Optional[List[int]] = None) -> List[int]:
+        """Get ids of leads matching the criteria, optionally restricted to lead_ids"""
+        query, residual = SegmentService.build_matching_query(criteria, db)
+        
+        if lead_ids is not None:
+            query = query.filter(Lead.id.in_(lead_ids))
+        
+        if residual is None:
+            return [lead_id for (lead_id,) in query.with_entities(Lead.id)]
+        
+        return [
+            lead.id for lead in query.yield_per(PYTHON_FILTER_BATCH_SIZE)
+            if SegmentService.evaluate_criteria(lead, residual)
+        ]
+    
+    @staticmethod
+    def rebuild_segment_membership(segment: Segment, db: Session) -> int:
+        """Recompute a segment's membership from scratch and return its size"""
+        db.query(SegmentMembership).filter(
+            SegmentMembership.segment_id == segment.id
+        ).delete(synchronize_session=False)
+        
+        query, residual = SegmentService.build_matching_query(segment.criteria, db)
+        
+        if residual is None:
+            db.execute(
+                insert(SegmentMembership).from_select(
+                    ["segment_id", "lead_id"],
+                    query.with_entities(literal(segment.id), Lead.id).statement
+                )
+            )
+        else:
+            lead_ids = SegmentService._matching_lead_ids(segment.criteria, db)
+            for batch in SegmentService._batches(lead_ids):
+                db.execute(
+                    insert(SegmentMembership),
+                    [{"segment_id": segment.id, "lead_id": lead_id} for lead_id in batch]
+                )
+        
+        return db.query(SegmentMembership).filter(
+            SegmentMembership.segment_id == segment.id
+        ).count()
     
     @staticmethod
     def update_segment_count(segment_id: int, db: Session):
-        """Update cached lead count for a segment"""
+        """Rebuild membership and the cached lead count for a segment"""
         segment = db.query(Segment).filter(Segment.id == segment_id).first()
         if not segment:
             return
         
-        # Count matching leads
-        count = SegmentService.count_matching_leads(segment.criteria, db)
+        # Materialize matching leads
+        count = SegmentService.rebuild_segment_membership(segment, db)
         
         # Update segment
         segment.lead_count = count
         segment.last_calculated = datetime.utcnow()
         db.commit()
+        
+        lead_bitmap_index.invalidate()
     
     @staticmethod
-    def validate_criteria(criteria: Dict[str, Any]) -> Dict[str, Any]:
-        """Validate segment criteria"""
-        errors = []
-        warnings = []
+    def rebuild_all_memberships(db: Session):
+        """Rebuild membership for every segment"""
+        segment_ids = [segment_id for (segment_id,) in db.query(Segment.id)]
+        for segment_id in segment_ids:
+            SegmentService.update_segment_count(segment_id, db)
+    
+    @staticmethod
+    def refresh_lead_memberships(
+        lead_ids: List[int],
+        db: Session,
+        changed_fields: Optional[Iterable[str]] = None
+    ):
+        """
+        Incrementally update segment membership for created or updated leads.
         
-        operator = criteria.get("operator")
-        conditions = criteria.get("conditions", [])
+        Only segments whose criteria reference one of changed_fields are
+        re-evaluated; pass None for new leads to check every segment. Commits
+        the membership changes and adjusted lead counts.
+        """
+        lead_ids = [lead_id for lead_id in lead_ids if lead_id is not None]
+        if not lead_ids:
+            return
         
-        # Validate operator
-        if operator not in ["AND", "OR"]:
-            errors.append(f"Invalid operator: {operator}. Must be AND or OR")
+        # Lead attributes changed even if no segment membership does
+        lead_bitmap_index.invalidate()
         
-        # Validate conditions
-        if not conditions:
-            warnings.append("No conditions specified. Segment will match all leads.")
+        changed = set(changed_fields) if changed_fields is not None else None
         
-        available_fields = {f["field"] for f in SegmentService.get_available_fields()}
+        for segment in db.query(Segment).all():
+            if changed is not None and not (SegmentService.criteria_fields(segment.criteria) & changed):
+                continue
+            
+            for batch in SegmentService._batches(lead_ids):
+                matching = set(SegmentService._matching_lead_ids(segment.criteria, db, batch))
+                current = {
+                    lead_id for (lead_id,) in db.query(SegmentMembership.lead_id).filter(
+                        SegmentMembership.segment_id == segment.id,
+                        SegmentMembership.lead_id.in_(batch)
+                    )
+                }
+                
+                added = matching - current
+                removed = current - matching
+                
+                if added:
+                    db.execute(
+                        insert(SegmentMembership),
+                        [{"segment_id": segment.id, "lead_id": lead_id} for lead_id in added]
+                    )
+                if removed:
+                    db.query(SegmentMembership).filter(
+                        SegmentMembership.segment_id == segment.id,
+                        SegmentMembership.lead_id.in_(removed)
+                    ).delete(synchronize_session=False)
+                
+                segment.lead_count = (segment.lead_count or 0) + len(added) - len(removed)
+        
+        db.commit()
+    
+    @staticmethod
+    def remove_lead_memberships(lead_ids: List[int], db: Session):
+        """
+        Drop leads that are about to be deleted from every segment.
+        
+        Does not commit, so the caller deletes the leads in the same transaction.
+        """
+        lead_bitmap_index.invalidate()
         
-        for i, condition in enumerate(conditions):
-            field = condition.get("field")
-            op = condition.get("operator")
-            value = condition.get("value")
+        for batch in SegmentService._batches(lead_ids):
+            counts = db.query(
+                SegmentMembership.segment_id,
+                func.count(SegmentMembership.lead_id)
+            ).filter(
+                SegmentMembership.lead_id.in_(batch)
+            ).group_by(SegmentMembership.segment_id).all()
             
-            if not field:
-                errors.append(f"Condition {i+1}: Missing field")
-                continue
+            for segment_id, count in counts:
+                db.query(Segment).filter(Segment.id == segment_id).update(
+                    {Segment.lead_count: Segment.lead_count - count},
+                    synchronize_session=False
+                )
+            
+            db.query(SegmentMembership).filter(
+                SegmentMembership.lead_id.in_(batch)
+            ).delete(synchronize_session=False)
+    
+    @staticmethod
+    def count_covered_leads(db: Session) -> int:
+        """Count distinct leads that belong to at least one segment"""
+        segment_ids = [segment_id for (segment_id,) in db.query(Segment.id)]
+        covered = lead_bitmap_index.union([segment_key(segment_id) for segment_id in segment_ids], db)
+        return lead_bitmap_index.count(covered)
+    
+    @staticmethod
+    def count_segment_overlap(
+        db: Session,
+        include_segment_ids: List[int],
+        exclude_segment_ids: Optional[List[int]] = None,
+        status: Optional[str] = None,
+        sport_type: Optional[str] = None,
+        email_consent: Optional[bool] = None
+    ) -> int:
+        """
+        Count leads in every included segment and none of the excluded ones.
+        
+        Optional status, sport type and consent filters narrow the result
+        further. Answered entirely from the bitmap index.
+        """
+        keys = [segment_key(segment_id) for segment_id in include_segment_ids]
+        if status:
+            keys.append(status_key(status))
+        if sport_type:
+            keys.append(sport_type_key(sport_type))
+        if email_consent:
+            keys.append(EMAIL_CONSENT)
+        
+        result = lead_bitmap_index.intersection(keys, db)
+        
+        excluded = [segment_key(segment_id) for segment_id in exclude_segment_ids or []]
+        if email_consent is False:
+            excluded.append(EMAIL_CONSENT)
+        if excluded:
+            result &= ~lead_bitmap_index.union(excluded, db)
+        
+        return lead_bitmap_index.count(result)
+    
+    @staticmethod
+    def validate_criteria(criteria: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate segment criteria, including nested condition groups"""
+        errors = []
+        warnings = []
+        
+        available_fields = {f["field"] for f in SegmentService.get_available_fields()}
+        
+        def validate_group(group: Dict[str, Any], path: str):
+            operator = group.get("operator")
+            conditions = group.get("conditions", [])
+            label = f"Group {path}: " if path else ""
             
-            if field not in available_fields:
-                errors.append(f"Condition {i+1}: Invalid field '{field}'")
+            # Validate operator
+            if operator not in LOGICAL_OPERATORS:
+                errors.append(f"{label}Invalid operator: {operator}. Must be AND, OR or NOT")
             
-            if not op:
-                errors.append(f"Condition {i+1}: Missing operator")
+            # Validate conditions
+            if not conditions:
+                if path:
+                    warnings.append(f"{label}No conditions specified")
+                else:
+                    warnings.append("No conditions specified. Segment will match all leads.")
             
-            if value is None and op not in ["exists", "not_exists"]:
-                warnings.append(f"Condition {i+1}: No value specified")
+            for i, condition in enumerate(conditions):
+                position = f"{path}.{i+1}" if path else f"{i+1}"
+                
+                if SegmentService.is_group(condition):
+                    validate_group(condition, position)
+                    continue
+                
+                field = condition.get("field")
+                op = condition.get("operator")
+                value = condition.get("value")
+                
+                if not field:
+                    errors.append(f"Condition {position}: Missing field")
+                    continue
+                
+                if field not in available_fields:
+                    errors.append(f"Condition {position}: Invalid field '{field}'")
+                
+                if not op:
+                    errors.append(f"Condition {position}: Missing operator")
+                
+                if value is None and op not in ["exists", "not_exists"]:
+                    warnings.append(f"Condition {position}: No value specified")
+        
+        validate_group(criteria, "")
         
         return {
             "valid": len(errors) == 0,
@@ -270,14 +792,28 @@ class SegmentService:
             "warnings": warnings
         }
     
+    @staticmethod
+    def get_segment_leads_query(segment_id: int, db: Session) -> Query:
+        """Query the materialized members of a segment"""
+        return db.query(Lead).join(
+            SegmentMembership, SegmentMembership.lead_id == Lead.id
+        ).filter(
+            SegmentMembership.segment_id == segment_id
+        )
+    
     @staticmethod
     def get_segment_leads(segment_id: int, db: Session, limit: int = None) -> List[Lead]:
-        """Get all leads matching a specific segment"""
+        """Get all leads in a specific segment"""
         segment = db.query(Segment).filter(Segment.id == segment_id).first()
         if not segment:
             return []
         
-        return SegmentService.get_matching_leads(segment.criteria, db, limit)
+        query = SegmentService.get_segment_leads_query(segment_id, db).order_by(Lead.id)
+        
+        if limit:
+            query = query.limit(limit)
+        
+        return query.all()
 
 
 # Singleton instance
@@ -1,7 +1,78 @@
+import asyncio
+import time
 import httpx
-from typing import Dict, List, Optional, Any
-from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Any
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, urlparse
 from app.core.config import settings
+from app.core.http_clients import http_clients
+from app.services.lead_upsert_service import lead_upsert_service, MergePolicy
+
+
+SHOPIFY_API_VERSION = "2024-01"
+
+# Largest page Shopify's REST list endpoints return
+PAGE_LIMIT = 250
+
+# Customer fields needed to build leads
+CUSTOMER_FIELDS = (
+    "id,email,first_name,last_name,phone,accepts_marketing,"
+    "accepts_marketing_updated_at,orders_count,updated_at"
+)
+
+# Margin for clock differences with Shopify when resuming from a pass's start time
+CHECKPOINT_CLOCK_SKEW = timedelta(minutes=5)
+
+
+# Shopify can withdraw marketing consent but never restores consent a lead
+# withdrew elsewhere; consent details are recorded on new leads only and
+# other fields only fill gaps
+SHOPIFY_MERGE_POLICIES = {
+    "email_consent": MergePolicy.REVOKE_ONLY,
+    "consent_date": MergePolicy.KEEP,
+    "consent_source": MergePolicy.KEEP,
+    "source": MergePolicy.KEEP,
+}
+
+
+class ShopifyCallLimiter:
+    """Client-side view of a store's REST leaky bucket (X-Shopify-Shop-Api-Call-Limit)"""
+
+    def __init__(self, leak_rate: float, capacity: int = 40):
+        self.leak_rate = leak_rate
+        self.capacity = capacity
+        self.level = 0.0
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _leak(self):
+        now = time.monotonic()
+        self.level = max(0.0, self.level - (now - self.updated) * self.leak_rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until one more call fits in the bucket, keeping one slot spare"""
+        if self.leak_rate <= 0:
+            return
+
+        async with self._lock:
+            self._leak()
+            overflow = self.level + 2 - self.capacity
+            if overflow > 0:
+                await asyncio.sleep(overflow / self.leak_rate)
+                self._leak()
+            self.level += 1
+
+    def observe(self, header: Optional[str]):
+        """Sync with the bucket level Shopify reports, e.g. '32/40'"""
+        try:
+            used, capacity = (int(part) for part in header.split("/"))
+        except (AttributeError, ValueError):
+            return
+
+        self.level = float(used)
+        self.capacity = capacity
+        self.updated = time.monotonic()
 
 
 class ShopifyService:
@@ -24,6 +95,7 @@ class ShopifyService:
                 "access_token": settings.SHOPIFY_ACCESS_TOKEN_2,
             }
         ]
+        self._limiters: Dict[int, ShopifyCallLimiter] = {}
 
     def _get_store_config(self, store_id: int) -> Optional[Dict[str, Any]]:
         """Get store configuration by ID"""
@@ -42,14 +114,14 @@ class ShopifyService:
             and not store["access_token"].startswith("your-")
         )
 
-    async def _make_shopify_request(
+    async def _request(
         self,
         store_id: int,
         endpoint: str,
         method: str = "GET",
         params: Optional[Dict] = None
-    ) -> Dict[str, Any]:
-        """Make a request to Shopify Admin API"""
+    ) -> httpx.Response:
+        """Make a throttled request to Shopify Admin API, retrying when rate limited"""
         store = self._get_store_config(store_id)
 
         if not store:
@@ -59,7 +131,7 @@ class ShopifyService:
             raise Exception(f"Store {store['name']} is not properly configured. Please set SHOPIFY credentials in .env")
 
         # Shopify Admin API base URL
-        base_url = f"https://{store['store_url']}/admin/api/2024-01"
+        base_url = f"https://{store['store_url']}/admin/api/{SHOPIFY_API_VERSION}"
         url = f"{base_url}/{endpoint}"
 
         headers = {
@@ -67,22 +139,65 @@ class ShopifyService:
             "Content-Type": "application/json"
         }
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
+        client = http_clients.get("shopify")
+        limiter = self._limiters.setdefault(store_id, ShopifyCallLimiter(settings.SHOPIFY_LEAK_RATE_PER_SECOND))
+
+        try:
+            for attempt in range(settings.SHOPIFY_MAX_RETRIES + 1):
+                await limiter.acquire()
                 if method == "GET":
                     response = await client.get(url, headers=headers, params=params)
                 else:
                     response = await client.request(method, url, headers=headers, json=params)
+                limiter.observe(response.headers.get("X-Shopify-Shop-Api-Call-Limit"))
+
+                if response.status_code != 429 or attempt == settings.SHOPIFY_MAX_RETRIES:
+                    break
+                await asyncio.sleep(float(response.headers.get("Retry-After", 2.0)))
 
-                response.raise_for_status()
-                return response.json()
+            response.raise_for_status()
+            return response
+
+        except httpx.HTTPStatusError as e:
+            print(f"Shopify API error: {e.response.status_code} - {e.response.text}")
+            raise Exception(f"Shopify API error: {e.response.status_code}")
+        except Exception as e:
+            print(f"Error making Shopify request: {str(e)}")
+            raise Exception(f"Failed to connect to Shopify: {str(e)}")
 
-            except httpx.HTTPStatusError as e:
-                print(f"Shopify API error: {e.response.status_code} - {e.response.text}")
-                raise Exception(f"Shopify API error: {e.response.status_code}")
-            except Exception as e:
-                print(f"Error making Shopify request: {str(e)}")
-                raise Exception(f"Failed to connect to Shopify: {str(e)}")
+    async def _make_shopify_request(
+        self,
+        store_id: int,
+        endpoint: str,
+        method: str = "GET",
+        params: Optional[Dict] = None
+    ) -> Dict[str, Any]:
+        """Make a request to Shopify Admin API"""
+        response = await self._request(store_id, endpoint, method=method, params=params)
+        return response.json()
+
+    async def iter_pages(
+        self,
+        store_id: int,
+        endpoint: str,
+        key: str,
+        params: Optional[Dict] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield every page of a list endpoint, following the Link header's page_info cursor"""
+        params = {**(params or {}), "limit": PAGE_LIMIT}
+
+        while True:
+            response = await self._request(store_id, endpoint, params=params)
+            yield response.json().get(key, [])
+
+            next_link = response.links.get("next")
+            page_info = parse_qs(urlparse(next_link["url"]).query).get("page_info") if next_link else None
+            if not page_info:
+                break
+
+            # Filters are carried by the cursor; only limit and fields may accompany it
+            params = {name: value for name, value in params.items() if name in ("limit", "fields")}
+            params["page_info"] = page_info[0]
 
     async def get_store_info(self, store_id: int) -> Dict[str, Any]:
         """Get basic store information"""
@@ -144,19 +259,11 @@ class ShopifyService:
 
         try:
             # Fetch multiple endpoints in parallel for audit
-            shop_data = await self._make_shopify_request(store_id, "shop.json")
-            customers_data = await self._make_shopify_request(
-                store_id,
-                "customers/count.json"
-            )
-            orders_data = await self._make_shopify_request(
-                store_id,
-                "orders/count.json",
-                params={"status": "any"}
-            )
-            products_data = await self._make_shopify_request(
-                store_id,
-                "products/count.json"
+            shop_data, customers_data, orders_data, products_data = await asyncio.gather(
+                self._make_shopify_request(store_id, "shop.json"),
+                self._make_shopify_request(store_id, "customers/count.json"),
+                self._make_shopify_request(store_id, "orders/count.json", params={"status": "any"}),
+                self._make_shopify_request(store_id, "products/count.json")
             )
 
             shop = shop_data.get("shop", {})
@@ -256,81 +363,143 @@ class ShopifyService:
             print(f"Error fetching products: {str(e)}")
             return []
 
+    def _customer_to_lead(self, customer: Dict[str, Any]) -> Dict[str, Any]:
+        """Lead row for a Shopify customer"""
+        from app.models.lead import LeadSource
+
+        return {
+            "email": customer["email"],
+            "first_name": customer.get("first_name") or None,
+            "last_name": customer.get("last_name") or None,
+            "phone": customer.get("phone") or None,
+            "source": LeadSource.SHOPIFY.value,
+            "email_consent": bool(customer.get("accepts_marketing", False)),
+            "sms_consent": customer.get("accepts_marketing_updated_at") is not None,
+            "consent_date": datetime.now() if customer.get("accepts_marketing") else None,
+            "consent_source": "shopify_import",
+            "notes": f"Imported from Shopify. Total orders: {customer.get('orders_count', 0)}"
+        }
+
     async def sync_customers_to_leads(
         self,
         store_id: int,
         user_id: int,
-        db
+        db,
+        full_sync: bool = False
     ) -> Dict[str, Any]:
-        """Sync Shopify customers to marketing leads database"""
-        from app.models.lead import Lead, LeadSource
+        """
+        Sync Shopify customers to marketing leads database.
+
+        Walks every page of customers updated since the store's checkpoint
+        (all customers on the first run or when full_sync is set), upserting
+        and committing one page at a time.
+        """
+        from app.models.shopify_sync import ShopifySyncCheckpoint
+        from app.services.segment_service import segment_service
+
+        synced = 0
+        updated = 0
+        skipped = 0
+        errors = 0
+        total_processed = 0
+        pages = 0
 
         try:
-            customers = await self.get_customers(store_id, limit=250)
-
-            synced = 0
-            skipped = 0
-            errors = 0
-
-            for customer in customers:
-                try:
-                    # Check if customer already exists
-                    email = customer.get("email")
-                    if not email:
-                        skipped += 1
+            checkpoint = db.query(ShopifySyncCheckpoint).filter(
+                ShopifySyncCheckpoint.store_id == store_id,
+                ShopifySyncCheckpoint.resource == "customers"
+            ).first()
+            if checkpoint is None:
+                checkpoint = ShopifySyncCheckpoint(store_id=store_id, resource="customers", records_synced=0)
+                db.add(checkpoint)
+
+            params = {"fields": CUSTOMER_FIELDS}
+            if checkpoint.updated_at_min and not full_sync:
+                params["updated_at_min"] = checkpoint.updated_at_min
+
+            # Customers updated during the pass may sit on pages already walked
+            pass_started = datetime.now(timezone.utc)
+
+            async for customers in self.iter_pages(store_id, "customers.json", "customers", params):
+                pages += 1
+                total_processed += len(customers)
+                rows = []
+
+                for customer in customers:
+                    try:
+                        if not customer.get("email"):
+                            skipped += 1
+                            continue
+
+                        rows.append(self._customer_to_lead(customer))
+
+                    except Exception as e:
+                        print(f"Error syncing customer {customer.get('id')}: {str(e)}")
+                        errors += 1
                         continue
 
-                    existing_lead = db.query(Lead).filter(
-                        Lead.email == email,
-                        Lead.user_id == user_id
-                    ).first()
+                result = lead_upsert_service.upsert_leads(db, rows, policies=SHOPIFY_MERGE_POLICIES)
+                db.commit()
 
-                    if existing_lead:
-                        skipped += 1
-                        continue
+                segment_service.refresh_lead_memberships(result["inserted"] + result["updated"], db)
 
-                    # Create new lead from Shopify customer
-                    lead = Lead(
-                        user_id=user_id,
-                        name=f"{customer.get('first_name', '')} {customer.get('last_name', '')}".strip() or "Unknown",
-                        email=email,
-                        phone=customer.get("phone"),
-                        source=LeadSource.SHOPIFY,
-                        email_consent=customer.get("accepts_marketing", False),
-                        sms_consent=customer.get("accepts_marketing_updated_at") is not None,
-                        consent_date=datetime.now() if customer.get("accepts_marketing") else None,
-                        consent_source="shopify_import",
-                        notes=f"Imported from Shopify. Total orders: {customer.get('orders_count', 0)}"
-                    )
-
-                    db.add(lead)
-                    synced += 1
-
-                except Exception as e:
-                    print(f"Error syncing customer {customer.get('id')}: {str(e)}")
-                    errors += 1
-                    continue
+                synced += len(result["inserted"])
+                updated += len(result["updated"])
+                skipped += len(result["unchanged"])
 
+            # Pages are ordered by id, so the checkpoint only moves after a complete pass
+            checkpoint.updated_at_min = (pass_started - CHECKPOINT_CLOCK_SKEW).isoformat(timespec="seconds")
+            checkpoint.last_synced_at = datetime.utcnow()
+            checkpoint.records_synced = (checkpoint.records_synced or 0) + total_processed
             db.commit()
 
             return {
                 "success": True,
                 "synced": synced,
+                "updated": updated,
                 "skipped": skipped,
                 "errors": errors,
-                "total_processed": len(customers)
+                "total_processed": total_processed,
+                "pages": pages,
+                "updated_at_min": checkpoint.updated_at_min
             }
 
         except Exception as e:
+            db.rollback()
             print(f"Error syncing customers: {str(e)}")
             return {
                 "success": False,
                 "error": str(e),
-                "synced": 0,
-                "skipped": 0,
-                "errors": 0
+                "synced": synced,
+                "updated": updated,
+                "skipped": skipped,
+                "errors": errors,
+                "total_processed": total_processed,
+                "pages": pages
             }
 
+    async def sync_all_stores(self, user_id: int, full_sync: bool = False) -> Dict[str, Any]:
+        """Sync customers of every configured store concurrently, each with its own session"""
+        from app.db.session import SessionLocal
+
+        async def sync_store(store: Dict[str, Any]) -> Dict[str, Any]:
+            db = SessionLocal()
+            try:
+                result = await self.sync_customers_to_leads(store["id"], user_id, db, full_sync=full_sync)
+                return {"store_id": store["id"], "store_name": store["name"], **result}
+            finally:
+                db.close()
+
+        stores = [store for store in self.stores if self._is_store_configured(store)]
+        results = await asyncio.gather(*(sync_store(store) for store in stores))
+
+        return {
+            "success": all(result["success"] for result in results),
+            "synced": sum(result["synced"] for result in results),
+            "updated": sum(result["updated"] for result in results),
+            "stores": list(results)
+        }
+
     def get_all_stores(self) -> List[Dict[str, Any]]:
         """Get list of all configured stores"""
         return [
@@ -1,13 +1,21 @@
 import asyncio
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import bindparam, select, update
 from sqlalchemy.orm import Session
 from app.models.scheduled_post import ScheduledPost
 from app.models.content import GeneratedContent
 from app.core.config import settings
+from app.core.http_clients import http_clients
+from app.services.due_scheduler import due_scheduler
+from app.services.meta_graph_batch import graph_batch_client
 import httpx
 
 
+# Due scheduler kind for posts waiting to be published
+SOCIAL_POST_JOB = "social_post"
+
+
 class SocialMediaScheduler:
     """Service for scheduling and posting to social media platforms"""
 
@@ -44,7 +52,7 @@ class SocialMediaScheduler:
             }
 
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            async with http_clients.borrow("meta") as client:
                 # Debug token to check permissions
                 debug_response = await client.get(
                     f"{self.platforms_config['facebook']['api_base']}/debug_token",
@@ -92,44 +100,207 @@ class SocialMediaScheduler:
                 'error': str(e)
             }
     
-    async def process_scheduled_posts(self, db: Session):
-        """Process all posts that are scheduled for now or past"""
-        
-        current_time = datetime.utcnow()
-        
-        # Get posts that are due to be posted
-        due_posts = db.query(ScheduledPost).filter(
-            ScheduledPost.scheduled_time <= current_time,
+    # ============= Dispatch =============
+
+    def scheduled_times(self, db: Session, until: datetime) -> List[Tuple[int, datetime]]:
+        """Publish times of posts waiting to be auto-posted, up to until"""
+        return db.query(ScheduledPost.id, ScheduledPost.scheduled_time).filter(
             ScheduledPost.status == "scheduled",
-            ScheduledPost.auto_post == True
+            ScheduledPost.auto_post == True,
+            ScheduledPost.scheduled_time <= until
         ).all()
-        
-        for post in due_posts:
+
+    def track_post(self, post: ScheduledPost):
+        """Keep the due scheduler in step with a post after it is saved"""
+        if post.status == "scheduled" and post.auto_post:
+            due_scheduler.schedule(SOCIAL_POST_JOB, post.id, post.scheduled_time)
+        else:
+            due_scheduler.cancel(SOCIAL_POST_JOB, post.id)
+
+    def expire_stale_posts(self, db: Session) -> int:
+        """
+        Fail posts whose posting lease ran out.
+
+        The worker may have published before it stopped, so these are not
+        retried automatically; a duplicate public post is worse than a
+        missed one. Returns the number of posts failed.
+        """
+        now = datetime.utcnow()
+        stale = db.execute(
+            update(ScheduledPost)
+            .where(
+                ScheduledPost.status == "posting",
+                ScheduledPost.updated_at < now - timedelta(seconds=settings.SOCIAL_POST_LEASE_SECONDS)
+            )
+            .values(
+                status="failed",
+                error_message="Posting was interrupted; check the platform before rescheduling",
+                updated_at=now
+            )
+            .returning(ScheduledPost.id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.commit()
+        return len(stale)
+
+    def claim_due_posts(
+        self,
+        db: Session,
+        limit: Optional[int] = None,
+        post_ids: Optional[List[int]] = None
+    ) -> Tuple[datetime, List[ScheduledPost]]:
+        """
+        Lease due auto-posts (or the given posts, whatever their schedule)
+        by moving them from scheduled to posting in one UPDATE.
+
+        The claim time is written to updated_at and identifies the lease
+        when results are recorded.
+        """
+        claimed_at = datetime.utcnow()
+        claimable = ScheduledPost.status == "scheduled"
+
+        if post_ids is not None:
+            candidates = select(ScheduledPost.id).where(ScheduledPost.id.in_(post_ids), claimable)
+        else:
+            candidates = select(ScheduledPost.id).where(
+                claimable,
+                ScheduledPost.scheduled_time <= claimed_at,
+                ScheduledPost.auto_post == True
+            ).order_by(ScheduledPost.scheduled_time).limit(limit or settings.SOCIAL_POST_BATCH_SIZE)
+
+        # Re-checking the status in the outer WHERE keeps two workers from claiming the same post
+        claimed_ids = [
+            post_id for (post_id,) in db.execute(
+                update(ScheduledPost)
+                .where(ScheduledPost.id.in_(candidates), claimable)
+                .values(status="posting", updated_at=claimed_at)
+                .returning(ScheduledPost.id)
+                .execution_options(synchronize_session=False)
+            )
+        ]
+        db.commit()
+
+        if not claimed_ids:
+            return claimed_at, []
+        posts = db.query(ScheduledPost).filter(ScheduledPost.id.in_(claimed_ids)).order_by(ScheduledPost.scheduled_time).all()
+        return claimed_at, posts
+
+    async def dispatch_posts(self, posts: List[ScheduledPost], db: Session) -> List[Tuple[ScheduledPost, dict]]:
+        """Publish posts concurrently, at most SOCIAL_POST_CONCURRENCY at a time per platform"""
+        semaphores = {}
+
+        async def publish(post: ScheduledPost) -> dict:
+            platform = (post.platform or "").lower()
+            semaphore = semaphores.setdefault(platform, asyncio.Semaphore(settings.SOCIAL_POST_CONCURRENCY))
+            async with semaphore:
+                try:
+                    return await self.post_to_platform(post, db)
+                except Exception as e:
+                    print(f"Error posting scheduled post {post.id}: {str(e)}")
+                    return {'success': False, 'error': str(e)}
+
+        results = await asyncio.gather(*(publish(post) for post in posts))
+        return list(zip(posts, results))
+
+    def record_results(self, db: Session, claimed_at: datetime, results: List[Tuple[ScheduledPost, dict]]):
+        """Write all outcomes in one statement, skipping posts whose lease was lost"""
+        if not results:
+            return
+
+        now = datetime.utcnow()
+        table = ScheduledPost.__table__
+        statement = (
+            table.update()
+            .where(
+                table.c.id == bindparam("b_id"),
+                table.c.status == "posting",
+                table.c.updated_at == claimed_at
+            )
+            .values(
+                status=bindparam("b_status"),
+                posted_at=bindparam("b_posted_at"),
+                platform_post_id=bindparam("b_platform_post_id"),
+                platform_url=bindparam("b_platform_url"),
+                error_message=bindparam("b_error_message"),
+                updated_at=now
+            )
+        )
+
+        db.execute(statement, [
+            {
+                "b_id": post.id,
+                "b_status": "posted" if result['success'] else "failed",
+                "b_posted_at": now if result['success'] else None,
+                "b_platform_post_id": result.get('post_id'),
+                "b_platform_url": result.get('post_url'),
+                "b_error_message": None if result['success'] else result.get('error'),
+            }
+            for post, result in results
+        ])
+        db.commit()
+
+    def renew_lease(self, db: Session, post_ids: List[int], claimed_at: datetime) -> datetime:
+        """
+        Move the lease on posts still posting under claimed_at forward to now.
+
+        Uses its own session so the dispatching session's state is left
+        alone. Returns the new claim time that identifies the lease.
+        """
+        renewed_at = datetime.utcnow()
+        session = Session(bind=db.get_bind())
+        try:
+            session.execute(
+                update(ScheduledPost)
+                .where(
+                    ScheduledPost.id.in_(post_ids),
+                    ScheduledPost.status == "posting",
+                    ScheduledPost.updated_at == claimed_at
+                )
+                .values(updated_at=renewed_at)
+                .execution_options(synchronize_session=False)
+            )
+            session.commit()
+        finally:
+            session.close()
+        return renewed_at
+
+    async def _keep_lease(self, db: Session, post_ids: List[int], lease: Dict[str, datetime]):
+        """Renew a batch's lease every third of SOCIAL_POST_LEASE_SECONDS until cancelled"""
+        while True:
+            await asyncio.sleep(settings.SOCIAL_POST_LEASE_SECONDS / 3)
             try:
-                # Update status to posting
-                post.status = "posting"
-                db.commit()
-                
-                # Post to platform
-                result = await self.post_to_platform(post, db)
-                
-                if result['success']:
-                    post.status = "posted"
-                    post.posted_at = datetime.utcnow()
-                    post.platform_post_id = result.get('post_id')
-                    post.platform_url = result.get('post_url')
-                else:
-                    post.status = "failed"
-                    post.error_message = result.get('error')
-                
-                db.commit()
-                
+                lease["claimed_at"] = self.renew_lease(db, post_ids, lease["claimed_at"])
             except Exception as e:
-                post.status = "failed"
-                post.error_message = str(e)
-                db.commit()
-                print(f"Error posting scheduled post {post.id}: {str(e)}")
-    
+                print(f"Error renewing lease on scheduled posts: {str(e)}")
+
+    async def publish_claimed(self, db: Session, claimed_at: datetime, posts: List[ScheduledPost]) -> int:
+        """
+        Publish claimed posts and record the outcomes.
+
+        A batch can take longer than SOCIAL_POST_LEASE_SECONDS to publish,
+        so the lease is renewed while posts are in flight; only a worker
+        that stopped lets its posts expire.
+        """
+        lease = {"claimed_at": claimed_at}
+        keeper = asyncio.create_task(self._keep_lease(db, [post.id for post in posts], lease))
+        try:
+            results = await self.dispatch_posts(posts, db)
+        finally:
+            keeper.cancel()
+
+        self.record_results(db, lease["claimed_at"], results)
+        return len(results)
+
+    async def process_scheduled_posts(self, db: Session) -> int:
+        """Claim posts that are due and publish them. Returns the number of posts processed."""
+        self.expire_stale_posts(db)
+
+        claimed_at, posts = self.claim_due_posts(db)
+        if not posts:
+            return 0
+
+        return await self.publish_claimed(db, claimed_at, posts)
+
     async def post_to_platform(self, post: ScheduledPost, db: Session) -> dict:
         """Post content to the specified social media platform"""
         
@@ -158,7 +329,7 @@ class SocialMediaScheduler:
         """Post to Facebook page using Graph API"""
 
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            async with http_clients.borrow("meta") as client:
                 # Prepare post data
                 post_data = {
                     'message': post.post_text,
@@ -229,7 +400,7 @@ class SocialMediaScheduler:
             return {'success': False, 'error': 'Instagram posts require an image'}
 
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            async with http_clients.borrow("meta") as client:
                 # Step 1: Get Instagram Business Account ID
                 # First, get the connected Instagram account from the page
                 me_response = await client.get(
@@ -373,64 +544,86 @@ class SocialMediaScheduler:
         if post.status != "posted" or not post.platform_post_id:
             return
 
-        platform = post.platform.lower()
-
         try:
-            if platform == 'facebook':
-                await self._update_facebook_metrics(post)
-            elif platform == 'instagram':
-                await self._update_instagram_metrics(post)
-            # Twitter and LinkedIn would be handled similarly
-
+            await self._fetch_post_metrics(post)
             post.metrics_last_updated = datetime.utcnow()
             db.commit()
 
         except Exception as e:
             print(f"Error updating metrics for post {post.id}: {str(e)}")
 
-    async def _update_facebook_metrics(self, post: ScheduledPost):
-        """Fetch Facebook post metrics using Graph API"""
-
-        try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                # Fetch post insights
-                response = await client.get(
-                    f"{self.platforms_config['facebook']['api_base']}/{post.platform_post_id}",
-                    params={
-                        'fields': 'likes.summary(true),comments.summary(true),shares,reactions.summary(true)',
-                        'access_token': settings.META_ACCESS_TOKEN
-                    }
-                )
+    async def update_metrics_for_posts(self, posts: List[ScheduledPost], db: Session) -> int:
+        """
+        Refresh metrics for many posted items at once.
 
-                if response.status_code != 200:
-                    print(f"Failed to fetch Facebook metrics for post {post.platform_post_id}")
-                    return
+        Posts are fetched concurrently, so their Graph API calls share
+        batch requests. Returns the number of posts refreshed.
+        """
+        posts = [post for post in posts if post.status == "posted" and post.platform_post_id]
+        results = await asyncio.gather(
+            *(self._fetch_post_metrics(post) for post in posts),
+            return_exceptions=True
+        )
+
+        refreshed = 0
+        now = datetime.utcnow()
+        for post, result in zip(posts, results):
+            if isinstance(result, Exception):
+                print(f"Error updating metrics for post {post.id}: {str(result)}")
+                continue
+            post.metrics_last_updated = now
+            refreshed += 1
+
+        db.commit()
+        return refreshed
+
+    async def _fetch_post_metrics(self, post: ScheduledPost):
+        platform = post.platform.lower()
 
-                data = response.json()
+        if platform == 'facebook':
+            await self._update_facebook_metrics(post)
+        elif platform == 'instagram':
+            await self._update_instagram_metrics(post)
+        # Twitter and LinkedIn would be handled similarly
 
-                # Update metrics
-                post.likes_count = data.get('likes', {}).get('summary', {}).get('total_count', 0)
-                post.comments_count = data.get('comments', {}).get('summary', {}).get('total_count', 0)
-                post.shares_count = data.get('shares', {}).get('count', 0)
+    async def _update_facebook_metrics(self, post: ScheduledPost):
+        """Fetch Facebook post metrics using Graph API"""
 
-                # Try to get insights for reach (requires additional permissions)
-                insights_response = await client.get(
-                    f"{self.platforms_config['facebook']['api_base']}/{post.platform_post_id}/insights",
-                    params={
-                        'metric': 'post_impressions,post_engaged_users',
-                        'access_token': settings.META_ACCESS_TOKEN
-                    }
+        try:
+            # Post fields and insights (reach requires additional permissions) in the same batch
+            response, insights_response = await asyncio.gather(
+                graph_batch_client.get(
+                    post.platform_post_id,
+                    settings.META_ACCESS_TOKEN,
+                    params={'fields': 'likes.summary(true),comments.summary(true),shares,reactions.summary(true)'}
+                ),
+                graph_batch_client.get(
+                    f"{post.platform_post_id}/insights",
+                    settings.META_ACCESS_TOKEN,
+                    params={'metric': 'post_impressions,post_engaged_users'}
                 )
-
-                if insights_response.status_code == 200:
-                    insights_data = insights_response.json()
-                    for metric in insights_data.get('data', []):
-                        if metric.get('name') == 'post_impressions':
-                            post.reach = metric.get('values', [{}])[0].get('value', 0)
-                        elif metric.get('name') == 'post_engaged_users':
-                            engaged = metric.get('values', [{}])[0].get('value', 0)
-                            if post.reach > 0:
-                                post.engagement_rate = int((engaged / post.reach) * 100)
+            )
+
+            if response.status_code != 200:
+                print(f"Failed to fetch Facebook metrics for post {post.platform_post_id}")
+                return
+
+            data = response.json()
+
+            # Update metrics
+            post.likes_count = data.get('likes', {}).get('summary', {}).get('total_count', 0)
+            post.comments_count = data.get('comments', {}).get('summary', {}).get('total_count', 0)
+            post.shares_count = data.get('shares', {}).get('count', 0)
+
+            if insights_response.status_code == 200:
+                insights_data = insights_response.json()
+                for metric in insights_data.get('data', []):
+                    if metric.get('name') == 'post_impressions':
+                        post.reach = metric.get('values', [{}])[0].get('value', 0)
+                    elif metric.get('name') == 'post_engaged_users':
+                        engaged = metric.get('values', [{}])[0].get('value', 0)
+                        if post.reach > 0:
+                            post.engagement_rate = int((engaged / post.reach) * 100)
 
         except Exception as e:
             print(f"Error fetching Facebook metrics: {str(e)}")
@@ -439,46 +632,43 @@ class SocialMediaScheduler:
         """Fetch Instagram post metrics using Graph API"""
 
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                # Fetch media insights
-                response = await client.get(
-                    f"{self.platforms_config['instagram']['api_base']}/{post.platform_post_id}",
-                    params={
-                        'fields': 'like_count,comments_count,insights.metric(engagement,impressions,reach,saved)',
-                        'access_token': settings.META_ACCESS_TOKEN
-                    }
-                )
-
-                if response.status_code != 200:
-                    print(f"Failed to fetch Instagram metrics for post {post.platform_post_id}")
-                    return
-
-                data = response.json()
-
-                # Update basic metrics
-                post.likes_count = data.get('like_count', 0)
-                post.comments_count = data.get('comments_count', 0)
-
-                # Process insights
-                insights = data.get('insights', {}).get('data', [])
-                for insight in insights:
-                    name = insight.get('name')
-                    values = insight.get('values', [{}])[0].get('value', 0)
-
-                    if name == 'impressions':
-                        post.reach = values
-                    elif name == 'reach':
-                        # Use reach if available (more accurate than impressions)
-                        post.reach = values
-                    elif name == 'engagement':
-                        if post.reach > 0:
-                            post.engagement_rate = int((values / post.reach) * 100)
-                    elif name == 'saved':
-                        post.shares_count = values  # Treating 'saved' as shares
+            # Fetch media insights
+            response = await graph_batch_client.get(
+                post.platform_post_id,
+                settings.META_ACCESS_TOKEN,
+                params={'fields': 'like_count,comments_count,insights.metric(engagement,impressions,reach,saved)'}
+            )
+
+            if response.status_code != 200:
+                print(f"Failed to fetch Instagram metrics for post {post.platform_post_id}")
+                return
+
+            data = response.json()
+
+            # Update basic metrics
+            post.likes_count = data.get('like_count', 0)
+            post.comments_count = data.get('comments_count', 0)
+
+            # Process insights
+            insights = data.get('insights', {}).get('data', [])
+            for insight in insights:
+                name = insight.get('name')
+                values = insight.get('values', [{}])[0].get('value', 0)
+
+                if name == 'impressions':
+                    post.reach = values
+                elif name == 'reach':
+                    # Use reach if available (more accurate than impressions)
+                    post.reach = values
+                elif name == 'engagement':
+                    if post.reach > 0:
+                        post.engagement_rate = int((values / post.reach) * 100)
+                elif name == 'saved':
+                    post.shares_count = values  # Treating 'saved' as shares
 
         except Exception as e:
             print(f"Error fetching Instagram metrics: {str(e)}")
-    
+
     def get_next_posting_time(self, post: ScheduledPost) -> Optional[datetime]:
         """Calculate when the post will be processed"""
         
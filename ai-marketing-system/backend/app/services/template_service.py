@@ -1,11 +1,136 @@
 import re
-from typing import Dict, Any, Optional
+import threading
+from functools import lru_cache
+from typing import Dict, Any, Callable, List, Optional, Tuple
 from datetime import datetime
 
 
+VARIABLE_PATTERN = re.compile(r'\{\{([^}]+)\}\}')
+
+# Distinct template strings kept compiled by render_template
+COMPILED_CACHE_SIZE = 512
+
+
+def _capitalize(value):
+    return str(value).capitalize() if value else ''
+
+
+def _upper(value):
+    return str(value).upper() if value else ''
+
+
+def _lower(value):
+    return str(value).lower() if value else ''
+
+
+def _title(value):
+    return str(value).title() if value else ''
+
+
+FILTERS: Dict[str, Callable[[Any], Any]] = {
+    'capitalize': _capitalize,
+    'upper': _upper,
+    'lower': _lower,
+    'title': _title,
+}
+
+
+def _default_filter(default: str) -> Callable[[Any], Any]:
+    def apply(value):
+        return value if value else default
+    return apply
+
+
+class CompiledTemplate:
+    """
+    Render plan for a template: literal chunks with variable slots.
+
+    Each slot holds its variable name and the filter callables resolved
+    at compile time, so rendering is a lookup per slot and one join.
+    """
+
+    def __init__(self, content: str):
+        self.chunks: List[str] = []
+        self.slots: List[Tuple[int, str, Tuple[Callable[[Any], Any], ...]]] = []
+
+        position = 0
+        for match in VARIABLE_PATTERN.finditer(content):
+            self.chunks.append(content[position:match.start()])
+            self.slots.append((len(self.chunks), *self._compile_expression(match.group(1))))
+            self.chunks.append('')
+            position = match.end()
+        self.chunks.append(content[position:])
+
+    @staticmethod
+    def _compile_expression(expression: str) -> Tuple[str, Tuple[Callable[[Any], Any], ...]]:
+        """Split "name|filter|..." into the name and its filter callables"""
+        parts = expression.split('|')
+        filters = []
+        for filter_part in parts[1:]:
+            filter_part = filter_part.strip()
+            if filter_part.startswith('default:'):
+                filters.append(_default_filter(filter_part.split(':', 1)[1].strip('"\'')))
+            elif filter_part in FILTERS:
+                filters.append(FILTERS[filter_part])
+            # Unknown filters are ignored
+        return parts[0].strip(), tuple(filters)
+
+    def render(self, variables: Dict[str, Any], default_value: str = "") -> str:
+        """Fill the slots from variables and join the chunks"""
+        output = self.chunks.copy()
+        for index, name, filters in self.slots:
+            value = variables.get(name, default_value)
+            for apply in filters:
+                value = apply(value)
+            output[index] = str(value) if value is not None else default_value
+        return ''.join(output)
+
+
+@lru_cache(maxsize=COMPILED_CACHE_SIZE)
+def compile_template(content: str) -> CompiledTemplate:
+    """Compile a template string, reusing the plan for repeated content"""
+    return CompiledTemplate(content)
+
+
 class TemplateRenderService:
     """Service for rendering email templates with variable substitution"""
 
+    def __init__(self):
+        # template id -> (version, compiled subject/html/plain text)
+        self._template_cache: Dict[int, Tuple[Any, Dict[str, Optional[CompiledTemplate]]]] = {}
+        self._lock = threading.Lock()
+
+    def get_compiled_template(self, template) -> Dict[str, Optional[CompiledTemplate]]:
+        """
+        Compiled subject, html_content and plain_text_content of an
+        EmailTemplate, cached by template id and updated_at.
+        """
+        version = (template.updated_at, template.created_at)
+
+        with self._lock:
+            cached = self._template_cache.get(template.id)
+            if cached and cached[0] == version:
+                return cached[1]
+
+        compiled = {
+            field: CompiledTemplate(getattr(template, field)) if getattr(template, field) else None
+            for field in ('subject', 'html_content', 'plain_text_content')
+        }
+
+        # Templates without a saved id are not cached
+        if template.id is not None:
+            with self._lock:
+                self._template_cache[template.id] = (version, compiled)
+
+        return compiled
+
+    def render_email_template(self, template, variables: Dict[str, Any]) -> Dict[str, Optional[str]]:
+        """Render an EmailTemplate's subject, html_content and plain_text_content"""
+        return {
+            field: plan.render(variables) if plan else None
+            for field, plan in self.get_compiled_template(template).items()
+        }
+
     @staticmethod
     def render_template(
         content: str,
@@ -28,50 +153,7 @@ class TemplateRenderService:
         Returns:
             Rendered content with variables replaced
         """
-        
-        def replace_variable(match):
-            """Replace a single variable match"""
-            full_match = match.group(1)
-            parts = full_match.split('|')
-            var_name = parts[0].strip()
-            
-            # Get the variable value
-            value = variables.get(var_name, default_value)
-            
-            # Apply filters if present
-            if len(parts) > 1:
-                for filter_part in parts[1:]:
-                    filter_part = filter_part.strip()
-                    
-                    # Handle default filter
-                    if filter_part.startswith('default:'):
-                        default = filter_part.split(':', 1)[1].strip('"\'')
-                        if not value:
-                            value = default
-                    
-                    # Handle capitalize filter
-                    elif filter_part == 'capitalize':
-                        value = str(value).capitalize() if value else ''
-                    
-                    # Handle upper filter
-                    elif filter_part == 'upper':
-                        value = str(value).upper() if value else ''
-                    
-                    # Handle lower filter
-                    elif filter_part == 'lower':
-                        value = str(value).lower() if value else ''
-                    
-                    # Handle title filter
-                    elif filter_part == 'title':
-                        value = str(value).title() if value else ''
-            
-            return str(value) if value is not None else default_value
-        
-        # Replace all {{variable}} patterns
-        pattern = r'\{\{([^}]+)\}\}'
-        rendered = re.sub(pattern, replace_variable, content)
-        
-        return rendered
+        return compile_template(content).render(variables, default_value)
 
     @staticmethod
     def extract_variables(content: str) -> list:
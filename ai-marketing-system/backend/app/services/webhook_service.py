@@ -1,15 +1,44 @@
 import hmac
 import hashlib
 import json
-from typing import Dict, Any, Optional
+from collections import Counter, defaultdict
+from typing import Dict, Any, Iterable, List, Optional
+from sqlalchemy import bindparam, func, insert, select, update
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import datetime, timedelta
 
+from ..core.config import settings
+from ..db.session import SessionLocal
 from ..models.webhook import Webhook, WebhookEvent
 from ..models.campaign import Campaign, EmailLog
 from ..models.lead import Lead
 from ..models.ab_test import ABTestVariant
 from ..services import ab_test_service
+from ..services.segment_service import segment_service
+
+
+# Counters each kind of event increments in batch processing
+CAMPAIGN_COUNTERS = {
+    "open": "total_opened",
+    "click": "total_clicked",
+    "delivered": "total_delivered",
+    "unsubscribe": "total_unsubscribed",
+}
+VARIANT_COUNTERS = {
+    "open": "total_opened",
+    "click": "total_clicked",
+    "bounce": "total_bounced",
+    "delivered": "total_delivered",
+    "unsubscribe": "total_unsubscribed",
+}
+# Email log status and timestamp column set by each kind of event
+EMAIL_LOG_UPDATES = {
+    "open": ("opened", "opened_at"),
+    "click": ("clicked", "clicked_at"),
+    "delivered": ("delivered", "delivered_at"),
+    "bounce": ("bounced", None),
+}
+CONSENT_REVOKING_EVENTS = {"bounce", "unsubscribe", "spam"}
 
 
 def verify_webhook_signature(
@@ -95,6 +124,10 @@ def process_webhook_event(
             webhook.last_received_at = datetime.utcnow()
         
         db.commit()
+        
+        if lead and event_category(event_type) in CONSENT_REVOKING_EVENTS:
+            segment_service.refresh_lead_memberships([lead.id], db, changed_fields={"email_consent"})
+        
         return True
         
     except Exception as e:
@@ -306,6 +339,15 @@ def parse_generic_event(payload: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+def parse_event(provider: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Parse an event with its provider's parser"""
+    if provider == "sendgrid":
+        return parse_sendgrid_event(payload)
+    if provider == "mailchimp":
+        return parse_mailchimp_event(payload)
+    return parse_generic_event(payload)
+
+
 def get_supported_providers() -> list:
     """Get list of supported webhook providers"""
     return [
@@ -339,3 +381,314 @@ def get_supported_providers() -> list:
         }
     ]
 
+
+
+def event_category(event_type: Optional[str]) -> Optional[str]:
+    """Kind of an event type (open, click, bounce, delivered, unsubscribe, spam), if known"""
+    event_type = (event_type or "").lower()
+    if "open" in event_type:
+        return "open"
+    if "click" in event_type:
+        return "click"
+    if "bounce" in event_type:
+        return "bounce"
+    if "delivered" in event_type or event_type == "delivery":
+        return "delivered"
+    if "unsubscribe" in event_type:
+        return "unsubscribe"
+    if "spam" in event_type or "complaint" in event_type:
+        return "spam"
+    return None
+
+
+def _as_int(value: Any) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _event_timestamp(parsed: Dict[str, Any]) -> datetime:
+    timestamp = _as_int(parsed.get("timestamp"))
+    return datetime.fromtimestamp(timestamp) if timestamp else datetime.utcnow()
+
+
+def ingest_event_batch(db: Session, webhook: Webhook, payloads: List[Dict[str, Any]]) -> int:
+    """
+    Store an array of raw events in one bulk insert, queued for processing.
+
+    Returns the number of events stored.
+    """
+    if not payloads:
+        return 0
+
+    now = datetime.utcnow()
+    rows = []
+    for payload in payloads:
+        parsed = parse_event(webhook.provider, payload)
+        rows.append({
+            "webhook_id": webhook.id,
+            "event_type": parsed.get("event_type") or "unknown",
+            "event_data": payload,
+            "event_timestamp": _event_timestamp(parsed),
+            "email": parsed.get("email"),
+            "status": "queued",
+            "received_at": now,
+        })
+
+    db.execute(insert(WebhookEvent), rows)
+    db.execute(
+        update(Webhook)
+        .where(Webhook.id == webhook.id)
+        .values(
+            total_events_received=func.coalesce(Webhook.total_events_received, 0) + len(rows),
+            last_received_at=now
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return len(rows)
+
+
+def claim_queued_events(db: Session, limit: Optional[int] = None) -> List[WebhookEvent]:
+    """
+    Lease queued events by moving them to processing in one UPDATE.
+
+    The claim time is kept in processed_at until the event is processed;
+    events whose lease ran out are queued again first, since a batch's
+    changes are committed together or not at all.
+    """
+    now = datetime.utcnow()
+    db.execute(
+        update(WebhookEvent)
+        .where(
+            WebhookEvent.status == "processing",
+            WebhookEvent.processed_at < now - timedelta(seconds=settings.WEBHOOK_LEASE_SECONDS)
+        )
+        .values(status="queued", processed_at=None)
+        .execution_options(synchronize_session=False)
+    )
+
+    candidates = select(WebhookEvent.id).where(WebhookEvent.status == "queued").order_by(WebhookEvent.id).limit(
+        limit or settings.WEBHOOK_BATCH_SIZE
+    )
+    # Re-checking the status in the outer WHERE keeps two workers from claiming the same event
+    claimed_ids = [
+        event_id for (event_id,) in db.execute(
+            update(WebhookEvent)
+            .where(WebhookEvent.id.in_(candidates), WebhookEvent.status == "queued")
+            .values(status="processing", processed_at=now)
+            .returning(WebhookEvent.id)
+            .execution_options(synchronize_session=False)
+        )
+    ]
+    db.commit()
+
+    if not claimed_ids:
+        return []
+    return db.query(WebhookEvent).filter(WebhookEvent.id.in_(claimed_ids)).order_by(WebhookEvent.id).all()
+
+
+def _increment_counters(db: Session, model, increments: Dict[int, Counter], columns: Iterable[str]):
+    """Apply summed counter increments with one UPDATE statement per table"""
+    if not increments:
+        return
+
+    columns = sorted(set(columns))
+    table = model.__table__
+    statement = table.update().where(table.c.id == bindparam("b_id")).values({
+        column: func.coalesce(table.c[column], 0) + bindparam(f"b_{column}") for column in columns
+    })
+    db.execute(statement, [
+        {"b_id": row_id, **{f"b_{column}": counts[column] for column in columns}}
+        for row_id, counts in increments.items()
+    ])
+
+
+def _update_email_logs(db: Session, log_events: List[tuple]):
+    """Move each (campaign, lead) email log along in event order"""
+    if not log_events:
+        return
+
+    campaign_ids = {campaign_id for campaign_id, _, _, _ in log_events}
+    lead_ids = {lead_id for _, lead_id, _, _ in log_events}
+    logs = defaultdict(list)
+    for log in db.query(EmailLog).filter(
+        EmailLog.campaign_id.in_(campaign_ids),
+        EmailLog.lead_id.in_(lead_ids)
+    ).order_by(EmailLog.id):
+        logs[(log.campaign_id, log.lead_id)].append(log)
+
+    for campaign_id, lead_id, category, event in log_events:
+        candidates = logs.get((campaign_id, lead_id))
+        if not candidates:
+            continue
+
+        status, timestamp_column = EMAIL_LOG_UPDATES[category]
+        if category == "open":
+            candidates = [log for log in candidates if log.status != "opened"]
+            if not candidates:
+                continue
+
+        email_log = candidates[0]
+        email_log.status = status
+        if timestamp_column:
+            setattr(email_log, timestamp_column, event.event_timestamp or datetime.utcnow())
+        else:
+            email_log.error_message = event.event_data.get("reason", "Email bounced")
+
+
+def process_event_batch(db: Session, events: List[WebhookEvent]) -> int:
+    """
+    Process claimed events together, with the same effects as processing
+    each through process_webhook_event.
+
+    Leads, campaigns and variants are looked up with one IN query each and
+    counter increments are summed into one UPDATE per table, all in a
+    single transaction. Returns the number of events processed.
+    """
+    if not events:
+        return 0
+
+    details = []
+    for event in events:
+        data = event.event_data if isinstance(event.event_data, dict) else {}
+        details.append((
+            event,
+            event_category(event.event_type),
+            data.get("email") or data.get("recipient") or event.email,
+            _as_int(data.get("campaign_id")),
+            _as_int(data.get("ab_test_variant_id")),
+        ))
+
+    emails = {email for _, _, email, _, _ in details if email}
+    lead_ids = {}
+    if emails:
+        for lead_id, email in db.query(Lead.id, Lead.email).filter(Lead.email.in_(emails)).order_by(Lead.id.desc()):
+            lead_ids[email] = lead_id
+
+    requested_campaigns = {campaign_id for _, _, _, campaign_id, _ in details if campaign_id}
+    campaign_ids = set()
+    if requested_campaigns:
+        campaign_ids = {campaign_id for (campaign_id,) in db.query(Campaign.id).filter(Campaign.id.in_(requested_campaigns))}
+
+    requested_variants = {variant_id for _, _, _, _, variant_id in details if variant_id}
+    variants = {}
+    if requested_variants:
+        variants = {variant.id: variant for variant in db.query(ABTestVariant).filter(ABTestVariant.id.in_(requested_variants))}
+
+    campaign_increments = defaultdict(Counter)
+    variant_increments = defaultdict(Counter)
+    revoked_leads = set()
+    log_events = []
+    event_rows = []
+
+    for event, category, email, campaign_id, variant_id in details:
+        lead_id = lead_ids.get(email) if email else None
+        campaign_id = campaign_id if campaign_id in campaign_ids else None
+        variant_id = variant_id if variant_id in variants and category in VARIANT_COUNTERS else None
+
+        if campaign_id and category in CAMPAIGN_COUNTERS:
+            campaign_increments[campaign_id][CAMPAIGN_COUNTERS[category]] += 1
+        if variant_id:
+            variant_increments[variant_id][VARIANT_COUNTERS[category]] += 1
+        if lead_id and category in CONSENT_REVOKING_EVENTS:
+            revoked_leads.add(lead_id)
+        if campaign_id and lead_id and category in EMAIL_LOG_UPDATES:
+            log_events.append((campaign_id, lead_id, category, event))
+
+        event_rows.append({
+            "b_id": event.id,
+            "b_lead_id": lead_id,
+            "b_campaign_id": campaign_id,
+            "b_variant_id": variant_id,
+        })
+
+    _update_email_logs(db, log_events)
+
+    if revoked_leads:
+        db.execute(
+            update(Lead)
+            .where(Lead.id.in_(revoked_leads))
+            .values(email_consent=False)
+            .execution_options(synchronize_session=False)
+        )
+
+    _increment_counters(db, Campaign, campaign_increments, CAMPAIGN_COUNTERS.values())
+    _increment_counters(db, ABTestVariant, variant_increments, VARIANT_COUNTERS.values())
+
+    # Rates follow the new totals
+    for variant_id in variant_increments:
+        variant = variants[variant_id]
+        db.expire(variant)
+        ab_test_service.calculate_variant_metrics(variant)
+
+    now = datetime.utcnow()
+    table = WebhookEvent.__table__
+    db.execute(
+        table.update().where(table.c.id == bindparam("b_id")).values(
+            status="processed",
+            processed_at=now,
+            error_message=None,
+            lead_id=bindparam("b_lead_id"),
+            campaign_id=bindparam("b_campaign_id"),
+            ab_test_variant_id=bindparam("b_variant_id")
+        ),
+        event_rows
+    )
+
+    processed_per_webhook = Counter(event.webhook_id for event in events)
+    webhooks = Webhook.__table__
+    db.execute(
+        webhooks.update().where(webhooks.c.id == bindparam("b_id")).values(
+            total_events_processed=func.coalesce(webhooks.c.total_events_processed, 0) + bindparam("b_count"),
+            last_received_at=now
+        ),
+        [{"b_id": webhook_id, "b_count": count} for webhook_id, count in processed_per_webhook.items()]
+    )
+
+    db.commit()
+
+    if revoked_leads:
+        segment_service.refresh_lead_memberships(list(revoked_leads), db, changed_fields={"email_consent"})
+
+    return len(events)
+
+
+def process_queued_events(db: Session, limit: Optional[int] = None) -> Dict[str, int]:
+    """
+    Claim and process one batch of queued events.
+
+    If the batch fails as a whole, its events are processed one at a time
+    so a single bad event is marked failed without holding up the rest.
+    """
+    events = claim_queued_events(db, limit)
+    if not events:
+        return {"claimed": 0, "processed": 0, "failed": 0}
+
+    try:
+        processed = process_event_batch(db, events)
+        return {"claimed": len(events), "processed": processed, "failed": 0}
+    except Exception as e:
+        db.rollback()
+        print(f"Error processing webhook event batch, falling back to single events: {str(e)}")
+
+    results = [process_webhook_event(db, event) for event in events]
+    return {"claimed": len(events), "processed": results.count(True), "failed": results.count(False)}
+
+
+def drain_queued_events() -> int:
+    """Process queued events until none are left, using a dedicated session"""
+    total = 0
+
+    db = SessionLocal()
+    try:
+        while True:
+            claimed = process_queued_events(db)["claimed"]
+            if not claimed:
+                break
+            total += claimed
+    finally:
+        db.close()
+
+    return total
@@ -0,0 +1,73 @@
+"""
+Blob store garbage collection worker.
+
+Deletes stored images that no content, scheduled post or ad variant
+references any more:
+
+    python -m app.workers.blob_gc_worker --once
+
+Run with --migrate once to move images from the flat uploads directory
+into the blob store, rewriting the URLs that point at them.
+"""
+
+import argparse
+import time
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.services.blob_store import blob_store
+
+
+def collect_garbage() -> dict:
+    db = SessionLocal()
+    try:
+        stats = blob_store.collect_garbage(db)
+        print(f"Blob garbage collection: {stats}")
+        return stats
+    finally:
+        db.close()
+
+
+def migrate_flat_uploads() -> dict:
+    db = SessionLocal()
+    try:
+        stats = blob_store.migrate_flat_uploads(db)
+        print(f"Flat upload migration: {stats}")
+        return stats
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def run(once: bool = False):
+    """Collect garbage every BLOB_GC_INTERVAL_SECONDS"""
+    while True:
+        try:
+            collect_garbage()
+        except Exception as e:
+            print(f"Error collecting blob garbage: {str(e)}")
+
+        if once:
+            break
+        time.sleep(settings.BLOB_GC_INTERVAL_SECONDS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete unreferenced blobs from the upload store")
+    parser.add_argument("--once", action="store_true", help="Run a single collection and exit")
+    parser.add_argument("--migrate", action="store_true", help="Move flat uploads into the blob store first")
+    args = parser.parse_args()
+
+    if args.migrate:
+        migrate_flat_uploads()
+
+    try:
+        run(args.once)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Scheduled work fired by the due scheduler.
+
+Registers what runs when scheduled posts, outreach steps and score decay
+come due. Started from the API process when SCHEDULER_ENABLED is set, in
+place of polling; dedicated social workers can still poll on their own.
+Each kind is opt in (SOCIAL_POST_INLINE_WORKER, OUTREACH_INLINE_WORKER,
+SCORE_DECAY_INLINE_WORKER), since anything already past due runs as soon
+as the API starts.
+"""
+
+from typing import List
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.services.due_scheduler import due_scheduler
+from app.services.lead_scoring_service import SCORE_DECAY_JOB, lead_scoring_service
+from app.services.outreach_service import OUTREACH_STEP_JOB, outreach_service
+from app.services.social_scheduler import SOCIAL_POST_JOB, social_scheduler
+from app.workers import social_worker
+
+
+async def publish_due_posts(post_ids: List[int]):
+    """Claim and publish everything due; the claim re-checks each post's schedule"""
+    while await social_worker.process_due_posts():
+        pass
+
+
+async def send_due_outreach_steps(enrollment_ids: List[int]):
+    db = SessionLocal()
+    try:
+        await outreach_service.process_pending_sequences(db, enrollment_ids)
+    finally:
+        db.close()
+
+
+def _rescore(lead_ids: List[int]):
+    db = SessionLocal()
+    try:
+        lead_scoring_service.bulk_calculate(db, lead_ids)
+    finally:
+        db.close()
+
+
+async def decay_scores(lead_ids: List[int]):
+    await run_in_threadpool(_rescore, lead_ids)
+
+
+def register():
+    """Register each kind of scheduled work with its loader"""
+    if settings.SOCIAL_POST_INLINE_WORKER:
+        due_scheduler.register(SOCIAL_POST_JOB, publish_due_posts, social_scheduler.scheduled_times)
+    if settings.OUTREACH_INLINE_WORKER:
+        due_scheduler.register(OUTREACH_STEP_JOB, send_due_outreach_steps, outreach_service.scheduled_times)
+    if settings.SCORE_DECAY_INLINE_WORKER:
+        due_scheduler.register(SCORE_DECAY_JOB, decay_scores, lead_scoring_service.scheduled_times)
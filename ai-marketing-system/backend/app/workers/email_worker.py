@@ -0,0 +1,61 @@
+"""
+Outbound email queue worker.
+
+Run one or more alongside the API to deliver queued campaign email:
+
+    python -m app.workers.email_worker --worker-id worker-1
+
+Set EMAIL_QUEUE_INLINE_WORKER=false when dedicated workers are running.
+Send rates are enforced per worker, so divide the provider limit across
+workers when scaling out.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.services.email_queue_service import email_queue_service
+from app.services.email_service import email_service
+
+
+async def run(worker_id: str, batch_size: int, once: bool = False):
+    """Process queue batches, sleeping when nothing is due"""
+    print(f"Email worker {worker_id} started")
+
+    db = SessionLocal()
+    try:
+        while True:
+            try:
+                claimed = await email_queue_service.process_batch(db, worker_id, batch_size)
+            except Exception as e:
+                db.rollback()
+                print(f"Error processing email queue: {str(e)}")
+                claimed = 0
+
+            if not claimed:
+                if once:
+                    break
+                await asyncio.sleep(settings.EMAIL_QUEUE_POLL_SECONDS)
+    finally:
+        db.close()
+        await email_service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deliver queued outbound email")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--batch-size", type=int, default=settings.EMAIL_QUEUE_BATCH_SIZE)
+    parser.add_argument("--once", action="store_true", help="Exit when the queue is empty")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args.worker_id, args.batch_size, args.once))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
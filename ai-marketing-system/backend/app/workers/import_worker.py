@@ -0,0 +1,64 @@
+"""
+Lead import worker.
+
+Processes spooled lead import jobs, resuming interrupted jobs from their
+last checkpoint:
+
+    python -m app.workers.import_worker --worker-id importer-1
+
+Set LEAD_IMPORT_INLINE_WORKER=false when dedicated workers are running.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.services.lead_import_service import lead_import_service
+
+
+def run(worker_id: str, once: bool = False):
+    """Process import jobs, sleeping when none are waiting"""
+    print(f"Import worker {worker_id} started")
+
+    while True:
+        try:
+            processed = lead_import_service.process_available_jobs(worker_id)
+        except Exception as e:
+            print(f"Error processing import jobs: {str(e)}")
+            processed = 0
+
+        if not processed:
+            if once:
+                break
+            time.sleep(settings.LEAD_IMPORT_POLL_SECONDS)
+
+
+async def run_inline(worker_id: str):
+    """Poll for import jobs from inside the API process until cancelled"""
+    while True:
+        try:
+            await run_in_threadpool(lead_import_service.process_available_jobs, worker_id)
+        except Exception as e:
+            print(f"Error processing import jobs: {str(e)}")
+        await asyncio.sleep(settings.LEAD_IMPORT_POLL_SECONDS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process queued lead imports")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--once", action="store_true", help="Exit when no jobs are waiting")
+    args = parser.parse_args()
+
+    try:
+        run(args.worker_id, args.once)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
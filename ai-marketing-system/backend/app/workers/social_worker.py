@@ -0,0 +1,74 @@
+"""
+Scheduled social post worker.
+
+Publishes auto-posts once their scheduled time has passed:
+
+    python -m app.workers.social_worker --worker-id poster-1
+
+The API process only publishes auto-posts itself when
+SOCIAL_POST_INLINE_WORKER is set. Posts already past due are published
+as soon as a worker starts. Posts are leased before publishing, so
+several workers can run at once without posting anything twice.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+
+from app.core.config import settings
+from app.core.http_clients import http_clients
+from app.db.session import SessionLocal
+from app.services.social_scheduler import social_scheduler
+
+
+async def process_due_posts() -> int:
+    db = SessionLocal()
+    try:
+        return await social_scheduler.process_scheduled_posts(db)
+    except Exception as e:
+        db.rollback()
+        print(f"Error processing scheduled posts: {str(e)}")
+        return 0
+    finally:
+        db.close()
+
+
+async def run(worker_id: str, once: bool = False):
+    """Publish due posts, sleeping when nothing is due"""
+    print(f"Social worker {worker_id} started")
+
+    try:
+        while True:
+            processed = await process_due_posts()
+
+            if not processed:
+                if once:
+                    break
+                await asyncio.sleep(settings.SOCIAL_POST_POLL_SECONDS)
+    finally:
+        await http_clients.close()
+
+
+async def run_inline():
+    """Publish due posts from inside the API process until cancelled"""
+    while True:
+        processed = await process_due_posts()
+        if not processed:
+            await asyncio.sleep(settings.SOCIAL_POST_POLL_SECONDS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish scheduled social posts")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--once", action="store_true", help="Exit when no posts are due")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args.worker_id, args.once))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Webhook event worker.
+
+Processes batches of webhook events received as arrays:
+
+    python -m app.workers.webhook_worker --worker-id webhooks-1
+
+Set WEBHOOK_INLINE_WORKER=false when dedicated workers are running.
+Events are leased before processing, so several workers can run at once,
+and events claimed by a worker that stopped are picked up again once
+their lease runs out.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.services import webhook_service
+
+
+def process_queued_events() -> int:
+    db = SessionLocal()
+    try:
+        return webhook_service.process_queued_events(db)["claimed"]
+    except Exception as e:
+        db.rollback()
+        print(f"Error processing webhook events: {str(e)}")
+        return 0
+    finally:
+        db.close()
+
+
+async def run(worker_id: str, once: bool = False):
+    """Process queued events, sleeping when none are waiting"""
+    print(f"Webhook worker {worker_id} started")
+
+    while True:
+        claimed = await run_in_threadpool(process_queued_events)
+
+        if not claimed:
+            if once:
+                break
+            await asyncio.sleep(settings.WEBHOOK_POLL_SECONDS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process batched webhook events")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--once", action="store_true", help="Exit when no events are queued")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args.worker_id, args.once))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,77 @@
+import asyncio
+import socket
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
 
+from sqlalchemy import inspect
+
 from app.core.config import settings
+from app.core.http_clients import http_clients
 from app.db.base import Base
-from app.db.session import engine
+from app.db.session import engine, SessionLocal
 from app.api.routes import auth, leads, campaigns, content, email_templates, social_scheduling, segments, ab_tests, webhooks, shopify, facebook_leads, lead_forms, outreach, retargeting, lead_tracking, website_forms, lead_analytics, meta_ab_tests
 
 # Import models to ensure tables are created
 from app.models import lead_form, website_form, lead_analytics as lead_analytics_models, meta_ab_test  # noqa: F401
+from app.models.segment import SegmentMembership
+from app.services.segment_service import segment_service
+from app.services.email_service import email_service
+from app.services.due_scheduler import due_scheduler
+from app.services.image_store import image_store
+from app.workers import due_worker, import_worker, social_worker
+
+# Segment membership is materialized the first time its table is created
+backfill_segment_memberships = not inspect(engine).has_table(SegmentMembership.__tablename__)
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+if backfill_segment_memberships:
+    db = SessionLocal()
+    try:
+        segment_service.rebuild_all_memberships(db)
+    finally:
+        db.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run in-process workers and release pooled connections on shutdown"""
+    http_clients.start()
+
+    import_task = None
+    if settings.LEAD_IMPORT_INLINE_WORKER:
+        worker_id = f"api-{socket.gethostname()}-{os.getpid()}"
+        import_task = asyncio.create_task(import_worker.run_inline(worker_id))
+
+    # The scheduler fires scheduled work when due; without it, due posts are polled for
+    social_task = None
+    if settings.SCHEDULER_ENABLED:
+        due_worker.register()
+        await due_scheduler.start()
+    elif settings.SOCIAL_POST_INLINE_WORKER:
+        social_task = asyncio.create_task(social_worker.run_inline())
+
+    yield
+
+    if import_task:
+        import_task.cancel()
+    if social_task:
+        social_task.cancel()
+    await due_scheduler.stop()
+    await email_service.close()
+    await http_clients.close()
+    image_store.close()
+
+
 # Create FastAPI app
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
-    description=settings.APP_DESCRIPTION
+    description=settings.APP_DESCRIPTION,
+    lifespan=lifespan
 )
 
 # Configure CORS
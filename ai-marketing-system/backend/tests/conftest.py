@@ -0,0 +1,47 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import app.models  # noqa: F401
+from app.models import lead_form, website_form, lead_analytics, meta_ab_test  # noqa: F401
+from app.db.base import Base
+
+
+@pytest.fixture
+def make_engine(tmp_path):
+    """
+    Factory for databases with every table created.
+
+    File-backed rather than :memory: so sessions opened from worker threads
+    or by separate "workers" in a test all see the same data.
+    """
+    engines = []
+
+    def make(name="test.db"):
+        engine = create_engine(f"sqlite:///{tmp_path / name}")
+        Base.metadata.create_all(bind=engine)
+        engines.append(engine)
+        return engine
+
+    yield make
+
+    for engine in engines:
+        engine.dispose()
+
+
+@pytest.fixture
+def engine(make_engine):
+    return make_engine()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def db(session_factory):
+    """An empty database session; test modules seed it by overriding db(db)"""
+    session = session_factory()
+    yield session
+    session.close()
@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+import os
+import time
+import pytest
+from datetime import datetime
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+
+from app.models.content import GeneratedContent
+from app.models.scheduled_post import ScheduledPost
+from app.services.blob_store import BlobStore
+
+
+@pytest.fixture
+def blobs(tmp_path):
+    return BlobStore(root=str(tmp_path / "uploads" / "blobs"))
+
+
+def age(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+async def send(response, headers):
+    """Run an ASGI response, returning its status, headers and body"""
+    messages = []
+    scope = {"type": "http", "method": "GET", "headers": Headers(headers).raw}
+
+    async def receive():
+        # The client stays connected until the response is complete
+        await asyncio.Event().wait()
+
+    async def capture(message):
+        messages.append(message)
+
+    await response(scope, receive, capture)
+    start = messages[0]
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return start["status"], Headers(raw=start["headers"]), body
+
+
+@pytest.mark.asyncio
+async def test_blobs_are_sharded_by_hash_and_stored_once(blobs):
+    data = b"\x89PNG\r\n\x1a\nimage"
+    digest = hashlib.sha256(data).hexdigest()
+
+    name = await blobs.put(data, "png")
+    assert name == f"{digest}.png"
+    assert blobs.path(name) == os.path.join(blobs.root, digest[:2], digest[2:4], name)
+    assert await blobs.put(data, "png") == name
+    assert os.listdir(os.path.dirname(blobs.path(name))) == [name]
+
+    assert BlobStore.name_from_url(f"http://localhost:8000{blobs.url(name)}") == name
+    with pytest.raises(ValueError):
+        blobs.path("../../etc/passwd")
+
+
+@pytest.mark.asyncio
+async def test_blobs_are_served_with_validators_and_ranges(blobs):
+    data = bytes(range(256)) * 4
+    name = await blobs.put(data, "png")
+    etag = f'"{name[:-4]}"'
+
+    status, headers, body = await send(await blobs.response(name, Headers({})), {})
+    assert status == 200
+    assert body == data
+    assert headers["etag"] == etag
+    assert headers["accept-ranges"] == "bytes"
+    assert "immutable" in headers["cache-control"]
+
+    not_modified = await blobs.response(name, Headers({"if-none-match": etag}))
+    assert not_modified.status_code == 304
+    not_modified = await blobs.response(name, Headers({"if-modified-since": headers["last-modified"]}))
+    assert not_modified.status_code == 304
+
+    request = {"range": "bytes=10-19", "if-range": etag}
+    status, headers, body = await send(await blobs.response(name, Headers(request)), request)
+    assert status == 206
+    assert body == data[10:20]
+    assert headers["content-range"] == f"bytes 10-19/{len(data)}"
+
+    with pytest.raises(HTTPException) as missing:
+        await blobs.response("0" * 64 + ".png", Headers({}))
+    assert missing.value.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_garbage_collection_keeps_referenced_and_recent_blobs(blobs, db):
+    kept = await blobs.put(b"kept", "png")
+    posted = await blobs.put(b"posted", "png")
+    orphan = await blobs.put(b"orphan", "png")
+    recent = await blobs.put(b"recent", "png")
+    orphan_variant = blobs.path(f"{orphan[:64]}_256.webp")
+    with open(orphan_variant, "wb") as f:
+        f.write(b"thumbnail")
+
+    for name in (kept, posted, orphan):
+        age(blobs.path(name), 7200)
+    db.add(GeneratedContent(content_type="social_post", image_url=blobs.url(kept)))
+    db.add(ScheduledPost(platform="instagram", post_text="Hi", scheduled_time=datetime.utcnow(), image_url=f"http://localhost:8000{blobs.url(posted)}"))
+    db.commit()
+
+    stats = blobs.collect_garbage(db, grace_seconds=3600)
+
+    assert stats["scanned"] == 4
+    assert stats["deleted"] == 1
+    assert not os.path.exists(blobs.path(orphan))
+    assert not os.path.exists(orphan_variant)
+    assert all(os.path.exists(blobs.path(name)) for name in (kept, posted, recent))
+
+
+@pytest.mark.asyncio
+async def test_flat_uploads_are_migrated_into_the_store(blobs, db, tmp_path):
+    upload_dir = tmp_path / "uploads"
+    upload_dir.mkdir()
+    (upload_dir / "generated_20251028_183015.png").write_bytes(b"legacy image")
+    (upload_dir / "generated_20251028_183016.png").write_bytes(b"legacy image")
+    digest = "a" * 64
+    (upload_dir / f"generated_{digest}.png").write_bytes(b"hashed image")
+    (upload_dir / f"generated_{digest}_256.webp").write_bytes(b"thumbnail")
+    (upload_dir / "notes.txt").write_text("not an image")
+
+    db.add(GeneratedContent(content_type="social_post", image_url="/uploads/generated_20251028_183015.png"))
+    db.commit()
+
+    stats = blobs.migrate_flat_uploads(db, upload_dir=str(upload_dir))
+
+    assert stats == {"moved": 3, "references_updated": 1, "variants_removed": 1}
+    assert sorted(os.listdir(upload_dir)) == ["blobs", "notes.txt"]
+
+    content = db.query(GeneratedContent).one()
+    name = BlobStore.name_from_url(content.image_url)
+    assert content.image_url == blobs.url(name)
+    with open(blobs.path(name), "rb") as f:
+        assert f.read() == b"legacy image"
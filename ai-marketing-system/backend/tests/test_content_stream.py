@@ -0,0 +1,109 @@
+import json
+import httpx
+import pytest
+
+from app.api.routes import content as content_routes
+from app.core.config import settings
+from app.core.http_clients import http_clients
+from app.models.content import GeneratedContent
+from app.schemas.content import ContentGenerationRequest
+from app.services.ai_content_generator import AIContentGenerator
+from app.services.json_stream import JSONFieldStream
+from app.services.llm_cache import LLMResponseCache
+
+
+POST = {"title": "Spring \"Ride\"", "caption": "Roll into spring, {50% off}", "hashtags": ["#bike", "#spring"]}
+
+
+def sse_body(text, size=7):
+    """OpenRouter-style event stream delivering text a few characters at a time"""
+    lines = [": OPENROUTER PROCESSING\n\n"]
+    for start in range(0, len(text), size):
+        delta = {"choices": [{"delta": {"content": text[start:start + size]}}]}
+        lines.append(f"data: {json.dumps(delta)}\n\n")
+    lines.append("data: [DONE]\n\n")
+    return "".join(lines).encode()
+
+
+@pytest.fixture
+def openrouter(monkeypatch):
+    """Streaming OpenRouter transport answering with the test post as a fenced JSON block"""
+    requests = []
+
+    def handler(request):
+        requests.append(json.loads(request.content))
+        body = sse_body("```json\n" + json.dumps(POST, indent=2) + "\n```")
+        return httpx.Response(200, headers={"Content-Type": "text/event-stream"}, content=body)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(http_clients, "get", lambda name: client)
+    return requests
+
+
+def test_fields_are_reported_as_they_complete():
+    stream = JSONFieldStream()
+    text = 'Here you go:\n{"title": "A, \\"B\\"", "count": 3, "tags": ["#a", {"b": "}"}], "ok": true}'
+
+    completed = []
+    for char in text:
+        completed.extend(stream.feed(char))
+        if stream.buffer.endswith('"B\\"", '):
+            # The title is reported as soon as its string closes
+            assert completed == [("title", 'A, "B"')]
+
+    assert completed == [("title", 'A, "B"'), ("count", 3), ("tags", ["#a", {"b": "}"}]), ("ok", True)]
+    assert stream.complete
+
+
+@pytest.mark.asyncio
+async def test_stream_json_yields_tokens_fields_and_result(openrouter, tmp_path, monkeypatch):
+    cache = LLMResponseCache(path=str(tmp_path / "llm_cache.db"))
+    monkeypatch.setattr("app.services.ai_content_generator.llm_cache", cache)
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", True)
+    generator = AIContentGenerator()
+
+    events = [event async for event in generator.stream_json("Write a post", "model-a")]
+
+    assert openrouter[0]["stream"] is True
+    tokens = "".join(data for kind, data in events if kind == "token")
+    assert json.loads(tokens.split("```json")[1].split("```")[0]) == POST
+    assert [data["name"] for kind, data in events if kind == "field"] == ["title", "caption", "hashtags"]
+    assert events[-1] == ("result", POST)
+
+    # The first field arrives before the model has finished writing
+    first_field = next(index for index, (kind, _) in enumerate(events) if kind == "field")
+    assert any(kind == "token" for kind, _ in events[first_field:])
+
+    # A repeat request replays the cached fields without calling the model
+    replay = [event async for event in generator.stream_json("Write a post", "model-a")]
+    assert len(openrouter) == 1
+    assert [kind for kind, _ in replay] == ["field", "field", "field", "result"]
+    assert replay[-1] == ("result", POST)
+
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_stream_endpoint_persists_content(openrouter, session_factory, db, monkeypatch):
+    monkeypatch.setattr(content_routes, "SessionLocal", session_factory)
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", False)
+
+    request = ContentGenerationRequest(content_type="social_post", platform="instagram", topic="Spring sale")
+    response = await content_routes.generate_content_stream(request)
+    assert response.media_type == "text/event-stream"
+
+    body = "".join([chunk async for chunk in response.body_iterator])
+    events = [
+        (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+        for block in body.strip().split("\n\n")
+    ]
+
+    assert [name for name, _ in events if name != "token"] == ["field", "field", "field", "done"]
+    done = events[-1][1]
+    assert done["caption"] == POST["caption"]
+    assert done["hashtags"] == "#bike #spring"
+    assert done["platform"] == "instagram"
+
+    saved = db.query(GeneratedContent).one()
+    assert saved.id == done["id"]
+    assert saved.title == POST["title"]
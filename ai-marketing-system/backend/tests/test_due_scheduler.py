@@ -0,0 +1,180 @@
+import asyncio
+import time
+import pytest
+from datetime import datetime, timedelta, timezone
+
+from app.core.config import settings
+from app.models.lead import Lead
+from app.models.lead_tracking import LeadScore
+from app.models.scheduled_post import ScheduledPost
+from app.services.due_scheduler import DueScheduler
+from app.services.lead_scoring_service import SCORE_DECAY_JOB, LeadScoringService
+from app.services.outreach_service import OUTREACH_STEP_JOB
+from app.services.social_scheduler import SOCIAL_POST_JOB, SocialMediaScheduler
+
+
+def soon(seconds):
+    return datetime.utcnow() + timedelta(seconds=seconds)
+
+
+@pytest.mark.asyncio
+async def test_callbacks_fire_when_items_come_due(session_factory):
+    """Items fire at their due time; rescheduled and cancelled entries do not fire early"""
+    fired = []
+
+    async def callback(item_ids):
+        fired.append((sorted(item_ids), time.time()))
+
+    scheduler = DueScheduler(resync_seconds=60, session_factory=session_factory)
+    scheduler.register("job", callback)
+    await scheduler.start()
+
+    start = time.time()
+    scheduler.schedule("job", 1, soon(0.05))
+    scheduler.schedule("job", 2, soon(0.05))
+    scheduler.schedule("job", 3, soon(0.05))
+    scheduler.schedule("job", 2, soon(0.25))
+    scheduler.cancel("job", 3)
+
+    await asyncio.sleep(0.15)
+    assert [ids for ids, _ in fired] == [[1]]
+    assert fired[0][1] - start >= 0.04
+
+    await asyncio.sleep(0.2)
+    assert [ids for ids, _ in fired] == [[1], [2]]
+    assert scheduler.pending() == 0
+
+    await scheduler.stop()
+
+
+@pytest.mark.asyncio
+async def test_pending_items_are_loaded_from_the_database(session_factory):
+    """Startup loads auto-posts due before the next resync; others wait for a later one"""
+    db = session_factory()
+    now = datetime.utcnow()
+    db.add_all([
+        ScheduledPost(platform="facebook", post_text="Due", scheduled_time=now - timedelta(minutes=1),
+                      status="scheduled", auto_post=True),
+        ScheduledPost(platform="facebook", post_text="Soon", scheduled_time=now + timedelta(seconds=30),
+                      status="scheduled", auto_post=True),
+        ScheduledPost(platform="facebook", post_text="Next week", scheduled_time=now + timedelta(days=7),
+                      status="scheduled", auto_post=True),
+        ScheduledPost(platform="facebook", post_text="Manual", scheduled_time=now, status="scheduled", auto_post=False),
+        ScheduledPost(platform="facebook", post_text="Done", scheduled_time=now, status="posted", auto_post=True),
+    ])
+    db.commit()
+    db.close()
+
+    fired = []
+
+    async def callback(item_ids):
+        fired.extend(item_ids)
+
+    scheduler = DueScheduler(resync_seconds=60, session_factory=session_factory)
+    scheduler.register(SOCIAL_POST_JOB, callback, SocialMediaScheduler().scheduled_times)
+    await scheduler.start()
+    await asyncio.sleep(0.05)
+
+    assert fired == [1]
+    assert scheduler.pending(SOCIAL_POST_JOB) == 1
+    assert 29 < scheduler.next_due_in() <= 30
+
+    await scheduler.stop()
+
+
+@pytest.mark.asyncio
+async def test_callbacks_for_a_kind_do_not_overlap(session_factory):
+    """Items coming due while a callback runs are handed to the next run"""
+    calls = []
+    running = []
+
+    async def callback(item_ids):
+        running.append(True)
+        assert len(running) == 1
+        calls.append(sorted(item_ids))
+        await asyncio.sleep(0.1)
+        running.pop()
+
+    scheduler = DueScheduler(resync_seconds=60, session_factory=session_factory)
+    scheduler.register("job", callback)
+    await scheduler.start()
+
+    scheduler.schedule("job", 1, soon(0))
+    await asyncio.sleep(0.02)
+    scheduler.schedule("job", 2, soon(0))
+    scheduler.schedule("job", 3, soon(0))
+    await asyncio.sleep(0.3)
+
+    assert calls == [[1], [2, 3]]
+    await scheduler.stop()
+
+
+def test_schedule_is_ignored_until_started(session_factory):
+    scheduler = DueScheduler(resync_seconds=60, session_factory=session_factory)
+    scheduler.register("job", lambda item_ids: None)
+    scheduler.schedule("job", 1, datetime.utcnow())
+    assert scheduler.pending() == 0
+
+
+def test_next_decay_follows_recency_thresholds():
+    """Scores are due again when the days since last contact cross 7, 30 and 90"""
+    contact = datetime(2024, 1, 1)
+    next_decay_at = LeadScoringService.next_decay_at
+
+    assert next_decay_at(contact, contact + timedelta(days=1)) == contact + timedelta(days=7)
+    assert next_decay_at(contact, contact + timedelta(days=7)) == contact + timedelta(days=30)
+    assert next_decay_at(contact.replace(tzinfo=timezone.utc), contact + timedelta(days=40)) == contact + timedelta(days=90)
+    assert next_decay_at(contact, contact + timedelta(days=90)) is None
+    assert next_decay_at(None, contact) is None
+
+
+def test_decay_times_are_filtered_in_sql(db):
+    """Only scores with a threshold after their last calculation and by until are loaded"""
+    now = datetime(2024, 6, 1)
+    until = now + timedelta(hours=1)
+    contacts = {
+        "due_7": now - timedelta(days=7) + timedelta(minutes=30),  # Crosses 7 days within the hour
+        "due_30": now - timedelta(days=30),  # Scored before crossing 30 days
+        "scored_after": now - timedelta(days=30, hours=1),  # Already rescored after crossing 30 days
+        "later": now - timedelta(days=3),  # Next threshold is days away
+        "stale": now - timedelta(days=200),  # Past every threshold
+    }
+    scored = {"scored_after": now - timedelta(minutes=10)}
+    leads = {name: Lead(email=f"{name}@example.com", last_contact_date=contact) for name, contact in contacts.items()}
+    db.add_all(leads.values())
+    db.commit()
+    db.add_all([
+        LeadScore(lead_id=lead.id, last_calculated_at=scored.get(name, now - timedelta(days=1)))
+        for name, lead in leads.items()
+    ])
+    db.commit()
+
+    expected = {
+        leads["due_7"].id: contacts["due_7"] + timedelta(days=7),
+        leads["due_30"].id: contacts["due_30"] + timedelta(days=30),
+    }
+    assert dict(LeadScoringService().scheduled_times(db, until)) == expected
+
+    # The window is applied by the database, not after loading every score
+    selected = db.query(LeadScore.lead_id).join(Lead, Lead.id == LeadScore.lead_id).filter(
+        LeadScoringService._decays_by(db, until)
+    )
+    assert {lead_id for (lead_id,) in selected} == set(expected)
+
+
+def test_scheduled_work_is_opt_in(monkeypatch, session_factory):
+    """Outreach steps and score decay only run from the API when enabled, like social posts"""
+    from app.workers import due_worker
+
+    def registered(**enabled):
+        for name in ("SOCIAL_POST_INLINE_WORKER", "OUTREACH_INLINE_WORKER", "SCORE_DECAY_INLINE_WORKER"):
+            monkeypatch.setattr(settings, name, enabled.get(name, False))
+        scheduler = DueScheduler(resync_seconds=60, session_factory=session_factory)
+        monkeypatch.setattr(due_worker, "due_scheduler", scheduler)
+        due_worker.register()
+        return set(scheduler._kinds)
+
+    assert registered() == set()
+    assert registered(OUTREACH_INLINE_WORKER=True, SCORE_DECAY_INLINE_WORKER=True) == {
+        OUTREACH_STEP_JOB, SCORE_DECAY_JOB
+    }
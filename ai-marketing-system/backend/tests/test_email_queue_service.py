@@ -0,0 +1,107 @@
+import time
+import pytest
+from datetime import datetime, timedelta
+
+from app.models.campaign import Campaign
+from app.models.email_queue import OutboundEmail, OutboundEmailStatus
+from app.models.lead import Lead
+from app.services.email_queue_service import EmailQueueService, TokenBucket
+from app.services.email_service import email_service
+
+
+@pytest.fixture
+def db(db):
+    """Seed the database with a campaign and three leads"""
+    db.add(Campaign(name="Spring Sale", campaign_type="email", subject="Sale",
+                         content="<p>Hello</p>", status="active", total_recipients=3))
+    db.add_all([Lead(email=f"lead{i}@example.com", email_consent=True) for i in range(3)])
+    db.commit()
+
+    return db
+
+
+def recipients(db):
+    return [
+        {"email": lead.email, "lead_id": lead.id, "lead_data": {"email": lead.email}}
+        for lead in db.query(Lead).order_by(Lead.id)
+    ]
+
+
+def test_enqueue_is_idempotent(db):
+    """Enqueueing the same campaign twice queues each lead once"""
+    service = EmailQueueService()
+
+    assert service.enqueue_campaign(db, 1, recipients(db)) == 3
+    assert service.enqueue_campaign(db, 1, recipients(db)) == 0
+    assert db.query(OutboundEmail).count() == 3
+
+
+def test_claims_do_not_overlap_until_lease_expires(db):
+    """A leased message is invisible to other workers until its lease runs out"""
+    service = EmailQueueService()
+    service.enqueue_campaign(db, 1, recipients(db))
+
+    first = service.claim_batch(db, "worker-a", 2)
+    second = service.claim_batch(db, "worker-b", 10)
+
+    assert len(first) == 2
+    assert len(second) == 1
+    assert not {m.id for m in first} & {m.id for m in second}
+    assert service.claim_batch(db, "worker-c", 10) == []
+
+    # Simulate worker-a crashing with an expired lease
+    for message in first:
+        message.locked_until = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+
+    assert {m.id for m in service.claim_batch(db, "worker-c", 10)} == {m.id for m in first}
+
+
+@pytest.mark.asyncio
+async def test_process_batch_sends_and_retries(db, monkeypatch):
+    """Sent messages complete the campaign; failures are retried then marked failed"""
+    service = EmailQueueService()
+    service.enqueue_campaign(db, 1, recipients(db))
+    sent = []
+
+    async def send_email(to_email, subject, body, **kwargs):
+        if to_email == "lead2@example.com":
+            return False
+        sent.append((to_email, kwargs["message_id"]))
+        return True
+
+    monkeypatch.setattr(email_service, "send_email", send_email)
+    monkeypatch.setattr("app.services.email_queue_service.settings.EMAIL_QUEUE_MAX_ATTEMPTS", 2)
+
+    assert await service.process_batch(db, "worker", 10) == 3
+    assert sorted(sent) == [
+        ("lead0@example.com", "campaign:1:lead:1"),
+        ("lead1@example.com", "campaign:1:lead:2"),
+    ]
+
+    failed = db.query(OutboundEmail).filter(OutboundEmail.to_email == "lead2@example.com").one()
+    assert failed.status == OutboundEmailStatus.QUEUED.value
+    assert failed.next_attempt_at > datetime.utcnow()
+
+    failed.next_attempt_at = datetime.utcnow()
+    db.commit()
+    assert await service.process_batch(db, "worker", 10) == 1
+    assert failed.status == OutboundEmailStatus.FAILED.value
+    assert failed.attempts == 2
+
+    campaign = db.query(Campaign).one()
+    assert campaign.total_sent == 2
+    assert campaign.status == "active"
+    assert service.get_queue_stats(db, 1) == {"queued": 0, "sending": 0, "sent": 2, "failed": 1}
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_rate():
+    """A bucket allows a burst up to its capacity, then paces at its rate"""
+    bucket = TokenBucket(rate=50, capacity=5)
+
+    started = time.monotonic()
+    for _ in range(10):
+        await bucket.acquire()
+
+    assert time.monotonic() - started >= 0.09
@@ -0,0 +1,230 @@
+import asyncio
+import pytest
+import aiosmtplib
+from datetime import datetime
+from email.message import EmailMessage
+from sqlalchemy import event
+
+from app.models.campaign import Campaign, EmailLog
+from app.services.email_service import EmailLogWriter, EmailService, SMTPConnectionPool, _PooledConnection
+
+
+class FakeSMTP:
+    """Stands in for aiosmtplib.SMTP and records what was sent"""
+
+    def __init__(self, fail_sends: int = 0):
+        self.is_connected = True
+        self.messages = []
+        self.fail_sends = fail_sends
+        self.resets = 0
+        self.fail_reset = False
+
+    async def send_message(self, message):
+        if self.fail_sends:
+            self.fail_sends -= 1
+            self.is_connected = False
+            raise aiosmtplib.SMTPServerDisconnected("Connection lost")
+        await asyncio.sleep(0)
+        if message["To"].startswith("bad"):
+            raise aiosmtplib.SMTPRecipientsRefused([
+                aiosmtplib.SMTPRecipientRefused(550, "No such user", message["To"])
+            ])
+        if message["To"].startswith("spam"):
+            raise aiosmtplib.SMTPDataError(554, "Message rejected")
+        self.messages.append(message["To"])
+
+    async def rset(self):
+        if self.fail_reset:
+            raise aiosmtplib.SMTPResponseException(421, "Closing connection")
+        self.resets += 1
+
+    async def quit(self):
+        self.is_connected = False
+
+    def close(self):
+        self.is_connected = False
+
+
+def make_pool(monkeypatch, size=2, max_messages=100, fail_first_sends=0):
+    """Create a pool whose connections are FakeSMTP clients"""
+    pool = SMTPConnectionPool("smtp.example.com", 587, "user", "secret", size, max_messages, 5)
+    clients = []
+
+    async def connect():
+        client = FakeSMTP(fail_sends=fail_first_sends if not clients else 0)
+        clients.append(client)
+        return _PooledConnection(client)
+
+    monkeypatch.setattr(pool, "_connect", connect)
+    return pool, clients
+
+
+def message_to(address):
+    message = EmailMessage()
+    message["To"] = address
+    return message
+
+
+@pytest.mark.asyncio
+async def test_pool_reuses_connections(monkeypatch):
+    """Many messages share at most pool-size connections"""
+    pool, clients = make_pool(monkeypatch, size=3)
+
+    await asyncio.gather(*(pool.send_message(message_to(f"lead{i}@example.com")) for i in range(30)))
+
+    assert len(clients) <= 3
+    assert sum(len(client.messages) for client in clients) == 30
+
+
+@pytest.mark.asyncio
+async def test_pool_recycles_after_message_cap(monkeypatch):
+    """Connections are replaced once they reach the per-connection cap"""
+    pool, clients = make_pool(monkeypatch, size=1, max_messages=4)
+
+    for i in range(10):
+        await pool.send_message(message_to(f"lead{i}@example.com"))
+
+    assert [len(client.messages) for client in clients] == [4, 4, 2]
+    assert not clients[0].is_connected
+
+
+@pytest.mark.asyncio
+async def test_pool_reconnects_after_disconnect(monkeypatch):
+    """A dropped connection is replaced and the message retried"""
+    pool, clients = make_pool(monkeypatch, size=1, fail_first_sends=1)
+
+    await pool.send_message(message_to("lead@example.com"))
+
+    assert len(clients) == 2
+    assert clients[1].messages == ["lead@example.com"]
+
+
+@pytest.mark.asyncio
+async def test_refused_messages_keep_the_connection(monkeypatch):
+    """A refused recipient or message resets the session with RSET instead of reconnecting"""
+    pool, clients = make_pool(monkeypatch, size=1)
+
+    for address in ["a@example.com", "bad1@example.com", "spam@example.com", "bad2@example.com", "b@example.com"]:
+        try:
+            await pool.send_message(message_to(address))
+        except (aiosmtplib.SMTPRecipientsRefused, aiosmtplib.SMTPResponseException):
+            pass
+
+    assert len(clients) == 1
+    assert clients[0].resets == 3
+    assert clients[0].messages == ["a@example.com", "b@example.com"]
+
+    # A session that cannot be reset is replaced
+    clients[0].fail_reset = True
+    with pytest.raises(aiosmtplib.SMTPRecipientsRefused):
+        await pool.send_message(message_to("bad3@example.com"))
+    await pool.send_message(message_to("c@example.com"))
+
+    assert len(clients) == 2
+    assert not clients[0].is_connected
+    assert clients[1].messages == ["c@example.com"]
+
+
+@pytest.mark.asyncio
+async def test_send_many_counts_results():
+    """send_many runs every job and isolates failures"""
+    service = EmailService()
+
+    async def send(job):
+        if job == "boom":
+            raise RuntimeError("boom")
+        return job == "ok"
+
+    results = await service.send_many(["ok", "fail", "boom", "ok"], send)
+
+    assert results == {"sent": 2, "failed": 2}
+
+
+@pytest.fixture
+def db(db):
+    """Seed the database with one campaign"""
+    db.add(Campaign(id=1, name="Spring Sale", campaign_type="email", total_sent=0, total_delivered=0))
+    db.commit()
+
+    return db
+
+
+def log_row(lead_id, status="sent"):
+    return {
+        "campaign_id": 1,
+        "lead_id": lead_id,
+        "recipient_email": f"lead{lead_id}@example.com",
+        "status": status,
+        "sent_at": datetime.utcnow(),
+    }
+
+
+def test_log_writer_flushes_in_batches(db):
+    """Logs are written per full buffer and sent counters bumped once per flush"""
+    writer = EmailLogWriter(db, flush_size=3, flush_ms=60000)
+    statements = []
+
+    @event.listens_for(db.get_bind(), "before_cursor_execute")
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with writer:
+        for lead_id in range(1, 5):
+            writer.add(**log_row(lead_id, "failed" if lead_id == 2 else "sent"))
+
+            if lead_id == 3:
+                assert db.query(EmailLog).count() == 3
+                assert db.query(Campaign).one().total_sent == 2
+
+    assert db.query(EmailLog).count() == 4
+    campaign = db.query(Campaign).one()
+    assert campaign.total_sent == 3
+    assert campaign.total_delivered == 3
+    assert sum(s.startswith("INSERT INTO email_logs") for s in statements) == 2
+
+
+def test_log_writer_flushes_stale_buffer(db):
+    """A buffer older than flush_ms is written on the next add"""
+    writer = EmailLogWriter(db, flush_size=100, flush_ms=0)
+
+    writer.add(**log_row(1))
+
+    assert db.query(EmailLog).count() == 1
+
+
+@pytest.mark.asyncio
+async def test_log_writer_flushes_on_a_timer(db):
+    """A trickle of sends is written flush_ms after the first, without another add"""
+    writer = EmailLogWriter(db, flush_size=100, flush_ms=20)
+
+    writer.add(**log_row(1))
+    assert db.query(EmailLog).count() == 0
+
+    await asyncio.sleep(0.1)
+    assert db.query(EmailLog).count() == 1
+
+
+def test_failed_flush_keeps_rows_and_the_callers_session(db, session_factory):
+    """A failed write leaves the rows buffered and the caller's pending changes alone"""
+    writer = EmailLogWriter(db, flush_size=100, flush_ms=60000)
+    failures = [RuntimeError("database is locked")]
+
+    @event.listens_for(db.get_bind(), "before_cursor_execute")
+    def fail_once(conn, cursor, statement, *args):
+        if statement.startswith("INSERT INTO email_logs") and failures:
+            raise failures.pop()
+
+    campaign = db.query(Campaign).one()
+    campaign.name = "Renamed"
+    writer.add(**log_row(1))
+    writer.add(**log_row(2))
+
+    assert writer.flush() is False
+    assert campaign in db.dirty
+    assert campaign.name == "Renamed"
+
+    writer.close()
+    check = session_factory()
+    assert check.query(EmailLog).count() == 2
+    assert check.query(Campaign).one().total_sent == 2
+    check.close()
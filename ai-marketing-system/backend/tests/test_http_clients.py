@@ -0,0 +1,65 @@
+import httpx
+import pytest
+
+from app.core.http_clients import ClientPolicy, HTTPClientRegistry, RetryTransport
+
+
+def flaky_transport(statuses):
+    """Mock transport answering with the given statuses in turn"""
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        status = statuses[min(len(calls), len(statuses)) - 1]
+        return httpx.Response(status, headers={"Retry-After": "0"})
+
+    return httpx.MockTransport(handler), calls
+
+
+@pytest.mark.asyncio
+async def test_clients_are_shared_per_integration():
+    """Each integration gets one long-lived client until the registry is closed"""
+    registry = HTTPClientRegistry({"meta": ClientPolicy(timeout=60.0), "openrouter": ClientPolicy(timeout=120.0)})
+
+    meta = registry.get("meta")
+    assert registry.get("meta") is meta
+    assert registry.get("openrouter") is not meta
+    assert meta.timeout.read == 60.0
+    assert meta.timeout.connect == 10.0
+
+    async with registry.borrow("meta") as client:
+        assert client is meta
+    assert not meta.is_closed
+
+    with pytest.raises(KeyError):
+        registry.get("unknown")
+
+    await registry.close()
+    assert meta.is_closed
+    assert registry.get("meta") is not meta
+
+    await registry.close()
+
+
+@pytest.mark.asyncio
+async def test_idempotent_requests_are_retried():
+    """GETs are retried on retryable statuses; POSTs are not repeated"""
+    policy = ClientPolicy(timeout=5.0, max_retries=2)
+
+    transport, calls = flaky_transport([503, 503, 200])
+    async with httpx.AsyncClient(transport=RetryTransport(transport, policy)) as client:
+        response = await client.get("https://graph.example.com/me")
+    assert response.status_code == 200
+    assert calls == ["GET"] * 3
+
+    transport, calls = flaky_transport([503, 200])
+    async with httpx.AsyncClient(transport=RetryTransport(transport, policy)) as client:
+        response = await client.post("https://graph.example.com/feed", json={"message": "hi"})
+    assert response.status_code == 503
+    assert calls == ["POST"]
+
+    transport, calls = flaky_transport([429])
+    async with httpx.AsyncClient(transport=RetryTransport(transport, policy)) as client:
+        response = await client.get("https://graph.example.com/me")
+    assert response.status_code == 429
+    assert len(calls) == 3
@@ -0,0 +1,83 @@
+import base64
+import hashlib
+import io
+import os
+import pytest
+from PIL import Image
+
+from app.services.blob_store import BlobStore
+from app.services.image_store import ImageStore, image_extension
+
+
+def png_bytes(width=800, height=600, color=(200, 40, 40)):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def blobs(tmp_path):
+    return BlobStore(root=str(tmp_path / "blobs"))
+
+
+@pytest.fixture
+def store(blobs):
+    store = ImageStore(blobs=blobs, thumbnail_widths=[256, 512], webp_quality=80, process_workers=1)
+    yield store
+    store.close()
+
+
+def test_image_extension_follows_signature():
+    assert image_extension(png_bytes(4, 4)) == "png"
+    assert image_extension(b"\xff\xd8\xff\xe0rest") == "jpg"
+    assert image_extension(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "webp"
+    assert image_extension(b"unknown") == "png"
+
+
+@pytest.mark.asyncio
+async def test_images_are_named_by_content_and_deduplicated(store, blobs):
+    image = png_bytes()
+    digest = hashlib.sha256(image).hexdigest()
+
+    url = await store.save_data_url("data:image/png;base64," + base64.b64encode(image).decode())
+    assert url == f"/api/content/blobs/{digest}.png"
+    with open(blobs.path(f"{digest}.png"), "rb") as f:
+        assert f.read() == image
+
+    # The same image saved again, by any route, reuses the file
+    assert await store.save_base64(base64.b64encode(image).decode()) == url
+    assert await store.save_bytes(image) == url
+
+    other = await store.save_bytes(png_bytes(color=(0, 0, 255)))
+    assert other != url
+    await store.wait_for_variants()
+    assert not [name for name in os.listdir(os.path.dirname(blobs.path(f"{digest}.png"))) if name.endswith(".tmp")]
+
+
+@pytest.mark.asyncio
+async def test_webp_variants_are_rendered(store, blobs):
+    url = await store.save_bytes(png_bytes())
+    stem = os.path.splitext(blobs.path(os.path.basename(url)))[0]
+
+    # The URL is returned once the original is written; variants follow
+    assert os.path.exists(blobs.path(os.path.basename(url)))
+    assert not os.path.exists(f"{stem}.webp")
+    await store.wait_for_variants()
+
+    with Image.open(f"{stem}.webp") as full:
+        assert full.format == "WEBP"
+        assert full.size == (800, 600)
+    with Image.open(f"{stem}_256.webp") as thumbnail:
+        assert thumbnail.size == (256, 192)
+    with Image.open(f"{stem}_512.webp") as thumbnail:
+        assert thumbnail.size == (512, 384)
+
+
+@pytest.mark.asyncio
+async def test_unreadable_images_are_saved_without_variants(store, blobs):
+    url = await store.save_bytes(b"not an image")
+    await store.wait_for_variants()
+    path = blobs.path(os.path.basename(url))
+
+    assert os.path.exists(path)
+    assert os.listdir(os.path.dirname(path)) == [os.path.basename(path)]
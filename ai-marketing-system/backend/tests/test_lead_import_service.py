@@ -0,0 +1,215 @@
+import asyncio
+import io
+import os
+import pytest
+from datetime import datetime, timedelta
+from fastapi import UploadFile
+
+from app.models.lead import Lead
+from app.models.lead_import_job import LeadImportJob
+from app.services.lead_import_service import LeadImportService, ImportFormatError
+from app.services.segment_service import segment_service
+
+
+@pytest.fixture
+def db(db):
+    """Seed the database with one existing lead"""
+    db.add(Lead(email="existing@example.com", first_name="Old", email_consent=False))
+    db.commit()
+
+    return db
+
+
+CSV = (
+    "\ufeffemail, first_name ,sport_type,unused\n"
+    "anna@example.com,Anna,cycling,x\n"
+    "existing@example.com,New,running,x\n"
+    "not-an-email,Bad,,x\n"
+    ",,,\n"
+    "ben@example.com,,triathlon,x\n"
+    "anna@example.com,Anna Again,cycling,x\n"
+    "cara@example.com,Cara,,x\n"
+).encode()
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    """Import service spooling uploads into a temporary directory"""
+    monkeypatch.setattr("app.services.lead_import_service.settings.LEAD_IMPORT_SPOOL_DIR", str(tmp_path / "imports"))
+    return LeadImportService()
+
+
+def queue_upload(service, db, content, filename, source="event"):
+    upload = UploadFile(file=io.BytesIO(content), filename=filename)
+    return asyncio.run(service.create_job(upload, source, db))
+
+
+def test_csv_import_in_chunks(db, service):
+    """Rows are deduped per chunk, merged into existing leads, and bad rows reported"""
+    job = queue_upload(service, db, CSV, "leads.csv")
+    assert job.status == "pending"
+    assert job.total_rows == 7
+    assert os.path.dirname(job.file_path).endswith("imports")
+    assert job.id not in job.file_path
+
+    job = service.claim_job(db, "worker-a")
+    service.process_job(db, job, chunk_size=2)
+
+    assert job.status == "completed"
+    assert job.processed_rows == 7
+    assert (job.imported, job.updated, job.skipped, job.failed) == (3, 1, 1, 1)
+    assert job.errors == ["Row 3: invalid email 'not-an-email'"]
+    assert not os.path.exists(job.file_path)
+
+    leads = {lead.email: lead for lead in db.query(Lead)}
+    assert set(leads) == {"existing@example.com", "anna@example.com", "ben@example.com", "cara@example.com"}
+    assert leads["anna@example.com"].first_name == "Anna"
+    assert leads["ben@example.com"].first_name is None
+    assert leads["existing@example.com"].first_name == "Old"
+    assert leads["existing@example.com"].sport_type == "running"
+    assert leads["existing@example.com"].email_consent is False
+    assert leads["cara@example.com"].email_consent is True
+    assert leads["cara@example.com"].source == "event"
+    assert [row_number for row_number, _ in service.open_rows(io.BytesIO(CSV), "leads.csv")[1]] == [1, 2, 3, 5, 6, 7]
+
+    status = service.get_job_status(job)
+    assert status["eta_seconds"] == 0
+    assert status["rows_per_second"] > 0
+
+
+def test_interrupted_import_resumes_from_checkpoint(db, service, monkeypatch):
+    """A failure after a committed chunk resumes from the checkpoint without duplicates"""
+    content = "email\n" + "".join(f"lead{i}@example.com\n" for i in range(10))
+    job = queue_upload(service, db, content.encode(), "leads.csv")
+
+    refresh = segment_service.refresh_lead_memberships
+    calls = []
+
+    def crash_on_second_chunk(lead_ids, db, *args, **kwargs):
+        calls.append(lead_ids)
+        if len(calls) == 2:
+            raise RuntimeError("worker died")
+        return refresh(lead_ids, db, *args, **kwargs)
+
+    monkeypatch.setattr(segment_service, "refresh_lead_memberships", crash_on_second_chunk)
+
+    service.process_job(db, service.claim_job(db, "worker-a"), chunk_size=4)
+    assert job.status == "pending"
+    assert job.processed_rows == 8
+    assert job.errors == ["Attempt 1: worker died"]
+
+    service.process_job(db, service.claim_job(db, "worker-b"), chunk_size=4)
+    assert job.status == "completed"
+    assert job.attempts == 2
+    assert job.imported == 10
+    assert db.query(Lead).count() == 11
+    assert [len(ids) for ids in calls] == [4, 4, 2]
+
+
+def test_database_errors_do_not_skip_rows(db, service, monkeypatch):
+    """A chunk that fails to write is retried from the checkpoint, not counted as failed rows"""
+    from sqlalchemy.exc import OperationalError
+    from app.services.lead_upsert_service import lead_upsert_service
+
+    content = "email\n" + "".join(f"lead{i}@example.com\n" for i in range(10))
+    job = queue_upload(service, db, content.encode(), "leads.csv")
+
+    upsert = lead_upsert_service.upsert_leads
+    calls = []
+
+    def fail_second_chunk(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise OperationalError("INSERT INTO leads", {}, Exception("database is locked"))
+        return upsert(*args, **kwargs)
+
+    monkeypatch.setattr(lead_upsert_service, "upsert_leads", fail_second_chunk)
+
+    service.process_job(db, service.claim_job(db, "worker-a"), chunk_size=4)
+    assert job.status == "pending"
+    assert job.processed_rows == 4
+    assert job.failed == 0
+
+    service.process_job(db, service.claim_job(db, "worker-b"), chunk_size=4)
+    assert job.status == "completed"
+    assert (job.imported, job.failed) == (10, 0)
+    assert db.query(Lead).count() == 11
+
+
+def test_worker_stops_once_its_lease_is_taken_over(db, session_factory, service, monkeypatch):
+    """A worker whose lease expired stops at its next checkpoint, so rows are not counted twice"""
+    content = "email\n" + "".join(f"lead{i}@example.com\n" for i in range(10))
+    job = queue_upload(service, db, content.encode(), "leads.csv")
+
+    refresh = segment_service.refresh_lead_memberships
+    takeovers = []
+
+    def take_over_after_first_chunk(lead_ids, session, *args, **kwargs):
+        refresh(lead_ids, session, *args, **kwargs)
+        if session is db and not takeovers:
+            # worker-a stalls past its lease and worker-b finishes the job
+            other = session_factory()
+            other.query(LeadImportJob).update({"locked_until": datetime.utcnow() - timedelta(seconds=1)})
+            other.commit()
+            takeovers.append(service.process_job(other, service.claim_job(other, "worker-b"), chunk_size=4).status)
+            other.close()
+
+    monkeypatch.setattr(segment_service, "refresh_lead_memberships", take_over_after_first_chunk)
+
+    service.process_job(db, service.claim_job(db, "worker-a"), chunk_size=4)
+
+    assert takeovers == ["completed"]
+    db.expire_all()
+    assert job.status == "completed"
+    assert (job.processed_rows, job.imported, job.skipped) == (10, 10, 0)
+    assert db.query(Lead).count() == 11
+
+
+def test_claimed_job_is_leased(db, service):
+    """A running job is only reclaimed once its lease expires"""
+    job = queue_upload(service, db, CSV, "leads.csv")
+
+    assert service.claim_job(db, "worker-a").id == job.id
+    assert service.claim_job(db, "worker-b") is None
+
+    job.locked_until = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+
+    reclaimed = service.claim_job(db, "worker-b")
+    assert reclaimed.locked_by == "worker-b"
+    assert reclaimed.attempts == 2
+
+
+def test_xlsx_import_streams_rows(db, service):
+    """Excel files are read row by row with openpyxl"""
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["email", "first_name", "phone"])
+    sheet.append(["dan@example.com", "Dan", 5551234])
+    sheet.append(["existing@example.com", "Nope", None])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+
+    job = queue_upload(service, db, buffer.getvalue(), "leads.XLSX", source="import")
+    assert job.total_rows == 2
+
+    service.process_job(db, service.claim_job(db, "worker"))
+
+    assert (job.imported, job.updated, job.skipped) == (1, 0, 1)
+    assert db.query(Lead).filter(Lead.email == "dan@example.com").one().phone == "5551234"
+
+
+@pytest.mark.parametrize("filename, content", [
+    ("leads.txt", b"email\na@example.com\n"),
+    ("leads.csv", b"name,phone\nAnna,555\n"),
+])
+def test_rejects_unreadable_files(db, service, tmp_path, filename, content):
+    """Unsupported formats and files without an email column are rejected before queueing"""
+    with pytest.raises(ImportFormatError):
+        queue_upload(service, db, content, filename)
+
+    assert db.query(LeadImportJob).count() == 0
+    spool_dir = tmp_path / "imports"
+    assert not spool_dir.exists() or not os.listdir(spool_dir)
@@ -0,0 +1,147 @@
+import pytest
+from datetime import datetime, timedelta
+
+from app.models.lead import Lead
+from app.models.lead_tracking import LeadScore, LeadScoreAggregate, EngagementHistory, EngagementType
+from app.services.lead_scoring_service import LeadScoringService
+from app.services.lead_tracking_service import LeadTrackingService
+
+COMPONENTS = ["demographic_score", "behavioral_score", "firmographic_score", "engagement_score", "intent_score"]
+
+
+@pytest.fixture
+def db(db):
+    """Seed the database with varied leads and engagement history"""
+    now = datetime.utcnow()
+
+    db.add_all([
+        Lead(email="anna@example.com", first_name="Anna", last_name="Lee", phone="555", location="Austin, United States",
+             customer_type="coach", sport_type="cycling", interests="[\"road\"]", source="referral",
+             status="opportunity", email_consent=True, sms_consent=True, last_contact_date=now - timedelta(days=2)),
+        Lead(email="ben@example.com", first_name="", location="Berlin", customer_type="athlete", source="import",
+             status="engaged", email_consent=False, last_contact_date=now - timedelta(days=45)),
+        Lead(email="cara@example.com", status=None, source="unknown", email_consent=None,
+             last_contact_date=now - timedelta(days=400)),
+        Lead(email="dan@example.com", first_name="Dan", customer_type="bike_fitter", source="facebook_lead_ads",
+             status="customer", sms_consent=True),
+    ])
+    db.commit()
+
+    events = [
+        (1, EngagementType.PURCHASE_MADE, 3), (1, EngagementType.EMAIL_REPLIED, 5), (1, EngagementType.EMAIL_REPLIED, 20),
+        (1, EngagementType.MEETING_SCHEDULED, 10), (1, EngagementType.FORM_SUBMITTED, 29),
+        (2, EngagementType.EMAIL_OPENED, 1), (2, EngagementType.EMAIL_OPENED, 40), (2, EngagementType.EMAIL_CLICKED, 80),
+        (2, EngagementType.PAGE_VIEWED, 85), (2, EngagementType.PAGE_VIEWED, 100), (2, "custom_event", 3),
+        (2, EngagementType.CONTENT_DOWNLOADED, 15), (2, EngagementType.EMAIL_OPENED, 2),
+        (3, EngagementType.PURCHASE_MADE, 120),
+    ]
+    db.add_all([
+        EngagementHistory(lead_id=lead_id, engagement_type=str(getattr(kind, "value", kind)),
+                          engaged_at=now - timedelta(days=days))
+        for lead_id, kind, days in events
+    ])
+    db.add(LeadScore(lead_id=4, total_score=12))
+    db.commit()
+
+    return db
+
+
+def test_bulk_scores_match_per_lead_calculation(db):
+    """Vectorized scores equal the per-lead calculation for every lead"""
+    results = LeadScoringService().bulk_calculate(db)
+
+    assert results["calculated"] == 4
+    assert results["failed"] == 0
+    assert db.query(LeadScore).count() == 4
+
+    bulk = {score.lead_id: score for score in db.query(LeadScore)}
+    assert bulk[4].previous_score == 12
+    assert bulk[4].score_change_amount == bulk[4].total_score - 12
+
+    expected = {}
+    for lead in db.query(Lead).order_by(Lead.id):
+        snapshot = {field: getattr(bulk[lead.id], field) for field in COMPONENTS + ["total_score", "grade", "temperature"]}
+        snapshot["score_factors"] = dict(bulk[lead.id].score_factors)
+        score = LeadTrackingService().calculate_lead_score(lead, db)
+        expected[lead.id] = {field: getattr(score, field) for field in snapshot}
+        assert snapshot == expected[lead.id], lead.email
+        assert score.score_changed is False
+
+    assert {row["lead_id"]: row["total_score"] for row in results["scores"]} == {
+        lead_id: values["total_score"] for lead_id, values in expected.items()
+    }
+    assert [lead.engagement_score for lead in db.query(Lead).order_by(Lead.id)] == [
+        values["total_score"] for values in expected.values()
+    ]
+
+
+def test_bulk_calculate_selected_leads_in_batches(db):
+    """Only the requested leads are scored, batch by batch"""
+    results = LeadScoringService().bulk_calculate(db, [2, 3, 99], batch_size=1)
+
+    assert results["total_leads"] == 2
+    assert results["calculated"] == 2
+    assert sorted(score.lead_id for score in db.query(LeadScore)) == [2, 3, 4]
+
+
+def score_snapshot(score):
+    return {field: getattr(score, field) for field in COMPONENTS + ["total_score", "grade", "temperature"]}
+
+
+def test_tracked_engagement_updates_score_incrementally(db):
+    """Each tracked engagement updates the score to what a full recalculation gives"""
+    service = LeadTrackingService()
+    lead = db.query(Lead).filter(Lead.id == 2).one()
+
+    for engagement_type in [EngagementType.EMAIL_REPLIED, EngagementType.PURCHASE_MADE, EngagementType.EMAIL_OPENED]:
+        service.track_engagement(lead_id=lead.id, engagement_type=engagement_type.value, db=db)
+
+        incremental = score_snapshot(db.query(LeadScore).filter(LeadScore.lead_id == lead.id).one())
+        assert incremental == score_snapshot(service.calculate_lead_score(lead, db))
+
+    aggregate = db.query(LeadScoreAggregate).filter(LeadScoreAggregate.lead_id == lead.id).one()
+    assert sum(sum(counts.values()) for counts in aggregate.daily_counts.values()) == 10
+
+
+def test_tracked_engagement_refreshes_score_segments(db):
+    """Score-based segments follow scores updated by tracked engagements"""
+    from app.models.segment import Segment
+    from app.services.segment_service import SegmentService
+
+    segment = Segment(name="Engaged", criteria={"field": "engagement_score", "operator": "greater_than", "value": 20})
+    db.add(segment)
+    db.commit()
+    SegmentService.update_segment_count(segment.id, db)
+    assert SegmentService.get_segment_leads(segment.id, db) == []
+
+    for _ in range(3):
+        LeadTrackingService().track_engagement(lead_id=2, engagement_type=EngagementType.PURCHASE_MADE.value, db=db)
+
+    assert db.get(Lead, 2).engagement_score > 20
+    assert [lead.id for lead in SegmentService.get_segment_leads(segment.id, db)] == [2]
+
+
+def test_bulk_rescoring_resets_running_aggregates(db):
+    """Bulk rescoring drops aggregates so they reseed from history"""
+    LeadTrackingService().track_engagement(lead_id=3, engagement_type="page_viewed", db=db)
+    assert db.query(LeadScoreAggregate).count() == 1
+
+    LeadScoringService().bulk_calculate(db, [3])
+
+    assert db.query(LeadScoreAggregate).count() == 0
+
+
+def test_hot_lead_listener_fires_when_lead_turns_hot(db):
+    """Listeners run once when an engagement pushes a lead to hot"""
+    service = LeadTrackingService()
+    alerts = []
+    service.hot_lead_listeners.append(lambda lead, score: alerts.append((lead.id, score.temperature)))
+
+    lead = db.query(Lead).filter(Lead.id == 2).one()
+    lead.status = "opportunity"
+    db.commit()
+
+    for _ in range(4):
+        service.track_engagement(lead_id=lead.id, engagement_type=EngagementType.PURCHASE_MADE.value, db=db)
+
+    assert alerts == [(2, "hot")]
@@ -0,0 +1,130 @@
+import pytest
+from sqlalchemy import event
+
+from app.models.lead import Lead
+from app.services.lead_upsert_service import LeadUpsertService, MergePolicy
+
+
+@pytest.fixture
+def db(db):
+    """Seed the database with one existing lead"""
+    db.add(Lead(email="anna@example.com", first_name="Anna", phone=None, location="Austin",
+                     email_consent=False, source="manual"))
+    db.commit()
+
+    return db
+
+
+ROWS = [
+    {"email": "anna@example.com", "first_name": "Annie", "phone": "555", "location": None, "email_consent": True},
+    {"email": " ben@example.com ", "first_name": "Ben", "phone": None, "location": "Berlin", "email_consent": True},
+]
+
+
+@pytest.fixture(params=["on_conflict", "portable"])
+def service(request, monkeypatch):
+    """Upsert service using ON CONFLICT, or the fallback for other databases"""
+    service = LeadUpsertService()
+    if request.param == "portable":
+        monkeypatch.setattr(service, "_dialect_insert", lambda db: None)
+    return service
+
+
+def test_merge_policies_per_column(db, service):
+    """Each column merges into the existing lead according to its policy"""
+    result = service.upsert_leads(db, ROWS, policies={
+        "first_name": MergePolicy.KEEP,
+        "email_consent": MergePolicy.OVERWRITE,
+    })
+    db.commit()
+
+    anna = db.query(Lead).filter(Lead.email == "anna@example.com").one()
+    ben = db.query(Lead).filter(Lead.email == "ben@example.com").one()
+
+    assert result["inserted"] == [ben.id]
+    assert result["updated"] == [anna.id]
+    assert result["ids"] == {"anna@example.com": anna.id, "ben@example.com": ben.id}
+
+    assert anna.first_name == "Anna"      # keep
+    assert anna.phone == "555"            # fill if null
+    assert anna.location == "Austin"      # null never overwrites
+    assert anna.email_consent is True     # overwrite
+    assert anna.source == "manual"        # not in the rows
+    assert anna.updated_at is not None
+
+    assert ben.first_name == "Ben"
+    assert ben.source == "manual"         # column default on insert
+    assert ben.status == "new"
+
+
+def test_unchanged_leads_are_not_written(db, service):
+    """Rows that would not change an existing lead leave it untouched"""
+    result = service.upsert_leads(db, [{"email": "anna@example.com", "first_name": "Other", "location": "Austin"}])
+    db.commit()
+
+    anna = db.query(Lead).one()
+    assert result["unchanged"] == [anna.id]
+    assert result["updated"] == []
+    assert anna.first_name == "Anna"
+    assert anna.updated_at is None
+
+
+def test_repeated_emails_in_one_batch_are_folded(db, service):
+    """Duplicate emails within a batch merge by policy instead of conflicting"""
+    result = service.upsert_leads(db, [
+        {"email": "cara@example.com", "first_name": None, "sport_type": "running"},
+        {"email": "cara@example.com", "first_name": "Cara", "sport_type": "cycling"},
+    ], policies={"sport_type": "overwrite"})
+    db.commit()
+
+    cara = db.query(Lead).filter(Lead.email == "cara@example.com").one()
+    assert result["inserted"] == [cara.id]
+    assert (cara.first_name, cara.sport_type) == ("Cara", "cycling")
+
+    with pytest.raises(ValueError):
+        service.upsert_leads(db, [{"email": " "}])
+
+
+def test_batch_is_a_handful_of_statements(db):
+    """Thousands of rows are written with a few statements rather than per-row round trips"""
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    rows = [{"email": f"lead{i}@example.com", "first_name": f"Lead {i}"} for i in range(2500)]
+    rows.append({"email": "anna@example.com", "phone": "555"})
+    result = LeadUpsertService().upsert_leads(db, rows)
+
+    assert len(result["inserted"]) == 2500
+    assert len(result["updated"]) == 1
+    assert sum("ON CONFLICT" in statement for statement in statements) >= 1
+    assert len(statements) < 20
+
+
+def test_revoke_only_never_opts_a_lead_back_in(db, service):
+    """False always wins, while True only fills an empty column"""
+    db.add(Lead(email="otto@example.com", email_consent=True))
+    db.add(Lead(email="nora@example.com"))
+    db.commit()
+    db.query(Lead).filter(Lead.email == "nora@example.com").update({"email_consent": None})
+    db.commit()
+    policies = {"email_consent": MergePolicy.REVOKE_ONLY}
+
+    result = service.upsert_leads(db, [
+        {"email": "anna@example.com", "email_consent": True},
+        {"email": "otto@example.com", "email_consent": False},
+        {"email": "nora@example.com", "email_consent": True},
+    ], policies=policies)
+    db.commit()
+
+    consent = {lead.email: lead.email_consent for lead in db.query(Lead)}
+    assert consent == {"anna@example.com": False, "otto@example.com": False, "nora@example.com": True}
+    assert len(result["updated"]) == 2
+    assert result["unchanged"] == [result["ids"]["anna@example.com"]]
+
+    # Within one batch, a withdrawal beats an earlier opt-in
+    result = service.upsert_leads(db, [
+        {"email": "pia@example.com", "email_consent": True},
+        {"email": "pia@example.com", "email_consent": False},
+    ], policies=policies)
+    db.commit()
+    assert db.query(Lead).filter(Lead.email == "pia@example.com").one().email_consent is False
@@ -0,0 +1,93 @@
+import json
+import time
+import pytest
+
+from app.core.config import settings
+from app.services.ai_content_generator import AIContentGenerator
+from app.services.llm_cache import LLMResponseCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = LLMResponseCache(path=str(tmp_path / "llm_cache.db"), ttl_seconds=60, max_entries=3)
+    yield cache
+    cache.close()
+
+
+def test_keys_cover_model_prompt_and_parameters():
+    key = LLMResponseCache.make_key("model-a", "Write a post", temperature=0.7, max_tokens=2000)
+
+    assert key == LLMResponseCache.make_key("model-a", "Write a post", max_tokens=2000, temperature=0.7)
+    assert key != LLMResponseCache.make_key("model-b", "Write a post", temperature=0.7, max_tokens=2000)
+    assert key != LLMResponseCache.make_key("model-a", "Write a post", temperature=0.9, max_tokens=2000)
+    assert key != LLMResponseCache.make_key("model-a", "Write an ad", temperature=0.7, max_tokens=2000)
+
+
+def test_entries_expire_after_ttl(cache, monkeypatch):
+    cache.set("key", "model", "response")
+    assert cache.get("key") == "response"
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("key") is None
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    for key in ["a", "b", "c"]:
+        cache.set(key, "model", key)
+        time.sleep(0.001)
+
+    cache.get("a")
+    time.sleep(0.001)
+    cache.set("d", "model", "d")
+
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in ["a", "c", "d"]] == ["a", "c", "d"]
+
+
+@pytest.mark.asyncio
+async def test_generation_reuses_cached_responses(cache, monkeypatch):
+    """Identical requests are answered from the cache unless fresh is set"""
+    monkeypatch.setattr("app.services.ai_content_generator.llm_cache", cache)
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", True)
+
+    calls = []
+
+    async def fake_openrouter(prompt, model, *args):
+        calls.append(prompt)
+        return json.dumps({"title": "Ride", "caption": f"Caption {len(calls)}", "hashtags": "#bike"})
+
+    generator = AIContentGenerator()
+    monkeypatch.setattr(generator, "_call_openrouter", fake_openrouter)
+
+    first = await generator.generate_social_post("Spring sale", "facebook")
+    second = await generator.generate_social_post("Spring sale", "facebook")
+    assert first == second
+    assert len(calls) == 1
+
+    await generator.generate_social_post("Spring sale", "instagram")
+    assert len(calls) == 2
+
+    fresh = await generator.generate_social_post("Spring sale", "facebook", fresh=True)
+    assert fresh["caption"] == "Caption 3"
+    assert (await generator.generate_social_post("Spring sale", "facebook"))["caption"] == "Caption 3"
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_unparseable_responses_are_not_cached(cache, monkeypatch):
+    monkeypatch.setattr("app.services.ai_content_generator.llm_cache", cache)
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", True)
+
+    calls = []
+
+    async def fake_openrouter(prompt, model, *args):
+        calls.append(prompt)
+        return "Sorry, I can't help with that"
+
+    generator = AIContentGenerator()
+    monkeypatch.setattr(generator, "_call_openrouter", fake_openrouter)
+
+    await generator.generate_ad_copy("Aero helmet", "Fast and light")
+    await generator.generate_ad_copy("Aero helmet", "Fast and light")
+    assert len(calls) == 2
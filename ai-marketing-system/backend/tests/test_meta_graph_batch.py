@@ -0,0 +1,164 @@
+import asyncio
+import json
+from datetime import datetime
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+
+from app.core.http_clients import http_clients
+from app.models.scheduled_post import ScheduledPost
+from app.services.meta_graph_batch import GraphBatchClient
+from app.services.social_scheduler import SocialMediaScheduler
+
+
+class FakeGraph:
+    """Graph API batch endpoint answering each sub-request with its own URL"""
+
+    def __init__(self, drop_first=0, fail=False):
+        self.batches = []
+        self.drop_first = drop_first
+        self.fail = fail
+
+    def handler(self, request):
+        form = parse_qs(request.content.decode(), keep_blank_values=True)
+        items = json.loads(form["batch"][0])
+        self.batches.append((form["access_token"][0], items))
+
+        if self.fail:
+            return httpx.Response(500, json={"error": {"message": "Service unavailable"}})
+
+        results = []
+        for item in items:
+            if self.drop_first > 0:
+                self.drop_first -= 1
+                results.append(None)
+                continue
+            body = {"url": item["relative_url"], "method": item["method"], "body": item.get("body")}
+            if "/insights" in item["relative_url"]:
+                body = {"data": [{"name": "post_impressions", "values": [{"value": 200}]},
+                                 {"name": "post_engaged_users", "values": [{"value": 50}]}]}
+            elif "fields=likes" in item["relative_url"]:
+                body = {"likes": {"summary": {"total_count": 7}}, "comments": {"summary": {"total_count": 2}}}
+            results.append({"code": 200, "body": json.dumps(body)})
+        return httpx.Response(200, json=results)
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    graph = FakeGraph()
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: graph.handler(request)))
+    monkeypatch.setattr(http_clients, "get", lambda name: client)
+    return graph
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_batches(graph):
+    """Concurrent calls are coalesced into batches of 50 and each caller gets its own response"""
+    batcher = GraphBatchClient(flush_ms=10)
+
+    responses = await asyncio.gather(*(
+        batcher.get(f"post_{i}", "token", params={"fields": "id"}) for i in range(120)
+    ))
+
+    assert [len(items) for _, items in graph.batches] == [50, 50, 20]
+    for i, response in enumerate(responses):
+        assert response.status_code == 200
+        assert response.json()["url"] == f"v18.0/post_{i}?fields=id"
+
+
+@pytest.mark.asyncio
+async def test_requests_are_grouped_by_token_and_encoded(graph):
+    """Each access token gets its own batch and POST bodies are form encoded"""
+    batcher = GraphBatchClient(flush_ms=5)
+
+    first, second = await asyncio.gather(
+        batcher.post("pixel/events", "token-a", data={"data": [{"event_name": "Lead"}]}),
+        batcher.get("me", "token-b")
+    )
+
+    assert sorted(token for token, _ in graph.batches) == ["token-a", "token-b"]
+    assert parse_qs(first.json()["body"])["data"] == ['[{"event_name": "Lead"}]']
+    assert second.json()["method"] == "GET"
+
+
+@pytest.mark.asyncio
+async def test_unanswered_subrequests_are_retried_and_failures_propagate(graph):
+    """Null sub-responses are sent again; a failed batch raises for every caller"""
+    batcher = GraphBatchClient(flush_ms=5)
+    graph.drop_first = 1
+
+    response = await batcher.get("me", "token")
+    assert response.json()["url"] == "v18.0/me"
+    assert len(graph.batches) == 2
+
+    graph.fail = True
+    results = await asyncio.gather(batcher.get("a", "token"), batcher.get("b", "token"), return_exceptions=True)
+    assert all(isinstance(result, httpx.HTTPStatusError) for result in results)
+
+
+@pytest.fixture
+def held_graph(monkeypatch):
+    """Graph API batch endpoint holding batches of "slow" requests until released"""
+    graph = FakeGraph()
+    release = asyncio.Event()
+
+    async def handler(request):
+        if b"slow" in request.content:
+            await release.wait()
+        return graph.handler(request)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(http_clients, "get", lambda name: client)
+    return graph, release
+
+
+@pytest.mark.asyncio
+async def test_overlapping_flushes_do_not_strand_requests(held_graph):
+    """A flush finishing late leaves a queue created after it started to be flushed"""
+    graph, release = held_graph
+    batcher = GraphBatchClient(max_batch_size=2, flush_ms=10)
+
+    # A full batch is held in flight while the timer flush for its queue also runs
+    slow = asyncio.gather(batcher.get("slow_a", "token"), batcher.get("slow_b", "token"))
+    await asyncio.sleep(0.05)
+
+    # Queued just before the held flush finishes, and flushed by its own timer
+    fast = asyncio.ensure_future(batcher.get("fast", "token"))
+    await asyncio.sleep(0)
+    release.set()
+
+    response = await asyncio.wait_for(fast, 1)
+    assert response.json()["url"] == "v18.0/fast"
+    assert len(await slow) == 2
+
+
+@pytest.mark.asyncio
+async def test_callers_wait_a_bounded_time(held_graph):
+    """A batch that never answers fails its callers after the timeout"""
+    batcher = GraphBatchClient(flush_ms=5, timeout_seconds=0.05)
+
+    with pytest.raises(Exception, match="timed out"):
+        await batcher.get("slow", "token")
+
+
+@pytest.mark.asyncio
+async def test_post_metrics_refresh_in_batches(graph, db, monkeypatch):
+    """Refreshing many posts takes a few batch requests instead of two calls per post"""
+    monkeypatch.setattr("app.services.social_scheduler.graph_batch_client", GraphBatchClient(flush_ms=10))
+
+    db.add_all([
+        ScheduledPost(platform="facebook", post_text="Hi", scheduled_time=datetime.utcnow(),
+                      status="posted", platform_post_id=f"page_{i}")
+        for i in range(60)
+    ])
+    db.commit()
+
+    refreshed = await SocialMediaScheduler().update_metrics_for_posts(db.query(ScheduledPost).all(), db)
+
+    assert refreshed == 60
+    assert sum(len(items) for _, items in graph.batches) == 120
+    assert len(graph.batches) == 3
+    post = db.query(ScheduledPost).first()
+    assert (post.likes_count, post.comments_count, post.reach, post.engagement_rate) == (7, 2, 200, 25)
+    assert post.metrics_last_updated is not None
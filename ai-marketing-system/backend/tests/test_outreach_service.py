@@ -0,0 +1,239 @@
+import asyncio
+import json
+import re
+import pytest
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.models.lead import Lead
+from app.models.outreach import OutreachEnrollment, OutreachMessage, OutreachSequence
+from app.services.ai_content_generator import ai_content_generator
+from app.services.email_service import email_service
+from app.services.llm_cache import LLMResponseCache
+from app.services.outreach_service import OutreachService
+
+
+@pytest.fixture
+def db(db):
+    """Seed the database with a two-step sequence and 12 enrolled leads"""
+    sequence = OutreachSequence(user_id=1, name="Welcome", status="active", sequence_steps=[
+        {"message_type": "intro", "subject": "Hi"},
+        {"message_type": "follow_up", "delay_days": 2}
+    ])
+    db.add(sequence)
+    db.add_all([
+        Lead(email=f"lead{i}@example.com", first_name=f"Lead{i}", email_consent=True) for i in range(12)
+    ])
+    db.commit()
+    db.add_all([
+        OutreachEnrollment(sequence_id=sequence.id, lead_id=lead.id, status="active", current_step=0,
+                           next_send_at=datetime.utcnow() - timedelta(minutes=1))
+        for lead in db.query(Lead)
+    ])
+    db.commit()
+
+    return db
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    """Slow fake AI provider and SMTP server that record their peak concurrency"""
+    stats = {"ai": 0, "ai_peak": 0, "smtp": 0, "smtp_peak": 0, "fail": set()}
+
+    async def fake_openrouter(prompt, model, *args, **kwargs):
+        stats["ai"] += 1
+        stats["ai_peak"] = max(stats["ai_peak"], stats["ai"])
+        await asyncio.sleep(0.05)
+        stats["ai"] -= 1
+        if any(f"Name: {name}\n" in prompt for name in stats["fail"]):
+            raise Exception("Provider overloaded")
+        return json.dumps({"subject": "Hello", "body": "Body", "personalization_tokens": {}})
+
+    async def fake_send_email(**kwargs):
+        stats["smtp"] += 1
+        stats["smtp_peak"] = max(stats["smtp_peak"], stats["smtp"])
+        await asyncio.sleep(0.02)
+        stats["smtp"] -= 1
+        return True
+
+    monkeypatch.setattr(ai_content_generator, "_call_openrouter", fake_openrouter)
+    monkeypatch.setattr(email_service, "send_email", fake_send_email)
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "OUTREACH_CONCURRENCY", 12)
+    monkeypatch.setattr(settings, "OUTREACH_AI_CONCURRENCY", 4)
+    monkeypatch.setattr(settings, "OUTREACH_SMTP_CONCURRENCY", 2)
+    monkeypatch.setattr(settings, "OUTREACH_PROMPT_BATCH_SIZE", 1)
+    return stats
+
+
+@pytest.mark.asyncio
+async def test_due_steps_run_concurrently_within_provider_limits(db, providers):
+    """Twelve steps overlap up to the AI and SMTP limits instead of running one at a time"""
+    results = await OutreachService().process_pending_sequences(db)
+
+    assert results["processed"] == 12
+    assert results["failed"] == 0
+    assert providers["ai_peak"] == 4
+    assert providers["smtp_peak"] == 2
+
+    db.expire_all()
+    assert db.query(OutreachMessage).count() == 12
+    assert db.query(OutreachSequence).one().total_sent == 12
+    assert all(enrollment.current_step == 1 for enrollment in db.query(OutreachEnrollment))
+    assert all(enrollment.next_send_at > datetime.utcnow() + timedelta(days=1) for enrollment in db.query(OutreachEnrollment))
+
+
+@pytest.mark.asyncio
+async def test_failures_are_isolated_and_reported_per_enrollment(db, providers):
+    """A failed step leaves other enrollments sent and is retried after its lease"""
+    providers["fail"] = {"Lead3", "Lead7"}
+
+    results = await OutreachService().process_pending_sequences(db)
+
+    assert results["processed"] == 10
+    assert results["failed"] == 2
+    failed = [result for result in results["enrollments"] if result["status"] == "failed"]
+    assert {result["error"] for result in failed} == {"Provider overloaded"}
+
+    db.expire_all()
+    for result in failed:
+        enrollment = db.get(OutreachEnrollment, result["enrollment_id"])
+        assert enrollment.current_step == 0
+        assert enrollment.next_send_at > datetime.utcnow()
+
+    # Nothing is due again until the lease runs out
+    assert (await OutreachService().process_pending_sequences(db))["enrollments"] == []
+
+
+@pytest.mark.asyncio
+async def test_overlapping_runs_do_not_send_a_step_twice(db, providers):
+    service = OutreachService()
+
+    first, second = await asyncio.gather(
+        service.process_pending_sequences(db),
+        service.process_pending_sequences(db)
+    )
+
+    assert first["processed"] + second["processed"] == 12
+    db.expire_all()
+    assert db.query(OutreachMessage).count() == 12
+
+
+@pytest.fixture
+def batch_provider(monkeypatch):
+    """Fake AI provider answering batch prompts with one message per listed lead"""
+    calls = {"batch": [], "single": 0, "drop": False}
+
+    async def fake_openrouter(prompt, model, *args, **kwargs):
+        names = re.findall(r"^(\d+)\. Name: (\w+)", prompt, re.MULTILINE)
+        if not names:
+            calls["single"] += 1
+            return json.dumps({"subject": "Hello", "body": "Single", "personalization_tokens": {}})
+
+        calls["batch"].append(len(names))
+        if calls["drop"]:
+            names = names[1:]
+        return json.dumps({"messages": [
+            {"lead": int(index), "subject": f"Hi {name}", "body": f"Dear {name}", "preview_text": "", "call_to_action": "Shop"}
+            for index, name in reversed(names)
+        ]})
+
+    async def fake_send_email(**kwargs):
+        return True
+
+    monkeypatch.setattr(ai_content_generator, "_call_openrouter", fake_openrouter)
+    monkeypatch.setattr(email_service, "send_email", fake_send_email)
+    monkeypatch.setattr(settings, "OUTREACH_PROMPT_BATCH_SIZE", 5)
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_due_steps_share_batched_generation_requests(db, batch_provider, monkeypatch):
+    """Twelve leads at the same step take three requests, each lead getting its own message"""
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", False)
+
+    results = await OutreachService().process_pending_sequences(db)
+
+    assert results["processed"] == 12
+    assert sorted(batch_provider["batch"]) == [2, 5, 5]
+    assert batch_provider["single"] == 0
+
+    db.expire_all()
+    for message in db.query(OutreachMessage):
+        lead = db.get(Lead, message.lead_id)
+        assert message.content == f"Dear {lead.first_name}"
+        assert message.subject == "Hi"  # The step's own subject wins
+        assert message.personalization_data["first_name"] == lead.first_name
+
+
+@pytest.mark.asyncio
+async def test_invalid_batches_fall_back_to_single_requests(db, batch_provider, tmp_path, monkeypatch):
+    """A reply missing a lead is discarded, not cached, and each lead is generated on its own"""
+    cache = LLMResponseCache(path=str(tmp_path / "llm_cache.db"))
+    monkeypatch.setattr("app.services.ai_content_generator.llm_cache", cache)
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", True)
+    batch_provider["drop"] = True
+
+    leads = db.query(Lead).order_by(Lead.id).limit(4).all()
+    messages = await OutreachService().generate_personalized_messages(leads)
+
+    assert batch_provider["batch"] == [4]
+    assert batch_provider["single"] == 4
+    assert [message["body"] for message in messages] == ["Single"] * 4
+
+    batch_provider["drop"] = False
+    messages = await OutreachService().generate_personalized_messages(leads)
+    assert batch_provider["batch"] == [4, 4]
+    assert [message["body"] for message in messages] == [f"Dear {lead.first_name}" for lead in leads]
+
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_due_steps_are_claimed_in_bounded_batches(db, providers, monkeypatch):
+    """Twelve due steps are leased five at a time, each batch sent before the next is claimed"""
+    monkeypatch.setattr(settings, "OUTREACH_CLAIM_BATCH_SIZE", 5)
+    service = OutreachService()
+    claims = []
+    claim = service.claim_due_enrollments
+
+    def record_claim(db, enrollment_ids=None, limit=None):
+        claimed_ids = claim(db, enrollment_ids, limit)
+        claims.append((len(claimed_ids), db.query(OutreachMessage).count()))
+        return claimed_ids
+
+    monkeypatch.setattr(service, "claim_due_enrollments", record_claim)
+
+    results = await service.process_pending_sequences(db)
+
+    assert results["processed"] == 12
+    assert claims == [(5, 0), (5, 5), (2, 10)]
+
+
+@pytest.mark.asyncio
+async def test_steps_whose_lease_was_taken_over_are_not_sent(db, providers, monkeypatch):
+    """A lease lost while the message was generated stops the send"""
+    generate = OutreachService.generate_personalized_message
+    service = OutreachService()
+
+    async def generate_then_lose_lease(lead, *args, **kwargs):
+        message = await generate(service, lead, *args, **kwargs)
+        if lead.first_name == "Lead3":
+            # Another run claimed the step after this lease ran out
+            db.query(OutreachEnrollment).filter(OutreachEnrollment.lead_id == lead.id).update(
+                {"next_send_at": datetime.utcnow() + timedelta(minutes=5)}
+            )
+            db.commit()
+        return message
+
+    monkeypatch.setattr(service, "generate_personalized_message", generate_then_lose_lease)
+
+    results = await service.process_pending_sequences(db)
+
+    assert results["processed"] == 11
+    [failed] = [result for result in results["enrollments"] if result["status"] == "failed"]
+    assert failed["error"] == "Lease expired before the step was sent"
+
+    db.expire_all()
+    assert db.query(OutreachMessage).count() == 11
+    assert db.get(OutreachEnrollment, failed["enrollment_id"]).current_step == 0
@@ -0,0 +1,380 @@
+import pytest
+from datetime import datetime
+
+from app.models.lead import Lead
+from app.services.segment_service import SegmentService
+
+
+@pytest.fixture
+def db(db):
+    """Seed the database with a handful of leads"""
+    db.add_all([
+        Lead(email="anna@example.com", first_name="Anna", sport_type="cycling", status="new",
+             email_consent=True, location="San Diego, California", engagement_score=40,
+             created_at=datetime(2024, 3, 1)),
+        Lead(email="ben@example.com", first_name="Ben", sport_type="triathlon", status="customer",
+             email_consent=False, location="Austin, Texas", engagement_score=75,
+             created_at=datetime(2023, 6, 15)),
+        Lead(email="cara@example.com", first_name="", sport_type=None, status="engaged",
+             email_consent=True, location=None, engagement_score=None,
+             created_at=datetime(2024, 8, 20)),
+        Lead(email="dan_100%@example.com", first_name="Dan", sport_type="running", status="new",
+             email_consent=None, location="los angeles, CALIFORNIA", engagement_score=10,
+             created_at=datetime(2022, 1, 1)),
+    ])
+    db.commit()
+
+    return db
+
+
+CONDITIONS = [
+    {"field": "sport_type", "operator": "equals", "value": "cycling"},
+    {"field": "sport_type", "operator": "equals", "value": None},
+    {"field": "sport_type", "operator": "not_equals", "value": "cycling"},
+    {"field": "sport_type", "operator": "in", "value": ["cycling", "running"]},
+    {"field": "sport_type", "operator": "in", "value": ["running", None]},
+    {"field": "sport_type", "operator": "not_in", "value": ["cycling", "running"]},
+    {"field": "sport_type", "operator": "not_in", "value": "triathlon"},
+    {"field": "location", "operator": "contains", "value": "california"},
+    {"field": "location", "operator": "not_contains", "value": "California"},
+    {"field": "email", "operator": "contains", "value": "100%"},
+    {"field": "first_name", "operator": "exists", "value": None},
+    {"field": "first_name", "operator": "not_exists", "value": None},
+    {"field": "email_consent", "operator": "equals", "value": True},
+    {"field": "email_consent", "operator": "equals", "value": "yes"},
+    {"field": "engagement_score", "operator": "greater_than", "value": 30},
+    {"field": "engagement_score", "operator": "less_than", "value": 50},
+    {"field": "created_at", "operator": "greater_than", "value": "2024-01-01"},
+    {"field": "created_at", "operator": "less_than", "value": "2023-12-31T00:00:00Z"},
+    {"field": "first_name", "operator": "greater_than", "value": "B"},
+    {"field": "status", "operator": "unknown_operator", "value": "new"},
+]
+
+
+def python_matches(db, criteria):
+    """Reference result using the per-lead Python evaluator"""
+    return {
+        lead.email for lead in db.query(Lead).all()
+        if SegmentService.evaluate_criteria(lead, criteria)
+    }
+
+
+@pytest.mark.parametrize("condition", CONDITIONS)
+def test_compiled_condition_matches_python(db, condition):
+    """SQL compilation returns the same leads as evaluate_condition"""
+    criteria = {"operator": "AND", "conditions": [condition]}
+
+    matched = {lead.email for lead in SegmentService.get_matching_leads(criteria, db)}
+
+    assert matched == python_matches(db, criteria)
+    assert SegmentService.count_matching_leads(criteria, db) == len(matched)
+
+
+@pytest.mark.parametrize("operator", ["AND", "OR"])
+def test_compiled_criteria_matches_python(db, operator):
+    """Mixed SQL and Python-only conditions combine correctly"""
+    criteria = {
+        "operator": operator,
+        "conditions": [
+            {"field": "status", "operator": "in", "value": ["new", "engaged"]},
+            {"field": "first_name", "operator": "greater_than", "value": "B"},
+        ]
+    }
+
+    matched = {lead.email for lead in SegmentService.get_matching_leads(criteria, db)}
+
+    assert matched == python_matches(db, criteria)
+
+
+def test_compile_criteria_pushes_everything_to_sql():
+    """Fully expressible criteria leave no residual for Python"""
+    criteria = {
+        "operator": "OR",
+        "conditions": [
+            {"field": "status", "operator": "equals", "value": "new"},
+            {"field": "location", "operator": "contains", "value": "texas"},
+        ]
+    }
+
+    clause, residual = SegmentService.compile_criteria(criteria)
+
+    assert clause is not None
+    assert residual is None
+
+
+def test_limit_applies_to_matches(db):
+    """Limit caps matching leads rather than the leads scanned"""
+    criteria = {
+        "operator": "AND",
+        "conditions": [{"field": "email_consent", "operator": "equals", "value": True}]
+    }
+
+    assert len(SegmentService.get_matching_leads(criteria, db, limit=1)) == 1
+    assert len(SegmentService.get_matching_leads(criteria, db, limit=10)) == 2
+
+
+NESTED_CRITERIA = [
+    {
+        "operator": "AND",
+        "conditions": [
+            {"field": "email_consent", "operator": "equals", "value": True},
+            {"operator": "OR", "conditions": [
+                {"field": "sport_type", "operator": "equals", "value": "cycling"},
+                {"field": "status", "operator": "equals", "value": "engaged"},
+            ]},
+            {"operator": "NOT", "conditions": [
+                {"field": "location", "operator": "contains", "value": "texas"},
+            ]},
+        ]
+    },
+    {
+        "operator": "OR",
+        "conditions": [
+            {"operator": "AND", "conditions": [
+                {"field": "status", "operator": "equals", "value": "new"},
+                {"field": "first_name", "operator": "greater_than", "value": "B"},
+            ]},
+            {"field": "sport_type", "operator": "equals", "value": "triathlon"},
+        ]
+    },
+    {
+        "operator": "NOT",
+        "conditions": [
+            {"field": "first_name", "operator": "greater_than", "value": "B"},
+            {"field": "status", "operator": "equals", "value": "new"},
+        ]
+    },
+    {"operator": "NOT", "conditions": [{"operator": "OR", "conditions": []}]},
+]
+
+
+@pytest.mark.parametrize("criteria", NESTED_CRITERIA)
+def test_nested_criteria_matches_python(db, criteria):
+    """Nested groups and NOT compile to the same results as Python evaluation"""
+    matched = {lead.email for lead in SegmentService.get_matching_leads(criteria, db)}
+
+    assert matched == python_matches(db, criteria)
+    assert SegmentService.count_matching_leads(criteria, db) == len(matched)
+
+
+def test_plan_orders_cheap_selective_conditions_first():
+    """Indexed, selective predicates are evaluated ahead of expensive ones"""
+    criteria = {
+        "operator": "AND",
+        "conditions": [
+            {"field": "location", "operator": "contains", "value": "california"},
+            {"operator": "OR", "conditions": [
+                {"field": "first_name", "operator": "contains", "value": "a"},
+                {"field": "status", "operator": "equals", "value": "customer"},
+            ]},
+            {"field": "sport_type", "operator": "equals", "value": "cycling"},
+        ]
+    }
+
+    planned = SegmentService.plan_criteria(criteria)
+
+    assert planned["conditions"][0]["field"] == "sport_type"
+    assert planned["conditions"][-1]["operator"] == "OR"
+    assert planned["conditions"][-1]["conditions"][0]["field"] == "status"
+
+
+def test_evaluate_criteria_short_circuits():
+    """Later conditions are skipped once an AND group is decided"""
+    class StrictLead:
+        status = "new"
+
+        def __getattr__(self, name):
+            raise AssertionError(f"{name} should not be evaluated")
+
+    criteria = {
+        "operator": "AND",
+        "conditions": [
+            {"field": "status", "operator": "equals", "value": "customer"},
+            {"field": "location", "operator": "contains", "value": "texas"},
+        ]
+    }
+
+    assert SegmentService.evaluate_criteria(StrictLead(), criteria) is False
+
+
+def test_validate_nested_criteria():
+    """Validation reports errors with their position in nested groups"""
+    criteria = {
+        "operator": "AND",
+        "conditions": [
+            {"field": "status", "operator": "equals", "value": "new"},
+            {"operator": "XOR", "conditions": [
+                {"field": "unknown", "operator": "equals", "value": 1},
+            ]},
+        ]
+    }
+
+    validation = SegmentService.validate_criteria(criteria)
+
+    assert validation["valid"] is False
+    assert "Group 2: Invalid operator: XOR. Must be AND, OR or NOT" in validation["errors"]
+    assert "Condition 2.1: Invalid field 'unknown'" in validation["errors"]
+
+
+def test_criteria_schema_accepts_nested_groups():
+    """The request schema round-trips nested groups"""
+    from app.schemas.segment import SegmentCriteria
+
+    criteria = SegmentCriteria(**NESTED_CRITERIA[0])
+
+    assert criteria.model_dump() == NESTED_CRITERIA[0]
+
+
+@pytest.fixture
+def bitmap_index(tmp_path, monkeypatch):
+    """Point the shared bitmap index at a temporary file"""
+    from app.services.bitmap_index import lead_bitmap_index
+
+    monkeypatch.setattr(lead_bitmap_index, "path", str(tmp_path / "segment_bitmaps.bin"))
+    lead_bitmap_index.invalidate()
+    yield lead_bitmap_index
+    lead_bitmap_index.invalidate()
+
+
+def member_ids(db, segment_id):
+    """Lead ids currently materialized for a segment"""
+    return {lead.id for lead in SegmentService.get_segment_leads(segment_id, db)}
+
+
+def test_membership_is_maintained_incrementally(db, bitmap_index):
+    """Lead changes update materialized membership and cached counts"""
+    from app.models.segment import Segment
+
+    segment = Segment(
+        name="Consented cyclists",
+        criteria={
+            "operator": "AND",
+            "conditions": [
+                {"field": "email_consent", "operator": "equals", "value": True},
+                {"field": "sport_type", "operator": "equals", "value": "cycling"},
+            ]
+        }
+    )
+    db.add(segment)
+    db.commit()
+    SegmentService.update_segment_count(segment.id, db)
+
+    anna = db.query(Lead).filter(Lead.email == "anna@example.com").one()
+    assert member_ids(db, segment.id) == {anna.id}
+    assert segment.lead_count == 1
+
+    # New lead joins
+    eve = Lead(email="eve@example.com", sport_type="cycling", email_consent=True)
+    db.add(eve)
+    db.commit()
+    SegmentService.refresh_lead_memberships([eve.id], db)
+    assert member_ids(db, segment.id) == {anna.id, eve.id}
+    assert segment.lead_count == 2
+
+    # Changes to unrelated fields leave the segment alone
+    anna.sport_type = "running"
+    db.commit()
+    SegmentService.refresh_lead_memberships([anna.id], db, changed_fields={"location"})
+    assert member_ids(db, segment.id) == {anna.id, eve.id}
+
+    # Changes to referenced fields re-evaluate it
+    SegmentService.refresh_lead_memberships([anna.id], db, changed_fields={"sport_type"})
+    assert member_ids(db, segment.id) == {eve.id}
+    assert segment.lead_count == 1
+
+    # Deleted leads leave every segment
+    SegmentService.remove_lead_memberships([eve.id], db)
+    db.delete(eve)
+    db.commit()
+    db.refresh(segment)
+    assert member_ids(db, segment.id) == set()
+    assert segment.lead_count == 0
+    assert SegmentService.count_covered_leads(db) == 0
+
+
+def test_lead_writers_keep_membership_current(db, bitmap_index):
+    """Stage transitions and consent-revoking webhooks refresh the segments they affect"""
+    from app.models.segment import Segment
+    from app.models.webhook import Webhook, WebhookEvent
+    from app.services import webhook_service
+    from app.services.lead_tracking_service import LeadTrackingService
+
+    new_leads = Segment(name="New", criteria={"field": "status", "operator": "equals", "value": "new"})
+    consented = Segment(name="Consented", criteria={"field": "email_consent", "operator": "equals", "value": True})
+    webhook = Webhook(name="SendGrid", provider="sendgrid", event_type="email", url_path="/webhooks/receive/sendgrid")
+    db.add_all([new_leads, consented, webhook])
+    db.commit()
+    SegmentService.rebuild_all_memberships(db)
+
+    anna = db.query(Lead).filter(Lead.email == "anna@example.com").one()
+    assert anna.id in member_ids(db, new_leads.id)
+    assert anna.id in member_ids(db, consented.id)
+
+    LeadTrackingService().transition_lead_stage(anna, "engaged", db=db)
+    assert anna.id not in member_ids(db, new_leads.id)
+
+    event = WebhookEvent(webhook_id=webhook.id, event_type="unsubscribe", event_data={"email": anna.email})
+    db.add(event)
+    db.commit()
+    assert webhook_service.process_webhook_event(db, event)
+    assert anna.id not in member_ids(db, consented.id)
+    assert consented.lead_count == 1
+
+
+def test_rebuild_membership_with_python_conditions(db):
+    """Rebuilding falls back to Python for conditions SQL cannot express"""
+    from app.models.segment import Segment
+
+    segment = Segment(
+        name="Late alphabet",
+        criteria={
+            "operator": "AND",
+            "conditions": [{"field": "first_name", "operator": "greater_than", "value": "B"}]
+        }
+    )
+    db.add(segment)
+    db.commit()
+    SegmentService.update_segment_count(segment.id, db)
+
+    expected = {
+        lead.id for lead in db.query(Lead).all()
+        if SegmentService.evaluate_criteria(lead, segment.criteria)
+    }
+    assert member_ids(db, segment.id) == expected
+    assert segment.lead_count == len(expected)
+
+
+def test_segment_overlap_uses_bitmaps(db, bitmap_index):
+    """Set algebra over segments matches the materialized membership"""
+    from app.models.segment import Segment
+
+    consented = Segment(name="Consented", criteria={
+        "operator": "AND",
+        "conditions": [{"field": "email_consent", "operator": "equals", "value": True}]
+    })
+    californians = Segment(name="California", criteria={
+        "operator": "AND",
+        "conditions": [{"field": "location", "operator": "contains", "value": "california"}]
+    })
+    db.add_all([consented, californians])
+    db.commit()
+    SegmentService.rebuild_all_memberships(db)
+
+    assert SegmentService.count_segment_overlap(db, [consented.id]) == 2
+    assert SegmentService.count_segment_overlap(db, [consented.id, californians.id]) == 1
+    assert SegmentService.count_segment_overlap(db, [californians.id], [consented.id]) == 1
+    assert SegmentService.count_segment_overlap(db, [], status="new") == 2
+    assert SegmentService.count_segment_overlap(db, [], sport_type="triathlon", email_consent=False) == 1
+    assert SegmentService.count_covered_leads(db) == 3
+
+    # Persisted bitmaps are reused after a restart, then rebuilt once stale
+    bitmap_index.invalidate()
+    saved = bitmap_index._read_file()
+    assert saved is not None
+    assert bitmap_index.lead_ids(saved[1]["segment:%d" % californians.id]) == sorted(
+        member_ids(db, californians.id)
+    )
+
+    db.add(Lead(email="fay@example.com", location="Fresno, California"))
+    db.commit()
+    assert SegmentService.count_segment_overlap(db, []) == 5
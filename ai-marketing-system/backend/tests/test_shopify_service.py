@@ -1,5 +1,12 @@
+import time
+import httpx
 import pytest
-from app.services.shopify_service import ShopifyService
+from datetime import datetime, timedelta, timezone
+
+from app.core.http_clients import http_clients
+from app.models.lead import Lead
+from app.models.shopify_sync import ShopifySyncCheckpoint
+from app.services.shopify_service import CHECKPOINT_CLOCK_SKEW, ShopifyService, ShopifyCallLimiter
 
 
 @pytest.fixture
@@ -73,3 +80,140 @@ def test_store_urls(shopify_service):
     stores = shopify_service.get_all_stores()
     assert stores[0]['store_url'] == 'premierbike.myshopify.com'
     assert stores[1]['store_url'] == 'positiononesports.myshopify.com'
+
+
+@pytest.fixture
+def db(db):
+    """Seed the database with one existing lead"""
+    db.add(Lead(email="anna@example.com", first_name="Anna", email_consent=False, source="manual"))
+    db.commit()
+
+    return db
+
+
+CUSTOMER_PAGES = [
+    [
+        {"id": 1, "email": "anna@example.com", "first_name": "Anna", "phone": "555",
+         "accepts_marketing": True, "orders_count": 3, "updated_at": "2024-03-01T10:00:00-05:00"},
+        {"id": 2, "email": None, "updated_at": "2024-03-01T09:00:00-05:00"},
+    ],
+    [
+        {"id": 3, "email": "dan@example.com", "first_name": "Dan", "last_name": "",
+         "accepts_marketing": False, "updated_at": "2024-03-01T14:30:00Z"},
+    ],
+]
+
+
+def mock_store(shopify_service, monkeypatch, handler):
+    """Point store 1 at a mock transport"""
+    shopify_service.stores[0].update(store_url="premier.myshopify.com", access_token="shpat_test")
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(http_clients, "get", lambda name: client)
+
+
+@pytest.mark.asyncio
+async def test_sync_walks_all_pages_and_checkpoints(shopify_service, db, monkeypatch):
+    """Customers are synced across Link header pages and later syncs are incremental"""
+    requests = []
+
+    def handler(request):
+        requests.append(dict(request.url.params))
+        page = 1 if request.url.params.get("page_info") == "next-cursor" else 0
+        headers = {"X-Shopify-Shop-Api-Call-Limit": "3/40"}
+        if page == 0 and "updated_at_min" not in request.url.params:
+            headers["Link"] = f'<https://{request.url.host}{request.url.path}?limit=250&page_info=next-cursor>; rel="next"'
+        customers = CUSTOMER_PAGES[page] if "updated_at_min" not in request.url.params else []
+        return httpx.Response(200, json={"customers": customers}, headers=headers)
+
+    mock_store(shopify_service, monkeypatch, handler)
+    started = datetime.now(timezone.utc)
+    result = await shopify_service.sync_customers_to_leads(store_id=1, user_id=1, db=db)
+
+    assert result["success"] is True
+    assert result["pages"] == 2
+    assert (result["synced"], result["updated"], result["skipped"]) == (1, 1, 1)
+    assert requests[0]["limit"] == "250"
+    assert "email" in requests[0]["fields"]
+    assert requests[1] == {"limit": "250", "fields": requests[0]["fields"], "page_info": "next-cursor"}
+
+    anna = db.query(Lead).filter(Lead.email == "anna@example.com").one()
+    dan = db.query(Lead).filter(Lead.email == "dan@example.com").one()
+    assert anna.email_consent is False  # A sync never opts an existing lead in
+    assert anna.consent_source is None
+    assert anna.phone == "555"
+    assert anna.source == "manual"
+    assert dan.source == "shopify"
+    assert dan.last_name is None
+    assert dan.email_consent is False
+
+    # The next sync resumes from when this pass started, not the newest customer seen,
+    # so customers updated on already-walked pages during the pass are picked up
+    checkpoint = db.query(ShopifySyncCheckpoint).one()
+    resume_from = datetime.fromisoformat(checkpoint.updated_at_min)
+    assert started - CHECKPOINT_CLOCK_SKEW - timedelta(seconds=1) <= resume_from <= started - CHECKPOINT_CLOCK_SKEW
+    assert checkpoint.records_synced == 3
+
+    resume_value = checkpoint.updated_at_min
+    result = await shopify_service.sync_customers_to_leads(store_id=1, user_id=1, db=db)
+    assert requests[-1]["updated_at_min"] == resume_value
+    assert (result["pages"], result["total_processed"]) == (1, 0)
+
+
+@pytest.mark.asyncio
+async def test_resync_keeps_unsubscribed_leads_unsubscribed(shopify_service, db, monkeypatch):
+    """A lead that unsubscribed stays unsubscribed and unchanged, while Shopify can still withdraw consent"""
+    db.add_all([
+        Lead(email="uma@example.com", email_consent=False, status="unsubscribed", source="shopify"),
+        Lead(email="otto@example.com", email_consent=True, consent_source="shopify_import", source="shopify"),
+    ])
+    db.commit()
+
+    customers = [
+        {"id": 4, "email": "uma@example.com", "accepts_marketing": True, "updated_at": "2024-03-01T10:00:00Z"},
+        {"id": 5, "email": "otto@example.com", "accepts_marketing": False, "updated_at": "2024-03-01T10:00:00Z"},
+    ]
+    mock_store(shopify_service, monkeypatch, lambda request: httpx.Response(200, json={"customers": customers}))
+
+    result = await shopify_service.sync_customers_to_leads(store_id=1, user_id=1, db=db, full_sync=True)
+    assert (result["synced"], result["updated"], result["skipped"]) == (0, 2, 0)  # Notes filled in
+
+    result = await shopify_service.sync_customers_to_leads(store_id=1, user_id=1, db=db, full_sync=True)
+    assert (result["synced"], result["updated"], result["skipped"]) == (0, 0, 2)
+
+    db.expire_all()
+    uma = db.query(Lead).filter(Lead.email == "uma@example.com").one()
+    otto = db.query(Lead).filter(Lead.email == "otto@example.com").one()
+    assert (uma.email_consent, uma.status, uma.consent_date) == (False, "unsubscribed", None)
+    assert otto.email_consent is False
+
+
+
+@pytest.mark.asyncio
+async def test_throttled_requests_are_retried(shopify_service, monkeypatch):
+    """A 429 is retried after Retry-After, and the call limit header is tracked"""
+    monkeypatch.setattr("app.services.shopify_service.settings.SHOPIFY_MAX_RETRIES", 2)
+    responses = [
+        httpx.Response(429, headers={"Retry-After": "0", "X-Shopify-Shop-Api-Call-Limit": "40/40"}),
+        httpx.Response(200, json={"shop": {"name": "Premier"}}, headers={"X-Shopify-Shop-Api-Call-Limit": "12/40"}),
+    ]
+    mock_store(shopify_service, monkeypatch, lambda request: responses.pop(0))
+
+    result = await shopify_service._make_shopify_request(1, "shop.json")
+
+    assert result["shop"]["name"] == "Premier"
+    assert not responses
+    assert shopify_service._limiters[1].level == 12
+
+
+
+@pytest.mark.asyncio
+async def test_call_limiter_waits_for_bucket_to_leak():
+    """Calls wait once the reported bucket is nearly full"""
+    limiter = ShopifyCallLimiter(leak_rate=100.0)
+    limiter.observe("40/40")
+
+    start = time.monotonic()
+    await limiter.acquire()
+
+    assert time.monotonic() - start >= 0.015
+    assert limiter.level <= 39
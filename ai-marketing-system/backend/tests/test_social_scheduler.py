@@ -0,0 +1,157 @@
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+from app.core.config import settings
+from app.models.scheduled_post import ScheduledPost
+from app.services.social_scheduler import SocialMediaScheduler
+
+
+def add_posts(db, count, platform="facebook", due=True, **fields):
+    scheduled_time = datetime.utcnow() + timedelta(minutes=-5 if due else 60)
+    db.add_all([
+        ScheduledPost(platform=platform, post_text=f"Post {i}", scheduled_time=scheduled_time,
+                      status="scheduled", auto_post=True, **fields)
+        for i in range(count)
+    ])
+    db.commit()
+
+
+def test_concurrent_claims_do_not_overlap(session_factory, db):
+    """Each due post is leased by exactly one worker"""
+    add_posts(db, 10)
+    add_posts(db, 3, due=False)
+
+    # Separate sessions act like separate workers
+    first = session_factory()
+    second = session_factory()
+    _, claimed_first = SocialMediaScheduler().claim_due_posts(first, limit=6)
+    _, claimed_second = SocialMediaScheduler().claim_due_posts(second, limit=6)
+    _, claimed_third = SocialMediaScheduler().claim_due_posts(first, limit=6)
+
+    ids_first = {post.id for post in claimed_first}
+    ids_second = {post.id for post in claimed_second}
+    assert len(ids_first) == 6
+    assert len(ids_second) == 4
+    assert not ids_first & ids_second
+    assert claimed_third == []
+    assert db.query(ScheduledPost).filter(ScheduledPost.status == "posting").count() == 10
+
+    first.close()
+    second.close()
+
+
+@pytest.mark.asyncio
+async def test_dispatch_bounds_concurrency_per_platform(db, monkeypatch):
+    """Platforms are published in parallel, each capped at SOCIAL_POST_CONCURRENCY"""
+    monkeypatch.setattr(settings, "SOCIAL_POST_CONCURRENCY", 2)
+    add_posts(db, 6, platform="facebook")
+    add_posts(db, 6, platform="instagram")
+
+    active = {"facebook": 0, "instagram": 0}
+    peak = {"facebook": 0, "instagram": 0}
+
+    async def fake_post(post, db):
+        active[post.platform] += 1
+        peak[post.platform] = max(peak[post.platform], active[post.platform])
+        await asyncio.sleep(0.01)
+        active[post.platform] -= 1
+        if post.post_text == "Post 5":
+            raise Exception("Rate limited")
+        return {'success': True, 'post_id': f"{post.platform}_{post.id}", 'post_url': None}
+
+    scheduler = SocialMediaScheduler()
+    monkeypatch.setattr(scheduler, "post_to_platform", fake_post)
+
+    assert await scheduler.process_scheduled_posts(db) == 12
+    assert peak == {"facebook": 2, "instagram": 2}
+
+    db.expire_all()
+    posts = db.query(ScheduledPost).all()
+    assert sum(post.status == "posted" for post in posts) == 10
+    failed = [post for post in posts if post.status == "failed"]
+    assert len(failed) == 2
+    assert all(post.error_message == "Rate limited" for post in failed)
+    assert all(post.platform_post_id == f"{post.platform}_{post.id}" for post in posts if post.status == "posted")
+
+
+@pytest.mark.asyncio
+async def test_results_are_recorded_in_one_statement(engine, db, monkeypatch):
+    """Status updates go out as a single executemany, and only for posts still leased"""
+    add_posts(db, 5)
+
+    async def fake_post(post, db):
+        return {'success': True, 'post_id': str(post.id)}
+
+    scheduler = SocialMediaScheduler()
+    monkeypatch.setattr(scheduler, "post_to_platform", fake_post)
+
+    claimed_at, posts = scheduler.claim_due_posts(db)
+    results = await scheduler.dispatch_posts(posts, db)
+
+    # Another worker expired one lease in the meantime
+    db.query(ScheduledPost).filter(ScheduledPost.id == posts[0].id).update({"status": "failed"})
+    db.commit()
+
+    updates = []
+
+    def count_updates(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE scheduled_posts"):
+            updates.append(executemany)
+
+    event.listen(engine, "before_cursor_execute", count_updates)
+    scheduler.record_results(db, claimed_at, results)
+    event.remove(engine, "before_cursor_execute", count_updates)
+
+    assert updates == [True]
+    db.expire_all()
+    statuses = [post.status for post in db.query(ScheduledPost).order_by(ScheduledPost.id)]
+    assert statuses == ["failed", "posted", "posted", "posted", "posted"]
+
+
+def test_expired_leases_fail_instead_of_reposting(db, monkeypatch):
+    """Posts stuck in posting past the lease are failed, not claimed again"""
+    add_posts(db, 2)
+    scheduler = SocialMediaScheduler()
+    scheduler.claim_due_posts(db)
+
+    assert scheduler.expire_stale_posts(db) == 0
+
+    monkeypatch.setattr(settings, "SOCIAL_POST_LEASE_SECONDS", -1)
+    assert scheduler.expire_stale_posts(db) == 2
+    assert scheduler.claim_due_posts(db)[1] == []
+
+    db.expire_all()
+    post = db.query(ScheduledPost).first()
+    assert post.status == "failed"
+    assert "interrupted" in post.error_message
+
+
+@pytest.mark.asyncio
+async def test_leases_are_renewed_while_posts_publish(db, session_factory, monkeypatch):
+    """A batch that outlives the lease is not expired by another worker, and its results are kept"""
+    monkeypatch.setattr(settings, "SOCIAL_POST_LEASE_SECONDS", 0.3)
+    add_posts(db, 3)
+
+    async def slow_post(post, db):
+        await asyncio.sleep(0.6)
+        return {'success': True, 'post_id': str(post.id)}
+
+    scheduler = SocialMediaScheduler()
+    monkeypatch.setattr(scheduler, "post_to_platform", slow_post)
+
+    async def other_worker():
+        other = session_factory()
+        expired = 0
+        for _ in range(5):
+            await asyncio.sleep(0.1)
+            expired += SocialMediaScheduler().expire_stale_posts(other)
+        other.close()
+        return expired
+
+    processed, expired = await asyncio.gather(scheduler.process_scheduled_posts(db), other_worker())
+
+    assert (processed, expired) == (3, 0)
+    db.expire_all()
+    assert [post.status for post in db.query(ScheduledPost)] == ["posted"] * 3
@@ -0,0 +1,83 @@
+import re
+import pytest
+from datetime import datetime
+from types import SimpleNamespace
+
+from app.services.template_service import TemplateRenderService, compile_template
+
+
+def regex_render(content, variables, default_value=""):
+    """Reference renderer: the original per-match regex implementation"""
+
+    def replace_variable(match):
+        parts = match.group(1).split('|')
+        value = variables.get(parts[0].strip(), default_value)
+        for filter_part in parts[1:]:
+            filter_part = filter_part.strip()
+            if filter_part.startswith('default:'):
+                default = filter_part.split(':', 1)[1].strip('"\'')
+                if not value:
+                    value = default
+            elif filter_part == 'capitalize':
+                value = str(value).capitalize() if value else ''
+            elif filter_part == 'upper':
+                value = str(value).upper() if value else ''
+            elif filter_part == 'lower':
+                value = str(value).lower() if value else ''
+            elif filter_part == 'title':
+                value = str(value).title() if value else ''
+        return str(value) if value is not None else default_value
+
+    return re.sub(r'\{\{([^}]+)\}\}', replace_variable, content)
+
+
+TEMPLATES = [
+    "Hi {{first_name}}!",
+    "Hi {{ first_name | capitalize }}, welcome to {{company_name|upper}}",
+    "{{first_name|default:\"Rider\"}} / {{ last_name | default:'Friend' | upper }}",
+    "{{missing}}{{missing|title}}{{sport_type|lower|capitalize}}",
+    "{{email|unknown_filter}} and {{current_year}}",
+    "No variables at all",
+    "{{first_name}}",
+    "{{ unclosed and {{ first_name }} }}",
+    "",
+]
+
+VARIABLES = [
+    {"first_name": "anna", "last_name": "", "company_name": "Premier Bike", "email": "a@example.com",
+     "sport_type": "CYCLING", "current_year": 2024},
+    {"first_name": None, "last_name": None, "sport_type": 0},
+    {},
+]
+
+
+@pytest.mark.parametrize("content", TEMPLATES)
+@pytest.mark.parametrize("variables", VARIABLES)
+@pytest.mark.parametrize("default_value", ["", "n/a"])
+def test_compiled_render_matches_regex(content, variables, default_value):
+    """Compiled render plans produce the same output as the regex renderer"""
+    assert compile_template(content).render(variables, default_value) == \
+        regex_render(content, variables, default_value)
+    assert TemplateRenderService.render_template(content, variables, default_value) == \
+        regex_render(content, variables, default_value)
+
+
+def test_email_template_cache_follows_updated_at():
+    """Stored templates are compiled once per id and updated_at"""
+    service = TemplateRenderService()
+    template = SimpleNamespace(
+        id=7, subject="Hi {{first_name}}", html_content="<p>{{first_name|upper}}</p>",
+        plain_text_content=None, updated_at=datetime(2024, 1, 1), created_at=datetime(2024, 1, 1)
+    )
+
+    compiled = service.get_compiled_template(template)
+    assert service.get_compiled_template(template) is compiled
+    assert service.render_email_template(template, {"first_name": "anna"}) == {
+        "subject": "Hi anna", "html_content": "<p>ANNA</p>", "plain_text_content": None
+    }
+
+    template.subject = "Hello {{first_name}}"
+    template.updated_at = datetime(2024, 2, 1)
+
+    assert service.get_compiled_template(template) is not compiled
+    assert service.render_email_template(template, {"first_name": "anna"})["subject"] == "Hello anna"
@@ -0,0 +1,140 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from app.models.ab_test import ABTest, ABTestVariant
+from app.models.campaign import Campaign, EmailLog
+from app.models.lead import Lead
+from app.models.webhook import Webhook, WebhookEvent
+from app.services import webhook_service
+
+
+def sendgrid_events():
+    """A SendGrid-style array of events across two leads, one campaign and one variant"""
+    events = []
+    for email in ["ann@example.com", "bob@example.com"]:
+        for kind in ["delivered", "open", "open", "click"]:
+            events.append({"email": email, "event": kind, "timestamp": 1700000000, "campaign_id": 1, "ab_test_variant_id": 1})
+    events.append({"email": "bob@example.com", "event": "unsubscribe", "timestamp": 1700000100, "campaign_id": 1})
+    events.append({"email": "nobody@example.com", "event": "bounce", "timestamp": 1700000100, "campaign_id": 99})
+    events.append({"email": "ann@example.com", "event": "processed", "timestamp": 1700000100})
+    return events
+
+
+@pytest.fixture
+def make_db(make_engine):
+    """Factory for databases with a webhook, campaign, variant, leads and email logs"""
+    sessions = []
+
+    def make(name="webhooks.db"):
+        session = sessionmaker(bind=make_engine(name))()
+        sessions.append(session)
+
+        session.add(Webhook(name="SendGrid", provider="sendgrid", event_type="email", url_path=f"/webhooks/receive/{name}"))
+        session.add(Campaign(name="Spring", campaign_type="email", total_sent=2))
+        session.commit()
+        session.add(ABTest(name="Subject test", campaign_id=1))
+        session.commit()
+        session.add(ABTestVariant(ab_test_id=1, name="A", total_sent=4))
+        session.add_all([Lead(email="ann@example.com", email_consent=True), Lead(email="bob@example.com", email_consent=True)])
+        session.commit()
+        session.add_all([
+            EmailLog(campaign_id=1, lead_id=lead.id, recipient_email=lead.email, status="sent")
+            for lead in session.query(Lead)
+        ])
+        session.commit()
+        return session
+
+    yield make
+
+    for session in sessions:
+        session.close()
+
+
+def snapshot(db):
+    db.expire_all()
+    campaign = db.get(Campaign, 1)
+    variant = db.get(ABTestVariant, 1)
+    return {
+        "campaign": (campaign.total_delivered, campaign.total_opened, campaign.total_clicked, campaign.total_unsubscribed),
+        "variant": (variant.total_delivered, variant.total_opened, variant.total_clicked, variant.open_rate, variant.click_rate),
+        "logs": sorted((log.lead_id, log.status) for log in db.query(EmailLog)),
+        "consent": sorted((lead.email, lead.email_consent) for lead in db.query(Lead)),
+        "events": sorted(
+            (row.event_type, row.status, row.lead_id, row.campaign_id, row.ab_test_variant_id)
+            for row in db.query(WebhookEvent)
+        ),
+        "webhook": (db.get(Webhook, 1).total_events_received, db.get(Webhook, 1).total_events_processed),
+    }
+
+
+def test_batches_match_processing_events_one_at_a_time(make_db):
+    batch_db = make_db("batch.db")
+    webhook = batch_db.get(Webhook, 1)
+    assert webhook_service.ingest_event_batch(batch_db, webhook, sendgrid_events()) == 11
+    assert webhook_service.process_queued_events(batch_db) == {"claimed": 11, "processed": 11, "failed": 0}
+
+    single_db = make_db("single.db")
+    webhook = single_db.get(Webhook, 1)
+    for payload in sendgrid_events():
+        parsed = webhook_service.parse_event(webhook.provider, payload)
+        webhook_event = WebhookEvent(webhook_id=webhook.id, event_type=parsed["event_type"], event_data=payload, email=parsed["email"])
+        single_db.add(webhook_event)
+        webhook.total_events_received += 1
+        single_db.commit()
+        webhook_service.process_webhook_event(single_db, webhook_event)
+
+    batched, single = snapshot(batch_db), snapshot(single_db)
+    assert batched == single
+    assert batched["campaign"] == (2, 4, 2, 1)
+    assert batched["logs"] == [(1, "clicked"), (2, "clicked")]
+    assert batched["consent"] == [("ann@example.com", True), ("bob@example.com", False)]
+    assert batched["webhook"] == (11, 11)
+
+
+def test_batches_use_a_fixed_number_of_statements(make_db):
+    db = make_db()
+    webhook = db.get(Webhook, 1)
+    webhook_service.ingest_event_batch(db, webhook, sendgrid_events() * 20)
+    events = webhook_service.claim_queued_events(db)
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    try:
+        assert webhook_service.process_event_batch(db, events) == 220
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+
+    assert len(statements) < 20
+    assert snapshot(db)["campaign"] == (40, 80, 40, 20)
+
+
+def test_claimed_events_are_leased(make_db):
+    db = make_db()
+    webhook_service.ingest_event_batch(db, db.get(Webhook, 1), sendgrid_events())
+
+    assert len(webhook_service.claim_queued_events(db, limit=4)) == 4
+    assert len(webhook_service.claim_queued_events(db)) == 7
+    assert webhook_service.claim_queued_events(db) == []
+
+    # A worker that stopped mid-batch leaves its events to be claimed again
+    db.query(WebhookEvent).filter(WebhookEvent.id <= 4).update(
+        {WebhookEvent.processed_at: datetime.utcnow() - timedelta(hours=1)}
+    )
+    db.commit()
+    assert [row.id for row in webhook_service.claim_queued_events(db)] == [1, 2, 3, 4]
+
+
+def test_failed_batches_fall_back_to_single_events(make_db, monkeypatch):
+    db = make_db()
+    webhook_service.ingest_event_batch(db, db.get(Webhook, 1), sendgrid_events())
+
+    def broken_batch(db, events):
+        raise Exception("Deadlock")
+
+    monkeypatch.setattr(webhook_service, "process_event_batch", broken_batch)
+
+    assert webhook_service.process_queued_events(db) == {"claimed": 11, "processed": 11, "failed": 0}
+    assert snapshot(db)["campaign"] == (2, 4, 2, 1)
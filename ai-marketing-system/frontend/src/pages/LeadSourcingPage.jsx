@@ -142,7 +142,7 @@ export default function LeadSourcingPage() {
     setSyncing(true)
     try {
       const response = await facebookLeadsAPI.syncForm(formId)
-      toast.success(`Imported ${response.data.imported} leads, skipped ${response.data.skipped}`)
+      toast.success(`Imported ${response.data.imported} leads, updated ${response.data.updated}, skipped ${response.data.skipped}`)
       fetchSourceStats()
     } catch (error) {
       toast.error(error.response?.data?.detail || 'Failed to sync leads')
@@ -91,19 +91,39 @@ export default function LeadsPage() {
       return
     }
 
+    e.target.value = ''
+    const toastId = toast.loading('Uploading leads...')
     try {
-      toast.loading('Importing leads...')
       const response = await leadsAPI.import(file, true, 'csv_import')
-      toast.dismiss()
-      toast.success(
-        `Imported ${response.data.imported} leads, skipped ${response.data.skipped}`
-      )
+      toast.loading('Import queued...', { id: toastId })
+
+      const job = await waitForImport(response.data.job_id, toastId)
+      if (job.status === 'failed') {
+        toast.error(job.errors[job.errors.length - 1] || 'Failed to import leads', { id: toastId })
+      } else {
+        toast.success(
+          `Imported ${job.imported} leads, updated ${job.updated}, skipped ${job.skipped}`,
+          { id: toastId }
+        )
+      }
       fetchLeads()
     } catch (error) {
-      toast.dismiss()
-      toast.error('Failed to import leads')
+      toast.error(error.response?.data?.detail || 'Failed to import leads', { id: toastId })
+    }
+  }
+
+  // Imports run in the background; poll the job until it finishes
+  const waitForImport = async (jobId, toastId) => {
+    while (true) {
+      await new Promise((resolve) => setTimeout(resolve, 2000))
+      const { data: job } = await leadsAPI.getImport(jobId)
+      if (job.status === 'completed' || job.status === 'failed') {
+        return job
+      }
+      if (job.total_rows) {
+        toast.loading(`Importing leads... ${job.processed_rows} of ${job.total_rows} rows`, { id: toastId })
+      }
     }
-    e.target.value = ''
   }
 
   return (
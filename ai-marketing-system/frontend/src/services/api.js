@@ -63,6 +63,7 @@ export const leadsAPI = {
       headers: { 'Content-Type': 'multipart/form-data' },
     })
   },
+  getImport: (jobId) => api.get(`/leads/import/${jobId}`),
   getStats: () => api.get('/leads/stats/overview'),
 }
 